@@ -1,11 +1,39 @@
 #使用py3版本，由gork重构
+import time
+STARTUP_T0 = time.perf_counter()  # 用于统计启动耗时，需在导入PyQt5之前记录
 import sys
 import os
+import asyncio
+import itertools
+import re
+import secrets
 import zipfile
 import urllib.request
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QComboBox, QSpinBox, QCheckBox, QTextEdit, QTabWidget, QGroupBox, QGridLayout, QProgressBar, QFileDialog, QMessageBox
-from PyQt5.QtCore import Qt, QProcess, QSettings, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QIcon
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QComboBox, QSpinBox, QCheckBox, QPlainTextEdit, QPlainTextDocumentLayout, QTabWidget, QGroupBox, QGridLayout, QProgressBar, QFileDialog, QMessageBox, QCompleter, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt, QObject, QPointF, QSettings, QStringListModel, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QIcon, QPainter, QPen, QPolygonF, QSyntaxHighlighter, QTextCharFormat, QTextCursor, QTextDocument
+
+from mcmanager.api import API_HOST, API_PORT, DEFAULT_SERVER, ControlServer, ServerHandle
+from mcmanager.backup import BACKUPS_DIR, SnapshotStore, backup_server
+from mcmanager.commands import CommandQueue, read_script
+from mcmanager.console import LEVEL_ERROR, LEVEL_WARN, LEVELS, SOURCES, ConsoleBuffer, ConsoleFilter, DEFAULT_MAX_LINES, classify_level
+from mcmanager.controller import STOP_EXITED, ControllerError, ServerController, describe_stop_stage
+from mcmanager.discovery import CACHE_FILE as DISCOVERY_CACHE, VersionDiscovery, neighbor_pattern
+from mcmanager.events import PlayerConnected, PlayerDisconnected, ServerStarted
+from mcmanager.health import EVENT_CRASH_LOOP, EVENT_CRASHED, EVENT_EXITED, EVENT_PLANNED_RESTART, EVENT_READY, EVENT_RESTARTED, ServerMonitor, describe_event
+from mcmanager.install import InstallError, install_version
+from mcmanager.logstore import LOGS_DIR, LogStore, format_record
+from mcmanager.metrics import CPU, DISK_READ, DISK_WRITE, NET_RX, NET_TX, RSS, THREADS, ResourceSampler, TimeSeries, format_bytes
+from mcmanager.netinfo import PublicIPLookup
+from mcmanager.packages import PackageCache
+from mcmanager.players import SESSIONS_FILE, PlayerTracker, SessionStore, format_duration
+from mcmanager.properties import add_change_listener, needs_restart, read_properties, write_properties
+from mcmanager.reader import LineQueue
+from mcmanager.scheduler import ACTION_BACKUP, ACTION_COMMAND, ACTION_RESTART, SCHEDULE_FILE, ScheduleError, Scheduler
+from mcmanager.store import BlobStore
+from mcmanager.timing import StartupTimer
+from mcmanager.verify import verify_before_start, verify_version
+from mcmanager.versions import SERVER_EXECUTABLE, STATE_FAILED, STATE_VERIFIED, VersionCatalog, server_executable
 
 class DownloadThread(QThread):
     progress_updated = pyqtSignal(int)
@@ -15,125 +43,508 @@ class DownloadThread(QThread):
         super().__init__()
         self.version = version
         self.save_path = save_path
+    #·下载进度回调，下载器已按固定频率节流。
+    def reportProgress(self, downloaded, total):
+        if total > 0:
+            self.progress_updated.emit(int(downloaded * 100 / total))
     #·下载线程的运行方法，用于下载Minecraft服务器包。
     def run(self):
-        # 重试次数
-        max_retries = 3
-        retry_count = 0
+        try:
+            # 边下载边校验、解压，失败时自动重试（已下载的部分会续传）；
+            # 与已安装版本相同的文件直接硬链接到共享仓库 lib/.store
+            result = install_version(self.version, self.save_path, retries=3,
+                                     progress=self.reportProgress, store=BlobStore(self.save_path),
+                                     cache=PackageCache.for_lib(self.save_path))
+            self.download_finished.emit(True, f"{'从缓存安装' if result.from_cache else '下载完成'}，共 {result.files} 个文件（复用 {result.linked_files} 个），SHA-256: {result.sha256}")
+        except urllib.error.HTTPError as e:
+            self.download_finished.emit(False, f"HTTP错误: {e.code} {e.reason}，可能是版本号不存在或链接已失效")
+        except urllib.error.URLError as e:
+            self.download_finished.emit(False, f"网络错误: {str(e)}, 请检查网络连接或稍后重试")
+        except zipfile.BadZipFile as e:
+            self.download_finished.emit(False, f"无效的ZIP文件: {str(e)}, 下载可能被中断或文件损坏")
+        except InstallError as e:
+            self.download_finished.emit(False, f"安装失败: {str(e)}")
+        except Exception as e:
+            self.download_finished.emit(False, f"下载失败: {str(e)}")
 
-        while retry_count < max_retries:
-            try:
-                url = f"https://www.minecraft.net/bedrockdedicatedserver/bin-win/bedrock-server-{self.version}.zip"
-                zip_file_path = os.path.join(self.save_path, f"bedrock-server-{self.version}.zip")
-                
-                # 添加User-Agent头，确保能访问Minecraft官网
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                
-                # 创建请求对象
-                req = urllib.request.Request(url, headers=headers)
-                
-                # 使用urlopen和自定义请求对象，增加超时设置
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    # 获取文件大小
-                    total_size = int(response.getheader('Content-Length', 0))
-                    
-                    # 写入文件并更新进度
-                    with open(zip_file_path, 'wb') as f:
-                        downloaded = 0
-                        block_size = 8192
-                        while True:
-                            buffer = response.read(block_size)
-                            if not buffer:
-                                break
-                            f.write(buffer)
-                            downloaded += len(buffer)
-                            if total_size > 0:
-                                percent = int((downloaded / total_size) * 100)
-                                self.progress_updated.emit(percent)
-                
-                # 验证文件大小
-                if os.path.exists(zip_file_path) and os.path.getsize(zip_file_path) < 1024 * 1024:  # 小于1MB可能是错误页面
-                    raise Exception(f"下载文件过小，可能是错误页面，文件大小: {os.path.getsize(zip_file_path)} 字节")
-                
-                # 解压文件
-                version_dir = os.path.join(self.save_path, self.version)
-                os.makedirs(version_dir, exist_ok=True)
-                
-                # 解压前验证ZIP文件
-                if not zipfile.is_zipfile(zip_file_path):
-                    raise zipfile.BadZipFile("文件不是有效的ZIP格式")
-                
-                with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                    # 检查zip文件内容
-                    zip_contents = zip_ref.namelist()
-                    if not any('bedrock_server.exe' in item for item in zip_contents):
-                        raise Exception("ZIP文件中没有找到bedrock_server.exe")
-                    
-                    # 解压文件
-                    zip_ref.extractall(version_dir)
-                
-                # 验证解压是否成功
-                bedrock_exe_path = os.path.join(version_dir, "bedrock_server.exe")
-                if not os.path.exists(bedrock_exe_path):
-                    raise Exception("解压失败，未找到bedrock_server.exe")
-                
-                # 删除临时zip文件
-                os.remove(zip_file_path)
-                
-                self.download_finished.emit(True, "下载完成")
-                return  # 成功下载，退出循环
-            except urllib.error.HTTPError as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    self.download_finished.emit(False, f"HTTP错误: {e.code} {e.reason}，可能是版本号不存在或链接已失效")
-                    return
-            except urllib.error.URLError as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    self.download_finished.emit(False, f"网络错误: {str(e)}, 请检查网络连接或稍后重试")
-                    return
-            except zipfile.BadZipFile as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    self.download_finished.emit(False, f"无效的ZIP文件: {str(e)}, 下载可能被中断或文件损坏")
-                    return
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    self.download_finished.emit(False, f"下载失败: {str(e)}")
-                    return
-            
-            # 等待1秒后重试
-            import time
-            time.sleep(1)
+
+class PublicIPThread(QThread):
+    ip_ready = pyqtSignal(str)
+    lookup_failed = pyqtSignal(str)
+    #·公网IP查询线程，避免网络请求阻塞界面。
+    def __init__(self, lookup):
+        super().__init__()
+        self.lookup = lookup
+        self.elapsed = 0.0
+    def run(self):
+        started = time.perf_counter()
+        try:
+            ip = self.lookup.lookup()
+            self.elapsed = time.perf_counter() - started
+            self.ip_ready.emit(ip)
+        except Exception as e:
+            self.elapsed = time.perf_counter() - started
+            self.lookup_failed.emit(str(e))
+
+
+class CoreThread(QThread):
+    #·核心事件循环线程，服务器控制器等 asyncio 组件都运行在这里，界面只是它的客户端。
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    def submit(self, coro):
+        """在核心线程中执行协程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    def call(self, callback, *args):
+        """在核心线程中调用普通函数"""
+        self.loop.call_soon_threadsafe(callback, *args)
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.wait()
+
+
+class ServerBridge(QObject):
+    #·把核心线程中控制器的回调转换为Qt信号，界面线程只取完整的行。
+    lines_available = pyqtSignal()
+    server_finished = pyqtSignal(int)
+    server_error = pyqtSignal(str)
+    server_event = pyqtSignal(str, str)
+    resources_sampled = pyqtSignal(dict)
+    backup_finished = pyqtSignal(bool, str)
+    properties_changed = pyqtSignal(str, dict)
+    verify_finished = pyqtSignal(str, str, str)
+    discovery_finished = pyqtSignal(str, list, str)
+    script_finished = pyqtSignal(str)
+    job_finished = pyqtSignal(str)
+    schedule_error = pyqtSignal(str)
+    logs_found = pyqtSignal(list, str)
+    players_changed = pyqtSignal(list)
+    players_ranked = pyqtSignal(list, str)
+    api_start = pyqtSignal()
+    api_state = pyqtSignal(bool, str)
+
+    def __init__(self, line_queue, log_store):
+        super().__init__()
+        self.line_queue = line_queue
+        self.log_store = log_store
+
+    def attach(self, monitor):
+        monitor.controller.add_output_listener(self.onOutput)
+        monitor.add_event_listener(lambda event, detail: self.onEvent(monitor, event, detail))
+        monitor.controller.add_stop_listener(self.onStopStage)
+
+    def attachPlayers(self, tracker):
+        tracker.add_listener(lambda event: self.onPlayerEvent(tracker, event))
+
+    def onPlayerEvent(self, tracker, event):
+        # 只有在线名单变化时才通知界面
+        if isinstance(event, (PlayerConnected, PlayerDisconnected, ServerStarted)):
+            self.players_changed.emit(tracker.index.online())
+
+    def onOutput(self, lines, source):
+        # 日志存储只是把行放入队列，由它自己的线程写入磁盘
+        self.log_store.write(lines, source)
+        # 队列由空变为非空时才通知界面，避免信号风暴
+        if self.line_queue.put_many(lines, source):
+            self.lines_available.emit()
+
+    def onEvent(self, monitor, event, detail):
+        self.server_event.emit(event, describe_event(event, detail))
+        # 只有不再自动重启时才算真正结束
+        if event in (EVENT_EXITED, EVENT_CRASH_LOOP):
+            exit_code = monitor.metrics.last_exit_code
+            self.server_finished.emit(exit_code if exit_code is not None else -1)
+
+    def onStopStage(self, stage, detail):
+        # 退出由监控事件报告
+        if stage != STOP_EXITED:
+            self.server_event.emit(stage, describe_stop_stage(stage, detail))
+
+    def onSample(self, key, values):
+        self.resources_sampled.emit(values)
+
+    def onPropertiesChanged(self, path, changes):
+        # 配置可能在核心线程中被重新读取，通过信号转到界面线程
+        self.properties_changed.emit(path, changes)
+
+    def reportVerify(self, version, future):
+        # 没有清单等无法校验的情况不改变版本状态
+        error = future.exception()
+        if error is None:
+            result = future.result()
+            self.verify_finished.emit(version, STATE_VERIFIED if result.ok else STATE_FAILED, str(result))
+        else:
+            self.verify_finished.emit(version, "", str(error))
+
+    def reportDiscovery(self, query, future):
+        error = future.exception()
+        if error is None:
+            self.discovery_finished.emit(query, future.result(), "")
+        else:
+            self.discovery_finished.emit(query, [], str(error))
+
+    def reportScript(self, name, started, future):
+        error = future.exception()
+        if error is not None:
+            self.script_finished.emit(f"脚本 {name} 执行失败: {error}")
+            return
+        results = future.result()
+        failed = [r for r in results if isinstance(r, Exception)]
+        message = f"脚本 {name} 执行完成：{len(results) - len(failed)}/{len(results)} 条命令已发送，用时 {time.perf_counter() - started:.1f} 秒"
+        if failed:
+            message += f"，{len(failed)} 条失败: {failed[0]}"
+        self.script_finished.emit(message)
+
+    def onJobFinished(self, job, result, error):
+        # 定时任务在核心线程中运行
+        self.job_finished.emit(f"定时任务 {job.describe()} 失败: {error}" if error else f"定时任务 {job.describe()}: {result}")
+
+    def reportLogSearch(self, started, future):
+        error = future.exception()
+        if error is not None:
+            self.logs_found.emit([], f"查询失败: {error}")
+            return
+        records = future.result()
+        self.logs_found.emit([format_record(r) for r in records],
+                             f"找到 {len(records)} 条，用时 {(time.perf_counter() - started) * 1000:.0f} 毫秒")
+
+    def reportPlayerRanking(self, future):
+        error = future.exception()
+        if error is not None:
+            self.players_ranked.emit([], f"查询失败: {error}")
+            return
+        ranking = future.result()
+        self.players_ranked.emit(ranking, f"共 {len(ranking)} 名玩家" if ranking else "还没有玩家记录")
+
+    def reportApi(self, server, future):
+        error = future.exception()
+        if error is None:
+            self.api_state.emit(True, f"控制接口已开启: {server.url}/api/servers")
+        else:
+            self.api_state.emit(False, f"控制接口开启失败: {error}")
+
+    def reportBackup(self, future):
+        error = future.exception()
+        if error is None:
+            self.backup_finished.emit(True, str(future.result()))
+        else:
+            self.backup_finished.emit(False, str(error))
+
+    def reportStop(self, future):
+        # 停止过程本身出错时也要结束等待，否则关闭窗口会一直等下去
+        error = future.exception()
+        if error is not None:
+            self.server_event.emit("stop_failed", f"停止服务器失败: {error}")
+            self.server_finished.emit(-1)
+
+    def reportFailure(self, future):
+        """核心线程中的操作失败时通知界面"""
+        error = future.exception()
+        if error is not None:
+            self.server_error.emit(str(error))
+
+
+class GuiServerHandle(ServerHandle):
+    #·控制接口中的服务器：启动经由界面线程，与点击“启动服务器”相同；停止和重启直接使用当前的监控器，
+    #·界面随监控事件更新。
+    def __init__(self, bridge):
+        super().__init__(DEFAULT_SERVER)
+        self.bridge = bridge
+
+    async def start(self):
+        self.bridge.api_start.emit()
+        # 等界面创建并启动新的控制器（最多 5 秒），返回的状态才是启动后的
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if self.running:
+                break
+
+
+class ConsoleHighlighter(QSyntaxHighlighter):
+    #·按级别给控制台行着色并标出筛选正则的匹配，Qt只对新加入的行调用highlightBlock。
+    def __init__(self, document):
+        super().__init__(document)
+        self.pattern = None
+        self.level_formats = {}
+        for level, color in ((LEVEL_WARN, "#e1a100"), (LEVEL_ERROR, "#ff4757")):
+            fmt = QTextCharFormat()
+            fmt.setForeground(QColor(color))
+            self.level_formats[level] = fmt
+        self.match_color = QColor("#fff3a0")
+
+    def highlightBlock(self, text):
+        # 块状态中记录了按来源判断的级别（见ConsoleView.markLevels），没有记录时按文字判断
+        state = self.currentBlockState()
+        level = LEVELS[state] if 0 <= state < len(LEVELS) else classify_level(text)
+        fmt = self.level_formats.get(level)
+        if fmt is not None:
+            self.setFormat(0, len(text), fmt)
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text):
+                if match.end() > match.start():
+                    fmt = QTextCharFormat(self.format(match.start()))
+                    fmt.setBackground(self.match_color)
+                    self.setFormat(match.start(), match.end() - match.start(), fmt)
+
+
+class ConsoleView(QPlainTextEdit):
+    #·控制台视图，由定时器合并刷新缓冲区中的新行，最多保留固定行数。
+    #·全部行始终追加在full_document中；设置筛选条件时只把匹配的行放入filtered_document并切换过去，
+    #·之后新到的行只筛选新行，清除筛选时直接切换回full_document，不需要重建。
+    def __init__(self, buffer, flush_interval=50, parent=None):
+        super().__init__(parent)
+        self.buffer = buffer
+        self.filter = None
+        # 文档没有父对象，切换文档时不会被删除
+        self.full_document = self.createDocument()
+        self.filtered_document = self.createDocument()
+        self.full_highlighter = ConsoleHighlighter(self.full_document)
+        self.filtered_highlighter = ConsoleHighlighter(self.filtered_document)
+        self.setDocument(self.full_document)
+        self.setReadOnly(True)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(flush_interval)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def createDocument(self):
+        document = QTextDocument()
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setUndoRedoEnabled(False)
+        # 超出行数上限时Qt会自动丢弃最旧的行
+        document.setMaximumBlockCount(self.buffer.max_lines)
+        return document
+
+    def setMaxLines(self, max_lines):
+        """修改保留的最大行数"""
+        self.buffer.set_max_lines(max_lines)
+        self.full_document.setMaximumBlockCount(self.buffer.max_lines)
+        self.filtered_document.setMaximumBlockCount(self.buffer.max_lines)
+
+    def scheduleFlush(self):
+        """安排一次刷新，定时器触发前到达的行会合并到同一批"""
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def setFilter(self, console_filter):
+        """更换筛选条件（None 显示全部）"""
+        # 先把待刷新的行加入文档，重建筛选视图时就不会重复
+        self.flush()
+        self.filter = console_filter if console_filter is not None and console_filter.active else None
+        if self.filter is None:
+            self.setDocument(self.full_document)
+            self.filtered_document.clear()
+        else:
+            lines = self.filter.apply(self.buffer.records())[-self.buffer.max_lines:]
+            self.filtered_highlighter.pattern = self.filter.pattern
+            self.filtered_document.setPlainText("\n".join(line.text for line in lines))
+            self.markLevels(self.filtered_document, self.filtered_highlighter, lines)
+            self.setDocument(self.filtered_document)
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    @staticmethod
+    def appendLines(document, lines):
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        text = "\n".join(line.text for line in lines)
+        cursor.insertText(text if document.isEmpty() else "\n" + text)
+
+    @staticmethod
+    def markLevels(document, highlighter, lines):
+        """lines为文档末尾的行；没有级别标记的标准错误行按ERROR着色，与筛选栏的判断一致"""
+        stderr = [i for i, line in enumerate(lines) if line.source == "stderr"]
+        if not stderr:
+            return
+        block = document.lastBlock()
+        for i in range(len(lines) - 1, stderr[0] - 1, -1):
+            if not block.isValid():
+                break  # 超出行数上限，较早的行已被丢弃
+            if lines[i].source == "stderr":
+                block.setUserState(LEVELS.index(lines[i].level))
+                highlighter.rehighlightBlock(block)
+            block = block.previous()
+
+    def flush(self):
+        """把缓冲区中的新行一次性追加到视图"""
+        lines = self.buffer.drain()
+        if not lines:
+            return
+        scrollbar = self.verticalScrollBar()
+        # 只有用户停留在底部时才自动滚动，翻看历史时不打扰
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        position = scrollbar.value()
+        self.appendLines(self.full_document, lines)
+        self.markLevels(self.full_document, self.full_highlighter, lines)
+        if self.filter is not None:
+            lines = self.filter.apply(lines)
+            if lines:
+                self.appendLines(self.filtered_document, lines)
+                self.markLevels(self.filtered_document, self.filtered_highlighter, lines)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+        else:
+            scrollbar.setValue(min(position, scrollbar.maximum()))
+
+
+class Sparkline(QWidget):
+    #·迷你曲线图，数据更新时只重绘自身。
+    def __init__(self, series, color="#1e90ff", parent=None):
+        super().__init__(parent)
+        self.series = series
+        self.color = QColor(color)
+        self.setMinimumSize(120, 24)
+        self.setMaximumHeight(28)
+        # 自己填充背景，省去Qt的擦除
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#0f3460"))
+        values = self.series.values()
+        if len(values) >= 2:
+            top = max(values) or 1.0
+            width, height = self.width() - 1, self.height() - 2
+            step = width / (self.series.capacity - 1)
+            left = width - step * (len(values) - 1)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(QPen(self.color, 1.5))
+            painter.drawPolyline(QPolygonF([
+                QPointF(left + i * step, 1 + height - value / top * height)
+                for i, value in enumerate(values)]))
+        painter.end()
 
 
 class MCServerManager(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.server_process = None
+        self.startup_timer = StartupTimer(STARTUP_T0)
+        self.startup_timer.mark("导入模块")
+        self.server_running = False
+        self.controller = None
+        self.monitor = None
+        self.commands = None
+        self.players = None  # 当前服务器的在线玩家和会话历史
+        self.api_server = None  # 本机控制接口，开启后其他程序可以启停服务器、查看控制台
+        self.closing = False  # 关闭窗口时正在等待服务器停止
         self.server_dir = "lib"
         self.selected_version = ""
         self.properties_file = ""
+        self.version_catalog = None
+        self.version_discovery = None
+        self.pending_download = None  # 确认存在后要下载的版本
+        # 控制台收到的所有内容都写入 logs/console，可以按时间和文字查询
+        self.log_store = LogStore(os.path.join(LOGS_DIR, "console"))
+        self.ip_lookup = PublicIPLookup(os.path.join(self.server_dir, ".cache", "public_ip.json"))
         self.initUI()
+        self.initCore()
+        self.startup_timer.mark("创建界面")
+        # 先显示上次缓存的公网IP，磁盘扫描和网络请求都放到窗口显示之后
+        self.showCachedPublicIP()
+        QTimer.singleShot(0, self.deferredStartup)
+    
+    def deferredStartup(self):
+        """窗口首次显示后再执行的启动工作"""
+        self.startup_timer.mark("首次绘制")
+        # 先读取定时任务，选中版本时才能列出该版本的任务
+        self.scheduler.load()
+        self.core.call(self.scheduler.start)
+        self.startup_timer.mark("读取定时任务")
         self.loadAvailableVersions()
+        self.startup_timer.mark("扫描版本")
         self.loadProperties()
+        self.startup_timer.mark("读取配置")
         # 获取并显示公网IP
         self.updatePublicIP()
         
+    def initCore(self):
+        """启动核心事件循环线程"""
+        self.output_queue = LineQueue()
+        self.core = CoreThread(self)
+        self.server_bridge = ServerBridge(self.output_queue, self.log_store)
+        self.server_bridge.lines_available.connect(self.readServerOutput)
+        self.server_bridge.server_finished.connect(self.serverFinished)
+        self.server_bridge.server_error.connect(self.serverError)
+        self.server_bridge.server_event.connect(self.serverEvent)
+        self.server_bridge.resources_sampled.connect(self.resourcesSampled)
+        self.server_bridge.backup_finished.connect(self.backupFinished)
+        self.server_bridge.properties_changed.connect(self.propertiesChanged)
+        self.server_bridge.verify_finished.connect(self.verifyFinished)
+        self.server_bridge.discovery_finished.connect(self.discoveryFinished)
+        self.server_bridge.script_finished.connect(self.log)
+        self.server_bridge.job_finished.connect(self.jobFinished)
+        self.server_bridge.schedule_error.connect(self.log)
+        self.server_bridge.logs_found.connect(self.logsFound)
+        self.server_bridge.players_changed.connect(self.playersChanged)
+        self.server_bridge.players_ranked.connect(self.playersRanked)
+        self.server_bridge.api_start.connect(self.startServer)
+        self.server_bridge.api_state.connect(self.apiStateChanged)
+        self.api_handle = GuiServerHandle(self.server_bridge)
+        add_change_listener(self.server_bridge.onPropertiesChanged)
+        self.core.start()
+        self.sampler = ResourceSampler(interval=self.sample_interval.value())
+        self.sampler.add_listener(self.server_bridge.onSample)
+        self.core.call(self.sampler.start)
+        # 定时任务按版本保存在 lib/schedule.json，调度在核心线程中运行
+        self.scheduler = Scheduler(os.path.join(self.server_dir, SCHEDULE_FILE), runner=self.runScheduledJob)
+        self.scheduler.add_listener(self.server_bridge.onJobFinished)
+        # 任务文件有问题时（可能在核心线程中重新读取）显示在控制台
+        self.scheduler.add_error_listener(self.server_bridge.schedule_error.emit)
+    
+    def closeEvent(self, event):
+        """关闭窗口时停止服务器并结束核心线程"""
+        if self.server_running:
+            # 先在核心线程中逐级停止服务器，界面保持响应并在控制台显示各阶段，
+            # 停止完成后由 serverFinished 再次关闭窗口
+            if not self.closing:
+                self.closing = True
+                self.core.call(self.scheduler.stop)
+                self.log("正在停止服务器，停止后自动关闭窗口...")
+                # 关闭窗口时缩短等待时间，超时后依次终止、强制结束
+                self.beginStop(timeout=10)
+            event.ignore()
+            return
+        if self.api_server is not None:
+            try:
+                self.core.submit(self.api_server.close()).result(5)
+            except Exception:
+                pass
+        self.core.call(self.scheduler.stop)
+        self.core.shutdown()
+        self.log_store.close()
+        if self.players is not None:
+            self.players.close()
+        super().closeEvent(event)
+        
     def loadAvailableVersions(self):
         """加载可用的服务器版本"""
+        # 版本目录没有变化时直接使用 lib/.cache 中的索引，不遍历目录树
+        if self.version_catalog is None or self.version_catalog.lib_dir != self.server_dir:
+            self.version_catalog = VersionCatalog(self.server_dir)
+        self.version_catalog.refresh()
+        previous = self.selected_version or self.version_catalog.last_used()
         self.version_combo.clear()
-        if os.path.exists(self.server_dir):
-            versions = [d for d in os.listdir(self.server_dir) if os.path.isdir(os.path.join(self.server_dir, d))]
-            for version in versions:
-                self.version_combo.addItem(version)
-            if versions and not self.selected_version:
-                self.selected_version = versions[0]
-                self.version_combo.setCurrentText(self.selected_version)
-                self.updatePropertiesFile()
+        versions = self.version_catalog.versions()
+        for version in versions:
+            self.version_combo.addItem(version)
+            self.markVersionItem(self.version_combo.count() - 1, self.version_catalog.get(version)["state"])
+        if previous in versions:
+            self.version_combo.setCurrentText(previous)
+        broken = [v for v in self.version_catalog.versions(include_broken=True) if v not in versions]
+        if broken:
+            self.log(f"以下版本不完整（缺少{SERVER_EXECUTABLE}），已跳过: {', '.join(broken)}")
+        failed = [v for v in versions if self.version_catalog.get(v)["state"] == STATE_FAILED]
+        if failed:
+            self.log(f"以下版本上次校验失败，修复文件后可以点击“校验文件”重新校验: {', '.join(failed)}")
+
+    def markVersionItem(self, index, state):
+        """校验失败的版本在下拉列表中显示为橙色并带有提示，校验通过后恢复"""
+        failed = state == STATE_FAILED
+        self.version_combo.setItemData(index, QColor("#e1a100") if failed else None, Qt.ForegroundRole)
+        self.version_combo.setItemData(index, "上次校验失败，文件可能缺失或损坏" if failed else None, Qt.ToolTipRole)
         
     def updatePropertiesFile(self):
         """更新属性文件路径"""
@@ -240,7 +651,7 @@ class MCServerManager(QMainWindow):
                 color: #ffffff;
                 font-size: 12pt;
             }
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #0f3460;
                 color: #ffffff;
                 border: 1px solid #16537e;
@@ -280,6 +691,8 @@ class MCServerManager(QMainWindow):
         self.createServerTab()
         self.createConfigTab()
         self.createConsoleTab()
+        self.createHistoryTab()
+        self.createPlayersTab()
         
         control_layout = QHBoxLayout()
         self.start_btn = QPushButton("启动服务器")
@@ -295,6 +708,10 @@ class MCServerManager(QMainWindow):
         self.save_btn.clicked.connect(self.saveProperties)
         control_layout.addWidget(self.save_btn)
         
+        self.backup_btn = QPushButton("备份存档")
+        self.backup_btn.clicked.connect(self.backupWorld)
+        control_layout.addWidget(self.backup_btn)
+        
         main_layout.addLayout(control_layout)
     
     def createServerTab(self):
@@ -311,15 +728,29 @@ class MCServerManager(QMainWindow):
         self.version_combo.currentTextChanged.connect(self.onVersionChanged)
         version_layout.addWidget(self.version_combo, 0, 1)
         
+        self.verify_btn = QPushButton("校验文件")
+        self.verify_btn.clicked.connect(self.verifyVersion)
+        version_layout.addWidget(self.verify_btn, 0, 2)
+        
         # 下载新版本
         version_layout.addWidget(QLabel("输入版本号下载:"), 1, 0)
         self.version_input = QLineEdit()
-        self.version_input.setPlaceholderText("例如: 1.26.0.25")
+        self.version_input.setPlaceholderText("例如: 1.26.0.25，查找时可用 1.26.0.* 或 1.26.0-10.*")
+        # 查找到的版本作为输入提示
+        self.version_suggestions = QStringListModel(self)
+        completer = QCompleter(self.version_suggestions, self.version_input)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.version_input.setCompleter(completer)
         version_layout.addWidget(self.version_input, 1, 1)
         
+        download_buttons = QHBoxLayout()
+        self.discover_btn = QPushButton("查找版本")
+        self.discover_btn.clicked.connect(self.discoverVersions)
+        download_buttons.addWidget(self.discover_btn)
         self.download_btn = QPushButton("下载版本")
         self.download_btn.clicked.connect(self.downloadVersion)
-        version_layout.addWidget(self.download_btn, 1, 2)
+        download_buttons.addWidget(self.download_btn)
+        version_layout.addLayout(download_buttons, 1, 2)
         
         # 下载进度条
         self.progress_bar = QProgressBar()
@@ -383,6 +814,57 @@ class MCServerManager(QMainWindow):
         self.port_label = QLabel(str(self.server_port.value()))
         status_layout.addWidget(self.port_label, 1, 1)
         
+        self.auto_restart = QCheckBox("崩溃自动重启")
+        self.auto_restart.setChecked(True)
+        self.auto_restart.toggled.connect(self.toggleAutoRestart)
+        status_layout.addWidget(self.auto_restart, 1, 2)
+        
+        status_layout.addWidget(QLabel("启动耗时:"), 2, 0)
+        self.ready_label = QLabel("-")
+        status_layout.addWidget(self.ready_label, 2, 1)
+        
+        status_layout.addWidget(QLabel("自动重启:"), 2, 2)
+        self.restart_label = QLabel("0 次")
+        status_layout.addWidget(self.restart_label, 2, 3)
+        
+        self.sample_interval = QSpinBox()
+        self.sample_interval.setRange(1, 60)
+        self.sample_interval.setValue(2)
+        self.sample_interval.setPrefix("采样间隔 ")
+        self.sample_interval.setSuffix(" 秒")
+        self.sample_interval.valueChanged.connect(self.setSampleInterval)
+        status_layout.addWidget(self.sample_interval, 1, 3)
+        
+        # 资源占用：当前值和最近一段时间的曲线
+        self.metric_series = {}
+        self.metric_labels = {}
+        self.sparklines = {}
+        for row, (name, title, color) in enumerate((
+                (CPU, "CPU:", "#ff6348"),
+                (RSS, "内存:", "#1e90ff"),
+                (THREADS, "线程:", "#a4b0be"),
+                ("disk", "磁盘I/O:", "#ffa502"),
+                ("net", "网络:", "#2ed573")), start=3):
+            self.metric_series[name] = TimeSeries(120)
+            self.metric_labels[name] = QLabel("-")
+            self.sparklines[name] = Sparkline(self.metric_series[name], color)
+            status_layout.addWidget(QLabel(title), row, 0)
+            status_layout.addWidget(self.metric_labels[name], row, 1)
+            status_layout.addWidget(self.sparklines[name], row, 2, 1, 2)
+        
+        # 本机控制接口：其他程序通过 HTTP / WebSocket 启停服务器、发送命令、查看控制台
+        self.api_enabled = QCheckBox("控制接口")
+        self.api_enabled.toggled.connect(self.toggleApi)
+        status_layout.addWidget(self.api_enabled, 8, 0)
+        self.api_port = QSpinBox()
+        self.api_port.setRange(1024, 65535)
+        self.api_port.setValue(API_PORT)
+        self.api_port.setPrefix("端口 ")
+        status_layout.addWidget(self.api_port, 8, 1)
+        self.api_label = QLabel("未开启（只允许本机访问）")
+        self.api_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        status_layout.addWidget(self.api_label, 8, 2, 1, 2)
+        
         layout.addWidget(status_group)
         
         # 服务器设置组
@@ -413,6 +895,8 @@ class MCServerManager(QMainWindow):
         self.selected_version = version
         self.updatePropertiesFile()
         self.loadProperties()
+        self.loadJobs()
+        self.refreshPlayerRanking()
     
     def onPortChanged(self, port):
         """端口变化时更新显示"""
@@ -438,6 +922,61 @@ class MCServerManager(QMainWindow):
             self.loadAvailableVersions()
             return
         
+        # 先用 HEAD 请求确认版本存在，不存在时给出相近的版本，避免一次失败的完整下载
+        self.pending_download = version
+        self.download_btn.setEnabled(False)
+        self.log(f"正在确认版本 {version} 是否存在...")
+        self.runDiscovery(version, self.discovery().check(version))
+    
+    def discovery(self):
+        """当前 lib 目录的版本查找服务（结果缓存在 lib/.cache/discovery.json）"""
+        cache_path = os.path.join(self.server_dir, DISCOVERY_CACHE)
+        if self.version_discovery is None or self.version_discovery.cache_path != cache_path:
+            self.version_discovery = VersionDiscovery.for_lib(self.server_dir)
+        return self.version_discovery
+    
+    def runDiscovery(self, query, coro):
+        self.discover_btn.setEnabled(False)
+        self.core.submit(coro).add_done_callback(lambda f: self.server_bridge.reportDiscovery(query, f))
+    
+    def discoverVersions(self):
+        """按输入的版本模式查找存在的版本"""
+        pattern = self.version_input.text().strip()
+        if not pattern:
+            QMessageBox.warning(self, "错误", "请输入版本号或版本模式，例如：1.26.0.*")
+            return
+        # 不足四段时补 *，例如 1.26.0 查找 1.26.0.*
+        pattern += ".*" * max(0, 4 - len(pattern.split(".")))
+        self.log(f"正在查找版本 {pattern}...")
+        self.runDiscovery(pattern, self.discovery().discover(pattern))
+    
+    def discoveryFinished(self, query, found, error):
+        """查找结束：确认下载的版本存在时开始下载，否则把找到的版本作为提示"""
+        self.discover_btn.setEnabled(True)
+        version = self.pending_download if query == self.pending_download else None
+        self.pending_download = None
+        if error:
+            self.log(f"查找版本失败: {error}")
+            if version:
+                # 无法确认时照常下载，由下载本身报告错误
+                self.startDownload(version)
+            return
+        if version and found and found[0][0] == version:
+            self.startDownload(version)
+            return
+        if version:
+            self.download_btn.setEnabled(True)
+            self.log(f"版本 {version} 不存在" + (f"，{neighbor_pattern(version)} 中存在以下版本:" if found else "，也没有找到相近的版本"))
+        else:
+            self.log(f"{query} 中存在以下版本:" if found else f"{query} 中没有找到存在的版本")
+        for name, size in found:
+            installed = "（已安装）" if os.path.isdir(os.path.join(self.server_dir, name)) else ""
+            self.log(f"  {name}  {format_bytes(size)}{installed}")
+        self.version_suggestions.setStringList([name for name, _ in found])
+        if found:
+            self.version_input.completer().complete()
+    
+    def startDownload(self, version):
         # 创建lib目录（如果不存在）
         os.makedirs(self.server_dir, exist_ok=True)
         
@@ -470,17 +1009,36 @@ class MCServerManager(QMainWindow):
         else:
             QMessageBox.warning(self, "失败", f"版本下载失败：{message}")
     
+    def showCachedPublicIP(self):
+        """显示缓存的公网IP"""
+        cached = self.ip_lookup.cached()
+        if cached:
+            self.ip_label.setText(cached[0])
+    
     def updatePublicIP(self):
-        """获取并更新公网IP"""
-        try:
-            # 使用ipinfo.io获取公网IP
-            with urllib.request.urlopen('https://ipinfo.io/ip') as response:
-                public_ip = response.read().decode().strip()
-                self.ip_label.setText(public_ip)
-        except Exception as e:
-            # 如果获取失败，显示错误信息并使用默认值
-            self.log(f"获取公网IP失败: {str(e)}")
+        """在后台获取并更新公网IP"""
+        if self.ip_lookup.is_fresh():
+            self.log(self.startup_timer.report())
+            return
+        self.ip_thread = PublicIPThread(self.ip_lookup)
+        self.ip_thread.ip_ready.connect(self.publicIPReady)
+        self.ip_thread.lookup_failed.connect(self.publicIPFailed)
+        self.ip_thread.start()
+    
+    def publicIPReady(self, public_ip):
+        """公网IP查询成功"""
+        self.ip_label.setText(public_ip)
+        self.startup_timer.record("公网IP", self.ip_thread.elapsed)
+        self.log(self.startup_timer.report())
+    
+    def publicIPFailed(self, message):
+        """公网IP查询失败"""
+        # 如果获取失败，显示错误信息；有缓存时继续显示上次的IP
+        self.log(f"获取公网IP失败: {message}")
+        if not self.ip_lookup.cached():
             self.ip_label.setText("127.0.0.1 (获取公网IP失败)")
+        self.startup_timer.record("公网IP", self.ip_thread.elapsed)
+        self.log(self.startup_timer.report())
     
     def createConfigTab(self):
         config_tab = QWidget()
@@ -553,9 +1111,47 @@ class MCServerManager(QMainWindow):
         layout = QVBoxLayout(console_tab)
         
         
-        self.console_output = QTextEdit()
-        self.console_output.setReadOnly(True)
-        self.console_output.setLineWrapMode(QTextEdit.NoWrap)
+        # 控制台行数上限
+        limit_layout = QHBoxLayout()
+        limit_layout.addWidget(QLabel("保留行数:"))
+        self.console_max_lines = QSpinBox()
+        self.console_max_lines.setRange(500, 200000)
+        self.console_max_lines.setSingleStep(1000)
+        self.console_max_lines.setValue(DEFAULT_MAX_LINES)
+        limit_layout.addWidget(self.console_max_lines)
+        limit_layout.addStretch()
+        layout.addLayout(limit_layout)
+        
+        # 筛选栏：输入停顿后才重建视图，之后新到的行只筛选新行
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("筛选:"))
+        self.console_filter_input = QLineEdit()
+        self.console_filter_input.setPlaceholderText("正则表达式（不区分大小写）")
+        filter_layout.addWidget(self.console_filter_input, 1)
+        self.console_filter_timer = QTimer(self)
+        self.console_filter_timer.setSingleShot(True)
+        self.console_filter_timer.setInterval(200)
+        self.console_filter_timer.timeout.connect(self.applyConsoleFilter)
+        self.console_filter_input.textChanged.connect(self.console_filter_timer.start)
+        self.console_level_checks = {}
+        for level in LEVELS:
+            box = QCheckBox(level)
+            box.setChecked(True)
+            box.toggled.connect(self.applyConsoleFilter)
+            filter_layout.addWidget(box)
+            self.console_level_checks[level] = box
+        self.console_source_checks = {}
+        for source, label in zip(SOURCES, ("服务器输出", "错误输出", "管理器")):
+            box = QCheckBox(label)
+            box.setChecked(True)
+            box.toggled.connect(self.applyConsoleFilter)
+            filter_layout.addWidget(box)
+            self.console_source_checks[source] = box
+        layout.addLayout(filter_layout)
+        
+        self.console_buffer = ConsoleBuffer(DEFAULT_MAX_LINES)
+        self.console_output = ConsoleView(self.console_buffer)
+        self.console_max_lines.valueChanged.connect(self.console_output.setMaxLines)
         layout.addWidget(self.console_output)
         
         
@@ -568,23 +1164,115 @@ class MCServerManager(QMainWindow):
         self.cmd_btn.clicked.connect(self.sendCommand)
         cmd_layout.addWidget(self.cmd_btn)
         
+        self.script_btn = QPushButton("执行脚本")
+        self.script_btn.setToolTip("每行一条命令，按速率排队发送，# 开头的行为注释")
+        self.script_btn.clicked.connect(self.runScript)
+        cmd_layout.addWidget(self.script_btn)
+        
         layout.addLayout(cmd_layout)
         
         self.tab_widget.addTab(console_tab, "控制台")
+        
+        # 定时任务
+        schedule_tab = QWidget()
+        layout = QVBoxLayout(schedule_tab)
+        layout.addWidget(QLabel("当前版本的定时任务（管理器运行期间执行，错过的运行在下次启动时补一次）:"))
+        self.schedule_list = QListWidget()
+        layout.addWidget(self.schedule_list)
+        
+        job_layout = QHBoxLayout()
+        self.job_trigger = QLineEdit()
+        self.job_trigger.setPlaceholderText("0 4 * * *（分 时 日 月 星期）或 every 30m")
+        job_layout.addWidget(self.job_trigger, 2)
+        self.job_action = QComboBox()
+        for label, action in (("发送命令", ACTION_COMMAND), ("重启服务器", ACTION_RESTART), ("备份存档", ACTION_BACKUP)):
+            self.job_action.addItem(label, action)
+        job_layout.addWidget(self.job_action)
+        self.job_argument = QLineEdit()
+        self.job_argument.setPlaceholderText("命令，或备份保留的快照数")
+        job_layout.addWidget(self.job_argument, 2)
+        self.job_add_btn = QPushButton("添加任务")
+        self.job_add_btn.clicked.connect(self.addJob)
+        job_layout.addWidget(self.job_add_btn)
+        layout.addLayout(job_layout)
+        
+        job_buttons = QHBoxLayout()
+        self.job_toggle_btn = QPushButton("启用/停用")
+        self.job_toggle_btn.clicked.connect(self.toggleJob)
+        job_buttons.addWidget(self.job_toggle_btn)
+        self.job_remove_btn = QPushButton("删除任务")
+        self.job_remove_btn.clicked.connect(self.removeJob)
+        job_buttons.addWidget(self.job_remove_btn)
+        job_buttons.addStretch()
+        layout.addLayout(job_buttons)
+        
+        self.tab_widget.addTab(schedule_tab, "定时任务")
+    
+    def createHistoryTab(self):
+        history_tab = QWidget()
+        layout = QVBoxLayout(history_tab)
+        
+        search_layout = QHBoxLayout()
+        self.history_query = QLineEdit()
+        self.history_query.setPlaceholderText("要查找的文字（不区分大小写），留空显示该时间段的全部内容")
+        self.history_query.returnPressed.connect(self.searchLogs)
+        search_layout.addWidget(self.history_query, 3)
+        self.history_range = QComboBox()
+        for label, seconds in (("最近1小时", 3600), ("最近24小时", 86400), ("最近7天", 7 * 86400), ("全部", 0)):
+            self.history_range.addItem(label, seconds)
+        self.history_range.setCurrentIndex(1)
+        search_layout.addWidget(self.history_range)
+        self.history_regex = QCheckBox("正则表达式")
+        search_layout.addWidget(self.history_regex)
+        self.history_btn = QPushButton("搜索")
+        self.history_btn.clicked.connect(self.searchLogs)
+        search_layout.addWidget(self.history_btn)
+        layout.addLayout(search_layout)
+        
+        self.history_status = QLabel("")
+        layout.addWidget(self.history_status)
+        self.history_output = QPlainTextEdit()
+        self.history_output.setReadOnly(True)
+        layout.addWidget(self.history_output)
+        
+        self.tab_widget.addTab(history_tab, "历史日志")
+    
+    def createPlayersTab(self):
+        players_tab = QWidget()
+        layout = QHBoxLayout(players_tab)
+        
+        online_layout = QVBoxLayout()
+        self.online_label = QLabel("在线玩家 (0)")
+        online_layout.addWidget(self.online_label)
+        self.online_list = QListWidget()
+        online_layout.addWidget(self.online_list)
+        layout.addLayout(online_layout, 1)
+        
+        ranking_layout = QVBoxLayout()
+        ranking_bar = QHBoxLayout()
+        ranking_bar.addWidget(QLabel("游戏时间排行:"))
+        self.ranking_range = QComboBox()
+        for label, seconds in (("全部", 0), ("最近7天", 7 * 86400), ("最近24小时", 86400)):
+            self.ranking_range.addItem(label, seconds)
+        self.ranking_range.currentIndexChanged.connect(self.refreshPlayerRanking)
+        ranking_bar.addWidget(self.ranking_range)
+        self.ranking_btn = QPushButton("刷新")
+        self.ranking_btn.clicked.connect(self.refreshPlayerRanking)
+        ranking_bar.addWidget(self.ranking_btn)
+        ranking_bar.addStretch()
+        ranking_layout.addLayout(ranking_bar)
+        self.ranking_status = QLabel("")
+        ranking_layout.addWidget(self.ranking_status)
+        self.ranking_list = QListWidget()
+        ranking_layout.addWidget(self.ranking_list)
+        layout.addLayout(ranking_layout, 2)
+        
+        self.tab_widget.addTab(players_tab, "玩家")
     
     def loadProperties(self):
         """Load server properties from file"""
-        if os.path.exists(self.properties_file):
-            with open(self.properties_file, 'r') as f:
-                lines = f.readlines()
-            
-            properties = {}
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    properties[key] = value
-            
+        properties = read_properties(self.properties_file)
+        if properties is not None:
             self.server_name.setText(properties.get('server-name', 'Dedicated Server'))
             
             # 游戏模式（英文转中文显示）
@@ -646,83 +1334,390 @@ class MCServerManager(QMainWindow):
             'chat-restriction': self.chat_restriction_map.get(self.chat_restriction.currentText(), 'None')
         }
         
-        with open(self.properties_file, 'w') as f:
-            for key, value in properties.items():
-                f.write(f"{key}={value}\n")
-        
-        self.log("配置已保存")
+        if write_properties(self.properties_file, properties):
+            self.log("配置已保存")
+        else:
+            self.log("配置没有变化")
+
+    def propertiesChanged(self, path, changes):
+        """配置文件变化（本程序保存或被外部修改）"""
+        if not self.properties_file or path != os.path.abspath(self.properties_file):
+            return
+        for key, (old, new) in sorted(changes.items()):
+            self.log(f"配置 {key}: {old if old is not None else '(无)'} → {new if new is not None else '(删除)'}")
+        # 外部修改时刷新界面；本程序保存时界面中的值本来就相同
+        self.loadProperties()
+        if self.server_running and needs_restart(changes):
+            self.log("修改的配置需要重启服务器后才会生效")
     
     def startServer(self):
         """Start the Minecraft server"""
+        if self.closing:
+            return  # 正在关闭窗口，不接受控制接口等的启动请求
         if not self.selected_version:
             self.log("请先选择服务器版本")
             return
         
-        if self.server_process is None or not self.server_process.state() == QProcess.Running:
-            server_exe = os.path.join(self.server_dir, self.selected_version, "bedrock_server.exe")
-            if os.path.exists(server_exe):
-                self.server_process = QProcess()
-                self.server_process.setWorkingDirectory(os.path.join(self.server_dir, self.selected_version))
-                self.server_process.readyReadStandardOutput.connect(self.readServerOutput)
-                self.server_process.readyReadStandardError.connect(self.readServerError)
-                self.server_process.finished.connect(self.serverFinished)
-                self.server_process.start(server_exe)
+        if not self.server_running:
+            version_dir = os.path.join(self.server_dir, self.selected_version)
+            if server_executable(version_dir):
+                self.server_running = True
+                self.version_catalog.touch(self.selected_version)
+                self.controller = ServerController(version_dir)
+                self.monitor = ServerMonitor(self.controller, auto_restart=self.auto_restart.isChecked())
+                self.commands = CommandQueue(self.controller)
+                if self.players is not None:
+                    self.players.close()
+                # 会话历史与该版本的日志放在一起：logs/versions/<版本>/sessions.db
+                self.players = PlayerTracker(os.path.join(LOGS_DIR, "versions", self.selected_version, SESSIONS_FILE))
+                self.players.attach(self.controller)
+                self.server_bridge.attach(self.monitor)
+                self.server_bridge.attachPlayers(self.players)
+                self.api_handle.bind(self.monitor, self.commands)
+                self.core.submit(self.verifiedStart(version_dir, self.monitor)).add_done_callback(
+                    self.server_bridge.reportFailure)
+                self.ready_label.setText("-")
+                self.restart_label.setText("0 次")
+                for name, series in self.metric_series.items():
+                    series.clear()
+                    self.metric_labels[name].setText("-")
+                    self.sparklines[name].update()
+                self.core.call(self.sampler.add, "server", self.controller)
                 self.start_btn.setEnabled(False)
                 self.stop_btn.setEnabled(True)
                 self.status_label.setText("在线")
                 self.status_label.setStyleSheet("color: #2ed573; font-weight: bold; font-size: 14pt;")
                 self.log(f"服务器 {self.selected_version} 已启动")
             else:
-                self.log(f"错误: 在 {self.selected_version} 目录中找不到bedrock_server.exe")
+                self.log(f"错误: 在 {self.selected_version} 目录中找不到{SERVER_EXECUTABLE}")
     
     def stopServer(self):
         """Stop the Minecraft server"""
-        if self.server_process and self.server_process.state() == QProcess.Running:
-            self.server_process.terminate()
-            if not self.server_process.waitForFinished(3000):
-                self.server_process.kill()
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
-            self.status_label.setText("离线")
-            self.status_label.setStyleSheet("color: #ff4757; font-weight: bold; font-size: 14pt;")
-            self.log("服务器已停止")
-    
-    def serverFinished(self, exitCode, exitStatus):
+        if self.server_running:
+            self.beginStop()
+
+    def beginStop(self, timeout=None):
+        """在核心线程中逐级停止（stop 命令→终止→强制结束），不阻塞界面，完成后由 serverFinished 更新状态"""
+        stop = self.monitor.stop() if timeout is None else self.monitor.stop(timeout=timeout)
+        self.core.submit(stop).add_done_callback(self.server_bridge.reportStop)
+        self.start_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+        self.status_label.setText("正在停止")
+        self.status_label.setStyleSheet("color: #ffa502; font-weight: bold; font-size: 14pt;")
+    
+    def serverFinished(self, exitCode):
         """Handle server finished"""
+        self.readServerOutput()
+        self.server_running = False
+        stats = self.controller.stats
+        dropped = self.output_queue.stats.lines_dropped
+        self.output_queue.stats.reset()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.status_label.setText("离线")
         self.status_label.setStyleSheet("color: #ff4757; font-weight: bold; font-size: 14pt;")
-        self.log(f"服务器已退出，退出码: {exitCode}")
+        self.log(f"本次读取 {stats.bytes_read} 字节 / {stats.lines_read} 行，丢弃 {dropped} 行")
+        self.playersChanged([])
+        if self.closing:
+            QTimer.singleShot(0, self.close)
+    
+    def serverEvent(self, event, message):
+        """Handle supervision and shutdown events"""
+        self.log(message)
+        if event == EVENT_READY:
+            self.ready_label.setText(f"{self.monitor.metrics.time_to_ready[-1]:.1f} 秒")
+        elif event == EVENT_CRASHED:
+            self.status_label.setText("重启中")
+            self.status_label.setStyleSheet("color: #ffa502; font-weight: bold; font-size: 14pt;")
+        elif event == EVENT_PLANNED_RESTART:
+            self.ready_label.setText("-")
+        elif event == EVENT_RESTARTED:
+            self.restart_label.setText(f"{self.monitor.metrics.restarts} 次")
+            self.status_label.setText("在线")
+            self.status_label.setStyleSheet("color: #2ed573; font-weight: bold; font-size: 14pt;")
+    
+    def loadJobs(self):
+        """显示当前版本的定时任务"""
+        self.schedule_list.clear()
+        for job in self.scheduler.jobs(self.selected_version):
+            if job.enabled:
+                state = "下次 " + time.strftime("%m-%d %H:%M:%S", time.localtime(job.next_run))
+            else:
+                state = "已停用"
+            item = QListWidgetItem(f"{job.describe()}    {state}")
+            item.setData(Qt.UserRole, job.id)
+            self.schedule_list.addItem(item)
+    
+    def addJob(self):
+        """为当前版本添加定时任务"""
+        if not self.selected_version:
+            self.log("请先选择服务器版本")
+            return
+        try:
+            job = self.scheduler.add(self.selected_version, self.job_trigger.text(),
+                                     self.job_action.currentData(), self.job_argument.text().strip())
+        except ScheduleError as e:
+            QMessageBox.warning(self, "错误", str(e))
+            return
+        self.log(f"已添加定时任务 {job.describe()}")
+        self.job_trigger.clear()
+        self.job_argument.clear()
+        self.loadJobs()
+    
+    def selectedJob(self):
+        item = self.schedule_list.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+    
+    def toggleJob(self):
+        job_id = self.selectedJob()
+        if job_id is not None:
+            self.scheduler.set_enabled(job_id, not self.scheduler.get(job_id).enabled)
+            self.loadJobs()
+    
+    def removeJob(self):
+        job_id = self.selectedJob()
+        if job_id is not None:
+            self.scheduler.remove(job_id)
+            self.loadJobs()
+    
+    def jobFinished(self, message):
+        self.log(message)
+        self.loadJobs()
+    
+    async def runScheduledJob(self, job):
+        # 在核心线程中执行定时任务；只有当前运行的版本才能发送命令和重启
+        version_dir = os.path.join(self.server_dir, job.instance)
+        controller = self.controller
+        running = (controller is not None and controller.running
+                   and os.path.abspath(controller.working_dir) == os.path.abspath(version_dir))
+        if job.action == ACTION_BACKUP:
+            store = SnapshotStore(os.path.join(BACKUPS_DIR, "versions", job.instance))
+            result = await backup_server(controller if running else ServerController(version_dir), store)
+            if job.argument:
+                await asyncio.to_thread(store.prune, int(job.argument))
+            return f"备份完成，{result}"
+        if not running:
+            raise ControllerError(f"服务器 {job.instance} 未运行")
+        if job.action == ACTION_RESTART:
+            await self.monitor.restart()
+            return "已重启"
+        await self.commands.run(job.argument)
+        return f"已发送 {job.argument}"
+    
+    @staticmethod
+    async def verifiedStart(version_dir, monitor):
+        # 在核心线程中执行：先快速校验文件（只比较大小和修改时间），再启动
+        await verify_before_start(version_dir)
+        await monitor.start()
+
+    def searchLogs(self):
+        """在后台线程中查询历史日志，最多显示最新的 500 条"""
+        seconds = self.history_range.currentData()
+        since = time.time() - seconds if seconds else None
+        self.history_btn.setEnabled(False)
+        self.history_status.setText("正在查询...")
+        started = time.perf_counter()
+        future = self.core.submit(asyncio.to_thread(
+            self.log_store.search, self.history_query.text(), since, None, None, self.history_regex.isChecked()))
+        future.add_done_callback(lambda f: self.server_bridge.reportLogSearch(started, f))
+
+    def logsFound(self, lines, message):
+        """Show log search results"""
+        self.history_btn.setEnabled(True)
+        self.history_status.setText(message)
+        self.history_output.setPlainText("\n".join(lines))
+        self.history_output.verticalScrollBar().setValue(self.history_output.verticalScrollBar().maximum())
+
+    def playersChanged(self, online):
+        """Show online players"""
+        self.online_label.setText(f"在线玩家 ({len(online)})")
+        self.online_list.clear()
+        for player in online:
+            self.online_list.addItem(f"{player.name}（{time.strftime('%H:%M', time.localtime(player.since))} 上线）")
+        self.refreshPlayerRanking()
+
+    def refreshPlayerRanking(self):
+        """在后台线程中查询当前版本的游戏时间排行"""
+        if not self.selected_version:
+            return
+        seconds = self.ranking_range.currentData()
+        since = time.time() - seconds if seconds else None
+        store = SessionStore(os.path.join(LOGS_DIR, "versions", self.selected_version, SESSIONS_FILE))
+        self.core.submit(asyncio.to_thread(self.playerRanking, store, since)).add_done_callback(
+            self.server_bridge.reportPlayerRanking)
+
+    def playerRanking(self, store, since):
+        # 在工作线程中执行：先等排队中的会话写入，刚下线的玩家也计入排行
+        if self.players is not None and self.players.store is not None:
+            self.players.store.flush(1)
+        return store.top(20, since)
+
+    def playersRanked(self, ranking, message):
+        """Show playtime ranking"""
+        self.ranking_status.setText(message)
+        self.ranking_list.clear()
+        for i, (name, seconds, sessions) in enumerate(ranking, 1):
+            self.ranking_list.addItem(f"{i}. {name}  {format_duration(seconds)}（{sessions} 次）")
+
+    def verifyVersion(self):
+        """完整校验当前版本的所有程序文件"""
+        if not self.selected_version:
+            self.log("请先选择服务器版本")
+            return
+        version = self.selected_version
+        version_dir = os.path.join(self.server_dir, version)
+        self.verify_btn.setEnabled(False)
+        self.log(f"正在校验版本 {version} 的文件...")
+        future = self.core.submit(asyncio.to_thread(verify_version, version_dir, True))
+        future.add_done_callback(lambda f: self.server_bridge.reportVerify(version, f))
+
+    def verifyFinished(self, version, state, message):
+        """Handle verification result"""
+        self.verify_btn.setEnabled(True)
+        self.log(message)
+        if state == STATE_FAILED:
+            self.log(f"版本 {version} 校验失败，已在版本列表中标记；修复文件后可以再次校验")
+        if state and self.version_catalog is not None:
+            self.version_catalog.mark(version, state)
+            index = self.version_combo.findText(version)
+            if index >= 0:
+                self.markVersionItem(index, state)
+
+    def backupWorld(self):
+        """备份当前版本的世界，服务器运行中时暂停写入的时间很短"""
+        if not self.selected_version:
+            self.log("请先选择服务器版本")
+            return
+        version_dir = os.path.join(self.server_dir, self.selected_version)
+        controller = self.controller if self.server_running else ServerController(version_dir)
+        store = SnapshotStore(os.path.join(BACKUPS_DIR, "versions", self.selected_version))
+        self.backup_btn.setEnabled(False)
+        self.log("正在备份存档...")
+        self.core.submit(backup_server(controller, store)).add_done_callback(self.server_bridge.reportBackup)
+    
+    def backupFinished(self, success, message):
+        """Handle backup result"""
+        self.backup_btn.setEnabled(True)
+        self.log(f"备份完成，{message}" if success else f"备份失败: {message}")
+    
+    def resourcesSampled(self, values):
+        """Update resource usage labels and sparklines"""
+        disk = values[DISK_READ] + values[DISK_WRITE]
+        net = values[NET_RX] + values[NET_TX]
+        for name, value, text in (
+                (CPU, values[CPU], f"{values[CPU]:.1f}%"),
+                (RSS, values[RSS], format_bytes(values[RSS])),
+                (THREADS, values[THREADS], f"{values[THREADS]:.0f}"),
+                ("disk", disk, f"{format_bytes(disk)}/s"),
+                ("net", net, f"{format_bytes(net)}/s")):
+            self.metric_series[name].append(value)
+            self.metric_labels[name].setText(text)
+            self.sparklines[name].update()
+    
+    def setSampleInterval(self, seconds):
+        """修改资源采样间隔，下一次采样起生效"""
+        self.core.call(setattr, self.sampler, "interval", seconds)
+    
+    def toggleApi(self, checked):
+        """开启或关闭本机控制接口"""
+        self.api_port.setEnabled(not checked)
+        if checked:
+            # 每次开启时生成新的 token，浏览器中的其他网页拿不到它
+            server = ControlServer([self.api_handle], API_HOST, self.api_port.value(), secrets.token_urlsafe(16))
+            self.api_server = server
+            self.api_label.setText("正在开启...")
+            self.core.submit(server.start()).add_done_callback(
+                lambda f: self.server_bridge.reportApi(server, f))
+        elif self.api_server is not None:
+            self.core.submit(self.api_server.close())
+            self.api_server = None
+            self.api_label.setText("未开启（只允许本机访问）")
+            self.log("控制接口已关闭")
+
+    def apiStateChanged(self, ok, message):
+        """Handle control API start result"""
+        self.log(message)
+        if ok:
+            self.api_label.setText(f"{self.api_server.url}/api/servers\ntoken: {self.api_server.token}"
+                                   if self.api_server else "")
+        else:
+            self.api_server = None
+            self.api_enabled.blockSignals(True)
+            self.api_enabled.setChecked(False)
+            self.api_enabled.blockSignals(False)
+            self.api_port.setEnabled(True)
+            self.api_label.setText("未开启（只允许本机访问）")
+
+    def toggleAutoRestart(self, checked):
+        """开关崩溃自动重启"""
+        if self.monitor is not None:
+            self.core.call(setattr, self.monitor, "auto_restart", checked)
     
     def sendCommand(self):
         """Send command to the server"""
         cmd = self.cmd_input.text().strip()
-        if cmd and self.server_process and self.server_process.state() == QProcess.Running:
-            self.server_process.write((cmd + "\n").encode())
+        if cmd and self.server_running:
+            self.core.call(self.commands.send, cmd)
             self.cmd_input.clear()
             self.log(f"> {cmd}")
     
+    def runScript(self):
+        """从文件读取命令，经命令队列限速发送"""
+        if not self.server_running:
+            self.log("服务器未运行")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "选择命令脚本", "", "命令脚本 (*.txt *.mcfunction);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            commands = read_script(path)
+        except (OSError, UnicodeDecodeError) as e:
+            self.log(f"无法读取脚本: {e}")
+            return
+        name = os.path.basename(path)
+        self.log(f"正在执行脚本 {name}（{len(commands)} 条命令）...")
+        started = time.perf_counter()
+        self.core.submit(self.commands.run_many(commands)).add_done_callback(
+            lambda f: self.server_bridge.reportScript(name, started, f))
+    
     def readServerOutput(self):
         """Read server output"""
-        output = self.server_process.readAllStandardOutput().data().decode()
-        self.log(output)
-    
-    def readServerError(self):
-        """Read server error"""
-        error = self.server_process.readAllStandardError().data().decode()
-        self.log(error)
+        # 核心线程已经按行分帧，这里只取出完整的行，按来源分组加入缓冲区
+        for source, group in itertools.groupby(self.output_queue.drain(), key=lambda item: item[1]):
+            if self.console_buffer.extend([line for line, _ in group], source):
+                self.console_output.scheduleFlush()
+
+    def applyConsoleFilter(self):
+        """按筛选栏的条件重建控制台视图"""
+        levels = [level for level, box in self.console_level_checks.items() if box.isChecked()]
+        sources = [source for source, box in self.console_source_checks.items() if box.isChecked()]
+        try:
+            console_filter = ConsoleFilter(self.console_filter_input.text(), levels, sources)
+        except re.error as e:
+            self.console_filter_input.setStyleSheet("border: 1px solid #ff4757;")
+            self.console_filter_input.setToolTip(f"正则表达式无效: {e}")
+            return
+        self.console_filter_input.setStyleSheet("")
+        self.console_filter_input.setToolTip("")
+        self.console_output.setFilter(console_filter)
     
-    def serverFinished(self, exitCode, exitStatus):
-        """Handle server finished"""
+    def serverError(self, message):
+        """Handle server start failure"""
+        self.server_running = False
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
-        self.log(f"服务器已退出，退出码: {exitCode}")
+        self.status_label.setText("离线")
+        self.status_label.setStyleSheet("color: #ff4757; font-weight: bold; font-size: 14pt;")
+        self.log(f"服务器启动失败: {message}")
     
     def log(self, message):
         """Log message to console"""
-        self.console_output.append(message)
-        self.console_output.ensureCursorVisible()
+        self.log_store.write([message], "manager")
+        if self.api_server is not None:
+            self.core.call(self.api_handle.hub.publish, [message], "manager")
+        # 先写入环形缓冲区，由定时器批量刷新到界面
+        if self.console_buffer.append(message):
+            self.console_output.scheduleFlush()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
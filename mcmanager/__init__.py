@@ -0,0 +1,3 @@
+"""MC Server Manager 的核心模块（不依赖 PyQt5 的部分）。"""
+
+__version__ = "1.0.2"
@@ -0,0 +1,644 @@
+"""本机控制接口：通过 HTTP 启停服务器、发送命令，并把控制台广播给多个客户端。
+
+接口运行在控制器所在的 asyncio 事件循环中，只使用标准库：
+
+    GET  /api/servers                    全部服务器的状态
+    GET  /api/servers/<名称>             一个服务器的状态
+    POST /api/servers/<名称>/start|stop|restart
+    POST /api/servers/<名称>/command     JSON {"command": "list", "expect": "正则", "timeout": 5}
+                                         或 {"commands": [...]}
+    GET  /api/servers/<名称>/console     持续输出控制台（NDJSON，每行一个 {"time", "source", "text"}），
+                                         带 Upgrade: websocket 时改为 WebSocket，每条消息为一行或多行 NDJSON，
+                                         客户端发来的文本消息作为命令发送
+        ?tail=100        先发送最近的若干行
+        ?slow=skip|close 客户端跟不上时跳过积压的行（并发送 {"dropped": 行数}）或断开连接
+
+图形界面和 start 命令中服务器的名称为 default，supervise 中为实例名称。
+设置了 token 时请求需要带上 Authorization: Bearer <token> 或 ?token=<token>。
+带有 Origin 头的请求（包括 WebSocket 握手）只接受来自本机页面（127.0.0.1、localhost、[::1]）的，
+POST 必须是 Content-Type: application/json：浏览器不经预检就能发出的跨站“简单请求”一律拒绝，
+其他网页不能借用户的浏览器启停服务器、发送命令或读取控制台。
+
+每个服务器的 ConsoleHub 把收到的整批输出追加到有界的环形缓冲区，只在第一个客户端
+读取时编码一次，所有客户端共享同一份字节；每个客户端只保存自己读到的位置，
+发送受自己的写缓冲区限制（慢客户端只会落后，不会拖慢读取服务器输出或其他客户端），
+落后超过缓冲区容量时按 slow 的设置跳过或断开，完全不再读取的客户端在 CLIENT_STALL 秒后断开。
+
+命令行用法：
+    python -m mcmanager.api bench [--clients 300] [--lines 200000]   在本机测试广播的吞吐量
+    curl -N http://127.0.0.1:8766/api/servers/default/console         查看控制台
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import re
+import sys
+import time
+import urllib.parse
+from json.encoder import encode_basestring
+
+from .commands import CommandQueueError, CommandTimeout
+from .controller import STOPPED, ControllerError
+
+API_HOST = "127.0.0.1"
+API_PORT = 8766
+DEFAULT_SERVER = "default"  # 图形界面和 start 命令中服务器的名称
+BACKLOG_LINES = 10000       # 每个服务器保留的最近行数，也是客户端最多能落后的行数
+TAIL_LINES = 0
+CLIENT_BUFFER = 256 * 1024  # 每个客户端的写缓冲区上限（字节）
+CLIENT_STALL = 30.0         # 写缓冲区一直是满的（客户端不再读取）超过这个秒数时断开
+MAX_BODY = 64 * 1024
+REQUEST_TIMEOUT = 10.0
+
+SLOW_SKIP = "skip"    # 跳过积压的行
+SLOW_CLOSE = "close"  # 断开连接
+
+LOCAL_ORIGIN_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+                415: "Unsupported Media Type", 500: "Internal Server Error", 504: "Gateway Timeout"}
+
+
+class ApiError(Exception):
+    """请求无效或无法执行，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def websocket_frame(payload, opcode=0x1):
+    """服务器发出的（不加掩码的）单帧 WebSocket 消息"""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 65536:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    return header + payload
+
+
+def _unmask(data, mask):
+    size = len(data)
+    key = (mask * (size // 4 + 1))[:size]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(size, "big")
+
+
+def _encode_lines(lines, source, stamp):
+    prefix = '{"time": %.3f, "source": "%s", "text": ' % (stamp, source)
+    return "".join(prefix + encode_basestring(line) + "}\n" for line in lines).encode("utf-8")
+
+
+class _Chunk:
+    """一批输出，编码结果在第一次读取时生成，之后所有客户端共用"""
+
+    __slots__ = ("first", "lines", "source", "time", "_payload", "_frame")
+
+    def __init__(self, first, lines, source, stamp):
+        self.first = first
+        self.lines = lines
+        self.source = source
+        self.time = stamp
+        self._payload = None
+        self._frame = None
+
+    def payload(self, offset=0):
+        if offset:
+            return _encode_lines(self.lines[offset:], self.source, self.time)
+        if self._payload is None:
+            self._payload = _encode_lines(self.lines, self.source, self.time)
+        return self._payload
+
+    def frame(self, offset=0):
+        if offset:
+            return websocket_frame(self.payload(offset))
+        if self._frame is None:
+            self._frame = websocket_frame(self.payload())
+        return self._frame
+
+
+class ConsoleHub:
+    """一个服务器的控制台广播。publish 的签名与控制器的输出监听器相同。
+
+    所有方法都必须在事件循环线程中调用。行按到达顺序编号，客户端用 read(cursor)
+    取出 cursor 之后的内容；publish 只追加一个数据块，开销与客户端数量无关。
+    """
+
+    def __init__(self, capacity=BACKLOG_LINES):
+        self.capacity = capacity
+        self.next_seq = 0      # 下一行的编号，也是累计收到的行数
+        self.subscribers = 0
+        self.dropped = 0       # 因客户端跟不上而跳过的行数（所有客户端合计）
+        self.disconnected = 0  # 因跟不上而断开的客户端数
+        self._chunks = collections.deque()
+        self._lines = 0
+        self._changed = None
+        self._notifying = False
+
+    def publish(self, lines, source):
+        if not lines:
+            return
+        self._chunks.append(_Chunk(self.next_seq, lines, source, time.time()))
+        self.next_seq += len(lines)
+        self._lines += len(lines)
+        while self._lines > self.capacity and len(self._chunks) > 1:
+            self._lines -= len(self._chunks.popleft().lines)
+        if self._changed is not None and not self._notifying:
+            # 唤醒客户端放到之后的回调中，同一轮中的多批输出只唤醒一次
+            self._notifying = True
+            asyncio.get_running_loop().call_soon(self._notify)
+
+    def _notify(self):
+        self._notifying = False
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def cursor(self, tail=0):
+        """新客户端的起始位置：最近 tail 行之前"""
+        oldest = self._chunks[0].first if self._chunks else self.next_seq
+        return max(oldest, self.next_seq - tail)
+
+    def read(self, cursor, websocket=False):
+        """返回 (数据块列表, 跳过的行数, 新的位置)"""
+        if cursor >= self.next_seq:
+            return [], 0, cursor
+        chunks = []
+        for chunk in reversed(self._chunks):
+            chunks.append(chunk)
+            if chunk.first <= cursor:
+                break
+        chunks.reverse()
+        lost = max(0, chunks[0].first - cursor)
+        offset = max(0, cursor - chunks[0].first)
+        encode = _Chunk.frame if websocket else _Chunk.payload
+        data = [encode(chunks[0], offset)] + [encode(chunk) for chunk in chunks[1:]]
+        return data, lost, self.next_seq
+
+    async def wait(self, cursor):
+        """等待 cursor 之后有新的行"""
+        while cursor >= self.next_seq:
+            if self._changed is None:
+                self._changed = asyncio.Event()
+            await self._changed.wait()
+
+    def stats(self):
+        return {"lines": self.next_seq, "subscribers": self.subscribers,
+                "dropped": self.dropped, "disconnected": self.disconnected}
+
+
+class ServerHandle:
+    """接口中的一个服务器：由一个 ServerMonitor 和它的 CommandQueue 控制。
+
+    bind 可以多次调用（图形界面每次启动都会创建新的控制器），控制台广播保持不变。
+    """
+
+    def __init__(self, name, monitor=None, commands=None, capacity=BACKLOG_LINES):
+        self.name = name
+        self.hub = ConsoleHub(capacity)
+        self.monitor = None
+        self.commands = None
+        if monitor is not None:
+            self.bind(monitor, commands)
+
+    def bind(self, monitor, commands):
+        if self.monitor is not None:
+            self.monitor.controller.remove_output_listener(self.hub.publish)
+        self.monitor = monitor
+        self.commands = commands
+        monitor.controller.add_output_listener(self.hub.publish)
+
+    @property
+    def running(self):
+        return self.monitor is not None and self.monitor.controller.running
+
+    def status(self):
+        controller = self.monitor.controller if self.monitor is not None else None
+        return {
+            "name": self.name,
+            "state": controller.state if controller is not None else STOPPED,
+            "pid": controller.pid if controller is not None else None,
+            "ready": bool(self.monitor and self.monitor.ready),
+            "restarts": self.monitor.metrics.restarts if self.monitor is not None else 0,
+            "console": self.hub.stats(),
+        }
+
+    async def start(self):
+        if self.monitor is None:
+            raise ApiError(409, "服务器没有配置")
+        await self.monitor.start()
+
+    async def stop(self):
+        await self.monitor.stop()
+
+    async def restart(self):
+        await self.monitor.restart()
+
+
+class InstanceHandle(ServerHandle):
+    """supervise 中的一个实例，启动前同步实例目录并校验文件"""
+
+    def __init__(self, supervisor, instance, capacity=BACKLOG_LINES):
+        super().__init__(instance.name, instance.monitor, instance.commands, capacity)
+        self.supervisor = supervisor
+        self.instance = instance
+
+    def status(self):
+        status = super().status()
+        status.update(version=self.instance.version, port=self.instance.port,
+                      players=[player.name for player in self.instance.players.index.online()])
+        return status
+
+    async def start(self):
+        await self.supervisor.start(self.name)
+
+
+class ControlServer:
+    """HTTP / WebSocket 控制接口。start/close 必须在事件循环线程中调用。"""
+
+    def __init__(self, handles, host=API_HOST, port=API_PORT, token=None):
+        self.handles = {handle.name: handle for handle in handles}
+        self.host = host
+        self.port = port
+        self.token = token
+        self.requests = 0
+        self._server = None
+        self._clients = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._clients):
+            task.cancel()
+        if self._clients:
+            await asyncio.gather(*self._clients, return_exceptions=True)
+
+    # ------------------------------------------------------------ 请求处理
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        writer.transport.set_write_buffer_limits(high=CLIENT_BUFFER)
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), REQUEST_TIMEOUT)
+                if request is None:
+                    return
+                self.requests += 1
+                await self._dispatch(request, reader, writer)
+            except ApiError as e:
+                await self._respond(writer, e.status, {"error": str(e)})
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                await self._respond(writer, 400, {"error": "无效的请求"})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                raise ApiError(400, "请求头过多")
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, "请求内容过大")
+        body = await reader.readexactly(length) if length else b""
+        url = urllib.parse.urlsplit(target)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers, body
+
+    def _authorized(self, query, headers):
+        if not self.token:
+            return True
+        supplied = query.get("token", "")
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            supplied = authorization[7:].strip()
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    @staticmethod
+    def _local_origin(headers):
+        """没有 Origin（非浏览器客户端）或来自本机页面时返回 True"""
+        origin = headers.get("origin")
+        if origin is None:
+            return True
+        try:
+            parsed = urllib.parse.urlsplit(origin)
+            host = parsed.hostname
+        except ValueError:
+            return False
+        return parsed.scheme in ("http", "https") and host in LOCAL_ORIGIN_HOSTS
+
+    async def _dispatch(self, request, reader, writer):
+        method, path, query, headers, body = request
+        if not self._local_origin(headers):
+            raise ApiError(403, "不接受来自其他网站的请求")
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            raise ApiError(415, "POST 请求的 Content-Type 必须是 application/json")
+        if not self._authorized(query, headers):
+            raise ApiError(401, "需要正确的 token")
+        parts = [urllib.parse.unquote(part) for part in path.split("/") if part]
+        if parts[:2] != ["api", "servers"] or len(parts) > 4:
+            raise ApiError(404, "没有这个接口")
+        if len(parts) == 2:
+            self._expect_method(method, "GET")
+            await self._respond(writer, 200, {"servers": [h.status() for h in self.handles.values()]})
+            return
+        handle = self.handles.get(parts[2])
+        if handle is None:
+            raise ApiError(404, f"服务器 {parts[2]} 不存在")
+        action = parts[3] if len(parts) == 4 else ""
+        if action == "":
+            self._expect_method(method, "GET")
+            await self._respond(writer, 200, handle.status())
+        elif action in ("start", "stop", "restart"):
+            self._expect_method(method, "POST")
+            await self._control(handle, action)
+            await self._respond(writer, 200, handle.status())
+        elif action == "command":
+            self._expect_method(method, "POST")
+            await self._respond(writer, 200, await self._command(handle, body))
+        elif action == "console":
+            self._expect_method(method, "GET")
+            tail = int(query.get("tail", TAIL_LINES))
+            slow = query.get("slow", SLOW_SKIP)
+            if slow not in (SLOW_SKIP, SLOW_CLOSE):
+                raise ApiError(400, f"slow 只能是 {SLOW_SKIP} 或 {SLOW_CLOSE}")
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self._websocket(handle, reader, writer, headers, tail, slow)
+            else:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                             b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+                await self._relay(handle.hub, reader, writer, tail, slow, websocket=False)
+        else:
+            raise ApiError(404, "没有这个接口")
+
+    @staticmethod
+    def _expect_method(method, expected):
+        if method != expected:
+            raise ApiError(405, f"请使用 {expected}")
+
+    @staticmethod
+    async def _respond(writer, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _control(handle, action):
+        if action == "start" and handle.running:
+            raise ApiError(409, "服务器已经在运行")
+        if action in ("stop", "restart") and not handle.running:
+            raise ApiError(409, "服务器未运行")
+        try:
+            await getattr(handle, action)()
+        except ControllerError as e:
+            raise ApiError(409, str(e))
+        except ApiError:
+            raise
+        except Exception as e:  # 例如实例的文件校验失败
+            raise ApiError(500, str(e))
+
+    @staticmethod
+    async def _command(handle, body):
+        data = json.loads(body or b"{}")
+        if not isinstance(data, dict):
+            raise ApiError(400, "请求内容应为 JSON 对象")
+        commands = data.get("commands") or ([data["command"]] if data.get("command") else [])
+        expect, timeout = data.get("expect"), data.get("timeout")
+        if not commands:
+            raise ApiError(400, "没有命令")
+        if not handle.running or handle.commands is None:
+            raise ApiError(409, "服务器未运行")
+        if expect is None:
+            for command in commands:
+                handle.commands.send(command)
+            return {"sent": len(commands)}
+        if len(commands) != 1:
+            raise ApiError(400, "expect 只能用于单条命令")
+        try:
+            result = await handle.commands.run(commands[0], re.compile(expect), timeout)
+        except re.error as e:
+            raise ApiError(400, f"无效的正则表达式: {e}")
+        except CommandTimeout as e:
+            raise ApiError(504, str(e))
+        except CommandQueueError as e:
+            raise ApiError(409, str(e))
+        return {"sent": 1, "result": result}
+
+    # ------------------------------------------------------------ 控制台
+
+    async def _websocket(self, handle, reader, writer, headers, tail, slow):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            raise ApiError(400, "缺少 Sec-WebSocket-Key")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        await self._relay(handle.hub, reader, writer, tail, slow, websocket=True,
+                          on_message=lambda text: self._websocket_command(handle, writer, text))
+
+    @staticmethod
+    def _websocket_command(handle, writer, text):
+        commands = [line.strip() for line in text.splitlines() if line.strip()]
+        if commands and (not handle.running or handle.commands is None):
+            writer.write(websocket_frame(json.dumps({"error": "服务器未运行"}, ensure_ascii=False).encode()))
+            return
+        for command in commands:
+            handle.commands.send(command)
+
+    async def _relay(self, hub, reader, writer, tail, slow, websocket, on_message=None):
+        """把 hub 的内容发给一个客户端，直到客户端断开"""
+        receiver = asyncio.ensure_future(self._receive(reader, writer, websocket, on_message))
+        sender = asyncio.ensure_future(self._send(hub, writer, tail, slow, websocket))
+        hub.subscribers += 1
+        try:
+            await asyncio.wait([receiver, sender], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            hub.subscribers -= 1
+            receiver.cancel()
+            sender.cancel()
+            await asyncio.gather(receiver, sender, return_exceptions=True)
+
+    @staticmethod
+    async def _send(hub, writer, tail, slow, websocket):
+        cursor = hub.cursor(tail)
+        while True:
+            await hub.wait(cursor)
+            data, lost, cursor = hub.read(cursor, websocket)
+            if lost:
+                hub.dropped += lost
+                if slow == SLOW_CLOSE:
+                    hub.disconnected += 1
+                    return
+                notice = b'{"dropped": %d}\n' % lost
+                data.insert(0, websocket_frame(notice) if websocket else notice)
+            writer.write(b"".join(data))
+            # 只有这个客户端的写缓冲区满时才会在这里等待，期间新的行继续进入 hub
+            try:
+                await asyncio.wait_for(writer.drain(), CLIENT_STALL)
+            except asyncio.TimeoutError:
+                hub.disconnected += 1
+                return
+
+    @staticmethod
+    async def _receive(reader, writer, websocket, on_message):
+        """NDJSON 客户端只需要检测断开；WebSocket 处理文本、ping 和 close"""
+        if not websocket:
+            while await reader.read(4096):
+                pass
+            return
+        message = b""
+        while True:
+            head = await reader.readexactly(2)
+            final, opcode = head[0] & 0x80, head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+            if length > MAX_BODY:
+                writer.write(websocket_frame((1009).to_bytes(2, "big"), 0x8))
+                return
+            mask = await reader.readexactly(4) if head[1] & 0x80 else b""
+            payload = await reader.readexactly(length)
+            if mask:
+                payload = _unmask(payload, mask)
+            if opcode == 0x8:
+                writer.write(websocket_frame(payload[:2], 0x8))
+                return
+            if opcode == 0x9:
+                writer.write(websocket_frame(payload, 0xA))
+            elif opcode in (0x0, 0x1):
+                message += payload
+                if final:
+                    on_message(message.decode("utf-8", "replace"))
+                    message = b""
+
+
+# ---------------------------------------------------------------- 测试
+
+async def _bench_client(port, path, slow_delay, counts, index):
+    reader, writer = await asyncio.open_connection(API_HOST, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await reader.readuntil(b"\r\n\r\n")
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            counts[index] += data.count(b"\n")
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+    finally:
+        writer.close()
+
+
+async def benchmark(clients=300, slow_clients=5, lines=200000, batch=100, line_size=120):
+    """在本机启动接口和 clients 个客户端，返回每秒发布的行数、客户端收到的行数等"""
+    handle = ServerHandle(DEFAULT_SERVER)
+    hub = handle.hub
+    server = await ControlServer([handle], port=0).start()
+    text = "x" * max(0, line_size - 40)
+    batches = [[f"[2026-10-18 12:00:00:000 INFO] {i:08d} {text}" for i in range(n, n + batch)]
+               for n in range(0, lines, batch)]
+
+    # 没有客户端时的发布开销，作为对照
+    started = time.perf_counter()
+    for item in batches:
+        hub.publish(item, "stdout")
+    idle_seconds = time.perf_counter() - started
+
+    total = clients + slow_clients
+    counts = [0] * total
+    path = f"/api/servers/{DEFAULT_SERVER}/console"
+    tasks = [asyncio.ensure_future(_bench_client(server.port, path, 0.05 if i >= clients else 0, counts, i))
+             for i in range(total)]
+    while hub.subscribers < total:
+        await asyncio.sleep(0.01)
+    start_seq = hub.next_seq
+    started = time.perf_counter()
+    publish_seconds = 0.0
+    for item in batches:
+        t = time.perf_counter()
+        hub.publish(item, "stdout")
+        publish_seconds += time.perf_counter() - t
+        await asyncio.sleep(0)  # 与真实的读取循环一样，每批之间让出事件循环
+    # 等待跟得上的客户端收完
+    deadline = time.perf_counter() + 30
+    while min(counts[:clients] or [lines]) < lines and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await server.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    delivered = sum(counts[:clients])
+    return {
+        "clients": clients,
+        "slow_clients": slow_clients,
+        "lines": hub.next_seq - start_seq,
+        "publish_us_per_line_idle": idle_seconds / lines * 1e6,
+        "publish_us_per_line": publish_seconds / lines * 1e6,
+        "lines_s": lines / elapsed,
+        "delivered_lines_s": delivered / elapsed,
+        "complete_clients": sum(1 for count in counts[:clients] if count >= lines),
+        "slow_received": counts[clients:],
+        "dropped": hub.dropped,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mcmanager.api", description="本机控制接口")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    p = commands.add_parser("bench", help="在本机测试控制台广播")
+    p.add_argument("--clients", type=int, default=300, help="跟得上的客户端数")
+    p.add_argument("--slow-clients", type=int, default=5, help="每次读取后等待 50 毫秒的慢客户端数")
+    p.add_argument("--lines", type=int, default=200000)
+    p.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+    results = asyncio.run(benchmark(args.clients, args.slow_clients, args.lines))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+        return
+    print(f"{results['clients']} 个客户端 + {results['slow_clients']} 个慢客户端，{results['lines']} 行")
+    print(f"发布开销: {results['publish_us_per_line']:.2f} 微秒/行（没有客户端时 "
+          f"{results['publish_us_per_line_idle']:.2f}）")
+    print(f"广播: {results['lines_s'] / 1e3:.0f} K 行/秒，合计送达 {results['delivered_lines_s'] / 1e6:.1f} M 行/秒，"
+          f"{results['complete_clients']}/{results['clients']} 个客户端收全")
+    print(f"慢客户端收到 {results['slow_received']} 行，跳过 {results['dropped']} 行")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
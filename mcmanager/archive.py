@@ -0,0 +1,506 @@
+"""世界快照的去重压缩归档。
+
+快照中的文件按内容切分成块（FastCDC 风格的归一化分块，边界由内容决定，
+文件中间插入或删除数据只影响附近的块），每个块以 SHA-256 为键、zlib 压缩后
+保存在仓库中，所有归档共享同一批块。哈希和压缩以文件为单位在进程池中并行，
+可以用满所有核心。归档与源文件的对应关系记录在 archives/<名称>.json 中，
+恢复一个归档只需要读取它引用的块。
+
+仓库结构（默认 backups/archive）：
+    chunks/ab/<sha256>     压缩后的块
+    archives/<名称>.json   归档清单
+    files.json             源文件（设备号、inode、大小、修改时间）到块列表的缓存，
+                           硬链接快照中未变化的文件不必重新读取
+
+命令行用法：
+    python -m mcmanager.archive create 快照目录 --name 名称
+    python -m mcmanager.archive sync backups/versions/1.26.0.25 [--keep-snapshots N]
+    python -m mcmanager.archive list
+    python -m mcmanager.archive restore 名称 目标目录
+    python -m mcmanager.archive prune --keep-hourly 24 --keep-daily 7 --keep-weekly 4
+    python -m mcmanager.archive bench [--size 200]
+"""
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ARCHIVE_DIR = os.path.join("backups", "archive")
+CHUNKS_DIR = "chunks"
+ARCHIVES_DIR = "archives"
+FILE_CACHE = "files.json"
+
+MIN_CHUNK = 16 * 1024
+AVG_CHUNK = 64 * 1024
+MAX_CHUNK = 256 * 1024
+COMPRESS_LEVEL = 3
+
+# 内容定义的切分点：用固定的随机表把每个字节映射为 0 或 1，连续 N 个 1 结束处为切分点，
+# 只取决于最近 N 个字节的内容。映射和查找由 bytes.translate/find 在 C 中完成，
+# 不需要逐字节执行 Python 代码。归一化分块：平均长度之前要求更长的连续段（更难满足），
+# 之后要求更短的连续段，使块长集中在平均值附近（对应 FastCDC 的两个掩码）。
+# 映射表必须固定，否则同样的内容在不同运行中切出不同的块。
+_ANCHOR_BITS = [0] * 128 + [1] * 128
+random.Random(0x6D636D67).shuffle(_ANCHOR_BITS)
+_ANCHOR_TABLE = bytes(_ANCHOR_BITS)
+_RUN_HARD = b"\x01" * 16
+_RUN_EASY = b"\x01" * 13
+
+
+class ArchiveError(Exception):
+    """归档不存在或仓库数据损坏"""
+
+
+# ---------------------------------------------------------------- 切块（在工作进程中执行）
+
+def _next_cut(anchors, start, end):
+    """返回从 start 开始的块的结束位置，anchors 为映射后的数据"""
+    if end - start <= MIN_CHUNK:
+        return end
+    limit = min(end, start + MAX_CHUNK)
+    normal = min(limit, start + AVG_CHUNK)
+    found = anchors.find(_RUN_HARD, start + MIN_CHUNK - len(_RUN_HARD), normal)
+    if found >= 0:
+        return found + len(_RUN_HARD)
+    found = anchors.find(_RUN_EASY, normal - len(_RUN_EASY), limit)
+    if found >= 0:
+        return found + len(_RUN_EASY)
+    return limit
+
+
+def chunk_boundaries(data):
+    """把数据切分成块，返回各块的 (起点, 终点)"""
+    anchors = data.translate(_ANCHOR_TABLE)
+    boundaries = []
+    start, end = 0, len(data)
+    while start < end:
+        cut = _next_cut(anchors, start, end)
+        boundaries.append((start, cut))
+        start = cut
+    return boundaries
+
+
+def _chunk_path(root, digest):
+    return os.path.join(root, CHUNKS_DIR, digest[:2], digest)
+
+
+def _store_file(root, path, level=COMPRESS_LEVEL):
+    """切分并保存一个文件，返回 (块列表 [[sha256, 长度]], 新写入的原始字节数, 新写入的压缩字节数)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    chunks = []
+    new_bytes = stored_bytes = 0
+    view = memoryview(data)
+    for start, end in chunk_boundaries(data):
+        piece = view[start:end]
+        digest = hashlib.sha256(piece).hexdigest()
+        chunks.append([digest, end - start])
+        target = _chunk_path(root, digest)
+        if os.path.exists(target):
+            continue
+        compressed = zlib.compress(piece, level)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 先写临时文件再改名，多个进程同时写同一个块也不会留下半个文件
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, target)
+        new_bytes += end - start
+        stored_bytes += len(compressed)
+    return chunks, new_bytes, stored_bytes
+
+
+def _store_file_task(args):
+    return _store_file(*args)
+
+
+# ---------------------------------------------------------------- 保留策略
+
+class RetentionPolicy:
+    """保留策略：最近 last 个，以及每小时/每天/每周/每月各保留最新的一个，直到数量用完"""
+
+    RULES = (("hourly", "%Y-%m-%d %H"), ("daily", "%Y-%m-%d"), ("weekly", "%G-%V"), ("monthly", "%Y-%m"))
+
+    def __init__(self, last=0, hourly=0, daily=0, weekly=0, monthly=0):
+        self.last = last
+        self.counts = {"hourly": hourly, "daily": daily, "weekly": weekly, "monthly": monthly}
+
+    @property
+    def empty(self):
+        """没有任何保留规则（按这样的策略清理会删除全部归档）"""
+        return self.last <= 0 and all(count <= 0 for count in self.counts.values())
+
+    def select(self, archives):
+        """archives 为 [(名称, 创建时间)]，返回要保留的名称集合"""
+        ordered = sorted(archives, key=lambda item: item[1], reverse=True)
+        keep = {name for name, _ in ordered[:self.last]}
+        for rule, fmt in self.RULES:
+            remaining = self.counts[rule]
+            seen = set()
+            for name, created in ordered:
+                if remaining <= 0:
+                    break
+                period = time.strftime(fmt, time.localtime(created))
+                if period in seen:
+                    continue
+                seen.add(period)
+                keep.add(name)
+                remaining -= 1
+        return keep
+
+
+# ---------------------------------------------------------------- 仓库
+
+class ArchiveResult:
+    def __init__(self, name, files, logical_bytes, reused_files, new_bytes, stored_bytes, elapsed):
+        self.name = name
+        self.files = files
+        self.logical_bytes = logical_bytes
+        self.reused_files = reused_files  # 命中文件缓存、未重新读取的文件数
+        self.new_bytes = new_bytes        # 新写入仓库的块的原始大小
+        self.stored_bytes = stored_bytes  # 新写入仓库的块的压缩后大小
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        """每秒处理的原始数据量（MB/s）"""
+        return self.logical_bytes / 1048576 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"归档 {self.name}：{self.files} 个文件，{self.logical_bytes / 1048576:.1f} MB，"
+                f"新增块 {self.new_bytes / 1048576:.1f} MB（压缩后 {self.stored_bytes / 1048576:.1f} MB），"
+                f"{self.elapsed:.2f} 秒，{self.throughput:.1f} MB/s")
+
+
+class ArchiveRepository:
+    def __init__(self, root=ARCHIVE_DIR, workers=None, level=COMPRESS_LEVEL):
+        self.root = root
+        self.workers = workers or os.cpu_count() or 1
+        self.level = level
+
+    def _archive_path(self, name):
+        return os.path.join(self.root, ARCHIVES_DIR, name + ".json")
+
+    def archives(self):
+        """返回 [(名称, 创建时间)]，按创建时间排序"""
+        items = []
+        try:
+            filenames = os.listdir(os.path.join(self.root, ARCHIVES_DIR))
+        except FileNotFoundError:
+            return items
+        for filename in filenames:
+            if filename.endswith(".json"):
+                items.append((filename[:-5], self.load(filename[:-5])["created"]))
+        return sorted(items, key=lambda item: item[1])
+
+    def load(self, name):
+        try:
+            with open(self._archive_path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ArchiveError(f"归档 {name} 不存在")
+
+    def _load_cache(self):
+        try:
+            with open(os.path.join(self.root, FILE_CACHE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_json(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def create(self, source_dir, name, created=None):
+        """归档目录 source_dir 中的全部文件"""
+        if os.path.exists(self._archive_path(name)):
+            raise ArchiveError(f"归档 {name} 已存在")
+        started = time.perf_counter()
+        cache = self._load_cache()
+        new_cache = {}
+        entries = []
+        pending = []
+        reused = logical = 0
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                relpath = os.path.relpath(path, source_dir).replace("\\", "/")
+                st = os.stat(path)
+                key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+                entry = {"path": relpath, "size": st.st_size, "mtime": st.st_mtime, "chunks": None}
+                entries.append(entry)
+                logical += st.st_size
+                chunks = cache.get(key)
+                # 缓存的块可能已被 prune 删除，确认存在后才复用
+                if chunks and all(os.path.exists(_chunk_path(self.root, c[0])) for c in chunks):
+                    entry["chunks"] = chunks
+                    new_cache[key] = chunks
+                    reused += 1
+                else:
+                    pending.append((entry, key, path))
+        new_bytes = stored_bytes = 0
+        if pending:
+            tasks = [(self.root, path, self.level) for _, _, path in pending]
+            if self.workers > 1 and len(pending) > 1:
+                with ProcessPoolExecutor(self.workers) as pool:
+                    results = list(pool.map(_store_file_task, tasks, chunksize=4))
+            else:
+                results = [_store_file_task(task) for task in tasks]
+            for (entry, key, _), (chunks, new, stored) in zip(pending, results):
+                entry["chunks"] = chunks
+                new_cache[key] = chunks
+                new_bytes += new
+                stored_bytes += stored
+        self._save_json(self._archive_path(name), {
+            "name": name,
+            "created": created if created is not None else time.time(),
+            "source": os.path.abspath(source_dir),
+            "files": entries,
+        })
+        self._save_json(os.path.join(self.root, FILE_CACHE), new_cache)
+        return ArchiveResult(name, len(entries), logical, reused, new_bytes, stored_bytes,
+                             time.perf_counter() - started)
+
+    def _restore_file(self, entry, target_dir):
+        target = os.path.join(target_dir, entry["path"])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as out:
+            for digest, length in entry["chunks"]:
+                try:
+                    with open(_chunk_path(self.root, digest), "rb") as f:
+                        data = zlib.decompress(f.read())
+                except (OSError, zlib.error) as e:
+                    raise ArchiveError(f"块 {digest} 损坏或缺失: {e}")
+                if len(data) != length:
+                    raise ArchiveError(f"块 {digest} 长度不符")
+                out.write(data)
+        os.utime(target, (entry["mtime"], entry["mtime"]))
+        return entry["size"]
+
+    def restore(self, name, target_dir):
+        """把归档恢复到 target_dir（不能已存在），返回 (文件数, 字节数, 耗时)"""
+        if os.path.exists(target_dir):
+            raise ArchiveError(f"{target_dir} 已存在")
+        started = time.perf_counter()
+        archive = self.load(name)
+        staging = target_dir + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        # zlib 解压和文件写入都会释放 GIL，线程池即可并行
+        with ThreadPoolExecutor(self.workers) as pool:
+            total = sum(pool.map(lambda e: self._restore_file(e, staging), archive["files"]))
+        os.replace(staging, target_dir)
+        return len(archive["files"]), total, time.perf_counter() - started
+
+    def prune(self, policy):
+        """按保留策略删除归档并回收不再被引用的块，返回 (删除的归档, 删除的块数, 释放的字节数)"""
+        if policy.empty:
+            raise ArchiveError("保留策略为空，至少需要指定一条保留规则")
+        archives = self.archives()
+        keep = policy.select(archives)
+        removed = [name for name, _ in archives if name not in keep]
+        for name in removed:
+            os.remove(self._archive_path(name))
+        chunks, freed = self.gc()
+        return removed, chunks, freed
+
+    def gc(self):
+        """删除不再被任何归档引用的块"""
+        referenced = set()
+        for name, _ in self.archives():
+            for entry in self.load(name)["files"]:
+                referenced.update(c[0] for c in entry["chunks"])
+        removed = freed = 0
+        chunks_dir = os.path.join(self.root, CHUNKS_DIR)
+        for dirpath, _, filenames in os.walk(chunks_dir):
+            for filename in filenames:
+                if filename not in referenced:
+                    path = os.path.join(dirpath, filename)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+        return removed, freed
+
+    def usage(self):
+        """返回 (所有归档的原始总大小, 去重后的块大小, 压缩后的块大小)"""
+        logical = 0
+        unique = {}
+        for name, _ in self.archives():
+            for entry in self.load(name)["files"]:
+                logical += entry["size"]
+                unique.update(entry["chunks"])
+        stored = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, CHUNKS_DIR)):
+            stored += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+        return logical, sum(unique.values()), stored
+
+    def sync(self, snapshots_root, keep_snapshots=None):
+        """归档快照目录（见 backup 模块）中尚未归档的快照，可选只保留最近几个快照"""
+        from .backup import SnapshotStore
+        store = SnapshotStore(snapshots_root)
+        prefix = os.path.basename(os.path.normpath(snapshots_root))
+        existing = {name for name, _ in self.archives()}
+        results = []
+        for snapshot in store.snapshots():
+            name = f"{prefix}-{snapshot}"
+            if name not in existing:
+                created = store.manifest(snapshot).get("created")
+                results.append(self.create(store.path(snapshot), name, created))
+        if keep_snapshots:
+            store.prune(keep_snapshots)
+        return results
+
+
+# ---------------------------------------------------------------- 基准测试
+
+def _synthetic_world(root, size_mb, rng):
+    """生成类似 LevelDB 存档的目录：若干 2 MB 的 .ldb（约一半可压缩）、日志、MANIFEST 和 level.dat"""
+    db = os.path.join(root, "Bedrock level", "db")
+    os.makedirs(db, exist_ok=True)
+    words = [rng.randbytes(rng.randint(3, 12)) for _ in range(512)]
+
+    def block():
+        # 一半随机数据，一半由常见片段组成，模拟压缩过的区块与重复的实体数据
+        if rng.random() < 0.5:
+            return rng.randbytes(4096)
+        return b"".join(rng.choice(words) for _ in range(600))[:4096]
+
+    for i in range(max(1, size_mb // 2)):
+        with open(os.path.join(db, f"{i + 5:06d}.ldb"), "wb") as f:
+            f.write(b"".join(block() for _ in range(512)))
+    with open(os.path.join(db, "000003.log"), "wb") as f:
+        f.write(b"".join(block() for _ in range(256)))
+    with open(os.path.join(db, "MANIFEST-000001"), "wb") as f:
+        f.write(rng.randbytes(64 * 1024))
+    with open(os.path.join(root, "Bedrock level", "level.dat"), "wb") as f:
+        f.write(rng.randbytes(2048))
+
+
+def _mutate_world(root, rng, serial):
+    """模拟一段时间的游戏：压缩合并删除旧文件、写入新文件、追加日志、改写 MANIFEST"""
+    db = os.path.join(root, "Bedrock level", "db")
+    ldb = sorted(f for f in os.listdir(db) if f.endswith(".ldb"))
+    for name in rng.sample(ldb, max(1, len(ldb) // 20)):
+        os.remove(os.path.join(db, name))
+    for i in range(max(1, len(ldb) // 10)):
+        with open(os.path.join(db, f"9{serial:02d}{i:03d}.ldb"), "wb") as f:
+            f.write(rng.randbytes(1024 * 1024) + b"\x00" * (1024 * 1024))
+    with open(os.path.join(db, "000003.log"), "ab") as f:
+        f.write(rng.randbytes(256 * 1024))
+    with open(os.path.join(db, "MANIFEST-000001"), "r+b") as f:
+        f.seek(1024)
+        f.write(rng.randbytes(4096))
+
+
+def benchmark(size_mb=200, rounds=3, workers=None, work_dir=None):
+    """在合成世界上测量归档与恢复的吞吐量和去重率，返回结果字典"""
+    import tempfile
+    base = tempfile.mkdtemp(prefix="mcarchive-", dir=work_dir)
+    try:
+        rng = random.Random(1)
+        world = os.path.join(base, "world")
+        _synthetic_world(world, size_mb, rng)
+        repo = ArchiveRepository(os.path.join(base, "repo"), workers=workers)
+        runs = []
+        for serial in range(rounds):
+            if serial:
+                _mutate_world(world, rng, serial)
+            # 每轮从头复制一份，模拟没有硬链接缓存可用的快照
+            snapshot = os.path.join(base, f"snapshot-{serial}")
+            shutil.copytree(world, snapshot)
+            result = repo.create(snapshot, f"bench-{serial}")
+            runs.append({"logical_mb": result.logical_bytes / 1048576, "new_mb": result.new_bytes / 1048576,
+                         "seconds": result.elapsed, "mb_per_s": result.throughput})
+        restore_files, restore_bytes, restore_seconds = repo.restore(f"bench-{rounds - 1}", os.path.join(base, "restored"))
+        logical, unique, stored = repo.usage()
+        return {
+            "workers": repo.workers,
+            "runs": runs,
+            "restore_mb_per_s": restore_bytes / 1048576 / restore_seconds if restore_seconds else 0.0,
+            "logical_mb": logical / 1048576,
+            "unique_mb": unique / 1048576,
+            "stored_mb": stored / 1048576,
+            "dedup_ratio": logical / unique if unique else 0.0,
+            "compression_ratio": unique / stored if stored else 0.0,
+        }
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m mcmanager.archive", description="世界快照去重归档")
+    parser.add_argument("--repo", default=ARCHIVE_DIR, help=f"仓库目录（默认 {ARCHIVE_DIR}）")
+    parser.add_argument("--workers", type=int, help="并行进程数（默认 CPU 核心数）")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    p = commands.add_parser("create", help="归档一个目录")
+    p.add_argument("source")
+    p.add_argument("--name", required=True)
+    p = commands.add_parser("sync", help="归档快照目录中尚未归档的快照")
+    p.add_argument("snapshots")
+    p.add_argument("--keep-snapshots", type=int, help="归档后只保留最近的快照数量")
+    commands.add_parser("list", help="列出归档")
+    p = commands.add_parser("restore", help="恢复一个归档")
+    p.add_argument("name")
+    p.add_argument("target")
+    p = commands.add_parser("prune", help="按保留策略删除归档")
+    for rule in ("last", "hourly", "daily", "weekly", "monthly"):
+        p.add_argument(f"--keep-{rule}", type=int, default=0)
+    p = commands.add_parser("bench", help="在合成世界上测试吞吐量和去重率")
+    p.add_argument("--size", type=int, default=200, help="合成世界大小（MB）")
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+    if args.command == "prune" and not any(getattr(args, f"keep_{rule}") > 0
+                                          for rule in ("last", "hourly", "daily", "weekly", "monthly")):
+        parser.error("prune 至少需要一个大于 0 的 --keep-* 参数")
+
+    repo = ArchiveRepository(args.repo, workers=args.workers)
+    try:
+        if args.command == "create":
+            print(repo.create(args.source, args.name))
+        elif args.command == "sync":
+            for result in repo.sync(args.snapshots, args.keep_snapshots):
+                print(result)
+        elif args.command == "list":
+            for name, created in repo.archives():
+                print(f"{name}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))}")
+        elif args.command == "restore":
+            files, size, seconds = repo.restore(args.name, args.target)
+            print(f"已恢复 {files} 个文件，{size / 1048576:.1f} MB，{seconds:.2f} 秒")
+        elif args.command == "prune":
+            policy = RetentionPolicy(args.keep_last, args.keep_hourly, args.keep_daily,
+                                     args.keep_weekly, args.keep_monthly)
+            removed, chunks, freed = repo.prune(policy)
+            print(f"删除 {len(removed)} 个归档、{chunks} 个块，释放 {freed / 1048576:.1f} MB")
+        elif args.command == "bench":
+            result = benchmark(args.size, args.rounds, args.workers)
+            if args.json:
+                print(json.dumps(result, indent=2))
+                return 0
+            print(f"并行进程: {result['workers']}")
+            for i, run in enumerate(result["runs"]):
+                print(f"第 {i + 1} 轮: {run['logical_mb']:.1f} MB，新增 {run['new_mb']:.1f} MB，"
+                      f"{run['seconds']:.2f} 秒，{run['mb_per_s']:.1f} MB/s")
+            print(f"恢复: {result['restore_mb_per_s']:.1f} MB/s")
+            print(f"原始 {result['logical_mb']:.1f} MB，去重后 {result['unique_mb']:.1f} MB，"
+                  f"压缩后 {result['stored_mb']:.1f} MB，去重率 {result['dedup_ratio']:.2f}x，"
+                  f"压缩率 {result['compression_ratio']:.2f}x")
+    except ArchiveError as e:
+        print(f"错误: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""存档备份：增量硬链接快照。
+
+服务器运行时，通过标准输入依次发送 `save hold`、`save query`、`save resume`：
+暂停写入后，服务器在 `save query` 的输出中列出需要复制的文件及其有效长度
+（"路径:长度, 路径:长度, ..."，路径相对于 worlds 目录）。只复制自上次快照以来
+变化过的文件（按有效长度截断），未变化的文件直接硬链接到上一个快照，
+因此备份通常只需几秒，暂停写入的时间也很短。服务器未运行时直接复制整个世界目录。
+
+快照目录结构：<备份目录>/<时间>/<世界名>/...，每个快照附带 manifest.json，
+记录每个文件的长度和源文件状态，用于判断下次备份时文件是否变化。
+"""
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+
+from .controller import RUNNING
+from .properties import read_properties
+
+BACKUPS_DIR = "backups"  # 其中 versions/<版本> 和 instances/<实例> 分别存放各自的快照
+MANIFEST = "manifest.json"
+TMP_SUFFIX = ".tmp"
+COPY_CHUNK = 1024 * 1024
+
+HOLD_TIMEOUT = 10.0
+QUERY_INTERVAL = 0.25
+QUERY_TIMEOUT = 60.0
+
+_LOG_PREFIX = re.compile(r"^\[[^\]]*\]\s*")
+_FILE_ENTRY = re.compile(r"^(.+/.+):(\d+)$")  # 路径总是以世界名开头
+
+
+class BackupError(Exception):
+    """备份或恢复失败"""
+
+
+class SnapshotResult:
+    def __init__(self, name, path, files, copied, linked, bytes_copied, elapsed, hold_time=0.0):
+        self.name = name
+        self.path = path
+        self.files = files
+        self.copied = copied
+        self.linked = linked
+        self.bytes_copied = bytes_copied
+        self.elapsed = elapsed
+        self.hold_time = hold_time  # 暂停写入的时长（秒），离线备份为 0
+
+    def __str__(self):
+        return (f"快照 {self.name}：{self.files} 个文件，复制 {self.copied} 个"
+                f"（{self.bytes_copied / 1048576:.1f} MB），链接 {self.linked} 个，"
+                f"耗时 {self.elapsed:.2f} 秒，暂停写入 {self.hold_time:.2f} 秒")
+
+
+def _strip_prefix(line):
+    return _LOG_PREFIX.sub("", line.strip())
+
+
+def parse_file_list(line):
+    """解析 save query 输出的文件列表，返回 [(路径, 长度)]；不是文件列表时返回 None"""
+    entries = []
+    for part in _strip_prefix(line).split(", "):
+        match = _FILE_ENTRY.match(part.strip().replace("\\", "/"))
+        if match is None:
+            return None
+        entries.append((match.group(1), int(match.group(2))))
+    return entries or None
+
+
+def level_name(server_dir):
+    properties = read_properties(os.path.join(server_dir, "server.properties")) or {}
+    return properties.get("level-name", "Bedrock level")
+
+
+def _copy_prefix(source, target, length):
+    """复制文件的前 length 个字节"""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        copy_range = getattr(os, "copy_file_range", None)
+        remaining = length
+        while remaining > 0:
+            if copy_range is not None:
+                try:
+                    copied = copy_range(src.fileno(), dst.fileno(), min(remaining, 1 << 30))
+                except OSError:
+                    copy_range = None  # 跨文件系统等情况，退回普通读写
+                    continue
+            else:
+                data = src.read(min(remaining, COPY_CHUNK))
+                copied = len(data)
+                dst.write(data)
+            if not copied:
+                break  # 源文件比列出的长度短
+            remaining -= copied
+
+
+class SnapshotStore:
+    """一个服务器（版本目录或实例）的快照集合"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def snapshots(self):
+        """按时间顺序返回所有已完成的快照名称"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names
+                      if not n.endswith(TMP_SUFFIX) and os.path.isfile(os.path.join(self.root, n, MANIFEST)))
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def manifest(self, name):
+        with open(os.path.join(self.root, name, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _new_name(self):
+        name = time.strftime("%Y%m%d-%H%M%S")
+        existing = set(self.snapshots())
+        suffix = 1
+        candidate = name
+        while candidate in existing:
+            suffix += 1
+            candidate = f"{name}-{suffix}"
+        return candidate
+
+    def create(self, worlds_dir, files):
+        """根据文件列表 [(相对 worlds 的路径, 长度)] 创建快照，返回 SnapshotResult"""
+        started = time.perf_counter()
+        snapshots = self.snapshots()
+        previous_name = snapshots[-1] if snapshots else None
+        previous = self.manifest(previous_name)["files"] if previous_name else {}
+        name = self._new_name()
+        tmp_dir = self.path(name) + TMP_SUFFIX
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        entries = {}
+        copied = linked = bytes_copied = 0
+        for relpath, length in files:
+            source = os.path.join(worlds_dir, relpath)
+            target = os.path.join(tmp_dir, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                st = os.stat(source)
+            except FileNotFoundError:
+                continue  # 列出后又被服务器删除的文件
+            entry = {"length": length, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            old = previous.get(relpath)
+            if old == entry:
+                try:
+                    os.link(os.path.join(self.path(previous_name), relpath), target)
+                    linked += 1
+                    entries[relpath] = entry
+                    continue
+                except OSError:
+                    pass  # 不支持硬链接或上一个快照已损坏，改为复制
+            _copy_prefix(source, target, length)
+            copied += 1
+            bytes_copied += length
+            entries[relpath] = entry
+        with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "previous": previous_name, "files": entries}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_dir, self.path(name))
+        return SnapshotResult(name, self.path(name), len(entries), copied, linked,
+                              bytes_copied, time.perf_counter() - started)
+
+    def restore(self, name, worlds_dir):
+        """用快照中的世界替换 worlds 目录中的同名世界（服务器必须已停止）"""
+        source = self.path(name)
+        if name not in self.snapshots():
+            raise BackupError(f"快照 {name} 不存在")
+        for world in os.listdir(source):
+            world_source = os.path.join(source, world)
+            if not os.path.isdir(world_source):
+                continue
+            target = os.path.join(worlds_dir, world)
+            staging = target + TMP_SUFFIX
+            shutil.rmtree(staging, ignore_errors=True)
+            # 复制而不是链接，恢复后的修改不会影响快照
+            shutil.copytree(world_source, staging)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(staging, target)
+
+    def prune(self, keep):
+        """只保留最近 keep 个快照。硬链接的文件在最后一个引用删除时才释放空间"""
+        removed = []
+        for name in self.snapshots()[:-keep] if keep > 0 else []:
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            removed.append(name)
+        return removed
+
+
+def world_files(worlds_dir, level):
+    """离线备份时列出世界目录中的全部文件"""
+    files = []
+    world_dir = os.path.join(worlds_dir, level)
+    for dirpath, _, filenames in os.walk(world_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, worlds_dir).replace("\\", "/")
+            files.append((relpath, os.path.getsize(path)))
+    return files
+
+
+async def backup_server(controller, store, server_dir=None, hold_timeout=HOLD_TIMEOUT,
+                        query_timeout=QUERY_TIMEOUT, query_interval=QUERY_INTERVAL):
+    """备份一个服务器的世界，服务器运行中时与 save hold/query/resume 配合。
+
+    文件复制在线程池中进行，不阻塞事件循环；无论成功与否都会发送 save resume。
+    """
+    server_dir = server_dir or controller.working_dir
+    worlds_dir = os.path.join(server_dir, "worlds")
+    loop = asyncio.get_running_loop()
+    if controller.state != RUNNING:
+        level = level_name(server_dir)
+        if not os.path.isdir(os.path.join(worlds_dir, level)):
+            raise BackupError(f"世界 {level} 不存在")
+        files = world_files(worlds_dir, level)
+        return await loop.run_in_executor(None, store.create, worlds_dir, files)
+
+    hold_started = time.perf_counter()
+    holding = controller.expect(lambda line: "Saving" in line or "already running" in line)
+    if not controller.send("save hold"):
+        holding.cancel()
+        raise BackupError("无法向服务器发送命令")
+    try:
+        try:
+            await asyncio.wait_for(holding, hold_timeout)
+        except asyncio.TimeoutError:
+            raise BackupError("服务器没有响应 save hold")
+        files = await _query_files(controller, query_timeout, query_interval)
+        result = await loop.run_in_executor(None, store.create, worlds_dir, files)
+    finally:
+        controller.send("save resume")
+    result.hold_time = time.perf_counter() - hold_started
+    return result
+
+
+async def _query_files(controller, timeout, interval):
+    """反复发送 save query，直到服务器准备好并列出文件"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        listing = controller.expect(lambda line: parse_file_list(line) is not None)
+        not_ready = controller.expect(lambda line: "not been completed" in line)
+        try:
+            if not controller.send("save query"):
+                raise BackupError("服务器已停止")
+            done, _ = await asyncio.wait({listing, not_ready}, timeout=max(interval, 5.0),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if listing in done:
+                return parse_file_list(listing.result())
+        finally:
+            listing.cancel()
+            not_ready.cancel()
+        await asyncio.sleep(interval)
+    raise BackupError(f"服务器在 {timeout:.0f} 秒内没有准备好存档文件")
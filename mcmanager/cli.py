@@ -0,0 +1,905 @@
+"""命令行 / 后台运行入口，不依赖 PyQt5，适合没有图形界面的主机。
+
+    python -m mcmanager versions                 列出已安装的版本
+    python -m mcmanager download 1.26.0.25       下载并安装版本（安装包缓存在 lib/.cache/packages，--mirror 使用局域网镜像）
+    python -m mcmanager discover 1.21.51.*       并发查找存在的版本，每段可以是数字、范围 50-60、列表 1,2 或 *
+    python -m mcmanager start [版本]             前台运行，控制台输出到终端，输入的行作为命令发送
+    python -m mcmanager start [版本] --daemon    后台运行，控制台输出写入 <版本目录>/console.log
+                                                 服务器崩溃或卡死时自动重启，--no-restart 关闭
+    python -m mcmanager stop [版本]              停止后台运行的服务器
+    python -m mcmanager verify [版本 ...] [--deep] 按安装清单校验文件，--deep 重新计算全部哈希，
+                                                 start 启动前会自动快速校验
+    python -m mcmanager console [版本] [-f]      查看（并持续跟踪）后台服务器的控制台
+    python -m mcmanager logs [文字] [--since 时间] [--until 时间]  查询历史控制台日志（--instance 名称 查询实例，
+                                                 --gui 查询图形界面控制台），日志保存在 logs 目录
+    python -m mcmanager players [版本] [--player 名称] [--since 时间]  玩家游戏时间排行或某个玩家的会话
+                                                 （--instance 名称 查看实例）
+    python -m mcmanager start [版本] --api 8766  同时开启本机控制接口：启停、发送命令、多人查看控制台
+                                                 （接口说明见 mcmanager/api.py，supervise 同样支持 --api）
+    python -m mcmanager backup [版本] [--keep N]  备份世界（服务器运行中也可以），--list 列出快照，
+                                                 --restore 快照名 在服务器停止时恢复
+
+多实例：
+    python -m mcmanager instance add 名称 版本 [--port 端口]   新建实例（端口自动分配）
+    python -m mcmanager instance list                          列出实例
+    python -m mcmanager instance remove 名称 [--delete]        删除实例
+    python -m mcmanager supervise [名称 ...]                   在一个进程中同时运行多个实例，
+                                                               输入 "名称: 命令" 发送命令，"*: 命令" 发给全部实例，
+                                                               "status" 查看各实例的状态和资源占用，
+                                                               "backup 名称" 或 "backup *" 备份实例的世界，
+                                                               并按 schedule 中的定时任务执行
+    python -m mcmanager schedule add 名称 "0 4 * * *" restart   新建定时任务（触发条件为 cron 表达式或 "every 30m"，
+                                                               操作为 command 命令 / restart / backup [保留数]）
+    python -m mcmanager schedule list [名称]                    列出定时任务和下次运行时间
+    python -m mcmanager schedule remove|enable|disable 编号     删除、启用或停用定时任务
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+PID_FILE = ".mcmanager.pid"
+STOP_FILE = ".mcmanager.stop"
+BACKUP_FILE = ".mcmanager.backup"  # 请求后台服务器备份，处理完后结果写入 BACKUP_FILE + ".done"
+CONSOLE_LOG = "console.log"
+API_TOKEN_ENV = "MCMANAGER_API_TOKEN"
+
+
+class CommandError(Exception):
+    """命令行参数或环境有误，直接把消息显示给用户"""
+
+
+def _version_dir(args):
+    from .versions import list_versions
+    versions = list_versions(args.lib)
+    version = args.version
+    if not version:
+        if not versions:
+            raise CommandError(f"{args.lib} 中没有已安装的版本，请先使用 download 下载")
+        version = _catalog(args).last_used() or versions[0]
+    elif version not in versions:
+        raise CommandError(f"版本 {version} 未安装")
+    return os.path.join(args.lib, version)
+
+
+def _catalog(args):
+    from .versions import VersionCatalog
+    catalog = VersionCatalog(args.lib)
+    catalog.refresh()
+    return catalog
+
+
+def _read_pid(version_dir):
+    """返回在后台运行该版本的管理器进程的 pid。
+
+    pid 文件记录了进程的启动时间：进程已经不存在（崩溃、被强制结束或断电后留下的文件），
+    或者 pid 已被其他进程复用时删除 pid 文件并返回 None。
+    """
+    from .metrics import process_start_time
+    path = os.path.join(version_dir, PID_FILE)
+    try:
+        with open(path, "r") as f:
+            fields = f.read().split()
+        pid = int(fields[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    started = fields[1] if len(fields) > 1 else ""
+    current = process_start_time(pid)
+    if current is None or (started and current and current != started):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return pid
+
+
+def _write_pid(version_dir):
+    from .metrics import process_start_time
+    pid = os.getpid()
+    with open(os.path.join(version_dir, PID_FILE), "w") as f:
+        f.write(f"{pid}\n{process_start_time(pid) or ''}\n")
+
+
+# ---------------------------------------------------------------- versions
+
+def cmd_versions(args):
+    from .metrics import format_bytes
+    from .versions import STATE_BROKEN, STATE_FAILED, STATE_VERIFIED
+    catalog = _catalog(args)
+    for version in catalog.versions(include_broken=True):
+        entry = catalog.get(version)
+        notes = [format_bytes(entry["size"])]
+        if entry["state"] == STATE_BROKEN:
+            notes.append("不完整")
+        elif entry["state"] == STATE_FAILED:
+            notes.append("校验失败")
+        elif entry["state"] == STATE_VERIFIED:
+            notes.append("已校验")
+        if entry["last_used"]:
+            notes.append("最近使用 " + time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"])))
+        pid = _read_pid(os.path.join(args.lib, version))
+        if pid:
+            notes.append(f"运行中, pid {pid}")
+        print(f"{version}  ({', '.join(notes)})")
+    return 0
+
+
+# ---------------------------------------------------------------- verify
+
+def cmd_verify(args):
+    from .verify import VerifyError, create_manifest, verify_version
+    from .versions import STATE_FAILED, STATE_VERIFIED
+    catalog = _catalog(args)
+    versions = args.versions or catalog.versions(include_broken=True)
+    failed = 0
+    total_bytes = total_time = 0.0
+    for version in versions:
+        if catalog.get(version) is None:
+            raise CommandError(f"版本 {version} 未安装")
+        version_dir = os.path.join(args.lib, version)
+        if args.rebuild:
+            create_manifest(version_dir, args.workers)
+            print(f"{version}: 已根据当前文件重新生成清单")
+            continue
+        try:
+            result = verify_version(version_dir, deep=args.deep, workers=args.workers)
+        except VerifyError as e:
+            print(f"{version}: {e}")
+            continue
+        print(result)
+        total_bytes += result.bytes_hashed
+        total_time += result.elapsed
+        catalog.mark(version, STATE_VERIFIED if result.ok else STATE_FAILED)
+        failed += not result.ok
+    if len(versions) > 1 and total_time:
+        print(f"合计哈希 {total_bytes / 1048576:.1f} MB，{total_time:.2f} 秒，{total_bytes / 1048576 / total_time:.0f} MB/s")
+    return 1 if failed else 0
+
+
+def _quick_verify(version_dir):
+    """启动前的快速校验，文件有问题时拒绝启动；没有清单的旧版本跳过"""
+    from .verify import VerifyError, verify_version
+    try:
+        result = verify_version(version_dir)
+    except VerifyError:
+        return
+    if not result.ok:
+        raise CommandError(f"{result}\n请使用 verify --deep 确认后重新下载该版本")
+
+
+# ---------------------------------------------------------------- download
+
+def cmd_download(args):
+    from .install import install_version
+    from .packages import PackageCache
+    from .store import BlobStore
+    from .versions import package_url
+
+    def progress(downloaded, total):
+        if total:
+            sys.stderr.write(f"\r下载中 {downloaded * 100 // total}% ({downloaded // 1048576}/{total // 1048576} MB)")
+            sys.stderr.flush()
+
+    os.makedirs(args.lib, exist_ok=True)
+    if os.path.exists(os.path.join(args.lib, args.version)):
+        raise CommandError(f"版本 {args.version} 已存在")
+    try:
+        result = install_version(args.version, args.lib, retries=args.retries,
+                                 url=package_url(args.version, args.mirror),
+                                 connections=args.connections, progress=progress,
+                                 store=BlobStore(args.lib),
+                                 cache=None if args.no_cache else PackageCache.for_lib(args.lib))
+    except Exception as e:
+        raise CommandError(f"下载失败: {e}")
+    sys.stderr.write("\n")
+    print(f"{'从缓存安装' if result.from_cache else '下载完成'}，共 {result.files} 个文件（复用 {result.linked_files} 个），SHA-256: {result.sha256}")
+    return 0
+
+
+def cmd_discover(args):
+    from .discovery import DiscoveryError, VersionDiscovery
+    from .metrics import format_bytes
+
+    discovery = VersionDiscovery.for_lib(args.lib, mirror=args.mirror, concurrency=args.concurrency)
+    started = time.perf_counter()
+    try:
+        found = asyncio.run(discovery.discover(args.pattern))
+    except DiscoveryError as e:
+        raise CommandError(str(e))
+    for version, size in found:
+        installed = "  (已安装)" if os.path.isdir(os.path.join(args.lib, version)) else ""
+        print(f"{version}  {format_bytes(size) if size else '大小未知'}{installed}")
+    print(f"找到 {len(found)} 个版本，发送 {discovery.requests} 个请求，{time.perf_counter() - started:.2f} 秒",
+          file=sys.stderr)
+    return 0 if found else 1
+
+
+# ---------------------------------------------------------------- start / stop
+
+def cmd_start(args):
+    version_dir = _version_dir(args)
+    pid = _read_pid(version_dir)
+    if pid:
+        raise CommandError(f"该版本已在后台运行（pid {pid}）")
+    if not args.no_verify:
+        _quick_verify(version_dir)
+    if args.daemon:
+        return _spawn_daemon(args, version_dir)
+    _catalog(args).touch(os.path.basename(version_dir))
+    try:
+        return asyncio.run(_run_server(version_dir, interactive=not args.no_input, log_path=args.log,
+                                       auto_restart=not args.no_restart, stop_timeout=args.stop_timeout,
+                                       api=_api_options(args)))
+    except KeyboardInterrupt:
+        return 130
+
+
+def _spawn_daemon(args, version_dir):
+    command = [sys.executable, "-m", "mcmanager", "--lib", args.lib, "start",
+               os.path.basename(version_dir), "--no-input", "--no-verify",
+               "--log", os.path.join(version_dir, CONSOLE_LOG)]
+    if args.no_restart:
+        command.append("--no-restart")
+    command += ["--stop-timeout", str(args.stop_timeout)]
+    if args.api is not None:
+        command += ["--api", str(args.api), "--api-host", args.api_host]
+    # 保证子进程从任意工作目录都能导入本包
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        p for p in (package_root, os.environ.get("PYTHONPATH")) if p))
+    if args.api_token:
+        env[API_TOKEN_ENV] = args.api_token  # 不出现在进程的命令行中
+    options = dict(stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, env=env)
+    if sys.platform == "win32":
+        options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options["start_new_session"] = True
+    process = subprocess.Popen(command, **options)
+    print(f"服务器已在后台启动（pid {process.pid}），使用 console 命令查看输出")
+    return 0
+
+
+def _api_options(args):
+    """--api 的参数 (主机, 端口, token)，没有指定 --api 时返回 None"""
+    if args.api is None:
+        return None
+    if args.api_host not in ("127.0.0.1", "localhost", "::1") and not args.api_token:
+        raise CommandError(f"控制接口监听非本机地址时必须设置 --api-token 或环境变量 {API_TOKEN_ENV}")
+    return args.api_host, args.api, args.api_token
+
+
+async def _start_api(handles, api, report):
+    from .api import ControlServer
+    host, port, token = api
+    try:
+        server = await ControlServer(handles, host, port, token).start()
+    except OSError as e:
+        raise CommandError(f"控制接口启动失败: {e}")
+    report(f"控制接口: {server.url}/api/servers")
+    return server
+
+
+async def _run_server(version_dir, interactive=True, log_path=None, auto_restart=True, stop_timeout=30.0,
+                      api=None):
+    from .commands import CommandQueue
+    from .controller import STOP_EXITED, ServerController, describe_stop_stage
+    from .health import ServerMonitor, describe_event
+    from .logstore import LogStore
+    from .players import SESSIONS_FILE, PlayerTracker
+
+    out = open(log_path, "a", encoding="utf-8") if log_path else sys.stdout
+    logs_root = _logs_root(version_dir)
+    logs = LogStore(logs_root)
+    handle = None  # 控制接口中的服务器
+
+    def write_lines(lines, source):
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+        logs.write(lines, source)
+        if source == "manager" and handle is not None:
+            handle.hub.publish(lines, source)  # 服务器输出由 handle 自己接收
+
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+    api_server = None
+    controller = ServerController(version_dir)
+    controller.add_output_listener(write_lines)
+    monitor = ServerMonitor(controller, auto_restart=auto_restart)
+    monitor.add_event_listener(lambda event, detail: write_lines([describe_event(event, detail)], "manager"))
+    # 粘贴大量命令时按速率排队发送
+    commands = CommandQueue(controller)
+    players = PlayerTracker(os.path.join(logs_root, SESSIONS_FILE))
+    players.attach(controller)
+
+    def report_stop(stage, detail):
+        if stage != STOP_EXITED:  # 退出由监控事件报告
+            write_lines([describe_stop_stage(stage, detail)], "manager")
+    controller.add_stop_listener(report_stop)
+    pid_path = os.path.join(version_dir, PID_FILE)
+    stop_path = os.path.join(version_dir, STOP_FILE)
+    if os.path.exists(stop_path):
+        os.remove(stop_path)
+    if api is not None:
+        from .api import DEFAULT_SERVER, ServerHandle
+        handle = ServerHandle(DEFAULT_SERVER, monitor, commands)
+        api_server = await _start_api([handle], api, lambda message: write_lines([message], "manager"))
+    await monitor.start()
+    _write_pid(version_dir)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows 不支持，Ctrl+C 会直接中断
+
+    if interactive:
+        # 守护线程读取标准输入，不会阻止进程退出
+        def read_stdin():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(commands.send, line.rstrip("\r\n"))
+        threading.Thread(target=read_stdin, daemon=True).start()
+
+    async def watch_control_files():
+        # stop、backup 命令通过控制文件通知，Windows 上同样可用
+        while not os.path.exists(stop_path):
+            if os.path.exists(os.path.join(version_dir, BACKUP_FILE)):
+                await _serve_backup_request(controller, version_dir, write_lines)
+            await asyncio.sleep(0.5)
+        stop_requested.set()
+
+    watcher = asyncio.ensure_future(watch_control_files())
+    stopper = asyncio.ensure_future(stop_requested.wait())
+    finished = asyncio.ensure_future(monitor.wait())
+    try:
+        if api_server is None:
+            await asyncio.wait([finished, stopper], return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await stopper  # 服务器可以通过接口再次启动，收到停止请求才退出
+        if controller.running or not finished.done():
+            await monitor.stop(timeout=stop_timeout)
+        exit_code = await monitor.wait()
+        return exit_code or 0
+    finally:
+        if api_server is not None:
+            await api_server.close()
+        watcher.cancel()
+        stopper.cancel()
+        for path in (pid_path, stop_path):
+            if os.path.exists(path):
+                os.remove(path)
+        if out is not sys.stdout:
+            out.close()
+        logs.close()
+        players.close()
+
+
+def _logs_root(version_dir):
+    from .logstore import LOGS_DIR
+    # 日志目录与 lib 目录并列
+    root = os.path.dirname(os.path.dirname(os.path.abspath(version_dir)))
+    return os.path.join(root, LOGS_DIR, "versions", os.path.basename(version_dir))
+
+
+# ---------------------------------------------------------------- backup
+
+def _snapshot_store(version_dir):
+    from .backup import BACKUPS_DIR, SnapshotStore
+    # 备份目录与 lib 目录并列
+    root = os.path.dirname(os.path.dirname(os.path.abspath(version_dir)))
+    return SnapshotStore(os.path.join(root, BACKUPS_DIR, "versions", os.path.basename(version_dir)))
+
+
+async def _serve_backup_request(controller, version_dir, write_lines):
+    from .backup import BackupError, backup_server
+    request_path = os.path.join(version_dir, BACKUP_FILE)
+    try:
+        with open(request_path, "r") as f:
+            keep = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        keep = 0
+    store = _snapshot_store(version_dir)
+    try:
+        result = await backup_server(controller, store)
+        if keep:
+            await asyncio.get_running_loop().run_in_executor(None, store.prune, keep)
+        message = f"备份完成，{result}"
+    except (BackupError, OSError) as e:
+        message = f"备份失败: {e}"
+    write_lines([message], "manager")
+    tmp_path = request_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(message)
+    os.replace(tmp_path, request_path + ".done")
+    os.remove(request_path)
+
+
+def cmd_backup(args):
+    from .backup import BackupError, backup_server
+    from .controller import ServerController
+    version_dir = _version_dir(args)
+    store = _snapshot_store(version_dir)
+    pid = _read_pid(version_dir)
+    if args.list:
+        for name in store.snapshots():
+            print(name)
+        return 0
+    if args.restore:
+        if pid:
+            raise CommandError("请先停止服务器再恢复")
+        try:
+            store.restore(args.restore, os.path.join(version_dir, "worlds"))
+        except BackupError as e:
+            raise CommandError(str(e))
+        print(f"已恢复快照 {args.restore}")
+        return 0
+    if pid:
+        # 由后台服务器进程在运行中完成备份
+        request_path = os.path.join(version_dir, BACKUP_FILE)
+        done_path = request_path + ".done"
+        if os.path.exists(done_path):
+            os.remove(done_path)
+        with open(request_path, "w") as f:
+            f.write(str(args.keep or 0))
+        deadline = time.monotonic() + args.timeout
+        while not os.path.exists(done_path):
+            if time.monotonic() > deadline or not _read_pid(version_dir):
+                raise CommandError("后台服务器没有完成备份")
+            time.sleep(0.2)
+        with open(done_path, "r", encoding="utf-8") as f:
+            print(f.read())
+        os.remove(done_path)
+        return 0
+    try:
+        result = asyncio.run(backup_server(ServerController(version_dir), store))
+    except BackupError as e:
+        raise CommandError(str(e))
+    if args.keep:
+        store.prune(args.keep)
+    print(f"备份完成，{result}")
+    return 0
+
+
+def cmd_stop(args):
+    version_dir = _version_dir(args)
+    pid = _read_pid(version_dir)
+    if not pid:
+        raise CommandError("服务器未在后台运行")
+    open(os.path.join(version_dir, STOP_FILE), "w").close()
+    if sys.platform != "win32":
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + args.timeout
+    while _read_pid(version_dir) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    if _read_pid(version_dir):
+        raise CommandError(f"服务器在 {args.timeout} 秒内没有退出")
+    print("服务器已停止")
+    return 0
+
+
+# ---------------------------------------------------------------- console
+
+def cmd_console(args):
+    from collections import deque
+    path = os.path.join(_version_dir(args), CONSOLE_LOG)
+    if not os.path.exists(path):
+        raise CommandError("没有控制台日志，服务器可能从未在后台运行")
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in deque(f, maxlen=args.lines):
+            sys.stdout.write(line)
+        sys.stdout.flush()
+        while args.follow:
+            line = f.readline()
+            if line:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                time.sleep(0.2)
+    return 0
+
+
+def cmd_logs(args):
+    from .logstore import LOGS_DIR, LogStore, format_record, parse_time
+    if args.instance:
+        root = os.path.join(LOGS_DIR, "instances", args.instance)
+    elif args.gui:
+        root = os.path.join(LOGS_DIR, "console")
+    else:
+        root = _logs_root(_version_dir(args))
+    if not os.path.isdir(root):
+        raise CommandError(f"没有历史日志（{root}）")
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+    except ValueError as e:
+        raise CommandError(str(e))
+    started = time.perf_counter()
+    try:
+        records = LogStore(root).search(args.text, since, until, args.source, args.regex, args.limit)
+    except re.error as e:
+        raise CommandError(f"无效的正则表达式: {e}")
+    for record in records:
+        print(format_record(record))
+    print(f"{len(records)} 条，{(time.perf_counter() - started) * 1000:.0f} 毫秒", file=sys.stderr)
+    return 0
+
+
+def cmd_players(args):
+    from .logstore import LOGS_DIR, parse_time
+    from .players import SESSIONS_FILE, SessionStore, format_duration
+    if args.instance:
+        root = os.path.join(LOGS_DIR, "instances", args.instance)
+    else:
+        root = _logs_root(_version_dir(args))
+    path = os.path.join(root, SESSIONS_FILE)
+    if not os.path.exists(path):
+        raise CommandError(f"没有玩家记录（{path}）")
+    try:
+        since = parse_time(args.since) if args.since else None
+    except ValueError as e:
+        raise CommandError(str(e))
+    store = SessionStore(path)
+
+    def when(t):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+
+    if args.player:
+        print(f"{args.player} 游戏时间 {format_duration(store.playtime(args.player, since))}")
+        for joined, left, reason in store.sessions(args.player, args.limit):
+            end = when(left) + f"（{reason}）" if left else "在线"
+            print(f"{when(joined)} - {end}")
+    else:
+        for name, seconds, sessions in store.top(args.limit, since):
+            print(f"{name}\t{format_duration(seconds)}\t{sessions} 次")
+    return 0
+
+
+# ---------------------------------------------------------------- 多实例
+
+def _supervisor(args):
+    from .supervisor import Supervisor
+    return Supervisor(args.lib, args.instances).load()
+
+
+def cmd_instance(args):
+    from .supervisor import SupervisorError
+    supervisor = _supervisor(args)
+    try:
+        if args.action == "add":
+            instance = supervisor.add_instance(args.name, args.version, args.port)
+            print(f"已创建实例 {instance.name}（版本 {instance.version}，端口 {instance.port}/{instance.port + 1}）")
+        elif args.action == "remove":
+            supervisor.remove_instance(args.name, delete_files=args.delete)
+            print(f"已删除实例 {args.name}")
+        elif args.action == "set-version":
+            supervisor.set_version(args.name, args.version)
+            print(f"实例 {args.name} 已切换到版本 {args.version}")
+        else:
+            for item in supervisor.status():
+                print(f"{item['name']}\t{item['version']}\t{item['port']}")
+    except SupervisorError as e:
+        raise CommandError(str(e))
+    return 0
+
+
+def cmd_schedule(args):
+    from .scheduler import ScheduleError
+    supervisor = _supervisor(args)
+    scheduler = supervisor.scheduler
+    for message in scheduler.load_errors:
+        print(f"警告: {message}", file=sys.stderr)
+
+    def when(t):
+        return time.strftime("%Y-%m-%d %H:%M", time.localtime(t)) if t else "-"
+
+    try:
+        if args.action == "add":
+            if args.name not in supervisor.instances:
+                raise CommandError(f"实例 {args.name} 不存在")
+            job = scheduler.add(args.name, args.trigger, args.operation, " ".join(args.argument), args.missed)
+            print(f"已添加 {job.describe()}，下次运行 {when(job.next_run)}")
+        elif args.action == "list":
+            for job in scheduler.jobs(args.name):
+                state = f"下次 {when(job.next_run)}" if job.enabled else "已停用"
+                print(f"{job.describe()}\t{state}\t上次 {when(job.last_run)}\t错过时 {job.missed}")
+        elif args.action == "remove":
+            scheduler.remove(args.id)
+            print(f"已删除任务 #{args.id}")
+        else:
+            scheduler.set_enabled(args.id, args.action == "enable")
+            print(f"任务 #{args.id} 已{'启用' if args.action == 'enable' else '停用'}")
+    except ScheduleError as e:
+        raise CommandError(str(e))
+    return 0
+
+
+def cmd_supervise(args):
+    from .supervisor import use_event_driven_child_watcher
+    supervisor = _supervisor(args)
+    names = args.names or list(supervisor.instances)
+    if not names:
+        raise CommandError("没有实例，请先使用 instance add 创建")
+    for name in names:
+        if name not in supervisor.instances:
+            raise CommandError(f"实例 {name} 不存在")
+    if args.no_restart:
+        for instance in supervisor.instances.values():
+            instance.monitor.auto_restart = False
+    use_event_driven_child_watcher()
+    try:
+        return asyncio.run(_run_supervisor(supervisor, names, args.stop_budget, args.metrics_interval,
+                                           api=_api_options(args)))
+    except KeyboardInterrupt:
+        return 130
+
+
+def _print_status(supervisor):
+    from .metrics import format_bytes
+    for item in supervisor.status():
+        line = f"{item['name']}\t{item['state']}\t端口 {item['port']}\t重启 {item['health']['restarts']} 次"
+        resources = item["resources"]
+        if item["pid"] and resources:
+            line += (f"\tCPU {resources['cpu']:.1f}%\t内存 {format_bytes(resources['rss'])}"
+                     f"\t线程 {resources['threads']:.0f}"
+                     f"\t磁盘 {format_bytes(resources['disk_read'] + resources['disk_write'])}/s")
+        if item["players"]:
+            line += f"\t在线 {len(item['players'])} 人: {', '.join(item['players'])}"
+        print(line)
+    print(f"采样开销: {supervisor.sampler.overhead * 100:.3f}% CPU")
+
+
+async def _run_supervisor(supervisor, names, stop_budget=30.0, metrics_interval=2.0, api=None):
+    from .backup import BackupError
+    from .controller import STOP_EXITED, describe_stop_stage
+    from .health import describe_event
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+
+    handles = {}
+
+    def write_lines(instance, lines, source):
+        prefix = f"[{instance.name}] "
+        sys.stdout.write("".join(prefix + line + "\n" for line in lines))
+        sys.stdout.flush()
+        if source == "manager":
+            instance.logs.write(lines, source)  # 服务器输出由实例自己记录
+            if instance.name in handles:
+                handles[instance.name].hub.publish(lines, source)
+
+    async def run_backup(name):
+        instance = supervisor.get(name)
+        try:
+            result = await supervisor.backup(name)
+            write_lines(instance, [f"备份完成，{result}"], "manager")
+        except (BackupError, OSError) as e:
+            write_lines(instance, [f"备份失败: {e}"], "manager")
+
+    def dispatch(line):
+        if line.strip() == "status":
+            _print_status(supervisor)
+            return
+        if line.startswith("backup "):
+            target = line[len("backup "):].strip()
+            for name in (names if target == "*" else [target]):
+                if name in supervisor.instances:
+                    asyncio.ensure_future(run_backup(name))
+            return
+        target, sep, command = line.partition(":")
+        if not sep:
+            print("请输入 \"名称: 命令\"、\"*: 命令\" 或 \"status\"")
+            return
+        target, command = target.strip(), command.strip()
+        for name in (names if target == "*" else [target]):
+            if name in supervisor.instances and not supervisor.send(name, command):
+                print(f"实例 {name} 未运行")
+
+    api_server = None
+    if api is not None:
+        from .api import InstanceHandle
+        handles.update((name, InstanceHandle(supervisor, supervisor.get(name))) for name in names)
+        api_server = await _start_api(list(handles.values()), api, print)
+    supervisor.add_output_listener(write_lines)
+    supervisor.sampler.interval = metrics_interval
+    supervisor.sampler.start()
+    supervisor.add_event_listener(
+        lambda instance, event, detail: write_lines(instance, [describe_event(event, detail)], "manager"))
+
+    def report_stop(instance, stage, detail):
+        if stage != STOP_EXITED:  # 退出由监控事件报告
+            write_lines(instance, [describe_stop_stage(stage, detail)], "manager")
+    for name in names:
+        instance = supervisor.get(name)
+        instance.controller.add_stop_listener(
+            lambda stage, detail, instance=instance: report_stop(instance, stage, detail))
+    for name, result in (await supervisor.start_all(names)).items():
+        if isinstance(result, Exception):
+            print(f"实例 {name} 启动失败: {result}")
+    def report_job(job, result, error):
+        if job.instance in supervisor.instances:
+            message = f"定时任务 #{job.id} 失败: {error}" if error else f"定时任务 #{job.id}: {result}"
+            write_lines(supervisor.get(job.instance), [message], "manager")
+    supervisor.scheduler.add_listener(report_job)
+    for message in supervisor.scheduler.load_errors:
+        print(f"警告: {message}")
+    supervisor.scheduler.add_error_listener(lambda message: print(f"警告: {message}"))
+    supervisor.scheduler.start()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    def read_stdin():
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(dispatch, line.rstrip("\r\n"))
+    threading.Thread(target=read_stdin, daemon=True).start()
+
+    async def all_exited():
+        await asyncio.gather(*(supervisor.get(n).monitor.wait() for n in names))
+
+    waiter = asyncio.ensure_future(all_exited())
+    stopper = asyncio.ensure_future(stop_requested.wait())
+    # 有控制接口时实例可以再次启动，收到停止请求才退出
+    await asyncio.wait([stopper] if api_server else [waiter, stopper], return_when=asyncio.FIRST_COMPLETED)
+    stopper.cancel()
+    supervisor.scheduler.stop()
+    supervisor.sampler.stop()
+    await supervisor.stop_all(stop_budget)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    if api_server is not None:
+        await api_server.close()
+    supervisor.close_logs()
+    return 0
+
+
+def _add_api_arguments(p):
+    from .api import API_HOST
+    p.add_argument("--api", type=int, metavar="端口", help="开启本机控制接口（HTTP / WebSocket），例如 --api 8766")
+    p.add_argument("--api-host", default=API_HOST, help="控制接口监听的地址（默认只允许本机访问）")
+    p.add_argument("--api-token", default=os.environ.get(API_TOKEN_ENV),
+                   help=f"访问控制接口需要的 token（默认读取环境变量 {API_TOKEN_ENV}）")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m mcmanager", description="Minecraft Bedrock 服务器管理（命令行）")
+    parser.add_argument("--lib", default="lib", help="服务器文件目录（默认 lib）")
+    parser.add_argument("--instances", default="instances", help="多实例目录（默认 instances）")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser("versions", help="列出已安装的版本")
+    p.set_defaults(func=cmd_versions)
+
+    p = commands.add_parser("download", help="下载并安装版本")
+    p.add_argument("version")
+    p.add_argument("--connections", type=int, default=4, help="并行连接数")
+    p.add_argument("--retries", type=int, default=3, help="失败重试次数")
+    p.add_argument("--mirror", help="局域网镜像地址（默认读取环境变量 MCMANAGER_MIRROR）")
+    p.add_argument("--no-cache", action="store_true", help="不使用本地安装包缓存")
+    p.set_defaults(func=cmd_download)
+
+    p = commands.add_parser("discover", help="查找官方（或镜像）上存在的版本")
+    p.add_argument("pattern", help="版本模式，例如 1.21.51.* 或 1.21.50-60.1,2")
+    p.add_argument("--mirror", help="局域网镜像地址（默认读取环境变量 MCMANAGER_MIRROR）")
+    p.add_argument("--concurrency", type=int, default=16, help="最大并发连接数")
+    p.set_defaults(func=cmd_discover)
+
+    p = commands.add_parser("start", help="启动服务器")
+    p.add_argument("version", nargs="?")
+    p.add_argument("--daemon", action="store_true", help="在后台运行")
+    p.add_argument("--no-input", action="store_true", help="不从标准输入读取命令")
+    p.add_argument("--log", help="把控制台输出追加到文件而不是标准输出")
+    p.add_argument("--no-restart", action="store_true", help="崩溃后不自动重启")
+    p.add_argument("--stop-timeout", type=float, default=30, help="停止时等待服务器保存存档的秒数，超时后强制结束")
+    p.add_argument("--no-verify", action="store_true", help="启动前不校验服务器文件")
+    _add_api_arguments(p)
+    p.set_defaults(func=cmd_start)
+
+    p = commands.add_parser("verify", help="校验已安装版本的文件是否完整")
+    p.add_argument("versions", nargs="*", help="要校验的版本（默认全部）")
+    p.add_argument("--deep", action="store_true", help="重新计算所有文件的哈希（默认只比较大小和修改时间）")
+    p.add_argument("--rebuild", action="store_true", help="根据当前文件重新生成清单（用于本功能之前安装的版本）")
+    p.add_argument("--workers", type=int, help="并行计算哈希的线程数（默认 CPU 核心数的两倍）")
+    p.set_defaults(func=cmd_verify)
+
+    p = commands.add_parser("stop", help="停止后台运行的服务器")
+    p.add_argument("version", nargs="?")
+    p.add_argument("--timeout", type=float, default=45, help="等待退出的秒数")
+    p.set_defaults(func=cmd_stop)
+
+    p = commands.add_parser("console", help="查看后台服务器的控制台")
+    p.add_argument("version", nargs="?")
+    p.add_argument("-n", "--lines", type=int, default=50, help="显示最后多少行")
+    p.add_argument("-f", "--follow", action="store_true", help="持续输出新的内容")
+    p.set_defaults(func=cmd_console)
+
+    p = commands.add_parser("logs", help="查询历史控制台日志")
+    p.add_argument("text", nargs="?", default="", help="要查找的文字（不区分大小写）")
+    p.add_argument("--version", help="版本（默认最近使用的版本）")
+    p.add_argument("--instance", help="查询实例的日志")
+    p.add_argument("--gui", action="store_true", help="查询图形界面控制台的日志")
+    p.add_argument("--since", help="开始时间，例如 \"2026-10-13 02:00\"")
+    p.add_argument("--until", help="结束时间")
+    p.add_argument("--source", choices=["stdout", "stderr", "manager"], help="只查询该来源")
+    p.add_argument("--regex", action="store_true", help="text 为正则表达式")
+    p.add_argument("--limit", type=int, default=500, help="最多显示的条数（最新的）")
+    p.set_defaults(func=cmd_logs)
+
+    p = commands.add_parser("players", help="查看玩家游戏时间排行或某个玩家的会话")
+    p.add_argument("version", nargs="?")
+    p.add_argument("--instance", help="查看实例的玩家")
+    p.add_argument("--player", help="玩家名称（不区分大小写）")
+    p.add_argument("--since", help="只统计该时间之后，例如 \"2026-10-01\"")
+    p.add_argument("--limit", type=int, default=20, help="最多显示的条数")
+    p.set_defaults(func=cmd_players)
+
+    p = commands.add_parser("backup", help="备份或恢复世界")
+    p.add_argument("version", nargs="?")
+    p.add_argument("--keep", type=int, help="只保留最近的快照数量")
+    p.add_argument("--list", action="store_true", help="列出已有的快照")
+    p.add_argument("--restore", metavar="快照", help="恢复快照（服务器必须已停止）")
+    p.add_argument("--timeout", type=float, default=120, help="等待后台服务器完成备份的秒数")
+    p.set_defaults(func=cmd_backup)
+
+    p = commands.add_parser("instance", help="管理多实例")
+    actions = p.add_subparsers(dest="action")
+    actions.required = True
+    a = actions.add_parser("add", help="新建实例")
+    a.add_argument("name")
+    a.add_argument("version")
+    a.add_argument("--port", type=int, help="IPv4端口（默认自动分配，IPv6端口为其加1）")
+    a = actions.add_parser("remove", help="删除实例")
+    a.add_argument("name")
+    a.add_argument("--delete", action="store_true", help="同时删除实例目录（包括存档）")
+    a = actions.add_parser("set-version", help="切换实例的版本")
+    a.add_argument("name")
+    a.add_argument("version")
+    actions.add_parser("list", help="列出实例")
+    p.set_defaults(func=cmd_instance)
+
+    p = commands.add_parser("schedule", help="管理多实例的定时任务（由 supervise 执行）")
+    actions = p.add_subparsers(dest="action")
+    actions.required = True
+    a = actions.add_parser("add", help="新建定时任务")
+    a.add_argument("name", help="实例名称")
+    a.add_argument("trigger", help="cron 表达式（分 时 日 月 星期）、@daily 或 \"every 30m\"")
+    a.add_argument("operation", choices=["command", "restart", "backup"])
+    a.add_argument("argument", nargs="*", help="command 的命令，或 backup 保留的快照数")
+    a.add_argument("--missed", choices=["once", "skip", "all"], default="once",
+                   help="管理器未运行期间错过的运行：补一次（默认）、跳过或全部补上")
+    a = actions.add_parser("list", help="列出定时任务")
+    a.add_argument("name", nargs="?", help="只列出该实例的任务")
+    for action, help_text in (("remove", "删除定时任务"), ("enable", "启用定时任务"), ("disable", "停用定时任务")):
+        a = actions.add_parser(action, help=help_text)
+        a.add_argument("id", type=int)
+    p.set_defaults(func=cmd_schedule)
+
+    p = commands.add_parser("supervise", help="同时运行多个实例")
+    p.add_argument("names", nargs="*", help="要运行的实例（默认全部）")
+    p.add_argument("--no-restart", action="store_true", help="崩溃后不自动重启")
+    p.add_argument("--stop-budget", type=float, default=30, help="退出时停止全部实例的总时限（秒）")
+    p.add_argument("--metrics-interval", type=float, default=2, help="资源采样间隔（秒）")
+    _add_api_arguments(p)
+    p.set_defaults(func=cmd_supervise)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except CommandError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
@@ -0,0 +1,255 @@
+"""发送给服务器的命令队列。
+
+直接向标准输入写命令时，一次粘贴几百条命令（例如批量 allowlist add、op）会在瞬间
+涌入服务器，也无法知道某条命令的结果。CommandQueue 把命令排队，按令牌桶限制速率，
+把同一时刻可以发送的命令合并成一次写入并等待管道排空（不会丢命令）；需要结果的命令
+带上期望的输出（正则表达式或判断函数），之后第一行匹配的输出即为该命令的结果，
+超时未出现则失败。等待结果的命令数量有上限，服务器处理得快时队列也跑得快，
+处理得慢时自动放慢，不会越积越多。
+
+所有方法都必须在事件循环所在的线程中调用。
+"""
+import asyncio
+import collections
+import re
+
+from .controller import STOPPED
+
+DEFAULT_RATE = 50.0       # 每秒最多发送的命令数
+DEFAULT_BURST = 50        # 空闲后可以立即发送的命令数
+DEFAULT_BATCH = 32        # 一次写入的最多命令数
+DEFAULT_INFLIGHT = 16     # 同时等待结果的最多命令数
+DEFAULT_TIMEOUT = 10.0    # 从发送到出现期望输出的最长时间
+
+
+class CommandQueueError(Exception):
+    """命令无法发送（服务器未运行或已停止）"""
+
+
+class CommandTimeout(CommandQueueError):
+    """命令已发送，但期望的输出没有按时出现"""
+
+
+def _predicate(expect):
+    if expect is None or callable(expect):
+        return expect
+    pattern = re.compile(expect) if isinstance(expect, str) else expect
+    return lambda line: pattern.search(line) is not None
+
+
+def read_script(path):
+    """读取命令脚本：每行一条命令，忽略空行和以 # 开头的注释"""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class _Command:
+    __slots__ = ("text", "predicate", "timeout", "future", "timer")
+
+    def __init__(self, text, predicate, timeout, future):
+        self.text = text
+        self.predicate = predicate
+        self.timeout = timeout
+        self.future = future
+        self.timer = None
+
+
+class TokenBucket:
+    """令牌桶：长期速率不超过 rate，空闲后最多连续放行 burst 个"""
+
+    def __init__(self, rate, burst, clock):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count):
+        """取出最多 count 个令牌，返回实际取出的个数"""
+        if not self.rate:
+            return count
+        self._refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+    def delay(self):
+        """距离下一个令牌可用的秒数"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate else 0.0
+
+
+class CommandQueueStats:
+    def __init__(self):
+        self.sent = 0        # 已写入标准输入的命令数
+        self.batches = 0     # 写入次数
+        self.matched = 0     # 得到期望输出的命令数
+        self.timeouts = 0
+        self.failed = 0      # 因服务器未运行没有发出的命令数
+
+
+class CommandQueue:
+    """一个服务器的命令队列。
+
+    rate 为 0 时不限制速率；一行输出最多作为一条命令的结果，多条命令期望相同的输出时
+    按发送顺序依次对应。
+    """
+
+    def __init__(self, controller, rate=DEFAULT_RATE, burst=DEFAULT_BURST, batch_size=DEFAULT_BATCH,
+                 max_inflight=DEFAULT_INFLIGHT, timeout=DEFAULT_TIMEOUT):
+        self.controller = controller
+        self.rate = rate
+        self.burst = burst
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.stats = CommandQueueStats()
+        self._queue = collections.deque()
+        self._inflight = []
+        self._bucket = None
+        self._wakeup = None
+        self._pump_task = None
+        controller.add_output_listener(self._on_output)
+        controller.add_state_listener(self._on_state)
+
+    def __len__(self):
+        """排队中和等待结果的命令数"""
+        return len(self._queue) + len(self._inflight)
+
+    def submit(self, command, expect=None, timeout=None):
+        """把命令加入队列，返回 Future。
+
+        expect 为 None 时命令写入标准输入后完成，结果为 None；否则结果为之后第一行
+        匹配 expect 的输出，timeout 秒（默认 self.timeout）内没有出现时抛出 CommandTimeout。
+        """
+        if "\n" in command or "\r" in command:
+            raise ValueError("一条命令不能包含换行")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.controller.running:
+            self.stats.failed += 1
+            future.set_exception(CommandQueueError("服务器未运行"))
+            return future
+        if self._pump_task is None or self._pump_task.done():
+            self._bucket = TokenBucket(self.rate, self.burst, loop.time)
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.ensure_future(self._pump())
+        self._queue.append(_Command(command, _predicate(expect), timeout or self.timeout, future))
+        self._wakeup.set()
+        return future
+
+    def send(self, command):
+        """把命令加入队列，不关心结果；服务器未运行时返回 False（与 ServerController.send 相同）"""
+        if not self.controller.running:
+            return False
+        self.submit(command).add_done_callback(lambda f: f.cancelled() or f.exception())
+        return True
+
+    async def run(self, command, expect=None, timeout=None):
+        """发送命令并等待结果（见 submit）"""
+        return await self.submit(command, expect, timeout)
+
+    async def run_many(self, commands, expect=None, timeout=None):
+        """依次发送多条命令，返回与 commands 对应的结果列表，失败的命令对应异常对象"""
+        futures = [self.submit(command, expect, timeout) for command in commands]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    def close(self):
+        """取消所有命令并停止发送"""
+        self._fail_all(CommandQueueError("命令队列已关闭"))
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        self.controller.remove_output_listener(self._on_output)
+        self.controller.remove_state_listener(self._on_state)
+
+    async def _pump(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                while self._queue and self._queue[0].future.done():
+                    self._queue.popleft()  # 调用方已经取消
+                if not self._queue:
+                    break
+                room = self.max_inflight - len(self._inflight)
+                if room <= 0:
+                    break  # 等待结果到来或超时后再唤醒
+                count = self._bucket.take(min(len(self._queue), self.batch_size, room))
+                if not count:
+                    await asyncio.sleep(self._bucket.delay())
+                    continue
+                batch = [self._queue.popleft() for _ in range(count)]
+                # 先登记再写入，避免错过很快到来的输出
+                for item in batch:
+                    if item.predicate is not None:
+                        self._inflight.append(item)
+                if not await self.controller.send_lines([item.text for item in batch]):
+                    self._fail_all(CommandQueueError("服务器未运行，命令没有发出"), batch)
+                    break
+                self.stats.sent += count
+                self.stats.batches += 1
+                loop = asyncio.get_running_loop()
+                for item in batch:
+                    if item.future.done():
+                        continue  # 写入期间已经得到结果
+                    if item.predicate is None:
+                        item.future.set_result(None)
+                    else:
+                        item.timer = loop.call_later(item.timeout, self._expire, item)
+
+    def _on_output(self, lines, source):
+        if not self._inflight:
+            return
+        freed = False
+        for line in lines:
+            for item in list(self._inflight):
+                if item.future.done():
+                    # 调用方已经取消
+                    self._inflight.remove(item)
+                    self._cancel_timer(item)
+                    freed = True
+                elif item.predicate(line):
+                    self._inflight.remove(item)
+                    self._cancel_timer(item)
+                    item.future.set_result(line)
+                    self.stats.matched += 1
+                    freed = True
+                    break
+        if freed and self._queue:
+            self._wakeup.set()
+
+    @staticmethod
+    def _cancel_timer(item):
+        if item.timer is not None:
+            item.timer.cancel()
+            item.timer = None
+
+    def _expire(self, item):
+        if item in self._inflight:
+            self._inflight.remove(item)
+            if not item.future.done():
+                self.stats.timeouts += 1
+                item.future.set_exception(CommandTimeout(f"命令 {item.text!r} 在 {item.timeout:g} 秒内没有得到期望的输出"))
+            if self._queue:
+                self._wakeup.set()
+
+    def _on_state(self, state, exit_code):
+        if state == STOPPED:
+            self._fail_all(CommandQueueError("服务器已停止"))
+
+    def _fail_all(self, error, extra=()):
+        items = list(extra) + list(self._queue) + self._inflight
+        self._queue.clear()
+        self._inflight = []
+        for item in items:
+            self._cancel_timer(item)
+            if not item.future.done():
+                self.stats.failed += 1
+                item.future.set_exception(error)
@@ -0,0 +1,142 @@
+"""控制台行缓冲：固定容量的环形缓冲区，配合界面定时器批量刷新。
+
+每行在加入缓冲区时记录来源并分类一次级别（ConsoleLine），之后按正则、级别、来源
+筛选（ConsoleFilter）时只比较缓存的字段，新行到达时也只需判断新行。
+"""
+import collections
+import re
+import threading
+from collections import deque
+
+# 默认保留的控制台行数
+DEFAULT_MAX_LINES = 5000
+
+LEVEL_INFO = "INFO"
+LEVEL_WARN = "WARN"
+LEVEL_ERROR = "ERROR"
+LEVELS = (LEVEL_INFO, LEVEL_WARN, LEVEL_ERROR)
+SOURCES = ("stdout", "stderr", "manager")
+
+# 服务器日志行形如 "[2026-01-01 12:00:00:123 WARN] ..."，前面可能还有 "NO LOG FILE! - "
+_LEVEL_RE = re.compile(r"\[[^\]]*?\b(INFO|WARN(?:ING)?|ERROR|FATAL)\]")
+_LEVEL_SPAN = 64  # 只在行首这么多字符中查找级别标记，避免误认聊天内容
+_LEVEL_NAMES = {"INFO": LEVEL_INFO, "WARN": LEVEL_WARN, "WARNING": LEVEL_WARN,
+                "ERROR": LEVEL_ERROR, "FATAL": LEVEL_ERROR}
+
+ConsoleLine = collections.namedtuple("ConsoleLine", "text source level")
+
+
+def classify_level(text, source="stdout"):
+    """一行的级别：行首的日志标记优先，没有标记时标准错误为 ERROR，其余为 INFO"""
+    match = _LEVEL_RE.search(text, 0, _LEVEL_SPAN)
+    if match:
+        return _LEVEL_NAMES[match.group(1)]
+    return LEVEL_ERROR if source == "stderr" else LEVEL_INFO
+
+
+class ConsoleFilter:
+    """控制台筛选条件。pattern 为正则表达式（不区分大小写），无效时抛出 re.error；
+    levels、sources 为允许的级别、来源集合，None 表示不限制。
+    """
+
+    def __init__(self, pattern="", levels=None, sources=None):
+        self.pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+        self.levels = frozenset(levels) if levels is not None else None
+        self.sources = frozenset(sources) if sources is not None else None
+
+    @property
+    def active(self):
+        """是否会排除任何行"""
+        return (self.pattern is not None
+                or self.levels is not None and not self.levels.issuperset(LEVELS)
+                or self.sources is not None and not self.sources.issuperset(SOURCES))
+
+    def matches(self, line):
+        if self.levels is not None and line.level not in self.levels:
+            return False
+        if self.sources is not None and line.source not in self.sources:
+            return False
+        return self.pattern is None or self.pattern.search(line.text) is not None
+
+    def apply(self, lines):
+        """筛选出匹配的行，先比较缓存的级别和来源，最后才做正则匹配"""
+        if self.levels is not None and not self.levels.issuperset(LEVELS):
+            lines = [line for line in lines if line.level in self.levels]
+        if self.sources is not None and not self.sources.issuperset(SOURCES):
+            lines = [line for line in lines if line.source in self.sources]
+        if self.pattern is not None:
+            search = self.pattern.search
+            lines = [line for line in lines if search(line.text)]
+        return lines
+
+
+class ConsoleBuffer:
+    """固定容量的控制台行缓冲区。
+
+    append/extend 可以在任意线程调用；界面线程定时调用 drain 取走
+    自上次刷新以来的新行（ConsoleLine），一次性追加到视图中。超出容量的旧行会被丢弃，
+    因此无论服务器输出多少，内存占用都是恒定的。
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        self._lock = threading.Lock()
+        self._lines = deque(maxlen=max_lines)
+        self._pending = deque(maxlen=max_lines)
+        self.total_lines = 0
+        self.overflowed = 0  # 还没来得及显示就被挤掉的行数
+
+    @property
+    def max_lines(self):
+        return self._lines.maxlen
+
+    def set_max_lines(self, max_lines):
+        """修改容量，保留最新的行"""
+        max_lines = max(1, int(max_lines))
+        with self._lock:
+            self._lines = deque(self._lines, maxlen=max_lines)
+            self._pending = deque(self._pending, maxlen=max_lines)
+
+    def append(self, text, source="manager"):
+        """追加一段文本（可包含多行），返回是否需要安排一次刷新"""
+        lines = text.splitlines()
+        if not lines:
+            lines = [""]
+        return self.extend(lines, source)
+
+    def extend(self, lines, source="stdout"):
+        """追加多行，返回追加前待刷新队列是否为空（即需要安排刷新）"""
+        lines = [ConsoleLine(line, source, classify_level(line, source)) for line in lines]
+        with self._lock:
+            was_idle = not self._pending
+            room = self._pending.maxlen - len(self._pending)
+            if len(lines) > room:
+                self.overflowed += len(lines) - room
+            self._lines.extend(lines)
+            self._pending.extend(lines)
+            self.total_lines += len(lines)
+            return was_idle
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def drain(self):
+        """取走所有待刷新的行（ConsoleLine）"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            return lines
+
+    def snapshot(self):
+        """返回当前缓冲区中全部行的文本"""
+        with self._lock:
+            return [line.text for line in self._lines]
+
+    def records(self):
+        """返回当前缓冲区中的全部行（ConsoleLine）"""
+        with self._lock:
+            return list(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._pending.clear()
@@ -0,0 +1,299 @@
+"""服务器进程控制（asyncio，不依赖 PyQt5）。
+
+图形界面和命令行都通过 ServerController 启动、停止服务器并读取输出。
+除特别说明外，所有方法都必须在事件循环所在的线程中调用。
+"""
+import asyncio
+import os
+
+from .reader import LineFramer, ReaderStats
+from .versions import IS_WINDOWS, SERVER_EXECUTABLE, server_executable
+
+# 进程状态
+STOPPED = "stopped"
+STARTING = "starting"
+RUNNING = "running"
+STOPPING = "stopping"
+
+READ_SIZE = 64 * 1024
+
+# 停止过程的各个阶段
+STOP_COMMAND = "command"      # 已发送 stop 命令
+STOP_SAVED = "saved"          # 服务器输出了退出日志，存档已保存
+STOP_TERMINATE = "terminate"  # 等待超时，请求终止进程
+STOP_KILL = "kill"            # 仍未退出，强制结束进程
+STOP_EXITED = "exited"        # 进程已退出，详情为退出码
+
+SHUTDOWN_MARKER = "Quit correctly"
+STOP_TIMEOUT = 30.0
+TERMINATE_TIMEOUT = 5.0
+
+
+class ControllerError(Exception):
+    """无法执行请求的操作（例如找不到服务器程序、服务器已在运行）"""
+
+
+def describe_stop_stage(stage, detail):
+    """把停止阶段转换成显示给用户的文字"""
+    if stage == STOP_COMMAND:
+        return f"已发送 stop 命令，等待服务器保存存档（最多 {round(detail, 1):g} 秒）"
+    if stage == STOP_SAVED:
+        return "服务器已保存存档，正在退出"
+    if stage == STOP_TERMINATE:
+        return "服务器没有按时退出，请求终止进程"
+    if stage == STOP_KILL:
+        return "进程仍未退出，强制结束"
+    if stage == STOP_EXITED:
+        return f"服务器已停止，退出码: {detail}"
+    return f"{stage}: {detail}"
+
+
+class ServerController:
+    """管理一个服务器进程。
+
+    输出监听器签名为 listener(lines, source)，source 为 "stdout" 或 "stderr"，
+    每次读到数据时以整批完整的行调用；状态监听器签名为 listener(state, exit_code)；
+    停止监听器签名为 listener(stage, detail)，在 stop() 的每个阶段调用。
+    """
+
+    def __init__(self, working_dir, executable=None, args=()):
+        self.working_dir = working_dir
+        self.executable = executable
+        self.args = list(args)
+        self.process = None
+        self.state = STOPPED
+        self.exit_code = None
+        self.stats = ReaderStats()
+        self._output_listeners = []
+        self._state_listeners = []
+        self._stop_listeners = []
+        self._readers = []
+        self._finished = None
+        self._quit_logged = None
+        self._expectations = []
+
+    @property
+    def running(self):
+        return self.state in (STARTING, RUNNING, STOPPING)
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    # ------------------------------------------------------------ 监听器
+
+    def add_output_listener(self, listener):
+        self._output_listeners.append(listener)
+
+    def remove_output_listener(self, listener):
+        if listener in self._output_listeners:
+            self._output_listeners.remove(listener)
+
+    def add_state_listener(self, listener):
+        self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    def add_stop_listener(self, listener):
+        self._stop_listeners.append(listener)
+
+    def remove_stop_listener(self, listener):
+        if listener in self._stop_listeners:
+            self._stop_listeners.remove(listener)
+
+    def _stop_stage(self, stage, detail=None):
+        for listener in list(self._stop_listeners):
+            listener(stage, detail)
+
+    def _set_state(self, state, exit_code=None):
+        self.state = state
+        for listener in list(self._state_listeners):
+            listener(state, exit_code)
+
+    def _emit(self, lines, source):
+        self.stats.lines_read += len(lines)
+        if self._quit_logged is not None and not self._quit_logged.is_set():
+            if any(SHUTDOWN_MARKER in line for line in lines):
+                self._quit_logged.set()
+        if self._expectations:
+            self._match_expectations(lines)
+        for listener in list(self._output_listeners):
+            listener(lines, source)
+
+    def _match_expectations(self, lines):
+        for line in lines:
+            for item in list(self._expectations):
+                predicate, future = item
+                if future.done():
+                    self._expectations.remove(item)
+                elif predicate(line):
+                    self._expectations.remove(item)
+                    future.set_result(line)
+
+    def expect(self, predicate):
+        """返回一个 Future，在之后第一行满足 predicate(line) 的输出到来时完成，结果为该行。
+
+        应在发送命令之前调用，以免错过命令的输出；不再需要时取消 Future 即可。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._expectations.append((predicate, future))
+        return future
+
+    # ------------------------------------------------------------ 进程控制
+
+    async def start(self):
+        """启动服务器进程，进程创建成功后返回"""
+        if self.running:
+            raise ControllerError("服务器已经在运行")
+        executable = self.executable or server_executable(self.working_dir)
+        if not executable:
+            raise ControllerError(f"在 {self.working_dir} 目录中找不到{SERVER_EXECUTABLE}")
+        env = None
+        if not IS_WINDOWS:
+            # Linux 版服务器需要从自身目录加载动态库
+            env = dict(os.environ, LD_LIBRARY_PATH=os.path.abspath(self.working_dir))
+        self.stats.reset()
+        self.exit_code = None
+        self._set_state(STARTING)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                executable, *self.args, cwd=self.working_dir, env=env,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            self._set_state(STOPPED)
+            raise ControllerError(f"服务器启动失败: {e}")
+        self._readers = [
+            asyncio.ensure_future(self._pump(self.process.stdout, "stdout")),
+            asyncio.ensure_future(self._pump(self.process.stderr, "stderr")),
+        ]
+        self._finished = asyncio.ensure_future(self._wait_process())
+        self._set_state(RUNNING)
+
+    async def _pump(self, stream, source):
+        framer = LineFramer()
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+            self.stats.bytes_read += len(data)
+            lines = framer.feed(data)
+            if lines:
+                self._emit(lines, source)
+        rest = framer.flush()
+        if rest:
+            self._emit(rest, source)
+
+    async def _wait_process(self):
+        exit_code = await self.process.wait()
+        # 读完管道中剩余的输出再通知退出
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        self.exit_code = exit_code
+        self.process = None
+        self._set_state(STOPPED, exit_code)
+        return exit_code
+
+    def send(self, command):
+        """向服务器发送一行命令，服务器未运行时返回 False"""
+        if self.process is None or self.state != RUNNING:
+            return False
+        try:
+            self.process.stdin.write((command + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+    async def send_lines(self, commands):
+        """把多条命令合并成一次写入并等待管道排空，服务器未运行时返回 False"""
+        if self.process is None or self.state != RUNNING:
+            return False
+        try:
+            self.process.stdin.write("".join(command + "\n" for command in commands).encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+    async def wait(self):
+        """等待进程退出，返回退出码"""
+        if self._finished is None:
+            return self.exit_code
+        return await asyncio.shield(self._finished)
+
+    def kill(self):
+        """立即强制结束进程（不等待退出）"""
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def stop(self, timeout=STOP_TIMEOUT, terminate_timeout=TERMINATE_TIMEOUT, deadline=None):
+        """优雅停止服务器，返回退出码。
+
+        先通过标准输入发送 stop 命令，让服务器保存存档后自行退出；timeout 秒内
+        没有退出则请求终止进程，再等待 terminate_timeout 秒后强制结束。
+        deadline 为事件循环时间上的总期限，用于在有限时间内同时停止多个服务器。
+        已经在停止过程中时只等待退出。
+        """
+        if self.process is None:
+            return self.exit_code
+        if self.state == STOPPING:
+            return await self.wait()
+        if deadline is not None:
+            remaining = max(0.0, deadline - asyncio.get_running_loop().time())
+            terminate_timeout = min(terminate_timeout, remaining / 4)
+            timeout = min(timeout, remaining - terminate_timeout)
+        waiter = asyncio.ensure_future(self.wait())
+        try:
+            self._quit_logged = asyncio.Event()
+            if self.send("stop"):
+                self._set_state(STOPPING)
+                self._stop_stage(STOP_COMMAND, timeout)
+                if await self._wait_quit(waiter, timeout):
+                    return await self._stopped(waiter)
+            else:
+                self._set_state(STOPPING)
+            if self.process is not None:
+                self._stop_stage(STOP_TERMINATE)
+                try:
+                    self.process.terminate()
+                except ProcessLookupError:
+                    pass
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), terminate_timeout)
+                except asyncio.TimeoutError:
+                    self._stop_stage(STOP_KILL)
+                    self.kill()
+            return await self._stopped(waiter)
+        finally:
+            self._quit_logged = None
+            waiter.cancel()
+
+    async def _wait_quit(self, waiter, timeout):
+        """等待进程在 timeout 秒内退出；看到退出日志时发出 STOP_SAVED。返回是否已退出"""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        quit_logged = asyncio.ensure_future(self._quit_logged.wait())
+        try:
+            pending = {waiter, quit_logged}
+            while waiter in pending:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    return False
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if quit_logged in done:
+                    self._stop_stage(STOP_SAVED)
+            return True
+        finally:
+            quit_logged.cancel()
+
+    async def _stopped(self, waiter):
+        exit_code = await asyncio.shield(waiter)
+        self._stop_stage(STOP_EXITED, exit_code)
+        return exit_code
@@ -0,0 +1,265 @@
+"""通过并发 HEAD 请求查找存在的服务器版本。
+
+版本号的写法不统一（例如 1.21.51.01 和 1.21.51.1），猜错一次就要等一次失败的下载。
+VersionDiscovery 把版本模式展开成候选版本，用 asyncio 并发向安装包地址发送 HEAD 请求，
+连接数不超过 concurrency，每个连接保持长连接依次发送请求。结果（存在与否、安装包大小）
+按地址缓存，存在的结果长期有效，不存在的结果较快过期（新版本随时可能发布）。
+
+版本模式以 "." 分隔，每一段可以是：
+    数字        51 或 01
+    a-b        范围，例如 50-60
+    a,b,c      列表
+    *          0-99
+范围和 "*" 中小于 10 的数字同时尝试一位和两位（补零）两种写法。
+"""
+import asyncio
+import json
+import os
+import ssl
+import time
+import urllib.parse
+
+from .download import DEFAULT_HEADERS
+from .versions import PACKAGE_PLATFORM, package_url, version_key
+
+CACHE_FILE = os.path.join(".cache", "discovery.json")
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 5.0
+POSITIVE_TTL = 7 * 86400
+NEGATIVE_TTL = 3600
+WILDCARD_MAX = 99
+MAX_CANDIDATES = 2000
+MAX_REDIRECTS = 3
+
+
+class DiscoveryError(Exception):
+    """版本模式无效，或者无法访问下载地址"""
+
+
+def _expand_part(part):
+    if part == "*":
+        part = f"0-{WILDCARD_MAX}"
+    values = []
+    for item in part.split(","):
+        if "-" in item:
+            low, _, high = item.partition("-")
+            if not (low.isdigit() and high.isdigit()) or int(low) > int(high):
+                raise DiscoveryError(f"无效的范围: {item}")
+            for n in range(int(low), int(high) + 1):
+                values.append(str(n))
+                if n < 10:
+                    values.append(f"0{n}")
+        elif item.isdigit():
+            values.append(item)
+        else:
+            raise DiscoveryError(f"无效的版本段: {item}")
+    return values
+
+
+def expand_pattern(pattern):
+    """把版本模式展开为候选版本列表"""
+    candidates = [""]
+    for part in pattern.strip().split("."):
+        values = _expand_part(part)
+        candidates = [f"{prefix}.{value}" if prefix else value for prefix in candidates for value in values]
+        if len(candidates) > MAX_CANDIDATES:
+            raise DiscoveryError(f"候选版本超过 {MAX_CANDIDATES} 个，请缩小范围")
+    return candidates
+
+
+def neighbor_pattern(version):
+    """一个不存在的版本的相近版本模式：最后一段改为 *"""
+    parts = version.split(".")
+    return ".".join(parts[:-1] + ["*"])
+
+
+class _HeadConnection:
+    """到一个主机的 HTTP/1.1 长连接，依次发送 HEAD 请求"""
+
+    def __init__(self, scheme, host, port, timeout):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        context = ssl.create_default_context() if self.scheme == "https" else None
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=context, server_hostname=self.host if context else None)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def head(self, path):
+        """返回 (状态码, {小写头名: 值})"""
+        # 复用的连接可能已被服务器关闭，失败时重新连接再试一次
+        for attempt in range(2):
+            fresh = self.writer is None
+            try:
+                return await asyncio.wait_for(self._exchange(path), self.timeout)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self.close()
+                if fresh or attempt:
+                    raise
+
+    async def _exchange(self, path):
+        if self.writer is None:
+            await self._connect()
+        host = self.host if self.port in (80, 443) else f"{self.host}:{self.port}"
+        lines = [f"HEAD {path} HTTP/1.1", f"Host: {host}", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in DEFAULT_HEADERS.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise EOFError("连接已关闭")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # HEAD 的响应没有正文，连接可以直接用于下一个请求
+        if headers.get("connection", "").lower() == "close" or status_line.startswith(b"HTTP/1.0"):
+            self.close()
+        return status, headers
+
+
+def _split_url(url):
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    return (parts.scheme, parts.hostname, port), path or "/"
+
+
+class VersionDiscovery:
+    """并发探测版本是否存在。discover/probe 是协程，必须在事件循环中调用。
+
+    mirror 为 None 时使用 package_url 的默认地址（官方地址或 MCMANAGER_MIRROR）。
+    clock 可以注入，用于测试缓存的过期。
+    """
+
+    def __init__(self, cache_path=None, mirror=None, platform=PACKAGE_PLATFORM,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, clock=time.time):
+        self.cache_path = cache_path
+        self.mirror = mirror
+        self.platform = platform
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.requests = 0  # 实际发出的 HEAD 请求数（不含缓存命中）
+        self._cache = {}
+        if cache_path:
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    @classmethod
+    def for_lib(cls, lib_dir, **kwargs):
+        return cls(os.path.join(lib_dir, CACHE_FILE), **kwargs)
+
+    def url(self, version):
+        return package_url(version, self.mirror, self.platform)
+
+    def _cached(self, url, now):
+        entry = self._cache.get(url)
+        if entry is None:
+            return None
+        ttl = self.positive_ttl if entry["exists"] else self.negative_ttl
+        return entry if now - entry["checked"] < ttl else None
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        now = self.clock()
+        # 顺便清理过期的条目
+        self._cache = {url: entry for url, entry in self._cache.items() if self._cached(url, now)}
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._cache, f)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    async def probe(self, versions):
+        """返回 {版本: 安装包大小（字节，未知为 0）或 None（不存在）}"""
+        now = self.clock()
+        results = {}
+        pending = asyncio.Queue()
+        for version in dict.fromkeys(versions):
+            entry = self._cached(self.url(version), now)
+            if entry is not None:
+                results[version] = entry["size"] if entry["exists"] else None
+            else:
+                pending.put_nowait(version)
+        if pending.empty():
+            return results
+        errors = []
+        workers = [asyncio.ensure_future(self._worker(pending, results, errors))
+                   for _ in range(min(self.concurrency, pending.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._save()
+        if errors and not results:
+            # 全部请求都因网络错误失败时报告错误，而不是当作版本都不存在
+            raise DiscoveryError(f"无法访问下载地址: {errors[0]!r}")
+        return results
+
+    async def _worker(self, pending, results, errors):
+        connections = {}
+        try:
+            while not pending.empty():
+                version = pending.get_nowait()
+                url = self.url(version)
+                try:
+                    size = await self._probe_url(url, connections)
+                except Exception as e:
+                    errors.append(e)
+                    continue  # 网络错误不缓存
+                results[version] = size
+                self._cache[url] = {"exists": size is not None, "size": size, "checked": self.clock()}
+        finally:
+            for connection in connections.values():
+                connection.close()
+
+    async def _probe_url(self, url, connections):
+        for _ in range(MAX_REDIRECTS + 1):
+            origin, path = _split_url(url)
+            connection = connections.get(origin)
+            if connection is None:
+                connection = connections[origin] = _HeadConnection(*origin, self.timeout)
+            self.requests += 1
+            status, headers = await connection.head(path)
+            if status in (301, 302, 303, 307, 308) and headers.get("location"):
+                url = urllib.parse.urljoin(url, headers["location"])
+                continue
+            if 200 <= status < 300:
+                return int(headers.get("content-length") or 0)
+            if status in (403, 404, 410):
+                return None
+            raise OSError(f"HTTP {status}")
+        raise OSError("重定向次数过多")
+
+    async def discover(self, pattern):
+        """返回模式中存在的版本 [(版本, 大小)]，新版本在前"""
+        results = await self.probe(expand_pattern(pattern))
+        found = [(version, size) for version, size in results.items() if size is not None]
+        return sorted(found, key=lambda item: version_key(item[0]), reverse=True)
+
+    async def check(self, version):
+        """确认版本存在时返回 [(版本, 大小)]；不存在时返回相近的存在版本"""
+        size = (await self.probe([version]))[version]
+        if size is not None:
+            return [(version, size)]
+        return await self.discover(neighbor_pattern(version))
@@ -0,0 +1,279 @@
+"""可断点续传的多连接分段下载。
+
+文件按固定大小切分为若干分片，由多个连接并行拉取（HTTP Range），
+数据直接写入 `<目标>.part`，各分片的进度保存在 `<目标>.part.json` 中。
+下载中断后重试或重新启动程序，都会从上次停下的位置继续。
+服务器不支持 Range 时退化为单连接顺序下载。
+"""
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+PIECE_SIZE = 8 * 1024 * 1024      # 分片大小
+BUFFER_SIZE = 1024 * 1024         # 每个连接复用的读缓冲区大小
+STATE_SAVE_INTERVAL = 1.0         # 进度文件的最短保存间隔（秒）
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    """下载失败（非网络层错误，例如服务器返回的内容不符合预期）"""
+
+
+class DownloadCancelled(DownloadError):
+    """下载被取消"""
+
+
+class RangedDownloader:
+    """多连接分段下载器。
+
+    progress 回调签名为 progress(downloaded, total)，调用频率不超过
+    每 progress_interval 秒一次（完成时一定会调用一次）。回调在下载线程中执行。
+
+    sink 可选，用于在数据到达时就地处理（例如边下载边校验、解压）：
+    sink.started(total, ranges) 在开始时以已存在的字节区间调用一次，
+    sink.received(offset, data) 在每块数据写入 .part 后调用（data 只在调用期间有效）。
+    tail_first 为 True 时优先下载最后一个分片（ZIP 的中央目录在文件末尾）。
+    finalize 为 False 时下载完成后保留 .part 文件，由调用方自行处理。
+    """
+
+    def __init__(self, url, dest, connections=4, piece_size=PIECE_SIZE,
+                 buffer_size=BUFFER_SIZE, headers=None, timeout=30,
+                 progress=None, progress_interval=0.1, sink=None,
+                 tail_first=False, finalize=True):
+        self.url = url
+        self.dest = dest
+        self.part_path = dest + ".part"
+        self.state_path = dest + ".part.json"
+        self.connections = max(1, connections)
+        self.piece_size = piece_size
+        self.buffer_size = buffer_size
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.timeout = timeout
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.sink = sink
+        self.tail_first = tail_first
+        self.finalize = finalize
+        self.total_size = 0
+        self.meta = {}          # 远端文件的 ETag 和 Last-Modified，用于之后的条件请求
+        self.resumed_bytes = 0  # 本次启动时已从 .part 中恢复的字节数
+        self._cancel = threading.Event()
+        self._abort = threading.Event()  # 某个连接出错时通知其他连接停下
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._last_progress = 0.0
+        self._last_save = 0.0
+        self._state = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    # ------------------------------------------------------------------ 入口
+
+    def run(self):
+        """执行下载，成功后返回目标文件路径（finalize 为 False 时返回 .part 路径）；
+        失败时抛出异常，已下载的部分保留以便续传"""
+        response = self._open(headers={"Range": "bytes=0-0"})
+        try:
+            self.meta = self._response_meta(response)
+            if response.status == 206:
+                match = _CONTENT_RANGE.match(response.getheader("Content-Range", ""))
+                if match and match.group(3) != "*":
+                    self.total_size = int(match.group(3))
+                    meta = self._response_meta(response)
+                    response.close()
+                    self._run_ranged(meta)
+                    return self._finish()
+                # 无法得知总大小，只能重新单连接下载
+                response.close()
+                response = self._open()
+            # 服务器忽略了 Range，直接使用这个响应顺序下载
+            self._run_single(response)
+            return self._finish()
+        finally:
+            response.close()
+
+    # ------------------------------------------------------------ 分段下载
+
+    def _run_ranged(self, meta):
+        state = self._load_state()
+        if (state is None or state.get("size") != self.total_size
+                or state.get("piece_size") != self.piece_size
+                or state.get("etag") != meta["etag"]
+                or state.get("last_modified") != meta["last_modified"]
+                or not os.path.exists(self.part_path)):
+            # 没有可用的断点（或远端文件已变化），从头开始
+            count = (self.total_size + self.piece_size - 1) // self.piece_size
+            state = dict(meta, url=self.url, size=self.total_size,
+                         piece_size=self.piece_size, pieces=[0] * count)
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.total_size)
+        self._state = state
+        self._downloaded = self.resumed_bytes = sum(state["pieces"])
+        self._save_state(force=True)
+        if self.sink is not None:
+            self.sink.started(self.total_size, [
+                (i * self.piece_size, i * self.piece_size + done)
+                for i, done in enumerate(state["pieces"]) if done])
+
+        pending = [i for i, done in enumerate(state["pieces"]) if done < self._piece_length(i)]
+        if self.tail_first and len(pending) > 1 and pending[-1] == len(state["pieces"]) - 1:
+            pending.insert(0, pending.pop())
+        errors = []
+        threads = [threading.Thread(target=self._worker, args=(pending, errors), daemon=True)
+                   for _ in range(min(self.connections, len(pending)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._save_state(force=True)
+        if errors:
+            raise errors[0]
+        if self._cancel.is_set():
+            raise DownloadCancelled("下载已取消")
+        self._emit_progress(force=True)
+
+    def _worker(self, pending, errors):
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        # 不使用Python层缓冲，保存进度时数据一定已经交给操作系统
+        with open(self.part_path, "r+b", buffering=0) as f:
+            while not self._stopping():
+                with self._lock:
+                    if not pending or errors:
+                        return
+                    index = pending.pop(0)
+                try:
+                    self._fetch_piece(index, f, view)
+                except Exception as e:
+                    with self._lock:
+                        errors.append(e)
+                    # 让其他连接尽快停下，已写入的进度会被保存
+                    self._abort.set()
+                    return
+
+    def _fetch_piece(self, index, f, view):
+        pieces = self._state["pieces"]
+        start = index * self.piece_size + pieces[index]
+        end = index * self.piece_size + self._piece_length(index) - 1
+        response = self._open(headers={"Range": f"bytes={start}-{end}"})
+        with response:
+            if response.status != 206:
+                raise DownloadError(f"服务器未按分段返回数据（HTTP {response.status}）")
+            f.seek(start)
+            while start <= end:
+                if self._stopping():
+                    return
+                n = response.readinto(view[:min(len(view), end - start + 1)])
+                if not n:
+                    raise DownloadError("连接提前关闭，分片数据不完整")
+                f.write(view[:n])
+                if self.sink is not None:
+                    self.sink.received(start, view[:n])
+                start += n
+                with self._lock:
+                    pieces[index] += n
+                    self._downloaded += n
+                if self._should_save():
+                    self._save_state()
+                self._emit_progress()
+
+    def _stopping(self):
+        return self._cancel.is_set() or self._abort.is_set()
+
+    def _piece_length(self, index):
+        return min(self.piece_size, self.total_size - index * self.piece_size)
+
+    # ------------------------------------------------------------ 单连接下载
+
+    def _run_single(self, response):
+        self.discard_partial()
+        self.total_size = int(response.getheader("Content-Length", 0) or 0)
+        if self.sink is not None:
+            self.sink.started(self.total_size, [])
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        with open(self.part_path, "wb", buffering=0) as f:
+            while True:
+                if self._cancel.is_set():
+                    raise DownloadCancelled("下载已取消")
+                n = response.readinto(view)
+                if not n:
+                    break
+                f.write(view[:n])
+                if self.sink is not None:
+                    self.sink.received(self._downloaded, view[:n])
+                self._downloaded += n
+                self._emit_progress()
+        if self.total_size and self._downloaded != self.total_size:
+            raise DownloadError(f"下载不完整: {self._downloaded}/{self.total_size} 字节")
+        self._emit_progress(force=True)
+
+    # ------------------------------------------------------------------ 工具
+
+    def _open(self, headers=None):
+        request = urllib.request.Request(self.url, headers=dict(self.headers, **(headers or {})))
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    @staticmethod
+    def _response_meta(response):
+        return {
+            "etag": response.getheader("ETag"),
+            "last_modified": response.getheader("Last-Modified"),
+        }
+
+    def _finish(self):
+        if not self.finalize:
+            return self.part_path
+        os.replace(self.part_path, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.dest
+
+    def discard_partial(self):
+        """删除 .part 文件和进度文件"""
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("url") == self.url else None
+
+    def _should_save(self):
+        return time.monotonic() - self._last_save >= STATE_SAVE_INTERVAL
+
+    def _save_state(self, force=False):
+        with self._lock:
+            if not force and not self._should_save():
+                return
+            self._last_save = time.monotonic()
+            data = json.dumps(self._state)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.state_path)
+
+    def _emit_progress(self, force=False):
+        if self.progress is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+            downloaded = self._downloaded
+        self.progress(downloaded, self.total_size)
@@ -0,0 +1,376 @@
+"""崩溃自动重启与存活检测。
+
+ServerMonitor 包装一个 ServerController：
+- 服务器异常退出后按指数退避（带随机抖动）自动重启；
+- 短时间内崩溃次数过多时熔断，不再重启，避免无限崩溃循环；
+- 存活检测：一段时间没有任何输出时，向 server-port 发送 RakNet 非连接 ping，
+  连续多次没有响应则认为进程卡死，强制结束后按崩溃处理；
+- 记录启动到出现 "Server started" 的耗时、崩溃与重启次数等指标。
+"""
+import asyncio
+import os
+import random
+import struct
+import time
+from collections import deque
+
+from .controller import STOPPED, ControllerError
+from .properties import read_properties
+
+READY_MARKER = "Server started"
+
+# 监控事件
+EVENT_READY = "ready"                    # 详情：启动耗时（秒）
+EVENT_EXITED = "exited"                  # 详情：退出码（不会再重启）
+EVENT_CRASHED = "crashed"                # 详情：退出码
+EVENT_RESTART_SCHEDULED = "restart_scheduled"  # 详情：等待秒数
+EVENT_RESTARTED = "restarted"            # 详情：第几次重启
+EVENT_CRASH_LOOP = "crash_loop"          # 详情：时间窗口内的崩溃次数
+EVENT_HUNG = "hung"                      # 详情：无响应的原因
+EVENT_PLANNED_RESTART = "planned_restart"  # 详情：停止时的退出码
+
+_RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+_UNCONNECTED_PING = 0x01
+_UNCONNECTED_PONG = 0x1c
+
+
+def describe_event(event, detail):
+    """把监控事件转换成显示给用户的文字"""
+    if event == EVENT_READY:
+        return f"服务器已就绪，启动耗时 {detail:.1f} 秒"
+    if event == EVENT_EXITED:
+        return f"服务器已退出，退出码: {detail}"
+    if event == EVENT_CRASHED:
+        return f"服务器异常退出: {detail}"
+    if event == EVENT_RESTART_SCHEDULED:
+        return f"{detail:.1f} 秒后自动重启"
+    if event == EVENT_RESTARTED:
+        return f"服务器已自动重启（第 {detail} 次）"
+    if event == EVENT_CRASH_LOOP:
+        return f"服务器短时间内崩溃 {detail} 次，已停止自动重启"
+    if event == EVENT_HUNG:
+        return f"服务器无响应（{detail}），强制结束"
+    if event == EVENT_PLANNED_RESTART:
+        return "服务器已按计划重启"
+    return f"{event}: {detail}"
+
+
+class RestartPolicy:
+    """重启策略：第 n 次重启前等待 base_delay * factor^(n-1) 秒（不超过 max_delay），
+    并加上 ±jitter 比例的随机抖动；crash_window 秒内崩溃 max_crashes 次即熔断。
+    就绪后稳定运行 stable_after 秒再崩溃时，等待时间从头计算。"""
+
+    def __init__(self, base_delay=2.0, factor=2.0, max_delay=300.0, jitter=0.2,
+                 max_crashes=5, crash_window=600.0, stable_after=120.0, restart_on_clean_exit=False,
+                 rng=random.random):
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_crashes = max_crashes
+        self.crash_window = crash_window
+        self.stable_after = stable_after
+        self.restart_on_clean_exit = restart_on_clean_exit
+        self.rng = rng
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.factor ** max(0, attempt - 1))
+        return max(0.0, delay * (1 + self.jitter * (2 * self.rng() - 1)))
+
+
+class CrashLoopBreaker:
+    """在时间窗口内统计崩溃次数"""
+
+    def __init__(self, max_crashes, window, clock=time.monotonic):
+        self.max_crashes = max_crashes
+        self.window = window
+        self.clock = clock
+        self._crashes = deque()
+
+    def record(self):
+        """记录一次崩溃，返回是否已经熔断"""
+        now = self.clock()
+        self._crashes.append(now)
+        while self._crashes and now - self._crashes[0] > self.window:
+            self._crashes.popleft()
+        return len(self._crashes) >= self.max_crashes
+
+    @property
+    def recent_crashes(self):
+        return len(self._crashes)
+
+    def reset(self):
+        self._crashes.clear()
+
+
+class _PingProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if data[:1] == bytes([_UNCONNECTED_PONG]) and not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+async def raknet_ping(host, port, timeout=2.0):
+    """发送 RakNet 非连接 ping，返回服务器的 MOTD 字符串；没有响应时返回 None"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _PingProtocol(future), remote_addr=(host, port))
+    except OSError:
+        return None
+    try:
+        packet = (bytes([_UNCONNECTED_PING]) + struct.pack(">q", int(time.time() * 1000))
+                  + _RAKNET_MAGIC + struct.pack(">q", random.getrandbits(63)))
+        transport.sendto(packet)
+        data = await asyncio.wait_for(future, timeout)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        transport.close()
+    # 0x1c | 时间(8) | 服务器GUID(8) | MAGIC(16) | 长度(2) | MOTD
+    if len(data) < 35:
+        return ""
+    length = struct.unpack(">H", data[33:35])[0]
+    return data[35:35 + length].decode("utf-8", "replace")
+
+
+class LivenessProbe:
+    """存活检测参数：距上次输出超过 idle_after 秒后才发送 UDP ping，
+    连续 failures 次无响应判定为卡死；启动后 startup_timeout 秒仍未就绪同样判定为卡死。"""
+
+    def __init__(self, host="127.0.0.1", interval=30.0, idle_after=60.0, failures=3,
+                 timeout=2.0, startup_timeout=300.0, ping=raknet_ping):
+        self.host = host
+        self.interval = interval
+        self.idle_after = idle_after
+        self.failures = failures
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.ping = ping
+
+    async def alive(self, port, output_age):
+        if output_age < self.idle_after:
+            return True
+        return await self.ping(self.host, port, self.timeout) is not None
+
+
+class RestartMetrics:
+    def __init__(self):
+        self.starts = 0
+        self.restarts = 0
+        self.crashes = 0
+        self.hangs = 0
+        self.last_exit_code = None
+        self.time_to_ready = deque(maxlen=20)  # 最近几次启动到就绪的耗时（秒）
+        self.ready_since = None
+
+    def as_dict(self):
+        ready = list(self.time_to_ready)
+        return {
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "crashes": self.crashes,
+            "hangs": self.hangs,
+            "last_exit_code": self.last_exit_code,
+            "last_time_to_ready": ready[-1] if ready else None,
+            "avg_time_to_ready": sum(ready) / len(ready) if ready else None,
+        }
+
+
+class ServerMonitor:
+    """为服务器控制器加上自动重启和存活检测。必须在事件循环线程中使用。
+
+    事件监听器签名为 listener(event, detail)，事件见模块顶部的 EVENT_* 常量。
+    """
+
+    def __init__(self, controller, policy=None, probe=None, auto_restart=True, clock=time.monotonic):
+        self.controller = controller
+        self.policy = policy or RestartPolicy()
+        self.probe = probe or LivenessProbe()
+        self.auto_restart = auto_restart
+        self.clock = clock
+        self.breaker = CrashLoopBreaker(self.policy.max_crashes, self.policy.crash_window, clock)
+        self.metrics = RestartMetrics()
+        self.ready = False
+        self.port = None
+        self._wanted = False
+        self._planned_restart = False
+        self._attempt = 0
+        self._started_at = 0.0
+        self._last_output = 0.0
+        self._probe_task = None
+        self._restart_task = None
+        self._listeners = []
+        self._done = None
+        controller.add_output_listener(self._on_output)
+        controller.add_state_listener(self._on_state)
+
+    def add_event_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _emit(self, event, detail=None):
+        if event in (EVENT_EXITED, EVENT_CRASH_LOOP) and self._done is not None:
+            self._done.set()
+        for listener in list(self._listeners):
+            listener(event, detail)
+
+    # ------------------------------------------------------------ 启停
+
+    async def start(self):
+        self._wanted = True
+        self._attempt = 0
+        self._done = asyncio.Event()
+        self.breaker.reset()
+        try:
+            await self._launch()
+        except ControllerError:
+            self._wanted = False
+            self._done.set()
+            raise
+
+    async def wait(self):
+        """等待服务器最终停止（不再自动重启），返回最后一次的退出码"""
+        if self._done is not None:
+            await self._done.wait()
+        return self.metrics.last_exit_code
+
+    async def stop(self, **kwargs):
+        """主动停止，不会触发自动重启。参数见 ServerController.stop"""
+        self._wanted = False
+        self._cancel_tasks()
+        if not self.controller.running and self._done is not None and not self._done.is_set():
+            # 正在等待重启（或退出尚未处理），进程已经不在了
+            self.metrics.last_exit_code = self.controller.exit_code
+            self._emit(EVENT_EXITED, self.controller.exit_code)
+        return await self.controller.stop(**kwargs)
+
+    async def restart(self, **kwargs):
+        """计划内重启（例如定时任务）：优雅停止后立即启动，不计入崩溃，也不发出 EVENT_EXITED"""
+        if not self.controller.running:
+            raise ControllerError("服务器未运行")
+        self._wanted = False
+        self._cancel_tasks()
+        self._planned_restart = True
+        try:
+            exit_code = await self.controller.stop(**kwargs)
+            if self._restart_task is not None:
+                await self._restart_task  # 等退出处理完再启动
+        finally:
+            self._planned_restart = False
+        self._wanted = True
+        self._attempt = 0
+        try:
+            await self._launch()
+        except ControllerError:
+            self._wanted = False
+            self._emit(EVENT_EXITED, exit_code)
+            raise
+        self._emit(EVENT_PLANNED_RESTART, exit_code)
+
+    async def _launch(self):
+        properties = read_properties(os.path.join(self.controller.working_dir, "server.properties")) or {}
+        try:
+            self.port = int(properties.get("server-port", "19132"))
+        except ValueError:
+            self.port = 19132
+        self.ready = False
+        self._started_at = self._last_output = self.clock()
+        await self.controller.start()
+        self.metrics.starts += 1
+        self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    def _cancel_tasks(self):
+        for task in (self._probe_task, self._restart_task):
+            if task is not None and not task.done() and task is not asyncio.current_task():
+                task.cancel()
+        self._probe_task = self._restart_task = None
+
+    # ------------------------------------------------------------ 控制器回调
+
+    def _on_output(self, lines, source):
+        self._last_output = self.clock()
+        if not self.ready and any(READY_MARKER in line for line in lines):
+            self.ready = True
+            elapsed = self._last_output - self._started_at
+            self.metrics.time_to_ready.append(elapsed)
+            self.metrics.ready_since = self._last_output
+            # 等其他输出监听器处理完这一批行之后再通知
+            asyncio.get_running_loop().call_soon(self._emit, EVENT_READY, elapsed)
+
+    def _on_state(self, state, exit_code):
+        if state == STOPPED and exit_code is not None:
+            self._restart_task = asyncio.ensure_future(self._handle_exit(exit_code))
+
+    async def _handle_exit(self, exit_code):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        ready_since = self.metrics.ready_since if self.ready else None
+        self.ready = False
+        self.metrics.last_exit_code = exit_code
+        if self._planned_restart:
+            return
+        clean = exit_code == 0 and not self.policy.restart_on_clean_exit
+        if not self._wanted or not self.auto_restart or clean:
+            self._wanted = False
+            self._emit(EVENT_EXITED, exit_code)
+            return
+        self.metrics.crashes += 1
+        if ready_since is not None and self.clock() - ready_since >= self.policy.stable_after:
+            self._attempt = 0
+        self._emit(EVENT_CRASHED, exit_code)
+        while self._wanted:
+            if self.breaker.record():
+                self._wanted = False
+                self._emit(EVENT_CRASH_LOOP, self.breaker.recent_crashes)
+                return
+            self._attempt += 1
+            delay = self.policy.delay(self._attempt)
+            self._emit(EVENT_RESTART_SCHEDULED, delay)
+            await asyncio.sleep(delay)
+            if not self._wanted:
+                return
+            try:
+                await self._launch()
+            except ControllerError as e:
+                self._emit(EVENT_CRASHED, str(e))
+                continue  # 启动失败同样计入崩溃次数
+            self.metrics.restarts += 1
+            self._emit(EVENT_RESTARTED, self.metrics.restarts)
+            return
+
+    # ------------------------------------------------------------ 存活检测
+
+    async def _probe_loop(self):
+        failures = 0
+        probe = self.probe
+        while self.controller.running:
+            await asyncio.sleep(probe.interval)
+            if not self.controller.running:
+                return
+            now = self.clock()
+            if not self.ready:
+                if now - self._started_at > probe.startup_timeout:
+                    self._hung(f"启动 {probe.startup_timeout:.0f} 秒后仍未就绪")
+                    return
+                continue
+            if await probe.alive(self.port, now - self._last_output):
+                failures = 0
+                continue
+            failures += 1
+            if failures >= probe.failures:
+                self._hung(f"端口 {self.port} 连续 {failures} 次无响应")
+                return
+
+    def _hung(self, reason):
+        self.metrics.hangs += 1
+        self._emit(EVENT_HUNG, reason)
+        # 强制结束后按崩溃处理，由 _handle_exit 决定是否重启
+        self.controller.kill()
@@ -0,0 +1,358 @@
+"""流式安装：边下载边校验、边解压。
+
+下载的数据到达时立即计算整包的 SHA-256；支持分段下载时优先拉取包含
+中央目录的末尾分片，之后每个文件的字节一旦到齐就交给线程池解压。
+服务器不支持分段时，下载完成后再把所有文件分发给线程池并行解压。
+所有文件先解压到 `lib/.staging-<版本>`，全部成功后整体重命名为
+`lib/<版本>`，中途失败不会留下半成品的版本目录。
+
+传入 BlobStore 时，与已安装版本内容相同的文件直接硬链接到共享仓库，
+只有变化的文件才会真正解压写入。
+"""
+import bisect
+import hashlib
+import os
+import shutil
+import struct
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .download import RangedDownloader
+from .store import is_mutable, member_key
+from .verify import create_manifest
+from .versions import IS_WINDOWS, SERVER_EXECUTABLE, package_url
+
+STAGING_PREFIX = ".staging-"
+MIN_PACKAGE_SIZE = 1024 * 1024  # 小于1MB可能是错误页面
+READ_BUFFER = 1024 * 1024
+
+_EOCD_SIGNATURE = b"PK\x05\x06"
+_EOCD_SIZE = 22
+_EOCD_SEARCH = _EOCD_SIZE + 0xFFFF  # 末尾记录后面最多跟 64KiB 注释
+
+
+class InstallError(Exception):
+    """安装失败（包内容不符合预期）"""
+
+
+class _ByteRanges:
+    """已到达的字节区间集合（自动合并相邻区间）"""
+
+    def __init__(self, ranges=()):
+        self._starts = []
+        self._ends = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def add(self, start, end):
+        if end <= start:
+            return
+        i = bisect.bisect_left(self._ends, start)
+        j = bisect.bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def contiguous_end(self, start):
+        """从 start 开始连续可用的字节的结束位置"""
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i >= 0 and self._ends[i] > start:
+            return self._ends[i]
+        return start
+
+    def covers(self, start, end):
+        return end <= start or self.contiguous_end(start) >= end
+
+
+class InstallResult:
+    def __init__(self, version, version_dir, sha256, size, files, linked_files=0, from_cache=False):
+        self.version = version
+        self.version_dir = version_dir
+        self.sha256 = sha256
+        self.size = size
+        self.files = files
+        self.linked_files = linked_files  # 直接从共享仓库链接、无需解压的文件数
+        self.from_cache = from_cache      # 安装包来自本地缓存，没有下载
+
+
+class InstallPipeline:
+    """下载并安装一个服务器版本。
+
+    作为 RangedDownloader 的 sink 使用：started/received 在下载线程中被调用。
+    """
+
+    def __init__(self, version, lib_dir, url=None, connections=4, workers=None, progress=None,
+                 store=None, cache=None):
+        self.version = version
+        self.lib_dir = lib_dir
+        self.url = url or package_url(version)
+        self.connections = connections
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.progress = progress
+        self.store = store
+        self.cache = cache
+        self.from_cache = False
+        self.linked_files = 0
+        self.zip_path = os.path.join(lib_dir, f"bedrock-server-{version}.zip")
+        self.staging_dir = os.path.join(lib_dir, STAGING_PREFIX + version)
+        self.version_dir = os.path.join(lib_dir, version)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._futures = []
+        self._reset()
+
+    def _reset(self):
+        self.total_size = 0
+        self._ranges = _ByteRanges()
+        self._hash = hashlib.sha256()
+        self._hashed = 0
+        self._reader = None
+        self._zip = None
+        self._central_dir = None   # (偏移, 大小)
+        self._entries = []         # 按本地文件头偏移排序的 (起, 止, ZipInfo)
+        self._next_entry = 0
+
+    # ------------------------------------------------------------------ 入口
+
+    def run(self):
+        if os.path.exists(self.staging_dir):
+            shutil.rmtree(self.staging_dir)
+        os.makedirs(self.staging_dir)
+        downloader = RangedDownloader(self.url, self.zip_path, connections=self.connections,
+                                      progress=self.progress, sink=self,
+                                      tail_first=True, finalize=False)
+        package = self.cache.lookup(self.version, self.url) if self.cache is not None else None
+        self.from_cache = package is not None
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                self._pool = pool
+                try:
+                    if package is not None:
+                        self._feed_local(package, downloader.part_path)
+                    else:
+                        downloader.run()
+                    with self._lock:
+                        self._catch_up_hash()
+                        self.total_size = self.total_size or self._hashed
+                        if self._zip is None:
+                            # 单连接下载：数据全部到齐后再并行解压
+                            self._open_directory(force=True)
+                        self._dispatch_ready()
+                finally:
+                    for future in self._futures:
+                        future.exception()
+                    self._pool = None
+            for future in self._futures:
+                future.result()
+            if self.from_cache and self._hash.hexdigest() != self.cache.get(self.version)["sha256"]:
+                raise InstallError("缓存的安装包已损坏")
+            self._check_package()
+            # 清单随版本目录一起出现，之后启动前可以校验文件是否被截断或损坏
+            create_manifest(self.staging_dir, self.workers)
+            os.replace(self.staging_dir, self.version_dir)
+        except BaseException:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            if self.from_cache:
+                # 缓存的安装包有问题，丢弃后重试时重新下载
+                self.cache.remove(self.version)
+                downloader.discard_partial()
+            raise
+        finally:
+            self._close()
+            if self.store is not None:
+                self.store.save_index()
+        if self.cache is not None and not self.from_cache:
+            # 下载的安装包移入缓存，下次安装同一版本时不必再下载
+            self.cache.add(self.version, self.url, downloader.part_path, self._hash.hexdigest(), downloader.meta)
+        # 安装成功后 .part 已无用；失败时保留以便下次续传
+        downloader.discard_partial()
+        return InstallResult(self.version, self.version_dir, self._hash.hexdigest(),
+                             self.total_size, len(self._entries), self.linked_files, self.from_cache)
+
+    def _feed_local(self, package, part_path):
+        """从缓存中的安装包安装：链接到 .part 的位置后一次性交给解压流程"""
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        try:
+            os.link(package, part_path)
+        except OSError:
+            shutil.copyfile(package, part_path)
+        size = os.path.getsize(part_path)
+        self.started(size, [(0, size)])
+        if self.progress is not None:
+            self.progress(size, size)
+
+    def _check_package(self):
+        if self._hashed != self.total_size:
+            raise InstallError("下载数据不完整")
+        if self.total_size < MIN_PACKAGE_SIZE:
+            raise InstallError(f"下载文件过小，可能是错误页面，文件大小: {self.total_size} 字节")
+        if not os.path.exists(os.path.join(self.staging_dir, SERVER_EXECUTABLE)):
+            raise InstallError(f"解压失败，未找到{SERVER_EXECUTABLE}")
+
+    def _close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._reader is not None:
+            self._reader.close()
+        self._zip = self._reader = None
+
+    # ------------------------------------------------------- 下载器回调
+
+    def started(self, total, ranges):
+        with self._lock:
+            self._close()
+            self._reset()
+            if total and total < MIN_PACKAGE_SIZE:
+                raise InstallError(f"下载文件过小，可能是错误页面，文件大小: {total} 字节")
+            self.total_size = total
+            for start, end in ranges:
+                self._ranges.add(start, end)
+            self._catch_up_hash()
+            self._open_directory()
+            self._dispatch_ready()
+
+    def received(self, offset, data):
+        with self._lock:
+            n = len(data)
+            self._ranges.add(offset, offset + n)
+            if offset == self._hashed:
+                # 顺序到达的数据直接在内存中计算哈希
+                self._hash.update(data)
+                self._hashed += n
+            self._catch_up_hash()
+            if self._zip is None:
+                self._open_directory()
+            self._dispatch_ready()
+
+    # ------------------------------------------------------------ 内部实现
+
+    def _read(self, offset, size):
+        if self._reader is None:
+            # 不使用缓冲，避免读到其他连接写入前的旧数据
+            self._reader = open(self.zip_path + ".part", "rb", buffering=0)
+        self._reader.seek(offset)
+        return self._reader.read(size)
+
+    def _catch_up_hash(self):
+        """乱序到达的分片在前面的数据补齐后，从 .part 文件中读回计算哈希"""
+        end = self._ranges.contiguous_end(self._hashed)
+        while self._hashed < end:
+            data = self._read(self._hashed, min(READ_BUFFER, end - self._hashed))
+            self._hash.update(data)
+            self._hashed += len(data)
+
+    def _open_directory(self, force=False):
+        """中央目录的字节到齐后读取文件列表"""
+        total = self.total_size
+        if self._zip is not None or not total:
+            return
+        if not force:
+            tail_start = max(0, total - _EOCD_SEARCH)
+            if not self._ranges.covers(tail_start, total):
+                return
+            if self._central_dir is None:
+                tail = self._read(tail_start, total - tail_start)
+                pos = tail.rfind(_EOCD_SIGNATURE)
+                if pos < 0 or pos + _EOCD_SIZE > len(tail):
+                    raise zipfile.BadZipFile("文件不是有效的ZIP格式")
+                cd_size, cd_offset = struct.unpack("<II", tail[pos + 12:pos + 20])
+                if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+                    return  # ZIP64：等全部下载完再解压
+                self._central_dir = (cd_offset, cd_size)
+            cd_offset, cd_size = self._central_dir
+            if not self._ranges.covers(cd_offset, cd_offset + cd_size):
+                return
+        try:
+            self._zip = zipfile.ZipFile(self.zip_path + ".part", "r")
+        except zipfile.BadZipFile:
+            raise zipfile.BadZipFile("文件不是有效的ZIP格式")
+        infos = sorted(self._zip.infolist(), key=lambda info: info.header_offset)
+        if not any(info.filename.endswith(SERVER_EXECUTABLE) for info in infos):
+            raise InstallError(f"ZIP文件中没有找到{SERVER_EXECUTABLE}")
+        cd_offset = self._central_dir[0] if self._central_dir else total
+        # 先在单线程中建好所有目录，避免多个解压线程同时创建
+        for info in infos:
+            parent = os.path.dirname(self._target_path(info.filename))
+            os.makedirs(parent, exist_ok=True)
+        for i, info in enumerate(infos):
+            end = infos[i + 1].header_offset if i + 1 < len(infos) else cd_offset
+            self._entries.append((info.header_offset, end, info))
+
+    def _dispatch_ready(self):
+        """把字节已经到齐的文件交给线程池解压（按偏移顺序检查，已解压的不再重复）"""
+        if self._zip is None or self._pool is None:
+            return
+        while self._next_entry < len(self._entries):
+            start, end, info = self._entries[self._next_entry]
+            if not self._ranges.covers(start, end):
+                break
+            self._next_entry += 1
+            self._submit(info)
+        # 乱序到达的后面的分片同样可以提前解压
+        for index in range(self._next_entry, len(self._entries)):
+            start, end, info = self._entries[index]
+            if info is not None and self._ranges.covers(start, end):
+                self._entries[index] = (start, end, None)
+                self._submit(info)
+
+    def _submit(self, info):
+        if info is None or info.is_dir():
+            return
+        self._futures.append(self._pool.submit(self._extract, info))
+
+    def _extract(self, info):
+        target = self._target_path(info.filename)
+        store = self.store
+        if store is not None and is_mutable(os.path.relpath(target, self.staging_dir)):
+            store = None
+        if store is not None:
+            key = member_key(info)
+            digest = store.lookup(key)
+            if digest is not None:
+                # 内容与已安装版本相同，直接链接，不必解压
+                store.link(digest, target)
+                with self._lock:
+                    self.linked_files += 1
+                return
+        digest = hashlib.sha256()
+        # ZipExtFile 读到末尾时会校验CRC，数据损坏会抛出 BadZipFile
+        with self._zip.open(info) as src, open(target, "wb") as dst:
+            for block in iter(lambda: src.read(READ_BUFFER), b""):
+                digest.update(block)
+                dst.write(block)
+        if not IS_WINDOWS and (info.external_attr >> 16 & 0o111 or info.filename == SERVER_EXECUTABLE):
+            # zipfile 不保留权限位，Linux 上需要手动加上可执行权限
+            os.chmod(target, 0o755)
+        if store is not None:
+            store.remember(key, store.adopt(target, digest.hexdigest()))
+
+    def _target_path(self, name):
+        name = os.path.splitdrive(name.replace("\\", "/"))[1]
+        parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+        return os.path.join(self.staging_dir, *parts)
+
+
+def install_version(version, lib_dir, retries=3, retry_delay=1.0, **kwargs):
+    """下载并安装一个版本，失败时重试（已下载的部分会续传）。
+
+    包内容本身有问题（InstallError）时不再重试，但缓存中的安装包有问题时会重新下载；
+    重试用尽后抛出最后一次的异常。其余关键字参数传给 InstallPipeline。
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        pipeline = InstallPipeline(version, lib_dir, **kwargs)
+        try:
+            return pipeline.run()
+        except InstallError:
+            if not pipeline.from_cache or attempt >= retries:
+                raise
+        except Exception:
+            if attempt >= retries:
+                raise
+        time.sleep(retry_delay)
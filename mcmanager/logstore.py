@@ -0,0 +1,583 @@
+"""控制台日志的持久化存储与检索。
+
+写入：LogStore.write(lines, source) 只把行放入队列，由后台线程批量追加到 active.log
+（每行为 "毫秒时间戳\\t来源\\t内容"），不会阻塞输出路径。active.log 超过 segment_bytes
+或最早一行超过 segment_age 秒时轮转：把它切成约 64 KiB 的块分别压缩，写成
+<起始毫秒>-<结束毫秒>.seg，旁边的 .idx 记录每个块的位置、时间范围和块中出现的词，
+总大小超过 max_bytes 时删除最旧的段。
+
+查询：search(text, since, until) 先按文件名中的时间范围选出段，再用 .idx 按时间和
+词选出可能包含结果的块，通过 mmap 只解压这些块；active.log 直接在 mmap 上搜索。
+词为两个字符以上的字母、数字或汉字串（纯数字不索引，时间用时间范围筛选），
+查询中的词只用于缩小范围，最终按子串（不区分大小写）或正则表达式匹配。
+
+命令行用法：
+    python -m mcmanager.logstore search logs/console TNT --since "2026-10-13 02:00" --until "2026-10-13 03:00"
+    python -m mcmanager.logstore stats logs/console
+    python -m mcmanager.logstore bench [--size-mb 256]
+"""
+import argparse
+import collections
+import json
+import mmap
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
+
+from .metrics import format_bytes
+
+LOGS_DIR = "logs"            # 与 lib、backups 并列
+ACTIVE_FILE = "active.log"
+SEGMENT_BYTES = 8 * 1024 * 1024
+SEGMENT_AGE = 24 * 3600
+MAX_BYTES = 1024 * 1024 * 1024
+BLOCK_BYTES = 64 * 1024
+COMPRESS_LEVEL = 6
+DEFAULT_LIMIT = 500
+INDEX_CACHE_SIZE = 256
+
+_TOKEN_RE = re.compile(r"\w{2,}")
+_SEGMENT_RE = re.compile(r"^(\d+)-(\d+)\.seg$")
+
+LogRecord = collections.namedtuple("LogRecord", "time source text")
+
+
+def tokens(text):
+    """文本中可索引的词（小写，去掉纯数字）"""
+    return {t for t in _TOKEN_RE.findall(text.lower()) if not t.isdigit()}
+
+
+def _parse_records(data):
+    """把 "毫秒\\t来源\\t内容\\n" 格式的字节解析为 LogRecord 列表（忽略不完整的最后一行）"""
+    records = []
+    for raw in data.split(b"\n")[:-1]:
+        ts, _, rest = raw.partition(b"\t")
+        source, _, text = rest.partition(b"\t")
+        try:
+            records.append(LogRecord(int(ts) / 1000, source.decode("ascii", "replace"),
+                                     text.decode("utf-8", "surrogateescape")))
+        except ValueError:
+            continue
+    return records
+
+
+def _count_lines(path):
+    try:
+        with open(path, "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1024 * 1024), b""))
+    except OSError:
+        return 0
+
+
+def _record_time(data, start):
+    """data[start:] 开头那一行的毫秒时间戳"""
+    end = data.find(b"\t", start, start + 20)
+    try:
+        return int(data[start:end])
+    except ValueError:
+        return 0
+
+
+class _Matcher:
+    def __init__(self, text, regex, since, until, source):
+        self.since = since
+        self.until = until
+        self.source = source
+        self.pattern = re.compile(text, re.IGNORECASE) if regex and text else None
+        self.needle = text.lower() if text and not regex else ""
+        # 只有子串查询可以用词索引缩小范围
+        self.tokens = tokens(text) if self.needle else set()
+        # 查询文字除 ASCII 字母外没有大小写之分时，可以直接在字节上查找，只解析包含它的行
+        self.raw = None
+        if self.needle and (self.needle.isascii() or self.needle.upper() == self.needle):
+            self.raw = self.needle.encode("utf-8")
+
+    def scan(self, data, start=0, end=None):
+        """data[start:end] 中可能匹配的记录（尚未按时间、来源筛选），按时间顺序"""
+        data = data[start:end]
+        if self.raw is None:
+            return _parse_records(data)
+        lowered = data.lower()
+        records = []
+        pos = lowered.find(self.raw)
+        while pos >= 0:
+            line_start = lowered.rfind(b"\n", 0, pos) + 1
+            line_end = lowered.find(b"\n", pos) + 1
+            if not line_end:
+                break
+            records.extend(_parse_records(data[line_start:line_end]))
+            pos = lowered.find(self.raw, line_end)
+        return records
+
+    def __call__(self, record):
+        if self.since is not None and record.time < self.since:
+            return False
+        if self.until is not None and record.time > self.until:
+            return False
+        if self.source and record.source != self.source:
+            return False
+        if self.pattern is not None:
+            return self.pattern.search(record.text) is not None
+        return not self.needle or self.needle in record.text.lower()
+
+
+class LogStore:
+    """一个服务器（或界面控制台）的日志目录。write/close 可以在任何线程调用。"""
+
+    def __init__(self, root, segment_bytes=SEGMENT_BYTES, segment_age=SEGMENT_AGE, max_bytes=MAX_BYTES):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.max_bytes = max_bytes
+        self.dropped = 0  # 写入失败丢弃的行数（包括轮转失败、暂时查询不到的行）
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._indexes = collections.OrderedDict()  # 段路径 -> 索引（最近使用的在后）
+        self._active = None
+        self._active_bytes = 0
+        self._active_start = None
+
+    @classmethod
+    def for_server(cls, base_dir, kind, name, **kwargs):
+        """base_dir/logs/<kind>/<name>，kind 为 "versions" 或 "instances"（与备份目录的布局相同）"""
+        return cls(os.path.join(base_dir, LOGS_DIR, kind, name), **kwargs)
+
+    # ------------------------------------------------------------ 写入
+
+    def write(self, lines, source="stdout"):
+        """把行加入写入队列，立即返回"""
+        if not lines:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="LogStore", daemon=True)
+                    self._thread.start()
+        self._queue.put((time.time(), source, lines))
+
+    def flush(self, timeout=None):
+        """等待队列中已有的行写入磁盘"""
+        if self._thread is not None:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait(timeout)
+
+    def close(self):
+        """写完队列中的行后结束写入线程"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if name.startswith("rotating-"):
+                self._compress_rotated(os.path.join(self.root, name))  # 上次轮转中断
+        self._open_active()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                chunks = []
+                waiters = []
+                first_time = last_time = None
+                stop = False
+                for item in batch:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        ts, source, lines = item
+                        first_time = ts if first_time is None else first_time
+                        last_time = ts
+                        prefix = f"{int(ts * 1000)}\t{source}\t"
+                        chunks.extend(prefix + line.replace("\n", " ").replace("\r", "") + "\n" for line in lines)
+                if chunks:
+                    self._append("".join(chunks).encode("utf-8", "surrogateescape"), first_time, last_time)
+                for waiter in waiters:
+                    waiter.set()
+                if stop:
+                    return
+        finally:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    def _open_active(self):
+        path = os.path.join(self.root, ACTIVE_FILE)
+        self._active = open(path, "ab")
+        self._active_bytes = self._active.tell()
+        self._active_start = None
+        if self._active_bytes:
+            with open(path, "rb") as f:
+                self._active_start = _record_time(f.read(20), 0) / 1000
+
+    def _append(self, data, first_time, last_time):
+        try:
+            if self._active is None:
+                self._open_active()  # 轮转后没能重新打开
+            self._active.write(data)
+            self._active.flush()
+        except OSError:
+            self.dropped += data.count(b"\n")
+            return
+        if self._active_start is None:
+            self._active_start = first_time
+        self._active_bytes += len(data)
+        if self._active_bytes >= self.segment_bytes or last_time - self._active_start >= self.segment_age:
+            try:
+                self._rotate()
+            except OSError:
+                pass  # active.log 没能关闭或重新打开，下次写入时再试
+
+    def _rotate(self):
+        active, self._active = self._active, None
+        active.close()
+        path = os.path.join(self.root, ACTIVE_FILE)
+        rotating = os.path.join(self.root, f"rotating-{int(self._active_start * 1000)}.log")
+        try:
+            os.replace(path, rotating)
+        except OSError:
+            # Windows 上正在被查询映射的文件不能改名，下次写入时再轮转
+            self._active = open(path, "ab")
+            return
+        self._open_active()
+        self._compress_rotated(rotating)
+
+    def _compress_rotated(self, path):
+        """压缩轮转出的日志并清理旧段。失败时（例如磁盘已满）不结束写入线程：
+        rotating-*.log 留到下次启动时再压缩，在此之前其中的行查询不到，计入 dropped"""
+        try:
+            self._compress(path)
+            self._enforce_limit()
+        except OSError:
+            self.dropped += _count_lines(path)
+
+    def _compress(self, path):
+        """把纯文本日志压缩成分块的 .seg 和 .idx，完成后删除原文件"""
+        with open(path, "rb") as f:
+            data = f.read()
+        end_of_data = data.rfind(b"\n") + 1
+        if not end_of_data:
+            os.remove(path)
+            return
+        start_ms = _record_time(data, 0)
+        last_line = data.rfind(b"\n", 0, end_of_data - 1) + 1
+        end_ms = _record_time(data, last_line)
+        base = os.path.join(self.root, f"{start_ms:013d}-{end_ms:013d}")
+        blocks = []
+        postings = {}
+        pos = 0
+        offset = 0
+        with open(base + ".seg.tmp", "wb") as out:
+            while pos < end_of_data:
+                end = data.rfind(b"\n", pos, pos + BLOCK_BYTES) + 1
+                if end <= pos:
+                    end = data.find(b"\n", pos) + 1  # 超长的一行单独成块
+                chunk = data[pos:end]
+                compressed = zlib.compress(chunk, COMPRESS_LEVEL)
+                out.write(compressed)
+                last = chunk.rfind(b"\n", 0, len(chunk) - 1) + 1
+                block_id = len(blocks)
+                blocks.append([offset, len(compressed), _record_time(chunk, 0), _record_time(chunk, last)])
+                for token in tokens(chunk.decode("utf-8", "surrogateescape")):
+                    postings.setdefault(token, []).append(block_id)
+                offset += len(compressed)
+                pos = end
+        index = {"start": start_ms, "end": end_ms, "raw_bytes": end_of_data, "blocks": blocks, "tokens": postings}
+        with open(base + ".idx.tmp", "wb") as out:
+            out.write(zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8", "surrogateescape")))
+        os.replace(base + ".idx.tmp", base + ".idx")
+        os.replace(base + ".seg.tmp", base + ".seg")
+        os.remove(path)
+
+    def _enforce_limit(self):
+        segments = self.segments()
+        total = sum(s["bytes"] for s in segments)
+        for segment in segments:
+            if total <= self.max_bytes:
+                break
+            for ext in (".seg", ".idx"):
+                try:
+                    os.remove(segment["path"] + ext)
+                except OSError:
+                    pass
+            total -= segment["bytes"]
+
+    # ------------------------------------------------------------ 查询
+
+    def segments(self):
+        """已压缩的段，按时间从旧到新：[{"path", "start", "end", "bytes"}]（path 不含扩展名）"""
+        result = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            match = _SEGMENT_RE.match(name)
+            if match:
+                path = os.path.join(self.root, name[:-4])
+                try:
+                    size = os.path.getsize(path + ".seg") + os.path.getsize(path + ".idx")
+                except OSError:
+                    continue
+                result.append({"path": path, "start": int(match.group(1)) / 1000,
+                               "end": int(match.group(2)) / 1000, "bytes": size})
+        result.sort(key=lambda s: s["start"])
+        return result
+
+    def _load_index(self, path):
+        index = self._indexes.get(path)
+        if index is None:
+            with open(path + ".idx", "rb") as f:
+                index = json.loads(zlib.decompress(f.read()).decode("utf-8", "surrogateescape"))
+            index["token_sets"] = {}
+            self._indexes[path] = index
+            if len(self._indexes) > INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(path)
+        return index
+
+    def _candidate_blocks(self, index, matcher):
+        since = matcher.since * 1000 if matcher.since is not None else None
+        until = matcher.until * 1000 if matcher.until is not None else None
+        candidates = None
+        postings = index["tokens"]
+        for token in matcher.tokens:
+            blocks = index["token_sets"].get(token)
+            if blocks is None:
+                if token in postings:
+                    blocks = set(postings[token])
+                else:
+                    # 查询词可能只是某个词的一部分
+                    blocks = set()
+                    for key, ids in postings.items():
+                        if token in key:
+                            blocks.update(ids)
+                index["token_sets"][token] = blocks
+            candidates = blocks if candidates is None else candidates & blocks
+            if not candidates:
+                return []
+        ids = range(len(index["blocks"])) if candidates is None else sorted(candidates)
+        return [i for i in ids
+                if (since is None or index["blocks"][i][3] >= since)
+                and (until is None or index["blocks"][i][2] <= until)]
+
+    def search(self, text="", since=None, until=None, source=None, regex=False, limit=DEFAULT_LIMIT):
+        """返回匹配的记录（LogRecord），按时间顺序，最多 limit 条（最新的）"""
+        matcher = _Matcher(text, regex, since, until, source)
+        found = []
+        self._search_active(matcher, found, limit)
+        for segment in reversed(self.segments()):
+            if len(found) >= limit:
+                break
+            if since is not None and segment["end"] < since or until is not None and segment["start"] > until:
+                continue
+            try:
+                self._search_segment(segment["path"], matcher, found, limit)
+            except (OSError, ValueError, zlib.error):
+                continue  # 段正在被删除或已损坏
+        found.reverse()
+        return found
+
+    def _search_segment(self, path, matcher, found, limit):
+        index = self._load_index(path)
+        blocks = self._candidate_blocks(index, matcher)
+        if not blocks:
+            return
+        with open(path + ".seg", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for block_id in reversed(blocks):
+                offset, length = index["blocks"][block_id][:2]
+                records = matcher.scan(zlib.decompress(data[offset:offset + length]))
+                for record in reversed(records):
+                    if matcher(record):
+                        found.append(record)
+                        if len(found) >= limit:
+                            return
+
+    def _search_active(self, matcher, found, limit):
+        path = os.path.join(self.root, ACTIVE_FILE)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = data.rfind(b"\n") + 1
+                start = self._bisect_time(data, matcher.since, end) if matcher.since is not None else 0
+                records = matcher.scan(data, start, end)
+        for record in reversed(records):
+            if matcher(record):
+                found.append(record)
+                if len(found) >= limit:
+                    return
+
+    @staticmethod
+    def _bisect_time(data, since, end):
+        """二分查找第一行时间不早于 since 的行首位置（各行按时间顺序写入）"""
+        target = since * 1000
+        low, high = 0, end
+        while low < high:
+            mid = (low + high) // 2
+            line_start = data.rfind(b"\n", 0, mid) + 1
+            if _record_time(data, line_start) < target:
+                next_line = data.find(b"\n", mid) + 1
+                if not next_line or next_line >= end:
+                    return end
+                low = next_line
+            else:
+                high = line_start
+        return low
+
+    def usage(self):
+        """(段数, 压缩后字节数, 原始字节数, active.log 字节数)"""
+        segments = self.segments()
+        raw = 0
+        for segment in segments:
+            try:
+                raw += self._load_index(segment["path"])["raw_bytes"]
+            except (OSError, ValueError, zlib.error):
+                pass
+        try:
+            active = os.path.getsize(os.path.join(self.root, ACTIVE_FILE))
+        except OSError:
+            active = 0
+        return len(segments), sum(s["bytes"] for s in segments), raw, active
+
+
+# ---------------------------------------------------------------- 命令行
+
+def parse_time(text):
+    """把 "YYYY-MM-DD[ HH:MM[:SS]]"（本地时间）转换为时间戳"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise ValueError(f"无效的时间: {text}（格式 YYYY-MM-DD HH:MM）")
+
+
+def format_record(record):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.time))
+    return f"{stamp} [{record.source}] {record.text}"
+
+
+def benchmark(root, size_mb=256, days=7):
+    """写入 size_mb MB 合成日志（时间跨度 days 天），返回写入和查询的耗时"""
+    rng = random.Random(1)
+    players = [f"Player{i:03d}" for i in range(200)]
+    events = ["Player connected: {p}, xuid: {n}", "Player disconnected: {p}, xuid: {n}",
+              "{p} placed block minecraft:stone at {x} 64 {z}", "{p} placed TNT at {x} 12 {z}",
+              "[Chat] <{p}> hello everyone", "Running AutoCompaction...", "{p} broke block minecraft:dirt"]
+    store = LogStore(root, max_bytes=size_mb * 1024 * 1024 * 2)
+    target = size_mb * 1024 * 1024
+    start_time = time.time() - days * 86400
+    written = 0
+    batch = 200
+    started = time.perf_counter()
+    clock = start_time
+    # 直接写入按时间顺序的记录，模拟 days 天的输出
+    os.makedirs(root, exist_ok=True)
+    store._open_active()
+    while written < target:
+        lines = []
+        for _ in range(batch):
+            # 极少出现的事件，用来测试索引的效果
+            template = rng.choice(events) if rng.random() > 0.00002 else "{p} ignited TNT near spawn"
+            lines.append(template.format(p=rng.choice(players), n=rng.getrandbits(48),
+                                         x=rng.randint(-5000, 5000), z=rng.randint(-5000, 5000)))
+        prefix = f"{int(clock * 1000)}\tstdout\t"
+        data = "".join(prefix + line + "\n" for line in lines).encode()
+        store._append(data, clock, clock)
+        written += len(data)
+        clock += days * 86400 * len(data) / target
+    store._active.close()
+    write_seconds = time.perf_counter() - started
+    results = {"size_mb": size_mb, "write_mb_s": written / 1048576 / write_seconds}
+    segments, compressed, raw, active = store.usage()
+    results.update(segments=segments, compressed_mb=compressed / 1048576, ratio=raw / compressed if compressed else 0)
+    day = start_time + 2 * 86400
+    queries = {
+        "rare_word": dict(text="ignited TNT"),
+        "common_phrase": dict(text="Player042 placed TNT"),
+        "word_in_hour": dict(text="TNT", since=day, until=day + 3600),
+        "hour_all": dict(since=day, until=day + 3600, limit=100000),
+        "missing_word": dict(text="creeper"),
+    }
+    for name, query in queries.items():
+        fresh = LogStore(root)
+        t = time.perf_counter()
+        count = len(fresh.search(**query))
+        cold = time.perf_counter() - t
+        t = time.perf_counter()
+        fresh.search(**query)
+        warm = time.perf_counter() - t
+        results[name] = {"matches": count, "cold_ms": cold * 1000, "warm_ms": warm * 1000}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mcmanager.logstore", description="控制台日志检索")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    p = commands.add_parser("search", help="按文字和时间范围查询")
+    p.add_argument("root", help="日志目录，例如 logs/console 或 logs/instances/<名称>")
+    p.add_argument("text", nargs="?", default="")
+    p.add_argument("--since", type=parse_time)
+    p.add_argument("--until", type=parse_time)
+    p.add_argument("--source", help="只查询该来源（stdout、stderr、manager）")
+    p.add_argument("--regex", action="store_true", help="text 为正则表达式")
+    p.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    p = commands.add_parser("stats", help="显示日志占用")
+    p.add_argument("root")
+    p = commands.add_parser("bench", help="生成合成日志并测试查询速度")
+    p.add_argument("--root", default=os.path.join(LOGS_DIR, ".bench"))
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    if args.command == "search":
+        started = time.perf_counter()
+        records = LogStore(args.root).search(args.text, args.since, args.until, args.source, args.regex, args.limit)
+        for record in records:
+            print(format_record(record))
+        print(f"{len(records)} 条，{(time.perf_counter() - started) * 1000:.0f} 毫秒", file=sys.stderr)
+    elif args.command == "stats":
+        segments, compressed, raw, active = LogStore(args.root).usage()
+        print(f"{segments} 个段，压缩后 {format_bytes(compressed)}（原始 {format_bytes(raw)}），"
+              f"当前日志 {format_bytes(active)}")
+    else:
+        shutil.rmtree(args.root, ignore_errors=True)
+        try:
+            results = benchmark(args.root, args.size_mb)
+        finally:
+            shutil.rmtree(args.root, ignore_errors=True)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print(f"写入 {results['write_mb_s']:.0f} MB/s，{results['segments']} 个段，"
+                  f"压缩后 {results['compressed_mb']:.1f} MB（{results['ratio']:.1f} 倍）")
+            for name, value in results.items():
+                if isinstance(value, dict):
+                    print(f"{name}: {value['matches']} 条，首次 {value['cold_ms']:.1f} 毫秒，"
+                          f"再次 {value['warm_ms']:.1f} 毫秒")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""服务器进程资源采样。
+
+ResourceSampler 按固定间隔读取每个服务器进程的 CPU、内存、线程数和磁盘/网络 I/O，
+换算成速率后写入固定长度的环形时间序列，供界面绘制曲线或命令行查看。
+
+读取方式由后端决定：Linux 上直接读取 /proc/<pid>（保持文件打开，每次用 pread
+从头读取，不重复打开文件）；其他系统安装了 psutil 时使用 psutil；都不可用时不采样。
+采样本身的 CPU 开销记录在 ResourceSampler.overhead 中。
+"""
+import asyncio
+import importlib.util
+import os
+import time
+from array import array
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_CAPACITY = 300  # 默认间隔下约 10 分钟
+
+# 指标名称
+CPU = "cpu"              # CPU 占用，单个核心的百分比
+RSS = "rss"              # 常驻内存，字节
+THREADS = "threads"      # 线程数
+DISK_READ = "disk_read"  # 磁盘读取，字节/秒
+DISK_WRITE = "disk_write"
+NET_RX = "net_rx"        # 网络接收，字节/秒（所在网络命名空间的合计）
+NET_TX = "net_tx"
+METRICS = (CPU, RSS, THREADS, DISK_READ, DISK_WRITE, NET_RX, NET_TX)
+
+
+class TimeSeries:
+    """固定容量的环形时间序列，写满后覆盖最旧的值"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def values(self):
+        """按时间顺序（从旧到新）返回全部值"""
+        if self._count < self.capacity:
+            return self._values[:self._count].tolist()
+        return (self._values[self._next:] + self._values[:self._next]).tolist()
+
+    @property
+    def last(self):
+        if not self._count:
+            return None
+        return self._values[self._next - 1]
+
+    def clear(self):
+        self._next = self._count = 0
+
+
+# ---------------------------------------------------------------- 后端
+#
+# 后端的 read(pid) 返回原始累计值：
+# (cpu_seconds, rss_bytes, threads, read_bytes, write_bytes, net_rx_bytes, net_tx_bytes)，
+# 进程不存在时返回 None；close(pid) 释放为该进程保留的资源。
+
+class ProcfsBackend:
+    """读取 Linux 的 /proc/<pid>"""
+
+    def __init__(self):
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self._files = {}
+
+    @staticmethod
+    def available():
+        return os.path.isfile("/proc/self/stat")
+
+    def _open(self, pid):
+        files = {}
+        for name in ("stat", "io", "net/dev"):
+            try:
+                files[name] = os.open(f"/proc/{pid}/{name}", os.O_RDONLY)
+            except OSError:
+                files[name] = None  # 例如没有权限读取 io
+        self._files[pid] = files
+        return files
+
+    def close(self, pid):
+        for fd in self._files.pop(pid, {}).values():
+            if fd is not None:
+                os.close(fd)
+
+    def read(self, pid):
+        files = self._files.get(pid) or self._open(pid)
+        try:
+            stat = os.pread(files["stat"], 4096, 0)
+        except (OSError, TypeError):
+            self.close(pid)
+            return None
+        if not stat:
+            self.close(pid)
+            return None
+        # 进程名可能包含空格和括号，从最后一个 ")" 之后开始按空格切分
+        fields = stat[stat.rfind(b")") + 2:].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        threads = int(fields[17])
+        rss = int(fields[21]) * self.page_size
+        read_bytes = write_bytes = 0
+        if files["io"] is not None:
+            try:
+                for line in os.pread(files["io"], 4096, 0).splitlines():
+                    key, _, value = line.partition(b":")
+                    if key == b"read_bytes":
+                        read_bytes = int(value)
+                    elif key == b"write_bytes":
+                        write_bytes = int(value)
+            except OSError:
+                pass
+        rx = tx = 0
+        if files["net/dev"] is not None:
+            try:
+                for line in os.pread(files["net/dev"], 65536, 0).splitlines()[2:]:
+                    name, _, counters = line.partition(b":")
+                    if name.strip() == b"lo":
+                        continue
+                    counters = counters.split()
+                    rx += int(counters[0])
+                    tx += int(counters[8])
+            except (OSError, IndexError, ValueError):
+                pass
+        return cpu, rss, threads, read_bytes, write_bytes, rx, tx
+
+
+class PsutilBackend:
+    """通过 psutil 读取（Windows、macOS）"""
+
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+        self._processes = {}
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("psutil") is not None
+
+    def close(self, pid):
+        self._processes.pop(pid, None)
+
+    def read(self, pid):
+        psutil = self.psutil
+        try:
+            process = self._processes.get(pid) or self._processes.setdefault(pid, psutil.Process(pid))
+            with process.oneshot():
+                times = process.cpu_times()
+                rss = process.memory_info().rss
+                threads = process.num_threads()
+                try:
+                    io = process.io_counters()
+                    read_bytes, write_bytes = io.read_bytes, io.write_bytes
+                except (AttributeError, psutil.AccessDenied):
+                    read_bytes = write_bytes = 0
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.close(pid)
+            return None
+        net = psutil.net_io_counters()
+        return times.user + times.system, rss, threads, read_bytes, write_bytes, net.bytes_recv, net.bytes_sent
+
+
+def format_bytes(value):
+    """把字节数格式化为便于阅读的文字"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def process_start_time(pid):
+    """返回进程启动时间的文字表示，同一个进程每次读取的结果相同，可以据此判断 pid 是否已被其他进程复用。
+
+    进程不存在（或已成为僵尸进程）时返回 None；进程存在但无法读取启动时间时返回空字符串。
+    """
+    if ProcfsBackend.available():
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            return None
+        fields = stat[stat.rfind(b")") + 2:].split()
+        if not fields or fields[0] in (b"Z", b"X"):
+            return None
+        return fields[19].decode()  # 开机后经过的时钟周期数
+    if PsutilBackend.available():
+        import psutil
+        try:
+            process = psutil.Process(pid)
+            if process.status() == psutil.STATUS_ZOMBIE:
+                return None
+            return f"{process.create_time():.2f}"
+        except psutil.NoSuchProcess:
+            return None
+        except psutil.AccessDenied:
+            return ""
+    return ""  # 无法判断，按仍在运行处理（Windows 上 os.kill 会直接结束进程，不能用来探测）
+
+
+def default_backend():
+    """返回当前系统可用的后端，没有可用的后端时返回 None"""
+    for backend in (ProcfsBackend, PsutilBackend):
+        if backend.available():
+            return backend()
+    return None
+
+
+# ---------------------------------------------------------------- 采样器
+
+class _Target:
+    def __init__(self, process, capacity):
+        self.process = process
+        self.series = {name: TimeSeries(capacity) for name in METRICS}
+        self.pid = None
+        self.previous = None
+        self.previous_time = 0.0
+
+
+class ResourceSampler:
+    """定时采样多个进程。start/stop/add/remove 都必须在事件循环线程中调用。
+
+    add(key, process) 中的 process 只需要有 pid 属性（进程未运行时为 None），
+    例如 ServerController；服务器重启后 pid 变化会自动跟上。
+    监听器签名为 listener(key, values)，values 是本次各指标的值。
+    """
+
+    def __init__(self, backend=None, interval=DEFAULT_INTERVAL, capacity=DEFAULT_CAPACITY,
+                 clock=time.monotonic):
+        self.backend = backend if backend is not None else default_backend()
+        self.interval = interval
+        self.capacity = capacity
+        self.clock = clock
+        self.targets = {}
+        self.overhead = 0.0  # 最近一次采样占用单核 CPU 的比例
+        self._listeners = []
+        self._handle = None
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add(self, key, process):
+        self.remove(key)
+        self.targets[key] = _Target(process, self.capacity)
+
+    def remove(self, key):
+        target = self.targets.pop(key, None)
+        if target is not None and target.pid is not None and self.backend is not None:
+            self.backend.close(target.pid)
+
+    def series(self, key, metric):
+        return self.targets[key].series[metric]
+
+    def latest(self, key):
+        target = self.targets.get(key)
+        # 第一次采样只记录原始值，还没有速率
+        if target is None or target.previous is None or target.series[CPU].last is None:
+            return None
+        return {name: series.last for name, series in target.series.items()}
+
+    def start(self):
+        if self.backend is None or self._handle is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        started = time.thread_time()
+        self.sample()
+        self.overhead = (time.thread_time() - started) / self.interval
+        self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def sample(self):
+        """立即采样一次所有进程"""
+        now = self.clock()
+        for key, target in self.targets.items():
+            pid = target.process.pid
+            if pid != target.pid:
+                if target.pid is not None:
+                    self.backend.close(target.pid)
+                target.pid, target.previous = pid, None
+            if pid is None:
+                continue
+            raw = self.backend.read(pid)
+            if raw is None:
+                target.previous = None
+                continue
+            previous, elapsed = target.previous, now - target.previous_time
+            target.previous, target.previous_time = raw, now
+            if previous is None or elapsed <= 0:
+                continue  # 速率需要两次采样
+            values = {
+                CPU: max(0.0, (raw[0] - previous[0]) / elapsed * 100),
+                RSS: raw[1],
+                THREADS: raw[2],
+                DISK_READ: max(0.0, (raw[3] - previous[3]) / elapsed),
+                DISK_WRITE: max(0.0, (raw[4] - previous[4]) / elapsed),
+                NET_RX: max(0.0, (raw[5] - previous[5]) / elapsed),
+                NET_TX: max(0.0, (raw[6] - previous[6]) / elapsed),
+            }
+            for name, value in values.items():
+                target.series[name].append(value)
+            for listener in list(self._listeners):
+                listener(key, values)
@@ -0,0 +1,75 @@
+"""公网IP查询：多个可替换的查询地址、短超时，以及带有效期的磁盘缓存。"""
+import ipaddress
+import json
+import os
+import time
+import urllib.request
+
+DEFAULT_ENDPOINTS = (
+    "https://ipinfo.io/ip",
+    "https://api.ipify.org",
+    "https://ifconfig.me/ip",
+)
+DEFAULT_TIMEOUT = 3
+DEFAULT_TTL = 6 * 3600  # 缓存有效期（秒）
+
+
+class PublicIPLookup:
+    """查询本机公网IP。
+
+    endpoints 中的每一项可以是返回纯文本IP的URL，也可以是一个无参函数
+    （返回IP字符串），按顺序尝试直到成功。结果写入 cache_path，
+    下次启动时可以先显示上次的IP，再在后台刷新。
+    """
+
+    def __init__(self, cache_path=None, endpoints=DEFAULT_ENDPOINTS,
+                 timeout=DEFAULT_TIMEOUT, ttl=DEFAULT_TTL):
+        self.cache_path = cache_path
+        self.endpoints = list(endpoints)
+        self.timeout = timeout
+        self.ttl = ttl
+
+    def cached(self):
+        """返回 (ip, 缓存时长秒)，没有缓存时返回 None（过期的缓存也会返回）"""
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["ip"], max(0.0, time.time() - data["time"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def is_fresh(self):
+        cached = self.cached()
+        return cached is not None and cached[1] < self.ttl
+
+    def lookup(self):
+        """依次尝试各个查询地址，返回IP；全部失败时抛出最后一个异常"""
+        error = None
+        for endpoint in self.endpoints:
+            try:
+                ip = self._query(endpoint)
+                self._store(ip)
+                return ip
+            except Exception as e:
+                error = e
+        raise error or OSError("没有可用的公网IP查询地址")
+
+    def _query(self, endpoint):
+        if callable(endpoint):
+            text = endpoint()
+        else:
+            with urllib.request.urlopen(endpoint, timeout=self.timeout) as response:
+                text = response.read(64).decode("ascii", "replace")
+        # 校验返回内容，防止把错误页面当成IP显示
+        return str(ipaddress.ip_address(text.strip()))
+
+    def _store(self, ip):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ip": ip, "time": time.time()}, f)
+        os.replace(tmp_path, self.cache_path)
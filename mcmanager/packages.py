@@ -0,0 +1,330 @@
+"""服务器安装包的本地缓存与局域网镜像。
+
+下载过的安装包按 SHA-256 保存在 `lib/.cache/packages/objects` 中，索引记录每个
+（平台, 版本）对应的对象以及远端的 ETag / Last-Modified。再次安装同一版本时先发送
+一个条件请求（If-None-Match / If-Modified-Since），远端返回 304 或网络不通时直接
+从本地文件解压，不再下载。
+
+一台主机可以作为局域网镜像（PackageMirror），其他主机设置环境变量
+MCMANAGER_MIRROR=http://<主机>:8765 或使用 download --mirror 后从镜像下载。
+镜像按需从官方地址拉取并缓存安装包，支持 Range（多连接下载）和条件请求。
+
+命令行用法：
+    python -m mcmanager.packages list                 列出缓存的安装包
+    python -m mcmanager.packages serve [--port 8765]  作为局域网镜像运行
+    python -m mcmanager.packages gc                   删除不再被索引引用的文件
+"""
+import email.utils
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .download import DEFAULT_HEADERS, RangedDownloader
+from .verify import hash_file
+from .versions import PACKAGE_BASE, PACKAGE_PLATFORM
+
+CACHE_DIR = os.path.join(".cache", "packages")
+INDEX_FILE = "index.json"
+MIRROR_PORT = 8765
+MIRROR_MAX_AGE = 300  # 镜像在这段时间内不重复向上游确认（秒）
+REVALIDATE_TIMEOUT = 10
+
+_MIRROR_PATH = re.compile(r"^/(bin-win|bin-linux)/bedrock-server-([\w.\-]+)\.zip$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class PackageCache:
+    """按版本索引、按内容保存的安装包缓存。各方法可以在多个线程中同时调用"""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    @classmethod
+    def for_lib(cls, lib_dir):
+        return cls(os.path.join(lib_dir, CACHE_DIR))
+
+    @staticmethod
+    def key(version, platform=PACKAGE_PLATFORM):
+        return f"{platform}/{version}"
+
+    def _key_lock(self, key):
+        # 同一个安装包同时只下载一次，其他请求等待后直接使用结果
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.index, ensure_ascii=False, indent=1)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest + ".zip")
+
+    def get(self, version, platform=PACKAGE_PLATFORM):
+        """返回缓存条目；没有缓存或文件已丢失时返回 None"""
+        entry = self.index.get(self.key(version, platform))
+        if entry is None or not os.path.isfile(self.object_path(entry["sha256"])):
+            return None
+        return entry
+
+    def lookup(self, version, url, platform=PACKAGE_PLATFORM, max_age=None):
+        """返回仍然有效的缓存文件路径，需要重新下载时返回 None。
+
+        max_age 秒内确认过的直接使用；否则向 url 发送条件请求，
+        304、没有验证信息或网络不可用时都继续使用缓存。
+        """
+        key = self.key(version, platform)
+        with self._key_lock(key):
+            entry = self.get(version, platform)
+            if entry is None:
+                return None
+            path = self.object_path(entry["sha256"])
+            if max_age is not None and time.time() - entry["checked"] < max_age:
+                return path
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            if not headers:
+                return path  # 同一版本的安装包内容不会变化，无法确认时按有效处理
+            request = urllib.request.Request(url, headers=dict(DEFAULT_HEADERS, **headers))
+            try:
+                with urllib.request.urlopen(request, timeout=REVALIDATE_TIMEOUT):
+                    return None  # 远端内容已变化
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    return path  # 远端暂时出错或已下架，本地副本仍然可用
+            except OSError:
+                return path  # 离线时使用缓存
+            entry["checked"] = time.time()
+            self._save_index()
+            return path
+
+    def add(self, version, url, path, digest, meta=None, platform=PACKAGE_PLATFORM):
+        """把下载好的文件移入缓存（path 会被移走），返回缓存文件路径"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        target = self.object_path(digest)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        meta = meta or {}
+        with self._lock:
+            self.index[self.key(version, platform)] = {
+                "version": version,
+                "platform": platform,
+                "sha256": digest,
+                "size": os.path.getsize(target),
+                "url": url,
+                "etag": meta.get("etag"),
+                "last_modified": meta.get("last_modified"),
+                "checked": time.time(),
+            }
+        self._save_index()
+        return target
+
+    def fetch(self, version, url, platform=PACKAGE_PLATFORM, max_age=None, connections=4, progress=None):
+        """返回安装包的缓存路径，没有缓存或远端已变化时先下载"""
+        with self._key_lock(self.key(version, platform)):
+            path = self.lookup(version, url, platform, max_age)
+            if path is not None:
+                return path
+            tmp_dir = os.path.join(self.root, "tmp")
+            os.makedirs(tmp_dir, exist_ok=True)
+            downloader = RangedDownloader(url, os.path.join(tmp_dir, f"{platform}-{version}.zip"),
+                                          connections=connections, progress=progress, finalize=False)
+            part_path = downloader.run()
+            path = self.add(version, url, part_path, hash_file(part_path), downloader.meta, platform)
+            downloader.discard_partial()
+            return path
+
+    def remove(self, version, platform=PACKAGE_PLATFORM):
+        with self._lock:
+            self.index.pop(self.key(version, platform), None)
+        self._save_index()
+
+    def gc(self):
+        """删除不再被索引引用的文件，返回 (文件数, 字节数)"""
+        with self._lock:
+            referenced = {entry["sha256"] + ".zip" for entry in self.index.values()}
+        removed = freed = 0
+        try:
+            names = os.listdir(self.objects_dir)
+        except FileNotFoundError:
+            return 0, 0
+        for name in names:
+            if name not in referenced:
+                path = os.path.join(self.objects_dir, name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+        return removed, freed
+
+
+# ---------------------------------------------------------------- 镜像
+
+class _MirrorHandler(BaseHTTPRequestHandler):
+    server_version = "MCManagerMirror"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        match = _MIRROR_PATH.match(self.path.split("?", 1)[0])
+        if match is None:
+            self.send_error(404)
+            return
+        platform, version = match.groups()
+        cache = self.server.cache
+        upstream = f"{self.server.upstream}/{platform}/bedrock-server-{version}.zip"
+        if not body and cache.get(version, platform) is None:
+            self._relay_head(upstream)  # 只是探测版本是否存在时不触发下载
+            return
+        try:
+            path = cache.fetch(version, upstream, platform, max_age=self.server.max_age)
+        except urllib.error.HTTPError as e:
+            self.send_error(e.code)
+            return
+        except Exception as e:
+            self.send_error(502, str(e))
+            return
+        entry = cache.get(version, platform)
+        etag = f'"{entry["sha256"]}"'
+        size = entry["size"]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start, end = 0, size - 1
+        status = 200
+        match = _RANGE.match(self.headers.get("Range", ""))
+        if match and any(match.groups()):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(0, size - int(last))  # bytes=-N：最后 N 个字节
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", email.utils.formatdate(os.path.getmtime(path), usegmt=True))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if body:
+            with open(path, "rb") as f:
+                # 由内核直接从文件发送到套接字
+                self.connection.sendfile(f, start, end - start + 1)
+
+    def _relay_head(self, upstream):
+        request = urllib.request.Request(upstream, headers=DEFAULT_HEADERS, method="HEAD")
+        try:
+            with urllib.request.urlopen(request, timeout=REVALIDATE_TIMEOUT) as response:
+                self.send_response(response.status)
+                for name in ("Content-Length", "ETag", "Last-Modified"):
+                    if response.getheader(name):
+                        self.send_header(name, response.getheader(name))
+                self.end_headers()
+        except urllib.error.HTTPError as e:
+            self.send_error(e.code)
+        except OSError as e:
+            self.send_error(502, str(e))
+
+
+class PackageMirror(ThreadingHTTPServer):
+    """把 PackageCache 作为局域网镜像提供给其他主机。serve_forever() 开始服务"""
+
+    daemon_threads = True
+
+    def __init__(self, cache, host="0.0.0.0", port=MIRROR_PORT, upstream=PACKAGE_BASE,
+                 max_age=MIRROR_MAX_AGE, verbose=False):
+        super().__init__((host, port), _MirrorHandler)
+        self.cache = cache
+        self.upstream = upstream.rstrip("/")
+        self.max_age = max_age
+        self.verbose = verbose
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m mcmanager.packages", description="安装包缓存与局域网镜像")
+    parser.add_argument("--lib", default="lib", help="服务器文件目录（默认 lib）")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    commands.add_parser("list", help="列出缓存的安装包")
+    commands.add_parser("gc", help="删除不再被索引引用的文件")
+    p = commands.add_parser("serve", help="作为局域网镜像运行")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=MIRROR_PORT)
+    p.add_argument("--upstream", default=PACKAGE_BASE, help="上游地址（默认官方地址）")
+    p.add_argument("--max-age", type=float, default=MIRROR_MAX_AGE, help="向上游确认的最短间隔（秒）")
+    args = parser.parse_args(argv)
+
+    cache = PackageCache.for_lib(args.lib)
+    if args.command == "list":
+        for key, entry in sorted(cache.index.items()):
+            checked = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["checked"]))
+            print(f"{key}  {_format_size(entry['size'])}  {entry['sha256'][:12]}  确认于 {checked}")
+    elif args.command == "gc":
+        removed, freed = cache.gc()
+        print(f"删除 {removed} 个文件，释放 {_format_size(freed)}")
+    elif args.command == "serve":
+        mirror = PackageMirror(cache, args.host, args.port, args.upstream, args.max_age, verbose=True)
+        print(f"镜像已启动: http://{args.host}:{mirror.server_address[1]}/，"
+              f"其他主机设置 MCMANAGER_MIRROR 为此地址即可")
+        try:
+            mirror.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            mirror.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
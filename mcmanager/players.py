@@ -0,0 +1,348 @@
+"""在线玩家索引与会话历史。
+
+PlayerTracker 注册为控制器的输出监听器，用 EventParser 把输出转换为事件：
+- PlayerIndex 在内存中维护在线玩家，"谁在线"、"某人是否在线"都是 O(1)；
+- SessionStore 把每次上线到下线记录为一条会话，保存在 SQLite 中。记录操作只是放入
+  队列，由后台线程每隔 batch_interval 秒（或攒够 batch_size 条）在一个事务中写入，
+  同时累计每个玩家的总时长，查询游戏时间不需要重新扫描日志。
+
+服务器停止或重新启动时，仍在线的玩家的会话在该时刻结束。管理器意外退出时没有结束的
+会话，在服务器下次启动时以最后一次写入的时间结束。
+"""
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .controller import STOPPED
+from .events import EventParser, PlayerConnected, PlayerDisconnected, ServerStarted
+
+SESSIONS_FILE = "sessions.db"  # 与日志放在一起：logs/versions/<版本>、logs/instances/<实例>
+BATCH_INTERVAL = 1.0
+BATCH_SIZE = 500
+
+REASON_DISCONNECT = "disconnect"
+REASON_SERVER_STOP = "server_stop"
+REASON_UNKNOWN = "unknown"  # 管理器意外退出
+
+OnlinePlayer = collections.namedtuple("OnlinePlayer", "name xuid since")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL COLLATE NOCASE,
+    xuid TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    total_seconds REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS players_name ON players (name);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    joined REAL NOT NULL,
+    left REAL,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_key ON sessions (key, joined);
+CREATE INDEX IF NOT EXISTS sessions_joined ON sessions (joined);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+"""
+
+
+def format_duration(seconds):
+    """游戏时间的显示，例如 3 小时 05 分、12 分、40 秒"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    hours, minutes = divmod(seconds // 60, 60)
+    return f"{hours} 小时 {minutes:02d} 分" if hours else f"{minutes} 分"
+
+
+def player_key(name, xuid):
+    """识别玩家的键：有 xuid 时用 xuid（改名后仍是同一个人），否则用小写名称"""
+    return xuid if xuid else "name:" + name.lower()
+
+
+class PlayerIndex:
+    """在线玩家索引，只在事件循环线程中修改"""
+
+    def __init__(self):
+        self._by_key = {}
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def __contains__(self, name):
+        return name.lower() in self._by_name
+
+    def get(self, name):
+        """按名称（不区分大小写）查找在线玩家，不在线时返回 None"""
+        return self._by_key.get(self._by_name.get(name.lower()))
+
+    def online(self):
+        """在线玩家，按上线时间排序"""
+        return sorted(self._by_key.values(), key=lambda player: player.since)
+
+    def join(self, name, xuid, now):
+        """记录上线，返回 OnlinePlayer；已经在线时返回 None"""
+        key = player_key(name, xuid)
+        if key in self._by_key:
+            return None
+        player = self._by_key[key] = OnlinePlayer(name, xuid, now)
+        self._by_name[name.lower()] = key
+        return player
+
+    def leave(self, name, xuid):
+        """记录下线，返回下线的 OnlinePlayer；不在线时返回 None"""
+        key = player_key(name, xuid)
+        if key not in self._by_key:
+            key = self._by_name.get(name.lower())
+        player = self._by_key.pop(key, None)
+        if player is not None:
+            self._by_name.pop(player.name.lower(), None)
+        return player
+
+    def clear(self):
+        """全部下线，返回原来在线的玩家"""
+        players = list(self._by_key.values())
+        self._by_key.clear()
+        self._by_name.clear()
+        return players
+
+
+class SessionStore:
+    """SQLite 中的会话历史。started/ended 可以在任何线程调用，只是把操作放入队列；
+    查询方法在调用线程中打开自己的连接（WAL 模式下不会被写入阻塞）。
+    """
+
+    def __init__(self, path, batch_interval=BATCH_INTERVAL, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.commits = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """启动写入线程（同时结束上次没有正常结束的会话）"""
+        self._put(("open",))
+
+    def started(self, player):
+        self._put(("start", player))
+
+    def ended(self, player, left, reason=REASON_DISCONNECT):
+        self._put(("end", player, left, reason))
+
+    def _put(self, item):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="SessionStore", daemon=True)
+                    self._thread.start()
+        self._queue.put(item)
+
+    def flush(self, timeout=None):
+        """等待已记录的操作写入数据库"""
+        if self._thread is not None:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            with connection:
+                self._close_dangling(connection)
+            stop = False
+            while not stop:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.batch_interval
+                # 攒一批再写，既不会每条操作提交一次，也不会让结果等待太久
+                while len(batch) < self.batch_size and batch[-1] is not None \
+                        and not isinstance(batch[-1], threading.Event):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                operations = [item for item in batch if isinstance(item, tuple) and item[0] != "open"]
+                if operations:
+                    with connection:
+                        self._apply(connection, operations)
+                    self.commits += 1
+                for item in batch:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        item.set()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _apply(connection, operations):
+        last = 0.0
+        for operation in operations:
+            player = operation[1]
+            key = player_key(player.name, player.xuid)
+            if operation[0] == "start":
+                connection.execute(
+                    "INSERT INTO players (key, name, xuid, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET name = excluded.name, last_seen = excluded.last_seen",
+                    (key, player.name, player.xuid, player.since, player.since))
+                connection.execute("INSERT INTO sessions (key, name, joined) VALUES (?, ?, ?)",
+                                   (key, player.name, player.since))
+                last = max(last, player.since)
+            else:
+                _, _, left, reason = operation
+                left = max(left, player.since)
+                connection.execute("UPDATE sessions SET left = ?, reason = ? WHERE key = ? AND joined = ? AND left IS NULL",
+                                   (left, reason, key, player.since))
+                connection.execute("UPDATE players SET total_seconds = total_seconds + ?, sessions = sessions + 1, "
+                                   "last_seen = ? WHERE key = ?", (left - player.since, left, key))
+                last = max(last, left)
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_activity', "
+                           "MAX(?, COALESCE((SELECT value FROM meta WHERE key = 'last_activity'), 0)))", (last,))
+
+    @staticmethod
+    def _close_dangling(connection):
+        row = connection.execute("SELECT value FROM meta WHERE key = 'last_activity'").fetchone()
+        last = row[0] if row else 0.0
+        dangling = connection.execute("SELECT key, joined FROM sessions WHERE left IS NULL").fetchall()
+        for key, joined in dangling:
+            left = max(joined, last)
+            connection.execute("UPDATE sessions SET left = ?, reason = ? WHERE key = ? AND joined = ? AND left IS NULL",
+                               (left, REASON_UNKNOWN, key, joined))
+            connection.execute("UPDATE players SET total_seconds = total_seconds + ?, sessions = sessions + 1 "
+                               "WHERE key = ?", (left - joined, key))
+
+    # ------------------------------------------------------------ 查询
+
+    def _query(self, sql, params=()):
+        if not os.path.exists(self.path):
+            return []
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def playtime(self, name, since=None, until=None, now=None):
+        """玩家（名称不区分大小写）的游戏时间（秒）；没有时间范围时直接读取累计值"""
+        now = time.time() if now is None else now
+        if since is None and until is None:
+            rows = self._query(
+                "SELECT p.total_seconds + COALESCE((SELECT SUM(? - s.joined) FROM sessions s "
+                "WHERE s.key = p.key AND s.left IS NULL), 0) FROM players p WHERE p.name = ?", (now, name))
+            return sum(row[0] for row in rows)
+        since = 0.0 if since is None else since
+        until = now if until is None else until
+        rows = self._query(
+            "SELECT SUM(MIN(COALESCE(s.left, ?), ?) - MAX(s.joined, ?)) FROM sessions s "
+            "JOIN players p ON p.key = s.key WHERE p.name = ? AND s.joined < ? AND COALESCE(s.left, ?) > ?",
+            (now, until, since, name, until, now, since))
+        return (rows[0][0] or 0.0) if rows else 0.0
+
+    def top(self, limit=10, since=None, now=None):
+        """游戏时间最长的玩家 [(名称, 秒数, 会话数)]；since 为 None 时统计全部历史"""
+        now = time.time() if now is None else now
+        if since is None:
+            return self._query(
+                "SELECT p.name, p.total_seconds + COALESCE((SELECT SUM(? - s.joined) FROM sessions s "
+                "WHERE s.key = p.key AND s.left IS NULL), 0) AS total, p.sessions FROM players p "
+                "ORDER BY total DESC LIMIT ?", (now, limit))
+        return self._query(
+            "SELECT p.name, SUM(MIN(COALESCE(s.left, ?), ?) - MAX(s.joined, ?)) AS total, COUNT(*) "
+            "FROM sessions s JOIN players p ON p.key = s.key WHERE COALESCE(s.left, ?) > ? "
+            "GROUP BY s.key ORDER BY total DESC LIMIT ?", (now, now, since, now, since, limit))
+
+    def sessions(self, name, limit=50):
+        """玩家最近的会话 [(上线时间, 下线时间或 None, 结束原因)]，新的在前"""
+        return self._query(
+            "SELECT s.joined, s.left, s.reason FROM sessions s JOIN players p ON p.key = s.key "
+            "WHERE p.name = ? ORDER BY s.joined DESC LIMIT ?", (name, limit))
+
+
+class PlayerTracker:
+    """把一个服务器的输出转换为事件，维护在线玩家和会话历史。
+
+    feed 和监听器都在事件循环线程中调用；listener(event) 收到每个解析出的事件。
+    db_path 为 None 时只维护在线玩家，不记录历史。
+    """
+
+    def __init__(self, db_path=None, parser=None):
+        self.parser = parser or EventParser()
+        self.index = PlayerIndex()
+        self.store = SessionStore(db_path) if db_path else None
+        self._listeners = []
+
+    def attach(self, controller):
+        controller.add_output_listener(self.feed)
+        controller.add_state_listener(self._on_state)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def feed(self, lines, source, now=None):
+        if source != "stdout":
+            return
+        for event in self.parser.feed(lines, now):
+            self.handle(event)
+
+    def handle(self, event):
+        if isinstance(event, PlayerConnected):
+            player = self.index.join(event.name, event.xuid, event.time)
+            if player is not None and self.store is not None:
+                self.store.started(player)
+        elif isinstance(event, PlayerDisconnected):
+            player = self.index.leave(event.name, event.xuid)
+            if player is not None and self.store is not None:
+                self.store.ended(player, event.time)
+        elif isinstance(event, ServerStarted):
+            self.end_all(event.time)  # 上次运行没有正常结束的会话
+            if self.store is not None:
+                self.store.open()
+        for listener in list(self._listeners):
+            listener(event)
+
+    def end_all(self, now=None, reason=REASON_SERVER_STOP):
+        """结束所有在线玩家的会话"""
+        now = time.time() if now is None else now
+        for player in self.index.clear():
+            if self.store is not None:
+                self.store.ended(player, now, reason)
+
+    def _on_state(self, state, exit_code):
+        if state == STOPPED:
+            self.end_all()
+
+    def close(self):
+        """把排队中的会话写入数据库（不改变在线状态）"""
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,188 @@
+"""server.properties 的读写。
+
+文件解析为 PropertiesDocument，保留原有的行顺序、注释、空行、换行符和界面不认识的键，
+没有 "=" 的行原样保留。write_properties 只修改给出的键，值没有变化时不写文件，
+写入时先写临时文件再改名，不会留下写了一半的配置。
+
+解析结果按路径缓存，以文件的修改时间和大小判断是否需要重新解析。
+通过 add_change_listener 注册的监听器 listener(path, changes) 在配置变化时调用
+（本程序写入或检测到文件被外部修改），changes 为 {键: (旧值, 新值)}，
+不存在的键对应的值为 None。
+
+界面线程和核心线程都会读写配置，缓存和监听器列表由一个锁保护，监听器在锁外调用。
+"""
+import os
+import threading
+
+ENCODING = "utf-8"
+# 只在创建新世界时生效，修改后不需要重启服务器
+NO_RESTART_KEYS = frozenset({"level-seed"})
+
+_cache = {}  # 绝对路径 -> (mtime_ns, size, PropertiesDocument)
+_change_listeners = []
+_lock = threading.RLock()
+
+
+class PropertiesDocument:
+    """保留原文格式的配置文件内容"""
+
+    def __init__(self, text=""):
+        self.newline = "\r\n" if "\r\n" in text else "\n"
+        self._lines = []   # 每行的原文（不含换行符）
+        self._index = {}   # 键 -> 行号
+        for line in text.splitlines():
+            self._append_line(line)
+        self._trailing_newline = not text or text.endswith(("\n", "\r"))
+
+    def _append_line(self, line):
+        key = _parse_key(line)
+        if key is not None:
+            self._index[key] = len(self._lines)  # 重复的键以最后一次出现为准
+        self._lines.append(line)
+
+    def copy(self):
+        document = PropertiesDocument()
+        document.newline = self.newline
+        document._lines = list(self._lines)
+        document._index = dict(self._index)
+        document._trailing_newline = self._trailing_newline
+        return document
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __getitem__(self, key):
+        return self._lines[self._index[key]].split("=", 1)[1].strip()
+
+    def get(self, key, default=None):
+        return self[key] if key in self._index else default
+
+    def keys(self):
+        return list(self._index)
+
+    def to_dict(self):
+        return {key: self[key] for key in self._index}
+
+    def set(self, key, value):
+        """设置一个键，返回是否有变化。已有的键原位修改，新键追加到末尾"""
+        value = str(value)
+        if key in self._index:
+            if self[key] == value:
+                return False
+            self._lines[self._index[key]] = f"{key}={value}"
+        else:
+            self._append_line(f"{key}={value}")
+        return True
+
+    def update(self, values):
+        """设置多个键，返回 {键: (旧值, 新值)}，只包含有变化的键"""
+        changes = {}
+        for key, value in values.items():
+            old = self.get(key)
+            if self.set(key, value):
+                changes[key] = (old, str(value))
+        return changes
+
+    def text(self):
+        text = self.newline.join(self._lines)
+        if self._lines and self._trailing_newline:
+            text += self.newline
+        return text
+
+
+def _parse_key(line):
+    stripped = line.strip()
+    if not stripped or stripped.startswith("#") or "=" not in stripped:
+        return None
+    return stripped.split("=", 1)[0].strip() or None
+
+
+def diff(old, new):
+    """比较两个 {键: 值}，返回 {键: (旧值, 新值)}"""
+    changes = {}
+    for key in old.keys() | new.keys():
+        if old.get(key) != new.get(key):
+            changes[key] = (old.get(key), new.get(key))
+    return changes
+
+
+def needs_restart(changes):
+    """判断这些修改是否需要重启正在运行的服务器才能生效"""
+    return any(key not in NO_RESTART_KEYS for key in changes)
+
+
+def add_change_listener(listener):
+    with _lock:
+        _change_listeners.append(listener)
+
+
+def remove_change_listener(listener):
+    with _lock:
+        if listener in _change_listeners:
+            _change_listeners.remove(listener)
+
+
+def _notify(path, changes):
+    if changes:
+        with _lock:
+            listeners = list(_change_listeners)
+        for listener in listeners:
+            listener(path, changes)
+
+
+def load_properties(path):
+    """读取配置文件，返回 PropertiesDocument 的副本；文件不存在时返回 None"""
+    if not path:
+        return None  # 没有选择版本
+    path = os.path.abspath(path)
+    with _lock:
+        document, changes = _load(path)
+    _notify(path, changes)
+    return document
+
+
+def _load(path):
+    """返回 (PropertiesDocument 的副本或 None, 外部修改的内容)，调用方持有 _lock"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _cache.pop(path, None)
+        return None, None
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2].copy(), None
+    # newline="" 保留原有的换行符，surrogateescape 保证非 UTF-8 字节也能原样写回
+    with open(path, "r", encoding=ENCODING, errors="surrogateescape", newline="") as f:
+        document = PropertiesDocument(f.read())
+    _cache[path] = (st.st_mtime_ns, st.st_size, document)
+    changes = diff(cached[2].to_dict(), document.to_dict()) if cached is not None else None
+    return document.copy(), changes
+
+
+def read_properties(path):
+    """读取配置文件，返回 {键: 值}；文件不存在时返回 None"""
+    document = load_properties(path)
+    return document.to_dict() if document is not None else None
+
+
+def write_properties(path, properties):
+    """把 {键: 值} 合并写入配置文件，其余内容保持不变。
+
+    返回 {键: (旧值, 新值)}；没有变化时不写文件，返回空字典。
+    """
+    path = os.path.abspath(path)
+    # 读取、修改和写回在同一个锁内完成，两个线程同时修改不同的键时不会丢失修改
+    with _lock:
+        document, external = _load(path)
+        document = document or PropertiesDocument()
+        changes = document.update(properties)
+        if changes:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding=ENCODING, errors="surrogateescape", newline="") as f:
+                f.write(document.text())
+            os.replace(tmp_path, path)
+            st = os.stat(path)
+            _cache[path] = (st.st_mtime_ns, st.st_size, document)
+    _notify(path, external)
+    _notify(path, changes)
+    return changes
@@ -0,0 +1,101 @@
+"""服务器输出读取：增量解码、按行分帧，以及带背压策略的有界行队列。"""
+import codecs
+import threading
+from collections import deque
+
+# 队列满时的处理策略
+DROP_OLDEST = "drop"   # 丢弃最旧的行
+MERGE = "merge"        # 丢弃最旧的行，并在下次取出时插入一条合并提示
+
+
+class LineFramer:
+    """把任意切分的字节块还原为完整的文本行。
+
+    使用增量解码器，跨块的多字节UTF-8字符不会被截断；不完整的最后一行
+    会保留到下一块到达时再拼接。
+    """
+
+    def __init__(self, encoding="utf-8", errors="replace"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        self._partial = ""
+
+    def feed(self, data):
+        """送入一块字节，返回其中所有完整的行（不含换行符）"""
+        text = self._partial + self._decoder.decode(data)
+        if not text:
+            return []
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+    def flush(self):
+        """进程结束时取出剩余的半行"""
+        text = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        if text.endswith("\r"):
+            text = text[:-1]
+        return [text] if text else []
+
+
+class ReaderStats:
+    """读取计数器"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.lines_dropped = 0
+
+    def as_dict(self):
+        return {
+            "bytes_read": self.bytes_read,
+            "lines_read": self.lines_read,
+            "lines_dropped": self.lines_dropped,
+        }
+
+
+class LineQueue:
+    """读取线程与界面线程之间的有界行队列。
+
+    生产者过快时不会无限堆积：超过容量的最旧行被丢弃并计数；
+    MERGE 策略下，消费者取出时会先得到一条"已丢弃 N 行"的提示行（来源为 manager）。
+    """
+
+    def __init__(self, maxsize=20000, policy=MERGE, stats=None):
+        self._lock = threading.Lock()
+        self._lines = deque()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stats = stats or ReaderStats()
+        self._dropped_since_drain = 0
+
+    def put_many(self, lines, source="stdout"):
+        """放入多行，返回放入前队列是否为空（用于边沿触发通知）"""
+        if not lines:
+            return False
+        with self._lock:
+            was_empty = not self._lines
+            self._lines.extend((line, source) for line in lines)
+            self.stats.lines_read += len(lines)
+            overflow = len(self._lines) - self.maxsize
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._lines.popleft()
+                self.stats.lines_dropped += overflow
+                self._dropped_since_drain += overflow
+            return was_empty
+
+    def drain(self):
+        """取出队列中的所有行，返回 [(行, 来源)]"""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped, self._dropped_since_drain = self._dropped_since_drain, 0
+        if dropped and self.policy == MERGE:
+            lines.insert(0, (f"[输出过快，已丢弃 {dropped} 行]", "manager"))
+        return lines
+
+    def __len__(self):
+        return len(self._lines)
@@ -0,0 +1,467 @@
+"""定时任务：定时发送命令、重启和备份。
+
+所有任务放在一个按下次运行时间排序的堆中，由一个协程等待堆顶任务到期，
+任务再多空闲时也只有一个定时器；每次最多等待 MAX_SLEEP 秒后重新读取时钟，
+系统休眠唤醒后能及时发现错过的任务。
+
+触发条件的写法：
+    every 30m / every 1h30m / every 90s / every 1d   固定间隔（从创建时间起算）
+    0 4 * * *                                         cron 表达式：分 时 日 月 星期（0 或 7 为星期日），
+                                                      每段可以是 *、数字、a-b、列表 a,b 和步长 */n
+    @hourly / @daily / @weekly / @monthly             cron 的简写
+
+错过的运行（管理器未运行或系统休眠，超过 grace 秒）按任务的 missed 处理：
+    once   补运行一次（默认）
+    skip   跳过，等下一次
+    all    每一次都补上（最多 MAX_CATCHUP 次）
+
+任务保存在 JSON 文件中，记录上次运行时间，管理器重启后据此判断错过的运行。
+文件被改坏（不是有效的 JSON）时保留之前读到的任务，在文件修正之前不会覆盖它；
+单个任务无效时跳过该任务，保存时原样写回。
+时钟可以注入，due(now) 不依赖事件循环，便于测试。
+"""
+import asyncio
+import datetime
+import heapq
+import json
+import os
+import re
+import threading
+import time
+
+ACTION_COMMAND = "command"   # 发送命令，参数为命令
+ACTION_RESTART = "restart"   # 重启服务器
+ACTION_BACKUP = "backup"     # 备份世界，参数为保留的快照数（可省略）
+ACTIONS = (ACTION_COMMAND, ACTION_RESTART, ACTION_BACKUP)
+
+MISSED_ONCE = "once"
+MISSED_SKIP = "skip"
+MISSED_ALL = "all"
+MISSED_POLICIES = (MISSED_ONCE, MISSED_SKIP, MISSED_ALL)
+
+SCHEDULE_FILE = "schedule.json"
+DEFAULT_GRACE = 60.0   # 迟到不超过这么多秒时仍算按时运行
+MAX_SLEEP = 60.0
+MAX_CATCHUP = 100
+CRON_SEARCH_LIMIT = 100000
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class ScheduleError(Exception):
+    """触发条件或任务设置无效"""
+
+
+class IntervalTrigger:
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ScheduleError("间隔必须大于 0")
+        self.seconds = seconds
+
+    def next_after(self, t, anchor):
+        """anchor + k * seconds 中第一个大于 t 的时间"""
+        if t < anchor:
+            return anchor
+        return anchor + ((t - anchor) // self.seconds + 1) * self.seconds
+
+
+def _parse_field(field, low, high):
+    values = set()
+    for item in field.split(","):
+        base, _, step = item.partition("/")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start, _, end = base.partition("-")
+            start, end = int(start), int(end)
+        else:
+            start = end = int(base)
+            if step:
+                end = high  # 5/15 表示从 5 开始每 15
+        step = int(step) if step else 1
+        if not (low <= start <= end <= high) or step <= 0:
+            raise ValueError(item)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronTrigger:
+    """cron 表达式（本地时间）"""
+
+    def __init__(self, expression):
+        fields = CRON_ALIASES.get(expression, expression).split()
+        if len(fields) != 5:
+            raise ScheduleError(f"cron 表达式应有 5 段（分 时 日 月 星期）: {expression}")
+        try:
+            self.minutes = _parse_field(fields[0], 0, 59)
+            self.hours = _parse_field(fields[1], 0, 23)
+            self.days = _parse_field(fields[2], 1, 31)
+            self.months = _parse_field(fields[3], 1, 12)
+            self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        except ValueError as e:
+            raise ScheduleError(f"cron 表达式中的 {e} 无效: {expression}")
+        # 日和星期都有限制时满足其一即可（与 cron 相同）
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, t, anchor=None):
+        dt = datetime.datetime.fromtimestamp(t).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for _ in range(CRON_SEARCH_LIMIT):
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ScheduleError("cron 表达式永远不会触发")
+
+
+def parse_trigger(spec):
+    """把触发条件文字解析为 IntervalTrigger 或 CronTrigger"""
+    spec = " ".join(spec.split())
+    if spec.startswith("every "):
+        text = spec[len("every "):].replace(" ", "")
+        parts = re.findall(r"(\d+(?:\.\d+)?)([smhd])", text)
+        if not parts or "".join(n + u for n, u in parts) != text:
+            raise ScheduleError(f"无效的间隔: {spec}（例如 every 30m、every 1h30m）")
+        return IntervalTrigger(sum(float(n) * _UNITS[u] for n, u in parts))
+    return CronTrigger(spec)
+
+
+class Job:
+    """一个定时任务，instance 为实例名（图形界面中为版本号）"""
+
+    def __init__(self, job_id, instance, trigger, action, argument="", missed=MISSED_ONCE,
+                 enabled=True, created=None, last_run=None):
+        if action not in ACTIONS:
+            raise ScheduleError(f"未知的操作: {action}")
+        if missed not in MISSED_POLICIES:
+            raise ScheduleError(f"未知的错过处理方式: {missed}")
+        if action == ACTION_COMMAND and not argument:
+            raise ScheduleError("发送命令的任务需要指定命令")
+        if action == ACTION_BACKUP and argument and not argument.isdigit():
+            raise ScheduleError("备份任务的参数应为保留的快照数")
+        self.id = job_id
+        self.instance = instance
+        self.trigger_spec = trigger
+        self.trigger = parse_trigger(trigger)
+        self.action = action
+        self.argument = argument
+        self.missed = missed
+        self.enabled = enabled
+        self.created = created if created is not None else time.time()
+        self.last_run = last_run
+        self.next_run = None
+
+    def describe(self):
+        names = {ACTION_COMMAND: f"发送命令 {self.argument}", ACTION_RESTART: "重启",
+                 ACTION_BACKUP: "备份" + (f"（保留 {self.argument} 个）" if self.argument else "")}
+        return f"#{self.id} {self.instance} [{self.trigger_spec}] {names[self.action]}"
+
+    def to_config(self):
+        return {"id": self.id, "instance": self.instance, "trigger": self.trigger_spec,
+                "action": self.action, "argument": self.argument, "missed": self.missed,
+                "enabled": self.enabled, "created": self.created, "last_run": self.last_run}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["id"], config["instance"], config["trigger"], config["action"],
+                   config.get("argument", ""), config.get("missed", MISSED_ONCE),
+                   config.get("enabled", True), config.get("created"), config.get("last_run"))
+
+
+class Scheduler:
+    """定时任务调度器。
+
+    runner 是协程函数 runner(job)，执行任务的操作，返回值作为结果文字；
+    监听器签名为 listener(job, result, error)，每次运行结束后调用；
+    错误监听器 listener(message) 在读取任务文件遇到问题时调用。
+    add/remove/set_enabled/jobs 可以在任何线程调用，任务在 start() 所在的事件循环中运行。
+    """
+
+    def __init__(self, path=None, runner=None, clock=time.time, grace=DEFAULT_GRACE):
+        self.path = path
+        self.runner = runner
+        self.clock = clock
+        self.grace = grace
+        self._jobs = {}
+        self._heap = []
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._running = set()  # 正在运行的任务编号
+        self._listeners = []
+        self._error_listeners = []
+        self._invalid = []  # 无效任务的原始配置，保存时原样写回
+        self._broken = None  # 任务文件无法读取时的错误信息
+        self.load_errors = []  # 最近一次 load 遇到的问题
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._mtime = None
+
+    # ------------------------------------------------------------ 持久化
+
+    def load(self):
+        """从文件读取任务（文件不存在时为空），返回遇到的问题列表（同时通知错误监听器）"""
+        errors = []
+        with self._lock:
+            st = None
+            try:
+                st = os.stat(self.path)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    configs = json.load(f)["jobs"]
+                if not isinstance(configs, list):
+                    raise ValueError("jobs 应为列表")
+            except FileNotFoundError:
+                configs, st = [], None
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # 保留之前的任务；记下修改时间，文件没有再变化时不重复报告
+                self._mtime = st.st_mtime_ns if st else None
+                self._broken = f"定时任务文件 {self.path} 无法读取: {e}"
+                errors.append(f"{self._broken}，修正前继续使用之前的任务")
+                configs = None
+            if configs is not None:
+                jobs, invalid = {}, []
+                for config in configs:
+                    try:
+                        job = Job.from_config(config)
+                    except (ScheduleError, ValueError, KeyError, TypeError, AttributeError) as e:
+                        invalid.append(config)
+                        errors.append(f"跳过无效的定时任务 {json.dumps(config, ensure_ascii=False)}: {e}")
+                        continue
+                    jobs[job.id] = job
+                self._jobs, self._invalid, self._broken = jobs, invalid, None
+                self._mtime = st.st_mtime_ns if st else None
+                self._rebuild()
+            self.load_errors = errors
+        for message in errors:
+            self._report(message)
+        return errors
+
+    def _report(self, message):
+        for listener in list(self._error_listeners):
+            listener(message)
+
+    def _check_writable(self):
+        if self._broken is not None:
+            raise ScheduleError(f"{self._broken}，修正后才能修改任务")
+
+    def save(self):
+        # 任务文件被改坏时不覆盖，留给用户修正
+        if not self.path or self._broken is not None:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"jobs": [job.to_config() for job in self._jobs.values()] + self._invalid}, f,
+                          ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def reload_if_changed(self):
+        """文件被其他进程（例如命令行）修改过时重新读取，返回是否重新读取"""
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self.load()
+        self._wake()
+        return True
+
+    # ------------------------------------------------------------ 任务管理
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add_error_listener(self, listener):
+        self._error_listeners.append(listener)
+
+    def add(self, instance, trigger, action, argument="", missed=MISSED_ONCE):
+        """新建任务并保存，返回 Job；设置无效时抛出 ScheduleError"""
+        with self._lock:
+            self.reload_if_changed()
+            self._check_writable()
+            # 编号也不与无效任务重复
+            used = list(self._jobs) + [c["id"] for c in self._invalid
+                                       if isinstance(c, dict) and isinstance(c.get("id"), int)]
+            job_id = max(used, default=0) + 1
+            job = Job(job_id, instance, trigger, action, argument, missed, created=self.clock())
+            self._jobs[job_id] = job
+            self._schedule(job, job.created)
+            self.save()
+        self._wake()
+        return job
+
+    def remove(self, job_id):
+        with self._lock:
+            self.reload_if_changed()
+            self._check_writable()
+            if self._jobs.pop(job_id, None) is None:
+                raise ScheduleError(f"没有编号为 {job_id} 的任务")
+            self.save()
+
+    def remove_instance(self, instance):
+        """删除实例的所有任务"""
+        with self._lock:
+            self.reload_if_changed()
+            self._check_writable()
+            for job in self.jobs(instance):
+                del self._jobs[job.id]
+            self.save()
+
+    def set_enabled(self, job_id, enabled):
+        with self._lock:
+            self.reload_if_changed()
+            self._check_writable()
+            job = self.get(job_id)
+            job.enabled = enabled
+            # 重新启用时从现在开始算，停用期间的运行不算错过
+            self._schedule(job, self.clock())
+            self.save()
+        self._wake()
+
+    def get(self, job_id):
+        try:
+            return self._jobs[job_id]
+        except KeyError:
+            raise ScheduleError(f"没有编号为 {job_id} 的任务")
+
+    def jobs(self, instance=None):
+        """返回任务列表（按编号），instance 不为 None 时只返回该实例的任务"""
+        with self._lock:
+            return [job for _, job in sorted(self._jobs.items())
+                    if instance is None or job.instance == instance]
+
+    # ------------------------------------------------------------ 调度
+
+    def _schedule(self, job, since):
+        """安排 since 之后的下一次运行"""
+        if not job.enabled:
+            job.next_run = None
+            return
+        job.next_run = job.trigger.next_after(since, job.created)
+        self._seq += 1
+        heapq.heappush(self._heap, (job.next_run, self._seq, job))
+
+    def _rebuild(self):
+        self._heap = []
+        for job in self._jobs.values():
+            self._schedule(job, job.last_run if job.last_run is not None else job.created)
+
+    def next_wakeup(self):
+        """最早的下次运行时间，没有任务时返回 None"""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        # 删除、停用或重新调度过的任务留在堆中的旧条目在这里丢弃
+        while self._heap:
+            t, _, job = self._heap[0]
+            if self._jobs.get(job.id) is job and job.next_run == t:
+                return
+            heapq.heappop(self._heap)
+
+    def due(self, now=None):
+        """取出到期的任务并安排下一次，返回 [(job, 本次应运行的次数)]"""
+        now = self.clock() if now is None else now
+        fired = []
+        with self._lock:
+            changed = False
+            while True:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                t, _, job = heapq.heappop(self._heap)
+                changed = True
+                times = 1
+                if now - t > self.grace:
+                    if job.missed == MISSED_SKIP:
+                        times = 0
+                    elif job.missed == MISSED_ALL:
+                        t_next = job.trigger.next_after(t, job.created)
+                        while t_next <= now and times < MAX_CATCHUP:
+                            times += 1
+                            t_next = job.trigger.next_after(t_next, job.created)
+                if times:
+                    fired.append((job, times))
+                # 下一次从现在之后算起，错过的不再重复触发
+                job.last_run = now
+                self._schedule(job, now)
+            if changed:
+                self.save()
+        return fired
+
+    # ------------------------------------------------------------ 运行
+
+    def start(self):
+        """在当前事件循环中开始调度"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                self.reload_if_changed()
+                fired = self.due()
+            except OSError as e:
+                # 磁盘满、没有权限等，下一轮再试，调度不会因此停止
+                self._report(f"定时任务文件读写失败: {e}")
+                fired = []
+            for job, times in fired:
+                if job.id in self._running:
+                    continue  # 上一次还没结束，不重叠运行
+                self._running.add(job.id)
+                asyncio.ensure_future(self._execute(job, times))
+            next_run = self.next_wakeup()
+            delay = MAX_SLEEP if next_run is None else min(MAX_SLEEP, max(0.0, next_run - self.clock()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job, times):
+        try:
+            for _ in range(times):
+                try:
+                    result, error = await self.runner(job), None
+                except Exception as e:
+                    result, error = None, e
+                for listener in list(self._listeners):
+                    listener(job, result, error)
+        finally:
+            self._running.discard(job.id)
@@ -0,0 +1,235 @@
+"""内容寻址的共享文件仓库。
+
+各版本目录中的文件以 SHA-256 为键保存在 `lib/.store/objects` 中，
+版本目录里的文件只是指向仓库对象的硬链接。相邻版本中内容相同的文件
+（行为包、资源包、定义文件等）在磁盘上只保存一份，安装新版本时也只需
+写入发生变化的文件。
+
+服务器或本程序会修改的配置文件（server.properties、allowlist.json 等）
+不会被链接，每个版本各自保留一份副本，避免修改一个版本影响其他版本。
+
+命令行用法：
+    python -m mcmanager.store usage   查看逻辑占用与实际占用
+    python -m mcmanager.store dedupe  把已安装的版本导入仓库
+    python -m mcmanager.store gc      删除不再被任何版本引用的对象
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+STORE_DIR = ".store"
+HASH_BUFFER = 1024 * 1024
+
+# 会被修改的文件，每个版本保留独立副本
+MUTABLE_FILES = {
+    "server.properties",
+    "allowlist.json",
+    "whitelist.json",
+    "permissions.json",
+    "valid_known_packs.json",
+}
+MUTABLE_DIRS = ("config/", "worlds/")
+
+
+def is_mutable(relpath):
+    """判断版本目录中的文件是否需要保留独立副本"""
+    relpath = relpath.replace("\\", "/")
+    return relpath in MUTABLE_FILES or relpath.startswith(MUTABLE_DIRS)
+
+
+def member_key(info):
+    """ZIP 成员的查找键：CRC、大小和路径都相同时视为同一内容"""
+    return f"{info.CRC:08x}:{info.file_size}:{info.filename}"
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """lib/.store 下的对象仓库。方法可以在多个线程中并发调用。"""
+
+    def __init__(self, lib_dir):
+        self.lib_dir = lib_dir
+        self.root = os.path.join(lib_dir, STORE_DIR)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.index_path = os.path.join(self.root, "index.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self._dirty = False
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    # ------------------------------------------------------------ 成员索引
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def lookup(self, key):
+        """按 ZIP 成员键查找已存在的对象，找不到返回 None"""
+        with self._lock:
+            digest = self._load_index().get(key)
+        if digest and self.has(digest):
+            return digest
+        return None
+
+    def remember(self, key, digest):
+        with self._lock:
+            index = self._load_index()
+            if index.get(key) != digest:
+                index[key] = digest
+                self._dirty = True
+
+    def save_index(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    # ------------------------------------------------------------ 链接与导入
+
+    def link(self, digest, target):
+        """把仓库对象硬链接到 target，不支持硬链接时复制"""
+        blob = self.blob_path(digest)
+        try:
+            os.link(blob, target)
+        except OSError:
+            shutil.copyfile(blob, target)
+
+    def adopt(self, path, digest=None):
+        """把已经写好的文件纳入仓库：对象已存在则把 path 换成指向它的链接，
+        否则把 path 链接为新对象。返回文件的 SHA-256。"""
+        digest = digest or hash_file(path)
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            if os.path.exists(blob):
+                if not os.path.samefile(blob, path):
+                    tmp_path = path + ".link"
+                    os.link(blob, tmp_path)
+                    os.replace(tmp_path, path)
+            else:
+                os.link(path, blob)
+        except FileExistsError:
+            # 另一个线程刚好写入了同一个对象
+            return self.adopt(path, digest)
+        except OSError:
+            pass  # 文件系统不支持硬链接，保留普通文件
+        return digest
+
+    def adopt_tree(self, version_dir):
+        """把一个已安装的版本目录导入仓库，返回 (文件数, 节省的字节数)"""
+        files = saved = 0
+        for dirpath, dirnames, filenames in os.walk(version_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                relpath = os.path.relpath(path, version_dir)
+                if is_mutable(relpath) or os.path.islink(path):
+                    continue
+                digest = hash_file(path)
+                existed = self.has(digest) and not os.path.samefile(self.blob_path(digest), path)
+                self.adopt(path, digest)
+                files += 1
+                if existed:
+                    saved += os.path.getsize(path)
+        return files, saved
+
+    # ------------------------------------------------------------ 维护
+
+    def gc(self):
+        """删除只剩仓库自身引用（链接数为1）的对象，返回 (删除数, 释放字节数)"""
+        removed = freed = 0
+        if not os.path.isdir(self.objects_dir):
+            return removed, freed
+        for entry in os.scandir(self.objects_dir):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                # Windows 上 DirEntry.stat() 的 st_nlink 总是 0，链接数必须用 os.stat 读取
+                st = os.stat(blob.path)
+                if st.st_nlink <= 1:
+                    os.remove(blob.path)
+                    removed += 1
+                    freed += st.st_size
+        with self._lock:
+            index = self._load_index()
+            for key, digest in list(index.items()):
+                if not self.has(digest):
+                    del index[key]
+                    self._dirty = True
+        self.save_index()
+        return removed, freed
+
+    def usage(self):
+        """统计磁盘占用：逻辑大小（各版本文件大小之和）与实际大小（去重后的 inode）"""
+        logical = 0
+        seen = {}
+        for name in os.listdir(self.lib_dir):
+            path = os.path.join(self.lib_dir, name)
+            if not os.path.isdir(path) or name == STORE_DIR:
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                for filename in filenames:
+                    st = os.lstat(os.path.join(dirpath, filename))
+                    if not name.startswith("."):
+                        logical += st.st_size
+                    seen[(st.st_dev, st.st_ino)] = st.st_size
+        if os.path.isdir(self.objects_dir):
+            for dirpath, dirnames, filenames in os.walk(self.objects_dir):
+                for filename in filenames:
+                    st = os.lstat(os.path.join(dirpath, filename))
+                    seen[(st.st_dev, st.st_ino)] = st.st_size
+        return logical, sum(seen.values())
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m mcmanager.store", description="共享文件仓库维护")
+    parser.add_argument("command", choices=["usage", "dedupe", "gc"])
+    parser.add_argument("--lib", default="lib", help="服务器文件目录（默认 lib）")
+    args = parser.parse_args(argv)
+    store = BlobStore(args.lib)
+    if args.command == "dedupe":
+        for name in sorted(os.listdir(args.lib)):
+            path = os.path.join(args.lib, name)
+            if os.path.isdir(path) and not name.startswith("."):
+                files, saved = store.adopt_tree(path)
+                print(f"{name}: {files} 个文件，节省 {_format_size(saved)}")
+    elif args.command == "gc":
+        removed, freed = store.gc()
+        print(f"已删除 {removed} 个对象，释放 {_format_size(freed)}")
+    logical, physical = store.usage()
+    print(f"逻辑占用 {_format_size(logical)}，实际占用 {_format_size(physical)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
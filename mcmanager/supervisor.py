@@ -0,0 +1,405 @@
+"""多实例管理：在一个管理进程中同时运行多个服务器。
+
+每个实例有自己的名称、版本、工作目录（`instances/<名称>`）、端口和控制台缓冲区。
+实例目录中的程序文件是版本目录的硬链接，只有配置文件和存档是实例私有的，
+因此增加一个实例几乎不占额外磁盘。所有实例的进程读写都在同一个 asyncio
+事件循环中完成，不会为每个实例创建线程。
+"""
+import asyncio
+import errno
+import json
+import os
+import shutil
+import socket
+import sys
+
+from .backup import BACKUPS_DIR, SnapshotStore, backup_server
+from .commands import CommandQueue
+from .console import ConsoleBuffer
+from .controller import ServerController
+from .health import ServerMonitor
+from .logstore import LOGS_DIR, LogStore
+from .metrics import ResourceSampler
+from .players import SESSIONS_FILE, PlayerTracker
+from .properties import write_properties
+from .scheduler import ACTION_BACKUP, ACTION_COMMAND, ACTION_RESTART, SCHEDULE_FILE, Scheduler
+from .store import is_mutable
+from .verify import VerifyError, verify_before_start
+
+INSTANCES_DIR = "instances"
+CONFIG_FILE = "instances.json"
+LINKED_FILES = ".mcmanager-files.json"  # 实例目录中由版本目录链接过来的文件列表
+RUNTIME_FILES = ("console.log",)  # 版本目录中运行时产生的文件，不同步到实例
+BASE_PORT = 19132
+INSTANCE_CONSOLE_LINES = 2000
+STOP_BUDGET = 30.0
+
+
+class SupervisorError(Exception):
+    """实例配置或操作有误"""
+
+
+def use_event_driven_child_watcher():
+    """Linux 上改用 pidfd 等待子进程退出（Python 3.12 起已是默认行为）。
+
+    旧版本默认的 ThreadedChildWatcher 会为每个子进程创建一个等待线程。
+    必须在事件循环启动前调用。
+    """
+    if sys.platform == "win32" or sys.version_info >= (3, 12):
+        return
+    watcher_class = getattr(asyncio, "PidfdChildWatcher", None)
+    if watcher_class is None:
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return  # 内核不支持 pidfd
+    asyncio.set_child_watcher(watcher_class())
+
+
+_PORT_IN_USE = {errno.EADDRINUSE, errno.EACCES,
+                getattr(errno, "WSAEADDRINUSE", -1), getattr(errno, "WSAEACCES", -1)}
+
+
+def _udp_port_free(port):
+    """检查本机IPv4和IPv6的UDP端口是否空闲（系统不支持IPv6时只检查IPv4）"""
+    for family, host in ((socket.AF_INET, "0.0.0.0"), (socket.AF_INET6, "::")):
+        try:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+        except OSError:
+            continue
+        with sock:
+            try:
+                sock.bind((host, port))
+            except OSError as e:
+                if family == socket.AF_INET or e.errno in _PORT_IN_USE:
+                    return False
+    return True
+
+
+class PortAllocator:
+    """为实例分配不冲突的端口对（IPv4端口，IPv6端口 = IPv4端口 + 1）"""
+
+    def __init__(self, base=BASE_PORT, limit=65534, probe=_udp_port_free):
+        self.base = base
+        self.limit = limit
+        self.probe = probe
+
+    def allocate(self, used, preferred=None):
+        """返回一个可用的IPv4端口。used 为其他实例已占用的端口集合（含IPv6端口）"""
+        candidates = range(self.base, self.limit, 2)
+        if preferred:
+            candidates = [preferred] + list(candidates)
+        for port in candidates:
+            if port in used or port + 1 in used:
+                continue
+            if self.probe(port) and self.probe(port + 1):
+                return port
+        raise SupervisorError("没有可用的端口")
+
+
+def sync_instance_dir(version_dir, instance_dir):
+    """让实例目录与版本目录保持一致。
+
+    程序文件以硬链接的方式指向版本目录（不支持时复制）；配置文件只在实例中
+    不存在时复制一份，已有的修改会保留；存档等实例自己的文件不受影响。
+    上一个版本链接过来、新版本中已不存在的文件会被删除。
+    """
+    os.makedirs(instance_dir, exist_ok=True)
+    record_path = os.path.join(instance_dir, LINKED_FILES)
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            previous = set(json.load(f))
+    except (OSError, ValueError):
+        previous = set()
+    linked = []
+    for dirpath, dirnames, filenames in os.walk(version_dir):
+        rel_dir = os.path.relpath(dirpath, version_dir)
+        dirnames[:] = [d for d in dirnames if not (rel_dir == "." and d == "worlds")]
+        for name in filenames:
+            if rel_dir == "." and (name.startswith(".") or name in RUNTIME_FILES):
+                continue
+            source = os.path.join(dirpath, name)
+            relpath = os.path.normpath(os.path.join(rel_dir, name)).replace("\\", "/")
+            target = os.path.join(instance_dir, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if is_mutable(relpath):
+                if not os.path.exists(target):
+                    shutil.copyfile(source, target)
+                continue
+            linked.append(relpath)
+            if os.path.exists(target) and os.path.samefile(source, target):
+                continue
+            tmp_path = target + ".link"
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copy2(source, tmp_path)
+            os.replace(tmp_path, target)
+    for relpath in previous.difference(linked):
+        path = os.path.join(instance_dir, relpath)
+        if os.path.isfile(path):
+            os.remove(path)
+    tmp_path = record_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sorted(linked), f)
+    os.replace(tmp_path, record_path)
+
+
+class Instance:
+    """一个服务器实例"""
+
+    def __init__(self, name, version, port, working_dir, auto_restart=True,
+                 console_lines=INSTANCE_CONSOLE_LINES, logs=None, players=None):
+        self.name = name
+        self.version = version
+        self.port = port
+        self.working_dir = working_dir
+        self.console = ConsoleBuffer(console_lines)
+        self.logs = logs  # LogStore，保存全部历史输出
+        self.controller = ServerController(working_dir)
+        self.controller.add_output_listener(self._on_output)
+        self.monitor = ServerMonitor(self.controller, auto_restart=auto_restart)
+        self.commands = CommandQueue(self.controller)
+        self.players = players or PlayerTracker()  # 在线玩家和会话历史
+        self.players.attach(self.controller)
+
+    def _on_output(self, lines, source):
+        self.console.extend(lines, source)
+        if self.logs is not None:
+            self.logs.write(lines, source)
+
+    @property
+    def running(self):
+        return self.controller.running
+
+    def to_config(self):
+        return {"name": self.name, "version": self.version, "port": self.port,
+                "auto_restart": self.monitor.auto_restart}
+
+
+class Supervisor:
+    """管理多个实例。除 load/save 外的方法都必须在事件循环线程中调用。"""
+
+    def __init__(self, lib_dir="lib", instances_dir=INSTANCES_DIR, ports=None, sampler=None,
+                 backups_dir=BACKUPS_DIR, logs_dir=LOGS_DIR):
+        self.lib_dir = lib_dir
+        self.instances_dir = instances_dir
+        self.backups_dir = backups_dir
+        self.logs_dir = logs_dir
+        self.config_path = os.path.join(instances_dir, CONFIG_FILE)
+        self.ports = ports or PortAllocator()
+        # 所有实例共用一个采样器，由运行事件循环的一方调用 sampler.start()
+        self.sampler = sampler or ResourceSampler()
+        self.instances = {}
+        # 各实例的定时任务，由运行事件循环的一方调用 scheduler.start()
+        self.scheduler = Scheduler(os.path.join(instances_dir, SCHEDULE_FILE), runner=self.run_job)
+        self._output_listeners = []
+        self._event_listeners = []
+
+    # ------------------------------------------------------------ 配置
+
+    def load(self):
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+        except (OSError, ValueError):
+            configs = []
+        for config in configs:
+            self._create(config["name"], config["version"], config["port"],
+                         config.get("auto_restart", True))
+        self.scheduler.load()
+        return self
+
+    def save(self):
+        os.makedirs(self.instances_dir, exist_ok=True)
+        tmp_path = self.config_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([i.to_config() for i in self.instances.values()], f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.config_path)
+
+    def add_output_listener(self, listener):
+        """listener(instance, lines, source)，对所有实例生效"""
+        self._output_listeners.append(listener)
+        for instance in self.instances.values():
+            self._attach(instance, listener)
+
+    def add_event_listener(self, listener):
+        """listener(instance, event, detail)，监控事件见 health 模块"""
+        self._event_listeners.append(listener)
+        for instance in self.instances.values():
+            self._attach_events(instance, listener)
+
+    def _attach(self, instance, listener):
+        instance.controller.add_output_listener(
+            lambda lines, source: listener(instance, lines, source))
+
+    def _attach_events(self, instance, listener):
+        instance.monitor.add_event_listener(
+            lambda event, detail: listener(instance, event, detail))
+
+    def _create(self, name, version, port, auto_restart=True):
+        logs_dir = os.path.join(self.logs_dir, "instances", name)
+        instance = Instance(name, version, port, os.path.join(self.instances_dir, name), auto_restart,
+                            logs=LogStore(logs_dir),
+                            players=PlayerTracker(os.path.join(logs_dir, SESSIONS_FILE)))
+        self.instances[name] = instance
+        self.sampler.add(name, instance.controller)
+        for listener in self._output_listeners:
+            self._attach(instance, listener)
+        for listener in self._event_listeners:
+            self._attach_events(instance, listener)
+        return instance
+
+    def used_ports(self, exclude=None):
+        used = set()
+        for instance in self.instances.values():
+            if instance.name != exclude:
+                used.update((instance.port, instance.port + 1))
+        return used
+
+    # ------------------------------------------------------------ 实例管理
+
+    def add_instance(self, name, version, port=None):
+        """新建实例：分配端口、准备实例目录并写入端口配置"""
+        if not name or name.startswith(".") or os.sep in name or "/" in name:
+            raise SupervisorError(f"无效的实例名称: {name}")
+        if name in self.instances:
+            raise SupervisorError(f"实例 {name} 已存在")
+        if not os.path.isdir(os.path.join(self.lib_dir, version)):
+            raise SupervisorError(f"版本 {version} 未安装")
+        used = self.used_ports()
+        if port and (port in used or port + 1 in used):
+            raise SupervisorError(f"端口 {port} 已被其他实例使用")
+        port = self.ports.allocate(used, preferred=port)
+        instance = self._create(name, version, port)
+        self.prepare(instance)
+        self.save()
+        return instance
+
+    def remove_instance(self, name, delete_files=False):
+        instance = self.get(name)
+        if instance.running:
+            raise SupervisorError(f"实例 {name} 正在运行")
+        del self.instances[name]
+        self.sampler.remove(name)
+        self.scheduler.remove_instance(name)
+        instance.logs.close()
+        instance.players.close()
+        if delete_files:
+            shutil.rmtree(instance.working_dir, ignore_errors=True)
+        self.save()
+
+    def set_version(self, name, version):
+        """切换实例使用的版本（存档和配置保留）"""
+        instance = self.get(name)
+        if instance.running:
+            raise SupervisorError(f"实例 {name} 正在运行")
+        instance.version = version
+        self.prepare(instance)
+        self.save()
+
+    def set_auto_restart(self, name, enabled):
+        self.get(name).monitor.auto_restart = enabled
+        self.save()
+
+    def get(self, name):
+        try:
+            return self.instances[name]
+        except KeyError:
+            raise SupervisorError(f"实例 {name} 不存在")
+
+    def prepare(self, instance):
+        """同步实例目录并写入端口配置"""
+        version_dir = os.path.join(self.lib_dir, instance.version)
+        if not os.path.isdir(version_dir):
+            raise SupervisorError(f"版本 {instance.version} 未安装")
+        sync_instance_dir(version_dir, instance.working_dir)
+        write_properties(os.path.join(instance.working_dir, "server.properties"),
+                         {"server-port": str(instance.port), "server-portv6": str(instance.port + 1)})
+
+    # ------------------------------------------------------------ 进程控制
+
+    async def start(self, name):
+        instance = self.get(name)
+        try:
+            await verify_before_start(os.path.join(self.lib_dir, instance.version))
+        except VerifyError as e:
+            raise SupervisorError(f"实例 {name}: {e}")
+        self.prepare(instance)
+        await instance.monitor.start()
+        return instance
+
+    async def stop(self, name, **kwargs):
+        return await self.get(name).monitor.stop(**kwargs)
+
+    async def restart(self, name, **kwargs):
+        """计划内重启运行中的实例"""
+        await self.get(name).monitor.restart(**kwargs)
+
+    async def run_job(self, job):
+        """执行定时任务，返回结果文字"""
+        instance = self.get(job.instance)
+        if job.action == ACTION_COMMAND:
+            if not instance.running:
+                raise SupervisorError(f"实例 {job.instance} 未运行")
+            await instance.commands.run(job.argument)
+            return f"已发送 {job.argument}"
+        if job.action == ACTION_RESTART:
+            await self.restart(job.instance)
+            return "已重启"
+        if job.action == ACTION_BACKUP:
+            result = await self.backup(job.instance, keep=int(job.argument) if job.argument else None)
+            return f"备份完成，{result}"
+        raise SupervisorError(f"未知的操作: {job.action}")
+
+    def close_logs(self):
+        """把各实例排队中的日志和玩家会话写入磁盘并结束写入线程"""
+        for instance in self.instances.values():
+            instance.logs.close()
+            instance.players.close()
+
+    def snapshots(self, name):
+        return SnapshotStore(os.path.join(self.backups_dir, "instances", self.get(name).name))
+
+    async def backup(self, name, keep=None):
+        """备份实例的世界（运行中时配合 save hold/query/resume），keep 为保留的快照数"""
+        instance = self.get(name)
+        store = self.snapshots(name)
+        result = await backup_server(instance.controller, store)
+        if keep:
+            await asyncio.get_running_loop().run_in_executor(None, store.prune, keep)
+        return result
+
+    def send(self, name, command):
+        """把命令加入实例的命令队列，实例未运行时返回 False"""
+        return self.get(name).commands.send(command)
+
+    async def run(self, name, command, expect=None, timeout=None):
+        """向实例发送命令并等待匹配 expect 的输出（见 CommandQueue.submit）"""
+        return await self.get(name).commands.run(command, expect, timeout)
+
+    async def start_all(self, names=None):
+        names = names or list(self.instances)
+        results = await asyncio.gather(*(self.start(n) for n in names), return_exceptions=True)
+        return dict(zip(names, results))
+
+    async def stop_all(self, budget=STOP_BUDGET):
+        """并行停止所有实例，在 budget 秒内完成（各实例按同一期限逐级升级停止方式）"""
+        deadline = asyncio.get_running_loop().time() + budget
+        # 等待自动重启的实例同样需要停止，以取消计划中的重启
+        await asyncio.gather(*(i.monitor.stop(deadline=deadline) for i in self.instances.values()),
+                             return_exceptions=True)
+
+    def status(self):
+        return [{
+            "name": i.name,
+            "version": i.version,
+            "port": i.port,
+            "state": i.controller.state,
+            "pid": i.controller.pid,
+            "auto_restart": i.monitor.auto_restart,
+            "health": i.monitor.metrics.as_dict(),
+            "resources": self.sampler.latest(i.name),
+            "players": [player.name for player in i.players.index.online()],
+        } for i in self.instances.values()]
@@ -0,0 +1,33 @@
+"""启动耗时统计。"""
+import time
+
+
+class StartupTimer:
+    """按阶段记录启动耗时。
+
+    mark(name) 记录从上一个标记到现在的耗时；后台完成的工作
+    （例如公网IP查询）用 record(name, seconds) 单独记录。
+    """
+
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self._last = self.origin
+        self.phases = []
+        self.background = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def record(self, name, seconds):
+        self.background.append((name, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def report(self):
+        total = self._last - self.origin
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases]
+        parts += [f"{name} {seconds * 1000:.0f}ms(后台)" for name, seconds in self.background]
+        return f"启动耗时 {total * 1000:.0f}ms: " + ", ".join(parts)
@@ -0,0 +1,164 @@
+"""已安装版本的完整性校验。
+
+安装时在版本目录中写入 .mcmanager.manifest.json，记录每个服务器程序文件的
+路径、大小、修改时间和 SHA-256（配置、世界等会被修改的文件不记录）。
+
+校验分两种模式：
+    快速模式：只比较大小和修改时间，修改时间变化但大小相同的文件再计算哈希确认，
+              通常只需要若干次 stat，适合每次启动前执行；
+    完整模式：重新计算所有文件的哈希，发现静默损坏。
+哈希在线程池中计算，文件通过 mmap 读取，hashlib 处理大块数据时会释放 GIL，
+多个文件可以同时利用多个核心和磁盘队列。
+"""
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .store import is_mutable
+
+MANIFEST_FILE = ".mcmanager.manifest.json"
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+
+
+class VerifyError(Exception):
+    """版本没有清单或无法校验"""
+
+
+def hash_file(path):
+    """用 mmap 读取并计算文件的 SHA-256"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).hexdigest()
+
+
+def _program_files(version_dir):
+    """列出版本目录中需要校验的文件（相对路径），跳过会被修改的文件和本程序的控制文件"""
+    files = []
+    for dirpath, _, filenames in os.walk(version_dir):
+        for filename in filenames:
+            relpath = os.path.relpath(os.path.join(dirpath, filename), version_dir).replace("\\", "/")
+            if is_mutable(relpath) or relpath.startswith(".") or relpath.endswith(".log"):
+                continue
+            files.append(relpath)
+    return sorted(files)
+
+
+def create_manifest(version_dir, workers=None):
+    """计算版本目录中所有程序文件的哈希并写入清单，返回清单内容"""
+    relpaths = _program_files(version_dir)
+    with ThreadPoolExecutor(workers or DEFAULT_WORKERS) as pool:
+        digests = list(pool.map(lambda p: hash_file(os.path.join(version_dir, p)), relpaths))
+    files = {}
+    for relpath, digest in zip(relpaths, digests):
+        st = os.stat(os.path.join(version_dir, relpath))
+        files[relpath] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    manifest = {"created": time.time(), "files": files}
+    path = os.path.join(version_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+def load_manifest(version_dir):
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise VerifyError(f"清单文件已损坏: {e}")
+
+
+class VerifyResult:
+    def __init__(self, version_dir, deep):
+        self.version_dir = version_dir
+        self.deep = deep
+        self.files = 0
+        self.bytes_hashed = 0
+        self.missing = []   # 清单中有、磁盘上没有的文件
+        self.corrupt = []   # 大小或哈希不符的文件
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.missing and not self.corrupt
+
+    @property
+    def throughput(self):
+        """哈希速度（MB/s）"""
+        return self.bytes_hashed / 1048576 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        mode = "完整校验" if self.deep else "快速校验"
+        summary = (f"{mode} {os.path.basename(os.path.normpath(self.version_dir))}：{self.files} 个文件，"
+                   f"哈希 {self.bytes_hashed / 1048576:.1f} MB，{self.elapsed:.2f} 秒")
+        if self.bytes_hashed:
+            summary += f"，{self.throughput:.0f} MB/s"
+        if self.ok:
+            return summary + "，全部完整"
+        problems = [f"缺少 {p}" for p in self.missing] + [f"损坏 {p}" for p in self.corrupt]
+        shown = "；".join(problems[:5]) + ("……" if len(problems) > 5 else "")
+        return f"{summary}，{len(problems)} 个文件有问题：{shown}"
+
+
+def verify_version(version_dir, deep=False, workers=None, update=True):
+    """按安装清单校验版本目录，返回 VerifyResult；没有清单时抛出 VerifyError。
+
+    快速模式下修改时间变化但哈希相同的文件（例如被复制过），update 为真时
+    把新的修改时间写回清单，下次不必再计算哈希。
+    """
+    started = time.perf_counter()
+    manifest = load_manifest(version_dir)
+    if manifest is None:
+        raise VerifyError(f"{version_dir} 没有安装清单，请先使用 verify --rebuild 生成")
+    result = VerifyResult(version_dir, deep)
+    to_hash = []
+    for relpath, expected in manifest["files"].items():
+        result.files += 1
+        try:
+            st = os.stat(os.path.join(version_dir, relpath))
+        except FileNotFoundError:
+            result.missing.append(relpath)
+            continue
+        if st.st_size != expected["size"]:
+            result.corrupt.append(relpath)
+        elif deep or st.st_mtime_ns != expected["mtime_ns"]:
+            to_hash.append((relpath, expected, st))
+    # 大文件先提交，避免最后只剩一个大文件在单线程里计算
+    to_hash.sort(key=lambda item: item[2].st_size, reverse=True)
+    with ThreadPoolExecutor(workers or DEFAULT_WORKERS) as pool:
+        digests = pool.map(lambda item: hash_file(os.path.join(version_dir, item[0])), to_hash)
+        refreshed = False
+        for (relpath, expected, st), digest in zip(to_hash, digests):
+            result.bytes_hashed += st.st_size
+            if digest != expected["sha256"]:
+                result.corrupt.append(relpath)
+            elif st.st_mtime_ns != expected["mtime_ns"]:
+                expected["mtime_ns"] = st.st_mtime_ns
+                refreshed = True
+    if refreshed and update:
+        path = os.path.join(version_dir, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    result.missing.sort()
+    result.corrupt.sort()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def verify_before_start(version_dir, deep=False):
+    """在线程池中校验版本目录，文件有问题时抛出 VerifyError；没有清单的旧版本不校验，返回 None"""
+    if not os.path.isfile(os.path.join(version_dir, MANIFEST_FILE)):
+        return None
+    result = await asyncio.get_running_loop().run_in_executor(None, verify_version, version_dir, deep)
+    if not result.ok:
+        raise VerifyError(f"{result}，请重新下载该版本")
+    return result
@@ -0,0 +1,176 @@
+"""已安装版本与平台相关的路径。
+
+VersionCatalog 把 lib 目录中各版本的信息（安装时间、大小、文件清单摘要、
+最近使用时间、是否完整）保存在 lib/.cache/versions.json 中。刷新时只列出 lib
+目录并检查每个版本目录和服务器程序的修改时间，有变化的版本才会重新遍历，
+版本再多启动时也不需要扫描整个目录树。
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from .store import is_mutable
+
+IS_WINDOWS = sys.platform == "win32"
+
+# Windows 和 Linux 的官方服务器包地址、可执行文件名不同
+SERVER_EXECUTABLE = "bedrock_server.exe" if IS_WINDOWS else "bedrock_server"
+PACKAGE_PLATFORM = "bin-win" if IS_WINDOWS else "bin-linux"
+PACKAGE_BASE = "https://www.minecraft.net/bedrockdedicatedserver"
+MIRROR_ENV = "MCMANAGER_MIRROR"  # 局域网镜像地址，例如 http://192.168.1.10:8765
+
+
+CATALOG_FILE = os.path.join(".cache", "versions.json")
+
+# 版本状态
+STATE_OK = "ok"              # 服务器程序存在
+STATE_VERIFIED = "verified"  # 已校验文件完整
+STATE_BROKEN = "broken"      # 缺少服务器程序
+STATE_FAILED = "failed"      # 上次校验发现文件缺失或损坏，仍可选择，重新校验通过后恢复
+
+
+def version_key(version):
+    """按数字比较版本号的排序键，例如 1.21.100.7 排在 1.21.9.1 之后"""
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part)
+                 for part in re.split(r"[.\-]", version))
+
+
+def _version_dirs(lib_dir):
+    """返回 {版本: os.DirEntry}（以 . 开头的是安装中的临时目录、缓存等，不是版本）"""
+    try:
+        with os.scandir(lib_dir) as it:
+            return {e.name: e for e in it if not e.name.startswith('.') and e.is_dir()}
+    except FileNotFoundError:
+        return {}
+
+
+def package_url(version, mirror=None, platform=PACKAGE_PLATFORM):
+    """返回版本安装包的下载地址；指定了镜像（或设置了环境变量 MCMANAGER_MIRROR）时从镜像下载"""
+    mirror = mirror or os.environ.get(MIRROR_ENV)
+    base = mirror.rstrip("/") if mirror else PACKAGE_BASE
+    return f"{base}/{platform}/bedrock-server-{version}.zip"
+
+
+def list_versions(lib_dir):
+    """列出 lib 目录中已安装的版本，新版本在前"""
+    return sorted(_version_dirs(lib_dir), key=version_key, reverse=True)
+
+
+def server_executable(version_dir):
+    """返回版本目录中的服务器可执行文件路径，找不到时返回 None"""
+    for name in (SERVER_EXECUTABLE, "bedrock_server.exe", "bedrock_server"):
+        path = os.path.join(version_dir, name)
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    return None
+
+
+def _scan_tree(version_dir):
+    """遍历版本目录，返回 (总大小, 文件清单摘要)。
+
+    摘要由服务器程序文件的路径、大小和修改时间计算；配置、世界、日志和本程序的
+    控制文件会在运行中变化，只计入大小。
+    """
+    entries = []
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(version_dir, relative)) as it:
+            for entry in it:
+                path = relative + "/" + entry.name if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                else:
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append((path, st.st_size, st.st_mtime_ns))
+    entries.sort()
+    digest = hashlib.sha256()
+    for path, size, mtime_ns in entries:
+        if is_mutable(path) or path.startswith(".") or path.endswith(".log"):
+            continue
+        digest.update(f"{path}\0{size}\0{mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return sum(e[1] for e in entries), digest.hexdigest()
+
+
+class VersionCatalog:
+    """lib 目录中已安装版本的持久化索引"""
+
+    def __init__(self, lib_dir, path=None):
+        self.lib_dir = lib_dir
+        self.path = path or os.path.join(lib_dir, CATALOG_FILE)
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """与磁盘同步，返回是否有变化（有变化时自动保存）"""
+        found = _version_dirs(self.lib_dir)
+        changed = False
+        for version in list(self.entries):
+            if version not in found:
+                del self.entries[version]
+                changed = True
+        for version, dir_entry in found.items():
+            st = dir_entry.stat()
+            executable = server_executable(dir_entry.path)
+            exe_mtime = os.stat(executable).st_mtime_ns if executable else None
+            entry = self.entries.get(version)
+            if entry is not None and entry["dir_mtime"] == st.st_mtime_ns and entry["exe_mtime"] == exe_mtime:
+                continue
+            size, manifest = _scan_tree(dir_entry.path)
+            if entry is not None and entry["manifest"] == manifest:
+                state = entry["state"]  # 只是目录时间变化，内容相同时保留校验结果
+            else:
+                state = STATE_OK if executable else STATE_BROKEN
+            self.entries[version] = {
+                "version": version,
+                "installed": entry["installed"] if entry else st.st_ctime,
+                "size": size,
+                "manifest": manifest,
+                "last_used": entry["last_used"] if entry else None,
+                "state": state,
+                "dir_mtime": st.st_mtime_ns,
+                "exe_mtime": exe_mtime,
+            }
+            changed = True
+        if changed:
+            self.save()
+        return changed
+
+    def versions(self, include_broken=False):
+        """按版本号返回版本列表，新版本在前；缺少服务器程序的版本只在 include_broken 时列出"""
+        return sorted((v for v, e in self.entries.items() if include_broken or e["state"] != STATE_BROKEN),
+                      key=version_key, reverse=True)
+
+    def get(self, version):
+        return self.entries.get(version)
+
+    def touch(self, version):
+        """记录版本的使用时间"""
+        if version in self.entries:
+            self.entries[version]["last_used"] = time.time()
+            self.save()
+
+    def mark(self, version, state):
+        """记录校验结果"""
+        if version in self.entries:
+            self.entries[version]["state"] = state
+            self.save()
+
+    def last_used(self):
+        """返回最近使用的可用版本，从未使用过时返回 None"""
+        used = [e for e in self.entries.values() if e["last_used"] and e["state"] != STATE_BROKEN]
+        return max(used, key=lambda e: e["last_used"])["version"] if used else None
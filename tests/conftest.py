@@ -0,0 +1,127 @@
+"""测试共用的夹具：本机 HTTP 源站、可控时钟和模拟服务器"""
+import hashlib
+import os
+import re
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mcmanager.controller import ServerController
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "tools", "fake_bedrock_server.py")
+LAST_MODIFIED = "Wed, 21 Oct 2026 07:28:00 GMT"
+T0 = 1_800_000_000.0
+
+_RANGE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    """按 server.files 返回内容，支持 HEAD、Range 和 If-None-Match"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        origin = self.server
+        origin.requests.append((self.command, self.path, dict(self.headers)))
+        data = origin.files.get(self.path.split("?", 1)[0])
+        if origin.status != 200 or data is None:
+            self.send_response(404 if origin.status == 200 else origin.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start, end, status = 0, len(data) - 1, 200
+        match = _RANGE.match(self.headers.get("Range", ""))
+        if match and origin.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, end)
+            status = 206
+        payload = data[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if not body:
+            return
+        if origin.truncate is not None and end > start:
+            # 模拟连接中断：只发送一部分就断开（只发生一次）
+            self.wfile.write(payload[:origin.truncate])
+            origin.truncate = None
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def http_origin():
+    """本机的 HTTP 源站：files 为 {路径: 内容}，ranges 为 False 时忽略 Range，
+    status 不为 200 时所有请求返回该状态码，truncate 使下一个（不是探测用的）GET 只发送这么多字节就断开，
+    requests 记录收到的 (方法, 路径, 请求头)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OriginHandler)
+    server.daemon_threads = True
+    server.files = {}
+    server.ranges = True
+    server.status = 200
+    server.truncate = None
+    server.requests = []
+    server.last_modified = LAST_MODIFIED
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClock:
+    def __init__(self, now=T0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """可以手动拨动的时钟，从 T0 开始"""
+    return FakeClock()
+
+
+def _free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def fake_server(tmp_path):
+    """返回 make(*参数)，创建运行 tools/fake_bedrock_server.py 的 ServerController"""
+    server_dir = tmp_path / "server"
+    server_dir.mkdir()
+    (server_dir / "server.properties").write_text(
+        f"server-port={_free_udp_port()}\nlevel-name=Bedrock level\n", encoding="utf-8")
+
+    def make(*args):
+        return ServerController(str(server_dir), executable=sys.executable, args=[FAKE_SERVER, *args])
+    return make
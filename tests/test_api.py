@@ -0,0 +1,144 @@
+"""ControlServer 的访问控制和慢客户端处理，只在本机回环地址上测试"""
+import asyncio
+import json
+import socket
+
+from mcmanager import api
+from mcmanager.api import ControlServer, ServerHandle
+
+TOKEN = "secret-token"
+SERVERS = "/api/servers"
+COMMAND = "/api/servers/default/command"
+CONSOLE = "/api/servers/default/console"
+
+
+async def _request(port, method, path, headers=None, body=b""):
+    """发送一个请求，返回 (状态码, 响应体)"""
+    reader, writer = await asyncio.open_connection(api.API_HOST, port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    data = await reader.read()
+    writer.close()
+    head, _, payload = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload
+
+
+def _run(scenario, token=TOKEN, capacity=api.BACKLOG_LINES):
+    async def main():
+        handle = ServerHandle(api.DEFAULT_SERVER, capacity=capacity)
+        server = await ControlServer([handle], port=0, token=token).start()
+        try:
+            return await scenario(server, handle)
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_token_required():
+    async def scenario(server, handle):
+        assert (await _request(server.port, "GET", SERVERS))[0] == 401
+        assert (await _request(server.port, "GET", SERVERS + "?token=wrong"))[0] == 401
+        status, body = await _request(server.port, "GET", SERVERS, {"Authorization": f"Bearer {TOKEN}"})
+        assert status == 200
+        assert json.loads(body)["servers"][0]["name"] == api.DEFAULT_SERVER
+        assert (await _request(server.port, "GET", f"{SERVERS}?token={TOKEN}"))[0] == 200
+    _run(scenario)
+
+
+def test_foreign_origin_rejected():
+    async def scenario(server, handle):
+        auth = {"Authorization": f"Bearer {TOKEN}"}
+        for origin in ("https://evil.example", "null", "http://127.0.0.1.evil.example"):
+            assert (await _request(server.port, "GET", SERVERS, {**auth, "Origin": origin}))[0] == 403
+        upgrade = {**auth, "Origin": "https://evil.example", "Upgrade": "websocket", "Connection": "Upgrade",
+                   "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ==", "Sec-WebSocket-Version": "13"}
+        assert (await _request(server.port, "GET", CONSOLE, upgrade))[0] == 403
+        for origin in ("http://localhost:3000", "http://127.0.0.1:8766", "http://[::1]"):
+            assert (await _request(server.port, "GET", SERVERS, {**auth, "Origin": origin}))[0] == 200
+    _run(scenario)
+
+
+def test_cross_site_simple_request_rejected():
+    """浏览器 no-cors 发出的 text/plain POST 不会执行，即使没有设置 token"""
+    async def scenario(server, handle):
+        body = b"op attacker\nstop"
+        status, _ = await _request(server.port, "POST", COMMAND, {"Content-Type": "text/plain"}, body)
+        assert status == 415
+        status, _ = await _request(server.port, "POST", "/api/servers/default/stop")
+        assert status == 415
+        # JSON 请求通过检查，服务器未运行时返回 409
+        status, _ = await _request(server.port, "POST", COMMAND, {"Content-Type": "application/json"},
+                                   json.dumps({"command": "list"}).encode())
+        assert status == 409
+    _run(scenario, token=None)
+
+
+async def _open_console(port, query):
+    """接收缓冲区很小的控制台客户端，方便填满服务器的写缓冲区"""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect((api.API_HOST, port))
+    sock.setblocking(False)
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(f"GET {CONSOLE}?{query} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode())
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def _flood(handle, batches, size=2000):
+    line = "x" * size
+    for _ in range(batches):
+        handle.hub.publish([line] * 10, "stdout")
+        await asyncio.sleep(0)
+
+
+def test_slow_client_skips_backlog():
+    async def scenario(server, handle):
+        reader, writer = await _open_console(server.port, "slow=skip")
+        while handle.hub.subscribers < 1:
+            await asyncio.sleep(0.01)
+        await _flood(handle, 500)
+        handle.hub.publish(["last"], "stdout")
+        received = []
+        while not received or json.loads(received[-1]).get("text") != "last":
+            received.append(await asyncio.wait_for(reader.readline(), 5))
+        writer.close()
+        dropped = [json.loads(line)["dropped"] for line in received if b'"dropped"' in line]
+        assert dropped and sum(dropped) == handle.hub.dropped
+        # 跳过的行加上收到的行正好是发布的全部行
+        assert sum(dropped) + sum(1 for line in received if b'"text"' in line) == 5001
+    _run(scenario, token=None, capacity=100)
+
+
+def test_slow_client_closed():
+    async def scenario(server, handle):
+        reader, writer = await _open_console(server.port, "slow=close")
+        while handle.hub.subscribers < 1:
+            await asyncio.sleep(0.01)
+        await _flood(handle, 500)
+        while await asyncio.wait_for(reader.read(65536), 5):
+            pass
+        writer.close()
+        assert handle.hub.disconnected == 1
+    _run(scenario, token=None, capacity=100)
+
+
+def test_stalled_client_disconnected(monkeypatch):
+    monkeypatch.setattr(api, "CLIENT_STALL", 0.2)
+
+    async def scenario(server, handle):
+        reader, writer = await _open_console(server.port, "slow=skip")
+        while handle.hub.subscribers < 1:
+            await asyncio.sleep(0.01)
+        await _flood(handle, 2000)
+        for _ in range(100):
+            if handle.hub.subscribers == 0:
+                break
+            await asyncio.sleep(0.05)
+        writer.close()
+        assert handle.hub.disconnected == 1
+        assert handle.hub.subscribers == 0
+    _run(scenario, token=None, capacity=100)
@@ -0,0 +1,90 @@
+"""save query 文件列表的解析和增量硬链接快照"""
+import asyncio
+import os
+
+from mcmanager.backup import SnapshotStore, backup_server, parse_file_list, world_files
+
+LEVEL = "Bedrock level"
+
+
+def test_parse_file_list():
+    line = ("[2027-01-04 03:00:00:123 INFO] Bedrock level/db/000005.ldb:262144, "
+            "Bedrock level/db/CURRENT:16, Bedrock level/level.dat:2048")
+    assert parse_file_list(line) == [("Bedrock level/db/000005.ldb", 262144),
+                                     ("Bedrock level/db/CURRENT", 16),
+                                     ("Bedrock level/level.dat", 2048)]
+    # Windows 版服务器列出的路径使用反斜杠
+    assert parse_file_list("Bedrock level\\db\\CURRENT:16") == [("Bedrock level/db/CURRENT", 16)]
+    assert parse_file_list("[2027-01-04 03:00:00:123 INFO] Data saved. Files are now ready to be copied.") is None
+    assert parse_file_list("A previous save has not been completed.") is None
+    assert parse_file_list("level.dat:2048") is None
+    assert parse_file_list("") is None
+
+
+def _world(tmp_path):
+    worlds = tmp_path / "worlds"
+    for name, data in (("level.dat", b"L" * 100), ("db/CURRENT", b"MANIFEST-000001\n"),
+                       ("db/000003.log", b"G" * 500)):
+        path = worlds / LEVEL / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return worlds
+
+
+def test_unchanged_files_are_linked(tmp_path):
+    worlds = _world(tmp_path)
+    store = SnapshotStore(str(tmp_path / "backups"))
+    # 日志文件只有前 300 字节有效
+    files = [(f"{LEVEL}/level.dat", 100), (f"{LEVEL}/db/CURRENT", 16), (f"{LEVEL}/db/000003.log", 300)]
+    first = store.create(str(worlds), files)
+    assert (first.files, first.copied, first.linked, first.bytes_copied) == (3, 3, 0, 416)
+    assert (tmp_path / "backups" / first.name / LEVEL / "db" / "000003.log").read_bytes() == b"G" * 300
+
+    (worlds / LEVEL / "db" / "000003.log").write_bytes(b"H" * 600)
+    files[2] = (f"{LEVEL}/db/000003.log", 600)
+    second = store.create(str(worlds), files)
+    assert (second.copied, second.linked, second.bytes_copied) == (1, 2, 600)
+    old, new = tmp_path / "backups" / first.name / LEVEL, tmp_path / "backups" / second.name / LEVEL
+    assert os.path.samefile(old / "level.dat", new / "level.dat")
+    assert not os.path.samefile(old / "db" / "000003.log", new / "db" / "000003.log")
+    assert store.snapshots() == [first.name, second.name]
+    assert store.manifest(second.name)["previous"] == first.name
+
+
+def test_prune_and_restore(tmp_path):
+    worlds = _world(tmp_path)
+    store = SnapshotStore(str(tmp_path / "backups"))
+    names = [store.create(str(worlds), world_files(str(worlds), LEVEL)).name for _ in range(3)]
+    assert store.prune(2) == names[:1]
+    assert store.snapshots() == names[1:]
+    # 删除较早的快照不影响链接到同一文件的较新快照
+    assert (tmp_path / "backups" / names[2] / LEVEL / "level.dat").read_bytes() == b"L" * 100
+
+    (worlds / LEVEL / "level.dat").write_bytes(b"broken")
+    (worlds / LEVEL / "extra").write_bytes(b"new file")
+    store.restore(names[2], str(worlds))
+    assert (worlds / LEVEL / "level.dat").read_bytes() == b"L" * 100
+    assert not (worlds / LEVEL / "extra").exists()
+    assert not os.path.samefile(worlds / LEVEL / "level.dat",
+                                tmp_path / "backups" / names[2] / LEVEL / "level.dat")
+
+
+def test_backup_running_server(fake_server, tmp_path):
+    controller = fake_server()
+    store = SnapshotStore(str(tmp_path / "backups"))
+
+    async def main():
+        ready = controller.expect(lambda line: "Server started" in line)
+        await controller.start()
+        try:
+            await asyncio.wait_for(ready, 10)
+            return await backup_server(controller, store, query_interval=0.01)
+        finally:
+            await controller.stop()
+    result = asyncio.run(main())
+    worlds = os.path.join(controller.working_dir, "worlds")
+    assert result.files == len(world_files(worlds, LEVEL)) > 0
+    assert result.copied == result.files
+    assert result.hold_time > 0
+    with open(os.path.join(worlds, LEVEL, "level.dat"), "rb") as f:
+        assert (tmp_path / "backups" / result.name / LEVEL / "level.dat").read_bytes() == f.read()
@@ -0,0 +1,135 @@
+"""CommandQueue 的限速、合并写入和结果对应，服务器为记录写入的桩控制器"""
+import asyncio
+
+import pytest
+
+from mcmanager.commands import CommandQueue, CommandQueueError, CommandTimeout, TokenBucket
+from mcmanager.controller import RUNNING, STOPPED
+
+
+class StubController:
+    """记录每次 send_lines 写入的命令；respond(命令) 返回该命令产生的输出行"""
+
+    def __init__(self, respond=None):
+        self.running = True
+        self.respond = respond
+        self.writes = []
+        self._output_listeners = []
+        self._state_listeners = []
+
+    def add_output_listener(self, listener):
+        self._output_listeners.append(listener)
+
+    def remove_output_listener(self, listener):
+        self._output_listeners.remove(listener)
+
+    def add_state_listener(self, listener):
+        self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        self._state_listeners.remove(listener)
+
+    async def send_lines(self, commands):
+        if not self.running:
+            return False
+        self.writes.append(list(commands))
+        if self.respond is not None:
+            lines = [line for command in commands for line in self.respond(command)]
+            if lines:
+                asyncio.get_running_loop().call_soon(self.emit, lines)
+        return True
+
+    def emit(self, lines):
+        for listener in list(self._output_listeners):
+            listener(lines, "stdout")
+
+    def set_state(self, state, exit_code=None):
+        self.running = state == RUNNING
+        for listener in list(self._state_listeners):
+            listener(state, exit_code)
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(10.0, 5, clock)
+    assert bucket.take(8) == 5
+    assert bucket.take(1) == 0
+    assert bucket.delay() == pytest.approx(0.1)
+    clock.now += 0.25
+    assert bucket.take(8) == 2
+    # 空闲再久也最多积攒 burst 个
+    clock.now += 100
+    assert bucket.take(8) == 5
+    assert TokenBucket(0, 1, clock).take(1000) == 1000
+
+
+def test_commands_are_batched_and_paced():
+    controller = StubController()
+    queue = CommandQueue(controller, rate=100.0, burst=5, batch_size=4)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await queue.run_many([f"allowlist add p{i}" for i in range(15)])
+        return loop.time() - started
+    elapsed = asyncio.run(main())
+    assert [command for batch in controller.writes for command in batch] == [f"allowlist add p{i}" for i in range(15)]
+    # 前 5 条按 batch_size 分两次立即写入，其余 10 条以每秒 100 条的速率发送
+    assert controller.writes[:2] == [[f"allowlist add p{i}" for i in range(4)], ["allowlist add p4"]]
+    assert max(len(batch) for batch in controller.writes) <= 4
+    assert elapsed >= 0.09
+    assert queue.stats.sent == 15
+    assert queue.stats.batches == len(controller.writes)
+
+
+def test_results_follow_send_order():
+    # 每条 list 命令输出相同格式的一行，按发送顺序对应
+    controller = StubController(lambda command: [f"There are 0/10 players online: ({command})"])
+    queue = CommandQueue(controller, rate=0)
+
+    async def main():
+        return await queue.run_many(["list a", "list b", "list c"], expect=r"players online")
+    assert asyncio.run(main()) == [f"There are 0/10 players online: (list {name})" for name in "abc"]
+    assert controller.writes == [["list a", "list b", "list c"]]
+    assert queue.stats.matched == 3
+
+
+def test_inflight_limit_waits_for_results():
+    controller = StubController(lambda command: [f"done {command}"])
+    queue = CommandQueue(controller, rate=0, max_inflight=2)
+    results = asyncio.run(queue.run_many([f"c{i}" for i in range(5)], expect="done"))
+    assert results == [f"done c{i}" for i in range(5)]
+    assert [len(batch) for batch in controller.writes] == [2, 2, 1]
+
+
+def test_timeout():
+    controller = StubController(lambda command: ["ok"] if command == "fast" else [])
+    queue = CommandQueue(controller, rate=0)
+
+    async def main():
+        slow = queue.submit("slow", expect="never", timeout=0.05)
+        fast = await queue.run("fast", expect="ok", timeout=0.05)
+        with pytest.raises(CommandTimeout):
+            await slow
+        return fast
+    assert asyncio.run(main()) == "ok"
+    assert queue.stats.timeouts == 1
+    assert len(queue) == 0
+
+
+def test_stopped_server_fails_everything():
+    controller = StubController()
+    queue = CommandQueue(controller, rate=1.0, burst=1)
+
+    async def main():
+        futures = [queue.submit("say hi", expect="never"), queue.submit("say hi"), queue.submit("say hi")]
+        await asyncio.sleep(0.01)
+        controller.set_state(STOPPED, 1)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        late = queue.submit("say hi")
+        return results, late
+    results, late = asyncio.run(main())
+    assert all(isinstance(result, CommandQueueError) for result in results)
+    assert isinstance(late.exception(), CommandQueueError)
+    assert not queue.send("say hi")
+    assert len(queue) == 0
+    assert queue.stats.failed == 4
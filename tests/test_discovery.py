@@ -0,0 +1,76 @@
+"""VersionDiscovery 的结果缓存：用本机的 http.server 代替下载地址，时钟由测试控制"""
+import asyncio
+
+import pytest
+
+from mcmanager.discovery import DiscoveryError, VersionDiscovery
+
+PLATFORM = "bin-linux"
+SIZE = 12345
+POSITIVE_TTL = 1000
+NEGATIVE_TTL = 100
+
+
+def _publish(origin, version):
+    origin.files[f"/{PLATFORM}/bedrock-server-{version}.zip"] = bytes(SIZE)
+
+
+@pytest.fixture
+def origin(http_origin):
+    _publish(http_origin, "1.21.2")
+    return http_origin
+
+
+def _paths(origin):
+    return [path for _, path, _ in origin.requests]
+
+
+def _discovery(origin, tmp_path, clock):
+    return VersionDiscovery(str(tmp_path / "discovery.json"), mirror=origin.base_url,
+                            platform=PLATFORM, concurrency=4, positive_ttl=POSITIVE_TTL,
+                            negative_ttl=NEGATIVE_TTL, clock=clock)
+
+
+def test_results_are_cached(origin, tmp_path, clock):
+    discovery = _discovery(origin, tmp_path, clock)
+    # 1-3 展开为 1、01、2、02、3、03
+    assert asyncio.run(discovery.discover("1.21.1-3")) == [("1.21.2", SIZE)]
+    assert len(origin.requests) == discovery.requests == 6
+
+    assert asyncio.run(discovery.discover("1.21.1-3")) == [("1.21.2", SIZE)]
+    assert len(origin.requests) == 6
+    # 缓存写入磁盘，新的实例同样命中
+    assert asyncio.run(_discovery(origin, tmp_path, clock).discover("1.21.1-3")) == [("1.21.2", SIZE)]
+    assert len(origin.requests) == 6
+
+
+def test_negative_results_expire_first(origin, tmp_path, clock):
+    discovery = _discovery(origin, tmp_path, clock)
+    asyncio.run(discovery.discover("1.21.1-3"))
+    _publish(origin, "1.21.3")
+
+    # 不存在的结果还没过期时看不到新发布的版本
+    clock.now += NEGATIVE_TTL - 1
+    assert asyncio.run(discovery.discover("1.21.1-3")) == [("1.21.2", SIZE)]
+    assert len(origin.requests) == 6
+
+    # 过期后只重新确认不存在的 5 个
+    clock.now += 2
+    assert asyncio.run(discovery.discover("1.21.1-3")) == [("1.21.3", SIZE), ("1.21.2", SIZE)]
+    assert len(origin.requests) == 11
+    assert not any(path.endswith("bedrock-server-1.21.2.zip") for path in _paths(origin)[6:])
+
+    # 存在的结果也过期后全部重新确认
+    clock.now += POSITIVE_TTL
+    asyncio.run(discovery.discover("1.21.1-3"))
+    assert len(origin.requests) == 17
+
+
+def test_network_errors_are_not_cached(origin, tmp_path, clock):
+    discovery = _discovery(origin, tmp_path, clock)
+    origin.status = 503
+    with pytest.raises(DiscoveryError):
+        asyncio.run(discovery.probe(["1.21.2"]))
+    origin.status = 200
+    assert asyncio.run(discovery.probe(["1.21.2"])) == {"1.21.2": SIZE}
+    assert len(origin.requests) == 2
@@ -0,0 +1,101 @@
+"""RangedDownloader 的分段、续传和单连接退化，源站为本机的 http.server"""
+import json
+import os
+
+import pytest
+
+from mcmanager.download import RangedDownloader
+
+PATH = "/bedrock-server.zip"
+PIECE = 64 * 1024
+
+
+@pytest.fixture
+def payload(http_origin):
+    data = os.urandom(5 * PIECE + 1234)
+    http_origin.files[PATH] = data
+    return data
+
+
+def _downloader(http_origin, tmp_path, **kwargs):
+    kwargs.setdefault("piece_size", PIECE)
+    kwargs.setdefault("buffer_size", 16 * 1024)
+    return RangedDownloader(http_origin.base_url + PATH, str(tmp_path / "package.zip"), **kwargs)
+
+
+def _ranges(http_origin):
+    return sorted(headers.get("Range") for method, path, headers in http_origin.requests)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_pieces_are_fetched_with_ranges(http_origin, tmp_path, payload):
+    progress = []
+    downloader = _downloader(http_origin, tmp_path, connections=3, progress=lambda *a: progress.append(a))
+    path = downloader.run()
+    assert _read(path) == payload
+    assert downloader.total_size == len(payload)
+    assert downloader.meta["last_modified"] == http_origin.last_modified
+    # 一个探测请求加上 6 个分片各一个请求
+    pieces = [f"bytes={i * PIECE}-{min(len(payload), (i + 1) * PIECE) - 1}" for i in range(6)]
+    assert _ranges(http_origin) == sorted(["bytes=0-0"] + pieces)
+    assert progress[-1] == (len(payload), len(payload))
+    # 完成后不留下 .part 和进度文件
+    assert not os.path.exists(downloader.part_path)
+    assert not os.path.exists(downloader.state_path)
+
+
+def test_resume_from_part_file(http_origin, tmp_path, payload):
+    first = _downloader(http_origin, tmp_path, connections=1)
+    http_origin.truncate = 1000
+    with pytest.raises(Exception):
+        first.run()
+    # 中断后保留 .part 和进度，第一个分片只下载了一部分
+    state = json.loads(_read(first.state_path))
+    assert state["pieces"][0] == 1000
+    assert sum(state["pieces"]) == 1000
+    assert os.path.exists(first.part_path)
+
+    http_origin.requests.clear()
+    second = _downloader(http_origin, tmp_path, connections=2)
+    path = second.run()
+    assert _read(path) == payload
+    assert second.resumed_bytes == 1000
+    # 已下载的部分不再请求
+    ranges = _ranges(http_origin)
+    assert f"bytes=1000-{PIECE - 1}" in ranges
+    assert f"bytes=0-{PIECE - 1}" not in ranges
+
+
+def test_changed_origin_restarts_download(http_origin, tmp_path, payload):
+    first = _downloader(http_origin, tmp_path, connections=1)
+    http_origin.truncate = 1000
+    with pytest.raises(Exception):
+        first.run()
+    # 远端文件变化（ETag 不同）时不能接着旧的 .part 下载
+    http_origin.files[PATH] = changed = os.urandom(len(payload))
+    second = _downloader(http_origin, tmp_path, connections=2)
+    assert _read(second.run()) == changed
+    assert second.resumed_bytes == 0
+
+
+def test_server_without_range_support(http_origin, tmp_path, payload):
+    http_origin.ranges = False
+    progress = []
+    downloader = _downloader(http_origin, tmp_path, connections=4, progress=lambda *a: progress.append(a))
+    assert _read(downloader.run()) == payload
+    # 服务器忽略 Range 时直接使用第一个响应顺序下载
+    assert len(http_origin.requests) == 1
+    assert progress[-1] == (len(payload), len(payload))
+
+
+def test_keep_part_for_caller(http_origin, tmp_path, payload):
+    downloader = _downloader(http_origin, tmp_path, finalize=False)
+    path = downloader.run()
+    assert path == downloader.part_path
+    assert _read(path) == payload
+    downloader.discard_partial()
+    assert not os.path.exists(path)
@@ -0,0 +1,130 @@
+"""ServerMonitor 的退避重启、崩溃熔断和存活检测，服务器为 tools/fake_bedrock_server.py"""
+import asyncio
+
+import pytest
+
+from mcmanager.health import (EVENT_CRASH_LOOP, EVENT_CRASHED, EVENT_EXITED, EVENT_HUNG, EVENT_READY,
+                              EVENT_RESTART_SCHEDULED, EVENT_RESTARTED, CrashLoopBreaker, LivenessProbe,
+                              RestartPolicy, ServerMonitor, raknet_ping)
+
+BASE_DELAY = 0.01
+
+
+def test_backoff_delays():
+    policy = RestartPolicy(base_delay=2.0, factor=2.0, max_delay=10.0, jitter=0.2, rng=lambda: 0.5)
+    assert [policy.delay(n) for n in range(1, 6)] == [2.0, 4.0, 8.0, 10.0, 10.0]
+    # 抖动为 ±jitter 比例
+    assert RestartPolicy(base_delay=2.0, jitter=0.2, rng=lambda: 0.0).delay(1) == pytest.approx(1.6)
+    assert RestartPolicy(base_delay=2.0, jitter=0.2, rng=lambda: 1.0).delay(1) == pytest.approx(2.4)
+
+
+def test_breaker_counts_crashes_in_window(clock):
+    breaker = CrashLoopBreaker(3, 60.0, clock)
+    assert not breaker.record()
+    clock.now += 30
+    assert not breaker.record()
+    # 第一次崩溃已经超出时间窗口
+    clock.now += 31
+    assert not breaker.record()
+    assert breaker.recent_crashes == 2
+    clock.now += 1
+    assert breaker.record()
+
+
+def _policy(**kwargs):
+    kwargs.setdefault("base_delay", BASE_DELAY)
+    kwargs.setdefault("jitter", 0.0)
+    return RestartPolicy(**kwargs)
+
+
+async def _run(monitor, events, on_event=None):
+    def listener(event, detail):
+        events.append((event, detail))
+        if on_event is not None:
+            on_event(event, detail)
+    monitor.add_event_listener(listener)
+    await monitor.start()
+    return await asyncio.wait_for(monitor.wait(), 20)
+
+
+def _names(events, *names):
+    return [detail for event, detail in events if event in names]
+
+
+def test_crashes_are_restarted_until_breaker_trips(fake_server, clock):
+    monitor = ServerMonitor(fake_server("--crash-after", "0.2", "--exit-code", "3"),
+                            policy=_policy(max_crashes=3), clock=clock)
+    events = []
+    assert asyncio.run(_run(monitor, events)) == 3
+    assert _names(events, EVENT_CRASHED) == [3, 3, 3]
+    assert _names(events, EVENT_RESTART_SCHEDULED) == [BASE_DELAY, BASE_DELAY * 2]
+    assert _names(events, EVENT_RESTARTED) == [1, 2]
+    assert events[-1] == (EVENT_CRASH_LOOP, 3)
+    assert len(_names(events, EVENT_READY)) == 3
+    assert monitor.metrics.as_dict()["crashes"] == 3
+
+
+def test_stable_run_resets_backoff(fake_server, clock):
+    policy = _policy(max_crashes=3, stable_after=120.0)
+    monitor = ServerMonitor(fake_server("--crash-after", "0.2"), policy=policy, clock=clock)
+    events = []
+
+    def on_event(event, detail):
+        if event == EVENT_READY:
+            clock.now += policy.stable_after
+    asyncio.run(_run(monitor, events, on_event))
+    # 每次都稳定运行了 stable_after 秒，等待时间不再翻倍
+    assert _names(events, EVENT_RESTART_SCHEDULED) == [BASE_DELAY, BASE_DELAY]
+    assert events[-1] == (EVENT_CRASH_LOOP, 3)
+
+
+def test_clean_exit_is_not_restarted(fake_server, clock):
+    controller = fake_server()
+    monitor = ServerMonitor(controller, policy=_policy(), clock=clock)
+    events = []
+
+    def on_event(event, detail):
+        if event == EVENT_READY:
+            controller.send("stop")
+    assert asyncio.run(_run(monitor, events, on_event)) == 0
+    assert events[-1] == (EVENT_EXITED, 0)
+    assert not _names(events, EVENT_CRASHED, EVENT_RESTART_SCHEDULED)
+
+
+def test_hung_server_is_killed_and_restarted(fake_server, clock):
+    pings = []
+
+    async def ping(host, port, timeout):
+        motd = await raknet_ping(host, port, timeout)
+        pings.append(motd)
+        return motd
+    probe = LivenessProbe(interval=0.05, idle_after=0.0, failures=2, timeout=0.2, ping=ping)
+    monitor = ServerMonitor(fake_server("--hang-after", "0.3"), policy=_policy(max_crashes=2),
+                            probe=probe, clock=clock)
+    events = []
+    asyncio.run(_run(monitor, events))
+    assert len(_names(events, EVENT_HUNG)) == 2
+    assert _names(events, EVENT_RESTARTED) == [1]
+    assert events[-1] == (EVENT_CRASH_LOOP, 2)
+    assert monitor.metrics.hangs == 2
+    # 卡死之前 ping 有响应，之后连续失败
+    assert pings[0].startswith("MCPE;Fake Server;")
+    assert pings[-2:] == [None, None]
+
+
+def test_startup_timeout(fake_server, clock):
+    probe = LivenessProbe(interval=0.02, startup_timeout=300.0)
+    monitor = ServerMonitor(fake_server("--startup-delay", "30"), policy=_policy(), probe=probe,
+                            auto_restart=False, clock=clock)
+    events = []
+
+    async def main():
+        task = asyncio.ensure_future(_run(monitor, events))
+        await asyncio.sleep(0.1)
+        assert not _names(events, EVENT_HUNG)
+        clock.now += probe.startup_timeout + 1
+        return await task
+    assert asyncio.run(main()) != 0
+    [reason] = _names(events, EVENT_HUNG)
+    assert "启动" in reason
+    assert events[-1][0] == EVENT_EXITED
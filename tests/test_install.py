@@ -0,0 +1,88 @@
+"""InstallPipeline 的流式解压和暂存目录的原子改名"""
+import io
+import os
+import zipfile
+
+import pytest
+
+from mcmanager.install import SERVER_EXECUTABLE, STAGING_PREFIX, InstallError, InstallPipeline
+
+VERSION = "1.21.0.1"
+PATH = f"/bedrock-server-{VERSION}.zip"
+
+
+def make_package(files=None, executable=True):
+    """内容随机（不可压缩）、大于 MIN_PACKAGE_SIZE 的安装包"""
+    files = dict(files or {})
+    files.setdefault("behavior_packs/vanilla/manifest.json", b'{"format_version": 2}')
+    files.setdefault("resource_packs/vanilla/textures.bin", os.urandom(1536 * 1024))
+    files.setdefault("server.properties", b"server-name=Dedicated Server\n")
+    if executable:
+        files.setdefault(SERVER_EXECUTABLE, b"\x7fELF" + os.urandom(4096))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue(), files
+
+
+def _installed(version_dir):
+    result = {}
+    for dirpath, _, filenames in os.walk(version_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                result[os.path.relpath(path, version_dir).replace(os.sep, "/")] = f.read()
+    return result
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_install_is_renamed_into_place(http_origin, tmp_path, ranges):
+    package, files = make_package()
+    http_origin.files[PATH] = package
+    http_origin.ranges = ranges
+    lib_dir = str(tmp_path / "lib")
+    os.makedirs(lib_dir)
+    result = InstallPipeline(VERSION, lib_dir, url=http_origin.base_url + PATH, connections=3).run()
+    assert result.version_dir == os.path.join(lib_dir, VERSION)
+    installed = _installed(result.version_dir)
+    for name, data in files.items():
+        assert installed[name] == data
+    assert result.size == len(package)
+    # 暂存目录和下载的临时文件都不会留下
+    assert os.listdir(lib_dir) == [VERSION]
+
+
+def test_failed_install_leaves_no_version_dir(http_origin, tmp_path):
+    package, _ = make_package(executable=False)
+    http_origin.files[PATH] = package
+    lib_dir = str(tmp_path / "lib")
+    os.makedirs(lib_dir)
+    with pytest.raises(InstallError):
+        InstallPipeline(VERSION, lib_dir, url=http_origin.base_url + PATH).run()
+    names = os.listdir(lib_dir)
+    assert VERSION not in names
+    assert not any(name.startswith(STAGING_PREFIX) for name in names)
+
+
+def test_small_error_page_is_rejected(http_origin, tmp_path):
+    http_origin.files[PATH] = b"<html>Not Found</html>"
+    with pytest.raises(InstallError):
+        InstallPipeline(VERSION, str(tmp_path), url=http_origin.base_url + PATH).run()
+    assert not os.path.exists(tmp_path / VERSION)
+
+
+def test_interrupted_download_is_resumed(http_origin, tmp_path):
+    package, files = make_package()
+    http_origin.files[PATH] = package
+    http_origin.truncate = 1000
+    url = http_origin.base_url + PATH
+    with pytest.raises(Exception):
+        InstallPipeline(VERSION, str(tmp_path), url=url, connections=1).run()
+    assert not os.path.exists(tmp_path / VERSION)
+    result = InstallPipeline(VERSION, str(tmp_path), url=url, connections=1).run()
+    assert _installed(result.version_dir)[SERVER_EXECUTABLE] == files[SERVER_EXECUTABLE]
+    # 第二次只请求没有下载完的部分
+    ranges = [headers.get("Range") for _, _, headers in http_origin.requests]
+    assert ranges.count("bytes=0-0") == 2
+    assert f"bytes=1000-{len(package) - 1}" in ranges
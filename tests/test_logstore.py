@@ -0,0 +1,107 @@
+"""LogStore 的轮转、分块索引和查询"""
+import os
+
+from mcmanager.logstore import LogStore
+
+from .conftest import T0
+
+
+def _fill(store, count, start=T0, step=1.0, source="stdout"):
+    """按给定的时间直接追加 count 行（不经过写入线程），第 i 行为 "line <i> ..." """
+    os.makedirs(store.root, exist_ok=True)
+    if store._active is None:
+        store._open_active()
+    for i in range(count):
+        ts = start + i * step
+        word = "creeper" if i % 50 == 7 else "zombie"
+        data = f"{int(ts * 1000)}\t{source}\tline {i} {word} spawned\n".encode()
+        store._append(data, ts, ts)
+    store._active.close()
+    store._active = None
+
+
+def test_written_lines_are_searchable(tmp_path):
+    store = LogStore(str(tmp_path / "logs"))
+    store.write(["Server started.", "Player connected: Steve"])
+    store.write(["Syntax error: foo"], source="stderr")
+    store.flush()
+    assert [r.text for r in store.search()] == ["Server started.", "Player connected: Steve", "Syntax error: foo"]
+    assert [r.text for r in store.search("steve")] == ["Player connected: Steve"]
+    assert [r.text for r in store.search(source="stderr")] == ["Syntax error: foo"]
+    assert [r.text for r in store.search(r"^Server\b", regex=True)] == ["Server started."]
+    store.close()
+    # 关闭后重新打开，继续追加到 active.log
+    store.write(["after restart"])
+    store.close()
+    assert store.search("restart")[0].text == "after restart"
+
+
+def test_rotation_into_indexed_segments(tmp_path):
+    store = LogStore(str(tmp_path / "logs"), segment_bytes=4096)
+    _fill(store, 1000)
+    segments = store.segments()
+    assert len(segments) > 5
+    assert segments[0]["start"] == T0
+    assert all(a["end"] < b["start"] for a, b in zip(segments, segments[1:]))
+    count, compressed, raw, active = store.usage()
+    assert count == len(segments) and raw > compressed and active < 4096
+
+    # 结果按时间顺序，limit 保留最新的
+    found = store.search("creeper")
+    assert [r.text for r in found] == [f"line {i} creeper spawned" for i in range(7, 1000, 50)]
+    assert [r.text for r in store.search("creeper", limit=2)] == ["line 907 creeper spawned",
+                                                                 "line 957 creeper spawned"]
+    # 词的一部分、时间范围、正则表达式
+    assert len(store.search("reep")) == len(found)
+    assert [r.text for r in store.search(since=T0 + 500, until=T0 + 502)] == [
+        "line 500 zombie spawned", "line 501 zombie spawned", "line 502 zombie spawned"]
+    assert [r.time for r in store.search(r"line 99\d ", regex=True)] == [T0 + i for i in range(990, 1000)]
+    assert store.search("skeleton") == []
+    # 新的实例从磁盘读取索引
+    assert len(LogStore(store.root).search("creeper")) == len(found)
+
+
+def test_old_segments_are_removed(tmp_path):
+    store = LogStore(str(tmp_path / "logs"), segment_bytes=4096, max_bytes=8192)
+    _fill(store, 2000)
+    segments = store.segments()
+    assert sum(s["bytes"] for s in segments) <= 8192
+    # 最旧的行已经删除，最新的还在
+    assert store.search("line 0 ") == []
+    assert store.search("line 1999 ")[0].time == T0 + 1999
+
+
+def test_interrupted_rotation_is_finished(tmp_path):
+    root = tmp_path / "logs"
+    root.mkdir()
+    (root / f"rotating-{int(T0 * 1000)}.log").write_bytes(f"{int(T0 * 1000)}\tstdout\tleft over\n".encode())
+    store = LogStore(str(root))
+    store.write(["new line"])
+    store.close()
+    assert [s["start"] for s in store.segments()] == [T0]
+    assert [r.text for r in store.search()] == ["left over", "new line"]
+    assert not any(name.startswith("rotating-") for name in os.listdir(root))
+
+
+def test_failed_rotation_keeps_writer_alive(tmp_path):
+    store = LogStore(str(tmp_path / "logs"), segment_bytes=200)
+
+    def disk_full(path):
+        raise OSError(28, "No space left on device")
+    store._compress = disk_full
+    store.write([f"before {i}" for i in range(10)])
+    store.flush(5)
+    # 轮转出的日志没能压缩，其中的行暂时查询不到
+    assert store.dropped == 10
+    assert store._thread.is_alive()
+
+    del store._compress
+    store.write(["after"])
+    store.flush()
+    assert [r.text for r in store.search()] == ["after"]
+    store.close()
+    # 下次启动时压缩上次留下的日志
+    reopened = LogStore(store.root)
+    reopened.write(["restarted"])
+    reopened.close()
+    assert [r.text for r in reopened.search()] == [f"before {i}" for i in range(10)] + ["after", "restarted"]
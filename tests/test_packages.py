@@ -0,0 +1,74 @@
+"""PackageCache 的条件请求：用本机的 http.server 代替官方下载地址"""
+import pytest
+
+from mcmanager.packages import PackageCache
+
+from .conftest import LAST_MODIFIED
+
+VERSION = "1.21.0.1"
+PLATFORM = "bin-linux"
+PATH = f"/bedrock-server-{VERSION}.zip"
+
+
+@pytest.fixture
+def origin(http_origin):
+    # 不支持 Range，下载器退化为单连接
+    http_origin.ranges = False
+    http_origin.files[PATH] = b"PK" + b"x" * 10000
+    http_origin.url = http_origin.base_url + PATH
+    return http_origin
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_fetch_then_revalidate_with_304(origin, tmp_path):
+    cache = PackageCache(str(tmp_path))
+    path = cache.fetch(VERSION, origin.url, PLATFORM, connections=1)
+    assert _read(path) == origin.files[PATH]
+    entry = cache.get(VERSION, PLATFORM)
+    assert entry["etag"] and entry["last_modified"] == LAST_MODIFIED
+    downloads = len(origin.requests)
+
+    # 再次安装只发送一个条件请求，远端返回 304 后使用缓存
+    assert cache.fetch(VERSION, origin.url, PLATFORM, connections=1) == path
+    assert len(origin.requests) == downloads + 1
+    _, _, request = origin.requests[-1]
+    assert request["If-None-Match"] == entry["etag"]
+    assert request["If-Modified-Since"] == LAST_MODIFIED
+
+    # 索引写入磁盘，新的 PackageCache 同样可以确认
+    assert PackageCache(str(tmp_path)).lookup(VERSION, origin.url, PLATFORM) == path
+
+
+def test_changed_origin_is_downloaded_again(origin, tmp_path):
+    cache = PackageCache(str(tmp_path))
+    old_path = cache.fetch(VERSION, origin.url, PLATFORM, connections=1)
+    origin.files[PATH] = b"PK" + b"y" * 10000
+    assert cache.lookup(VERSION, origin.url, PLATFORM) is None
+    new_path = cache.fetch(VERSION, origin.url, PLATFORM, connections=1)
+    assert new_path != old_path
+    assert _read(new_path) == origin.files[PATH]
+
+
+def test_max_age_skips_revalidation(origin, tmp_path):
+    cache = PackageCache(str(tmp_path))
+    path = cache.fetch(VERSION, origin.url, PLATFORM, connections=1)
+    count = len(origin.requests)
+    assert cache.lookup(VERSION, origin.url, PLATFORM, max_age=300) == path
+    assert len(origin.requests) == count
+    cache.index[cache.key(VERSION, PLATFORM)]["checked"] -= 600
+    assert cache.lookup(VERSION, origin.url, PLATFORM, max_age=300) == path
+    assert len(origin.requests) == count + 1
+
+
+def test_origin_errors_and_offline_use_cache(origin, tmp_path):
+    cache = PackageCache(str(tmp_path))
+    path = cache.fetch(VERSION, origin.url, PLATFORM, connections=1)
+    origin.status = 503
+    assert cache.lookup(VERSION, origin.url, PLATFORM) == path
+    origin.shutdown()
+    origin.server_close()
+    assert cache.lookup(VERSION, origin.url, PLATFORM) == path
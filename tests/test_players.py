@@ -0,0 +1,67 @@
+"""输出事件的解析、在线玩家和会话历史"""
+from mcmanager.events import (EventParser, PlayerConnected, PlayerDisconnected, PlayerSpawned, ServerStarted,
+                              VersionReported)
+from mcmanager.players import (REASON_DISCONNECT, REASON_SERVER_STOP, REASON_UNKNOWN, PlayerTracker,
+                               format_duration)
+
+from .conftest import T0
+
+XUID = "2535400000000001"
+
+
+def _joined(name, xuid=XUID):
+    return f"[2027-01-04 03:00:00:123 INFO] Player connected: {name}, xuid: {xuid}"
+
+
+def _left(name, xuid=XUID):
+    return f"[2027-01-04 03:00:00:123 INFO] Player disconnected: {name}, xuid: {xuid}, pfid: 00000000000001"
+
+
+def test_parse_events():
+    parser = EventParser()
+    assert parser.parse(_joined("Steve Two"), T0) == PlayerConnected(T0, "Steve Two", XUID)
+    assert parser.parse(_left("Steve Two"), T0) == PlayerDisconnected(T0, "Steve Two", XUID)
+    assert parser.parse("Player Spawned: Alex xuid: , pfid: 1", T0) == PlayerSpawned(T0, "Alex", "")
+    assert parser.parse("NO LOG FILE! - [2027-01-04 03:00:00:123 INFO] Server started.", T0) == ServerStarted(T0)
+    assert parser.parse("[2027-01-04 03:00:00:123 INFO] Version: 1.21.51.02", T0) == VersionReported(T0, "1.21.51.02")
+    assert parser.parse("[2027-01-04 03:00:00:123 INFO] Running AutoCompaction...", T0) is None
+    assert parser.parse("[Chat] <Steve> Player connected: fake, xuid: 1", T0) is None
+    assert len(parser.feed([_joined("A"), "noise", _left("A")], T0)) == 2
+
+
+def test_sessions_are_recorded(tmp_path):
+    tracker = PlayerTracker(str(tmp_path / "sessions.db"))
+    tracker.feed(["Server started."], "stdout", T0)
+    tracker.feed([_joined("Steve"), _joined("Alex", "")], "stdout", T0 + 10)
+    assert "steve" in tracker.index and len(tracker.index) == 2
+    tracker.feed([_left("Steve")], "stdout", T0 + 70)
+    # 标准错误中的行不是玩家事件
+    tracker.feed([_left("Alex", "")], "stderr", T0 + 80)
+    tracker.end_all(T0 + 130)
+    tracker.close()
+    store = tracker.store
+    assert store.playtime("STEVE") == 60
+    assert store.playtime("Alex") == 120
+    assert store.playtime("Alex", since=T0 + 100, now=T0 + 1000) == 30
+    assert store.sessions("Steve") == [(T0 + 10, T0 + 70, REASON_DISCONNECT)]
+    assert store.sessions("Alex") == [(T0 + 10, T0 + 130, REASON_SERVER_STOP)]
+    assert store.top(1) == [("Alex", 120, 1)]
+    assert format_duration(3900) == "1 小时 05 分"
+
+
+def test_dangling_sessions_end_at_last_activity(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    tracker = PlayerTracker(path)
+    tracker.feed(["Server started."], "stdout", T0)
+    tracker.feed([_joined("Steve")], "stdout", T0 + 10)
+    tracker.feed([_joined("Alex", "")], "stdout", T0 + 100)
+    # 管理器意外退出：会话没有结束，数据库中只有已经写入的操作
+    tracker.close()
+
+    restarted = PlayerTracker(path)
+    restarted.feed(["Server started."], "stdout", T0 + 5000)
+    restarted.close()
+    store = restarted.store
+    assert store.sessions("Steve") == [(T0 + 10, T0 + 100, REASON_UNKNOWN)]
+    assert store.sessions("Alex") == [(T0 + 100, T0 + 100, REASON_UNKNOWN)]
+    assert store.playtime("Steve", now=T0 + 6000) == 90
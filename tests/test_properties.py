@@ -0,0 +1,93 @@
+"""server.properties 的无损读写和变化通知"""
+import os
+import threading
+
+import pytest
+
+from mcmanager.properties import (PropertiesDocument, add_change_listener, load_properties, needs_restart,
+                                  read_properties, remove_change_listener, write_properties)
+
+ORIGINAL = (b"# comment\r\n"
+            b"server-name=Dedicated Server\r\n"
+            b"\r\n"
+            b"gamemode = survival\r\n"
+            b"unknown-key=\xe4\xb8\xad\xff\r\n"
+            b"not a property\r\n"
+            b"server-port=19132")
+
+
+@pytest.fixture
+def changes():
+    received = []
+
+    def listener(path, changed):
+        received.append(changed)
+    add_change_listener(listener)
+    yield received
+    remove_change_listener(listener)
+
+
+def test_round_trip_is_lossless(tmp_path):
+    path = tmp_path / "server.properties"
+    path.write_bytes(ORIGINAL)
+    document = load_properties(str(path))
+    assert document.newline == "\r\n"
+    assert document["gamemode"] == "survival"
+    assert document.text().encode("utf-8", "surrogateescape") == ORIGINAL
+    assert read_properties(str(path))["server-port"] == "19132"
+
+
+def test_only_changed_lines_are_rewritten(tmp_path, changes):
+    path = tmp_path / "server.properties"
+    path.write_bytes(ORIGINAL)
+    assert write_properties(str(path), {"gamemode": "creative", "difficulty": "hard"}) == {
+        "gamemode": ("survival", "creative"), "difficulty": (None, "hard")}
+    # 原文件末尾没有换行，写回后同样没有
+    expected = ORIGINAL.replace(b"gamemode = survival", b"gamemode=creative") + b"\r\ndifficulty=hard"
+    assert path.read_bytes() == expected
+    assert changes == [{"gamemode": ("survival", "creative"), "difficulty": (None, "hard")}]
+
+
+def test_unchanged_values_do_not_write(tmp_path, changes):
+    path = tmp_path / "server.properties"
+    path.write_bytes(ORIGINAL)
+    mtime = os.stat(path).st_mtime_ns
+    assert write_properties(str(path), {"gamemode": "survival"}) == {}
+    assert os.stat(path).st_mtime_ns == mtime
+    assert changes == []
+
+
+def test_external_change_is_detected(tmp_path, changes):
+    path = tmp_path / "server.properties"
+    path.write_text("server-port=19132\nlevel-seed=1\n", encoding="utf-8")
+    load_properties(str(path))
+    path.write_text("server-port=19133\nlevel-seed=22\n", encoding="utf-8")
+    assert load_properties(str(path))["server-port"] == "19133"
+    [changed] = changes
+    assert changed == {"server-port": ("19132", "19133"), "level-seed": ("1", "22")}
+    assert needs_restart(changed)
+    assert not needs_restart({"level-seed": ("1", "22")})
+
+
+def test_missing_file(tmp_path):
+    assert load_properties(str(tmp_path / "missing")) is None
+    # 新建的文件没有原有内容，使用 \n 换行
+    path = tmp_path / "server.properties"
+    write_properties(str(path), {"server-name": "x"})
+    assert path.read_bytes() == b"server-name=x\n"
+    assert PropertiesDocument().text() == ""
+
+
+def test_concurrent_writes_keep_every_key(tmp_path, changes):
+    path = str(tmp_path / "server.properties")
+
+    def writer(n):
+        for i in range(20):
+            write_properties(path, {f"key-{n}-{i}": str(i)})
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(read_properties(path)) == 80
+    assert len(changes) == 80
@@ -0,0 +1,138 @@
+"""Scheduler.due 的错过处理和任务文件的容错，时钟全部由测试控制"""
+import datetime
+import json
+import os
+
+import pytest
+
+from mcmanager.scheduler import (ACTION_COMMAND, ACTION_RESTART, MAX_CATCHUP, MISSED_ALL, MISSED_ONCE,
+                                 MISSED_SKIP, Scheduler, ScheduleError)
+
+from .conftest import T0, FakeClock
+
+
+def test_runs_on_time(clock):
+    scheduler = Scheduler(clock=clock)
+    job = scheduler.add("1.0", "every 1m", ACTION_COMMAND, "say hi")
+    assert scheduler.due(T0 + 59) == []
+    assert scheduler.due(T0 + 60) == [(job, 1)]
+    assert job.last_run == T0 + 60
+    assert job.next_run == T0 + 120
+    assert scheduler.due(T0 + 61) == []
+
+
+@pytest.mark.parametrize("missed, expected", [(MISSED_ONCE, 1), (MISSED_SKIP, None), (MISSED_ALL, 10)])
+def test_missed_runs(missed, expected, clock):
+    scheduler = Scheduler(clock=clock)
+    job = scheduler.add("1.0", "every 1m", ACTION_RESTART, missed=missed)
+    # 第一次应在 T0+60，错过了 T0+60 .. T0+600 共 10 次
+    fired = scheduler.due(T0 + 600)
+    assert fired == ([(job, expected)] if expected else [])
+    # 无论哪种方式，下一次都从现在之后算起
+    assert job.next_run == T0 + 660
+    assert scheduler.due(T0 + 600) == []
+
+
+def test_late_within_grace_is_not_missed(clock):
+    scheduler = Scheduler(clock=clock, grace=60.0)
+    job = scheduler.add("1.0", "every 1m", ACTION_RESTART, missed=MISSED_SKIP)
+    assert scheduler.due(T0 + 60 + 59) == [(job, 1)]
+
+
+def test_catch_up_is_bounded(clock):
+    scheduler = Scheduler(clock=clock)
+    job = scheduler.add("1.0", "every 1m", ACTION_RESTART, missed=MISSED_ALL)
+    assert scheduler.due(T0 + 60 * 10 * MAX_CATCHUP) == [(job, MAX_CATCHUP)]
+
+
+def test_disabled_job_does_not_accumulate_missed_runs(clock):
+    scheduler = Scheduler(clock=clock)
+    job = scheduler.add("1.0", "every 1m", ACTION_RESTART, missed=MISSED_ALL)
+    scheduler.set_enabled(job.id, False)
+    assert scheduler.due(T0 + 3600) == []
+    clock.now = T0 + 3600
+    scheduler.set_enabled(job.id, True)
+    assert scheduler.due(T0 + 3660) == [(job, 1)]
+
+
+def test_cron_missed_while_stopped(tmp_path):
+    """管理器停止期间错过的运行在重新启动后按上次运行时间补上"""
+    path = str(tmp_path / "schedule.json")
+    start = datetime.datetime(2027, 1, 4, 3, 0).timestamp()
+    scheduler = Scheduler(path, clock=FakeClock(start))
+    job = scheduler.add("1.0", "0 4 * * *", ACTION_RESTART, missed=MISSED_ALL)
+    four = datetime.datetime(2027, 1, 4, 4, 0).timestamp()
+    assert scheduler.due(four) == [(job, 1)]
+
+    # 三天后重新启动
+    later = datetime.datetime(2027, 1, 7, 12, 0).timestamp()
+    restarted = Scheduler(path, clock=FakeClock(later))
+    restarted.load()
+    [reloaded] = restarted.jobs()
+    assert reloaded.last_run == four
+    assert restarted.due() == [(reloaded, 3)]
+    assert reloaded.next_run == datetime.datetime(2027, 1, 8, 4, 0).timestamp()
+
+
+def test_broken_file_keeps_previous_jobs(tmp_path, clock):
+    path = tmp_path / "schedule.json"
+    scheduler = Scheduler(str(path), clock=clock)
+    job = scheduler.add("1.0", "every 1m", ACTION_RESTART)
+    reported = []
+    scheduler.add_error_listener(reported.append)
+
+    path.write_text("{not json", encoding="utf-8")
+    errors = scheduler.load()
+    assert errors and reported == errors
+    assert [j.id for j in scheduler.jobs()] == [job.id]
+    assert scheduler.due(T0 + 60) == [(scheduler.get(job.id), 1)]
+    # 改坏的文件不会被覆盖，也不能修改任务
+    assert path.read_text(encoding="utf-8") == "{not json"
+    with pytest.raises(ScheduleError):
+        scheduler.add("1.0", "every 5m", ACTION_RESTART)
+
+
+def test_invalid_job_is_skipped_and_preserved(tmp_path, clock):
+    path = tmp_path / "schedule.json"
+    bad = {"id": 7, "instance": "1.0", "trigger": "every 0m", "action": ACTION_RESTART}
+    good = {"id": 1, "instance": "1.0", "trigger": "every 1m", "action": ACTION_RESTART, "created": T0}
+    path.write_text(json.dumps({"jobs": [good, bad]}), encoding="utf-8")
+    scheduler = Scheduler(str(path), clock=clock)
+    errors = scheduler.load()
+    assert len(errors) == 1
+    assert [j.id for j in scheduler.jobs()] == [1]
+
+    job = scheduler.add("1.0", "every 5m", ACTION_RESTART)
+    assert job.id == 8
+    saved = json.loads(path.read_text(encoding="utf-8"))["jobs"]
+    assert bad in saved
+
+
+def _touch_later(path):
+    # 保证另一个进程的写入使修改时间变化（有些文件系统的时间精度较粗）
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_changes_keep_jobs_added_by_other_process(tmp_path, clock):
+    path = str(tmp_path / "schedule.json")
+    gui = Scheduler(path, clock=clock)
+    first = gui.add("1.0", "every 1m", ACTION_RESTART)
+    gui.add("2.0", "every 1m", ACTION_RESTART)
+    # 命令行在另一个进程中添加任务
+    cli = Scheduler(path, clock=clock)
+    cli.load()
+    added = cli.add("1.0", "every 5m", ACTION_COMMAND, "say hi")
+    _touch_later(path)
+
+    gui.set_enabled(first.id, False)
+    saved = {job["id"]: job for job in json.loads((tmp_path / "schedule.json").read_text(encoding="utf-8"))["jobs"]}
+    assert added.id in saved and not saved[first.id]["enabled"]
+
+    cli.add("2.0", "every 5m", ACTION_COMMAND, "say bye")
+    _touch_later(path)
+    gui.remove_instance("1.0")
+    assert [(job.instance, job.argument) for job in gui.jobs()] == [("2.0", ""), ("2.0", "say bye")]
+    reloaded = Scheduler(path, clock=clock)
+    reloaded.load()
+    assert [(job.instance, job.argument) for job in reloaded.jobs()] == [("2.0", ""), ("2.0", "say bye")]
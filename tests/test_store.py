@@ -0,0 +1,101 @@
+"""BlobStore 的去重、链接和回收"""
+import os
+
+from mcmanager.install import InstallPipeline
+from mcmanager.store import BlobStore, is_mutable
+
+from .test_install import make_package
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_mutable_files_are_not_shared():
+    assert is_mutable("server.properties")
+    assert is_mutable("worlds/Bedrock level/level.dat")
+    assert is_mutable("config\\default\\permissions.json")
+    assert not is_mutable("behavior_packs/vanilla/manifest.json")
+    assert not is_mutable("bedrock_server")
+
+
+def test_identical_files_share_one_blob(tmp_path):
+    lib = tmp_path / "lib"
+    for version in ("1.0", "1.1"):
+        _write(str(lib / version / "data" / "same.bin"), b"same content")
+        _write(str(lib / version / "server.properties"), b"server-name=x\n")
+    _write(str(lib / "1.1" / "data" / "changed.bin"), b"new in 1.1")
+    store = BlobStore(str(lib))
+    assert store.adopt_tree(str(lib / "1.0")) == (1, 0)
+    files, saved = store.adopt_tree(str(lib / "1.1"))
+    assert (files, saved) == (2, len(b"same content"))
+    assert os.path.samefile(lib / "1.0" / "data" / "same.bin", lib / "1.1" / "data" / "same.bin")
+    # 配置文件每个版本各自一份
+    assert not os.path.samefile(lib / "1.0" / "server.properties", lib / "1.1" / "server.properties")
+    logical, physical = store.usage()
+    assert logical - physical == len(b"same content")
+
+
+def test_install_links_unchanged_files(http_origin, tmp_path):
+    lib_dir = str(tmp_path)
+    store = BlobStore(lib_dir)
+    package, files = make_package()
+    shared = "resource_packs/vanilla/textures.bin"
+    http_origin.files["/1.0.zip"] = package
+    http_origin.files["/1.1.zip"], _ = make_package({shared: files[shared]})
+    InstallPipeline("1.0", lib_dir, url=http_origin.base_url + "/1.0.zip", store=store).run()
+    result = InstallPipeline("1.1", lib_dir, url=http_origin.base_url + "/1.1.zip", store=store).run()
+    assert result.linked_files >= 1
+    assert os.path.samefile(os.path.join(lib_dir, "1.0", shared), os.path.join(lib_dir, "1.1", shared))
+    assert not os.path.samefile(os.path.join(lib_dir, "1.0", "server.properties"),
+                                os.path.join(lib_dir, "1.1", "server.properties"))
+
+
+def test_gc_keeps_linked_blobs(tmp_path):
+    lib = tmp_path / "lib"
+    _write(str(lib / "1.0" / "a.bin"), b"only in 1.0")
+    _write(str(lib / "1.1" / "b.bin"), b"only in 1.1")
+    store = BlobStore(str(lib))
+    store.adopt_tree(str(lib / "1.0"))
+    store.adopt_tree(str(lib / "1.1"))
+    store.remember("a", store.adopt(str(lib / "1.0" / "a.bin")))
+    store.remember("b", store.adopt(str(lib / "1.1" / "b.bin")))
+    store.save_index()
+
+    os.remove(lib / "1.0" / "a.bin")
+    assert store.gc() == (1, len(b"only in 1.0"))
+    assert store.lookup("a") is None
+    assert store.lookup("b") is not None
+    # 重新读取索引，已删除对象的条目也已清理
+    assert BlobStore(str(lib)).lookup("a") is None
+    assert store.gc() == (0, 0)
+
+
+class _WindowsEntry:
+    """Windows 上的 DirEntry：stat() 不读取链接数，st_nlink 为 0"""
+
+    def __init__(self, entry):
+        self._entry = entry
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self):
+        return self._entry.is_dir()
+
+    def stat(self):
+        st = list(self._entry.stat())
+        st[3] = 0
+        return os.stat_result(st)
+
+
+def test_gc_reads_link_count_from_file(tmp_path, monkeypatch):
+    lib = tmp_path / "lib"
+    _write(str(lib / "1.0" / "a.bin"), b"still linked")
+    store = BlobStore(str(lib))
+    store.adopt_tree(str(lib / "1.0"))
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: [_WindowsEntry(entry) for entry in scandir(path)])
+    assert store.gc() == (0, 0)
+    assert (lib / "1.0" / "a.bin").read_bytes() == b"still linked"
@@ -0,0 +1,39 @@
+"""VersionCatalog 中校验失败的版本"""
+from mcmanager.verify import create_manifest, verify_version
+from mcmanager.versions import SERVER_EXECUTABLE, STATE_FAILED, STATE_OK, STATE_VERIFIED, VersionCatalog
+
+
+def _install(lib, version, executable=True):
+    version_dir = lib / version
+    (version_dir / "behavior_packs").mkdir(parents=True)
+    (version_dir / "behavior_packs" / "pack.bin").write_bytes(b"original data")
+    if executable:
+        (version_dir / SERVER_EXECUTABLE).write_bytes(b"\x7fELF")
+    create_manifest(str(version_dir))
+    return version_dir
+
+
+def test_failed_version_stays_listed_until_verified(tmp_path):
+    version_dir = _install(tmp_path, "1.21.0.1")
+    _install(tmp_path, "1.20.0.1", executable=False)
+    catalog = VersionCatalog(str(tmp_path))
+    catalog.refresh()
+    assert catalog.versions() == ["1.21.0.1"]
+    assert catalog.versions(include_broken=True) == ["1.21.0.1", "1.20.0.1"]
+    assert catalog.get("1.21.0.1")["state"] == STATE_OK
+
+    pack = version_dir / "behavior_packs" / "pack.bin"
+    pack.write_bytes(b"damaged data!")
+    result = verify_version(str(version_dir), deep=True)
+    assert not result.ok
+    catalog.mark("1.21.0.1", STATE_FAILED)
+    # 校验失败的版本仍然可以选择，重新打开索引后保持标记
+    reopened = VersionCatalog(str(tmp_path))
+    reopened.refresh()
+    assert reopened.versions() == ["1.21.0.1"]
+    assert reopened.get("1.21.0.1")["state"] == STATE_FAILED
+
+    pack.write_bytes(b"original data")
+    assert verify_version(str(version_dir), deep=True).ok
+    reopened.mark("1.21.0.1", STATE_VERIFIED)
+    assert VersionCatalog(str(tmp_path)).get("1.21.0.1")["state"] == STATE_VERIFIED
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""性能基准测试：控制台、下载安装和配置读写的热点路径。
+
+每个项目在单独的子进程和临时目录中运行（图形界面使用 offscreen 平台），
+互不影响内存统计；临时目录中的版本 1.0.0.0 是 fake_bedrock_server.py 的副本。
+
+    console     模拟服务器先以最快速度、再以固定速率输出日志，测量从 readServerOutput
+                到显示在控制台的吞吐量、延迟、界面线程每行的耗时、丢弃的行数和内存增长，
+                另测 log() 每条消息的耗时
+    download    本机的 PackageMirror 提供合成的安装包（支持 Range），测量 DownloadThread
+                下载并安装的速度，以及删除版本目录后从缓存重新安装的速度
+    properties  loadProperties / saveProperties 每次调用的耗时
+
+结果保存为 JSON：meta 记录时间、版本、提交、Python 和平台，results 为扁平的 {指标: 数值}。
+指标名的后缀表示方向：_lines_s、_mb_s 越大越好，_ms、_us、_mb、_dropped 越小越好。
+
+用法：
+    python tools/benchmark.py                       运行全部项目，结果保存到 bench-results/<时间>.json
+    python tools/benchmark.py console properties    只运行指定的项目
+    python tools/benchmark.py --quick               缩小规模，快速检查
+    python tools/benchmark.py --compare bench-results/旧.json [--threshold 0.15]
+                                                    与之前的结果比较，有指标变差超过阈值时返回 1
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+FAKE_SERVER = os.path.join(TOOLS_DIR, "fake_bedrock_server.py")
+RESULTS_DIR = os.path.join(ROOT, "bench-results")
+VERSION = "1.0.0.0"
+SUITES = ("console", "download", "properties")
+DEFAULT_THRESHOLD = 0.15
+WORKER_TIMEOUT = 900
+FLOOD_MARKER = "Flood finished:"
+
+# 指标名后缀 -> (方向, 忽略的最小变化)：1 为越大越好，-1 为越小越好
+DIRECTIONS = (
+    ("_lines_s", 1, 0.0),
+    ("_mb_s", 1, 0.0),
+    ("_ms", -1, 1.0),
+    ("_us", -1, 0.5),
+    ("_mb", -1, 2.0),
+    ("_dropped", -1, 100),
+)
+
+# 默认规模和 --quick 的规模
+SIZES = {
+    False: {"flood_lines": 200000, "steady_rate": 5000, "steady_seconds": 10, "line_size": 120,
+            "log_messages": 20000, "package_mb": 64, "package_files": 2000, "rounds": 200},
+    True: {"flood_lines": 20000, "steady_rate": 2000, "steady_seconds": 3, "line_size": 120,
+           "log_messages": 2000, "package_mb": 8, "package_files": 300, "rounds": 50},
+}
+
+# 与真实服务器自带的 server.properties 相同的键，每个键前面有说明
+PROPERTIES = (
+    ("server-name", "Dedicated Server"), ("gamemode", "survival"), ("force-gamemode", "false"),
+    ("difficulty", "easy"), ("allow-cheats", "false"), ("max-players", "10"),
+    ("online-mode", "true"), ("allow-list", "false"), ("server-port", "19132"),
+    ("server-portv6", "19133"), ("enable-lan-visibility", "true"), ("view-distance", "32"),
+    ("tick-distance", "4"), ("player-idle-timeout", "30"), ("max-threads", "8"),
+    ("level-name", "Bedrock level"), ("level-seed", ""), ("default-player-permission-level", "member"),
+    ("texturepack-required", "false"), ("content-log-file-enabled", "false"), ("compression-threshold", "1"),
+    ("compression-algorithm", "zlib"), ("server-authoritative-movement", "server-auth"),
+    ("player-position-acceptance-threshold", "0.5"), ("player-movement-action-direction-threshold", "0.85"),
+    ("server-authoritative-block-breaking-pick-range-scalar", "1.5"), ("chat-restriction", "None"),
+    ("disable-player-interaction", "false"), ("client-side-chunk-generation-enabled", "true"),
+    ("block-network-ids-are-hashes", "true"), ("disable-persona", "false"),
+    ("disable-custom-skins", "false"), ("server-build-radius-ratio", "Disabled"),
+    ("allow-outbound-script-debugging", "false"), ("allow-inbound-script-debugging", "false"),
+    ("script-debugger-auto-attach", "disabled"),
+)
+
+
+# ---------------------------------------------------------------- 准备
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _prepare(root):
+    """在 root/lib/<版本> 中放入模拟服务器和使用空闲端口的 server.properties"""
+    version_dir = os.path.join(root, "lib", VERSION)
+    os.makedirs(version_dir)
+    executable = os.path.join(version_dir, "bedrock_server")
+    shutil.copyfile(FAKE_SERVER, executable)
+    os.chmod(executable, 0o755)
+    ports = {"server-port": str(_free_port()), "server-portv6": str(_free_port())}
+    lines = []
+    for key, value in PROPERTIES:
+        lines.append(f"# {key} 的说明。")
+        lines.append("# Allowed values: 见官方文档")
+        lines.append(f"{key}={ports.get(key, value)}")
+        lines.append("")
+    with open(os.path.join(version_dir, "server.properties"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def _build_package(path, megabytes, files):
+    """生成合成的安装包：一个不可压缩的大文件（bedrock_server）加大量可压缩的小文件，返回大小"""
+    rng = random.Random(1)
+    binary_size = int(megabytes * 0.6 * 1024 * 1024)
+    small_size = max(64, int(megabytes * 0.4 * 1024 * 1024) // files)
+    words = ["minecraft", "block", "entity", "texture", "geometry", "render", "stone", "redstone"]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("bedrock_server", rng.randbytes(binary_size))
+        for i in range(files):
+            text = json.dumps({"format_version": "1.20.0", "id": i,
+                               "description": " ".join(rng.choice(words) for _ in range(small_size // 8))})
+            archive.writestr(f"behavior_packs/vanilla/entities/entity_{i:05d}.json", text[:small_size])
+    return os.path.getsize(path)
+
+
+# ---------------------------------------------------------------- 子进程中运行的项目
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _rss():
+    from mcmanager.metrics import default_backend
+    backend = default_backend()
+    if backend is None:
+        return None
+    values = backend.read(os.getpid())
+    return values[1] if values else None
+
+
+def _gui():
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    import main
+    window = main.MCServerManager()
+    window.show()
+    _wait(lambda: window.selected_version == VERSION, 10)
+    return app, window
+
+
+def _wait(predicate, timeout):
+    """处理界面事件直到 predicate() 为真"""
+    from PyQt5.QtCore import QEventLoop, QTimer
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"等待超过 {timeout} 秒")
+        loop = QEventLoop()
+        QTimer.singleShot(10, loop.quit)
+        loop.exec_()
+
+
+class ConsoleProbe:
+    """接管窗口的 readServerOutput 和控制台刷新，统计界面线程耗时、显示的行数和延迟"""
+
+    def __init__(self, window):
+        self.window = window
+        self.view = window.console_output
+        self.displayed = 0
+        self.busy = 0.0
+        self.pending = []
+        self.reset()
+        window.server_bridge.lines_available.disconnect(window.readServerOutput)
+        window.server_bridge.lines_available.connect(self.readServerOutput)
+        self.view.flush_timer.timeout.disconnect()
+        self.view.flush_timer.timeout.connect(self.flush)
+        self._drain = window.console_buffer.drain
+        window.console_buffer.drain = self.drain
+
+    def reset(self):
+        self.latencies = []
+        self.lines = 0
+        self.busy = 0.0
+        self.finished = None
+
+    def readServerOutput(self):
+        started = time.perf_counter()
+        self.window.readServerOutput()
+        self.busy += time.perf_counter() - started
+
+    def drain(self):
+        self.pending = self._drain()
+        return self.pending
+
+    def flush(self):
+        started = time.perf_counter()
+        self.pending = []
+        self.view.flush()
+        self.busy += time.perf_counter() - started
+        if not self.pending:
+            return
+        now = time.time()
+        self.lines += len(self.pending)
+        self.displayed += len(self.pending)
+        # 每次刷新取最后一行模拟日志的写出时间，得到这一批显示出来时的延迟
+        for line in reversed(self.pending[-5:]):
+            text = line.text
+            if FLOOD_MARKER in text:
+                self.finished = now
+            index = text.rfind(" t=")
+            if index >= 0:
+                self.latencies.append(now - float(text[index + 3:].split(" ", 1)[0]))
+                break
+
+
+def _flood(window, probe, name, lines, rate, size):
+    dropped = window.output_queue.stats.lines_dropped
+    probe.reset()
+    window.cmd_input.setText(f"flood {lines} {rate} {size}")
+    started = time.time()
+    window.sendCommand()
+    _wait(lambda: probe.finished is not None, max(60, lines / max(rate, 1000) * 5))
+    elapsed = probe.finished - started
+    prefix = f"console.{name}."
+    return {
+        prefix + "throughput_lines_s": lines / elapsed,
+        prefix + "latency_p50_ms": _percentile(probe.latencies, 0.5) * 1000,
+        prefix + "latency_p95_ms": _percentile(probe.latencies, 0.95) * 1000,
+        prefix + "latency_max_ms": max(probe.latencies, default=0.0) * 1000,
+        prefix + "gui_per_line_us": probe.busy / max(probe.lines, 1) * 1e6,
+        prefix + "queue_dropped": window.output_queue.stats.lines_dropped - dropped,
+    }
+
+
+def bench_console(config):
+    from PyQt5.QtCore import QTimer
+    app, window = _gui()
+    window.auto_restart.setChecked(False)
+    probe = ConsoleProbe(window)
+    samples = []  # (rss, 已显示的行数)
+
+    def sample():
+        rss = _rss()
+        if rss is not None:
+            samples.append((rss, probe.displayed))
+
+    sampler = QTimer()
+    sampler.timeout.connect(sample)
+    window.startServer()
+    _wait(lambda: window.ready_label.text() != "-", 30)
+    sample()
+    sampler.start(100)
+    results = _flood(window, probe, "max", config["flood_lines"], 0, config["line_size"])
+    rate = config["steady_rate"]
+    results.update(_flood(window, probe, "steady", rate * config["steady_seconds"], rate, config["line_size"]))
+
+    count = config["log_messages"]
+    started = time.perf_counter()
+    for i in range(count):
+        window.log(f"基准测试消息 {i}")
+    window.console_output.flush()
+    results["console.log_us"] = (time.perf_counter() - started) / count * 1e6
+
+    sampler.stop()
+    sample()
+    if samples:
+        mb = 1024 * 1024
+        capped = next((rss for rss, shown in samples if shown >= window.console_buffer.max_lines), samples[-1][0])
+        results["console.rss_start_mb"] = samples[0][0] / mb
+        results["console.rss_peak_mb"] = max(rss for rss, _ in samples) / mb
+        results["console.rss_growth_mb"] = (samples[-1][0] - samples[0][0]) / mb
+        # 缓冲区和文档都已达到行数上限之后仍在增长的部分
+        results["console.rss_growth_after_cap_mb"] = (samples[-1][0] - capped) / mb
+    window.stopServer()
+    _wait(lambda: not window.server_running, 30)
+    window.close()
+    app.processEvents()
+    return results
+
+
+def _install(lib_dir):
+    from main import DownloadThread
+    thread = DownloadThread(VERSION, lib_dir)
+    outcome = []
+    thread.download_finished.connect(lambda ok, message: outcome.append((ok, message)))
+    started = time.perf_counter()
+    thread.run()  # 直接在当前线程中运行，不经过 start()
+    elapsed = time.perf_counter() - started
+    if not outcome or not outcome[0][0]:
+        raise RuntimeError(outcome[0][1] if outcome else "下载没有结果")
+    return elapsed
+
+
+def bench_download(config):
+    from mcmanager.packages import PackageCache, PackageMirror
+    from mcmanager.versions import MIRROR_ENV
+    shutil.rmtree(os.path.join("lib", VERSION))
+    os.makedirs("origin")
+    origin = PackageCache(os.path.join("origin", "cache"))
+    package = os.path.join("origin", "package.zip")
+    size = _build_package(package, config["package_mb"], config["package_files"])
+    with open(package, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest() if hasattr(hashlib, "file_digest") \
+            else hashlib.sha256(f.read()).hexdigest()
+    origin.add(VERSION, "", package, digest)
+    # 上游地址不会被访问：缓存中已有安装包，且没有验证信息
+    mirror = PackageMirror(origin, host="127.0.0.1", port=0, upstream="http://127.0.0.1:9")
+    threading.Thread(target=mirror.serve_forever, daemon=True).start()
+    os.environ[MIRROR_ENV] = f"http://127.0.0.1:{mirror.server_address[1]}"
+    try:
+        cold = _install("lib")
+        shutil.rmtree(os.path.join("lib", VERSION))
+        cached = _install("lib")
+    finally:
+        mirror.shutdown()
+        mirror.server_close()
+    mb = size / (1024 * 1024)
+    return {
+        "download.package_bytes": size,
+        "download.cold_mb_s": mb / cold,
+        "download.cold_ms": cold * 1000,
+        "download.cached_mb_s": mb / cached,
+        "download.cached_ms": cached * 1000,
+    }
+
+
+def _timed(rounds, call, before=None):
+    total = 0.0
+    for i in range(rounds):
+        if before is not None:
+            before(i)
+        started = time.perf_counter()
+        call()
+        total += time.perf_counter() - started
+    return total / rounds * 1000
+
+
+def bench_properties(config):
+    app, window = _gui()
+    rounds = config["rounds"]
+    path = window.properties_file
+    base = os.stat(path).st_mtime_ns
+
+    def touch(i):
+        # 修改时间变化后缓存失效，相当于文件被外部修改
+        os.utime(path, ns=(base + i + 1, base + i + 1))
+
+    def rename(i):
+        window.server_name.setText(f"Benchmark {i}")
+
+    results = {
+        "properties.load_cached_ms": _timed(rounds, window.loadProperties),
+        "properties.load_ms": _timed(rounds, window.loadProperties, touch),
+        "properties.save_unchanged_ms": _timed(rounds, window.saveProperties),
+        # 包括写文件、通知监听器和重新加载界面
+        "properties.save_ms": _timed(rounds, window.saveProperties, rename),
+    }
+    window.close()
+    app.processEvents()
+    return results
+
+
+WORKERS = {"console": bench_console, "download": bench_download, "properties": bench_properties}
+
+
+def _worker(name, config):
+    sys.path.insert(0, ROOT)
+    results = WORKERS[name](config)
+    sys.stdout.write(json.dumps(results) + "\n")
+    sys.stdout.flush()
+    # 图形界面和后台线程不需要正常收尾
+    os._exit(0)
+
+
+# ---------------------------------------------------------------- 主进程
+
+def run_suite(name, config):
+    """在临时目录和子进程中运行一个项目，返回结果"""
+    root = tempfile.mkdtemp(prefix=f"mcmanager-bench-{name}-")
+    try:
+        _prepare(root)
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen", FAKE_BEDROCK_OPTS="--startup-delay 0")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        env.pop("MCMANAGER_MIRROR", None)
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", name,
+                                  "--config", json.dumps(config)],
+                                 cwd=root, env=env, stdout=subprocess.PIPE, text=True, timeout=WORKER_TIMEOUT)
+        lines = process.stdout.strip().splitlines()
+        if process.returncode != 0 or not lines:
+            raise RuntimeError(f"退出码 {process.returncode}")
+        return json.loads(lines[-1])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return f"{commit}-dirty" if commit and dirty else commit or None
+
+
+def _meta(config, quick):
+    sys.path.insert(0, ROOT)
+    from mcmanager import __version__
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "version": __version__,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "quick": quick,
+        "config": config,
+    }
+
+
+def _direction(key):
+    for suffix, direction, floor in DIRECTIONS:
+        if key.endswith(suffix):
+            return direction, floor
+    return None
+
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    """比较两份 results，返回 [(指标, 旧值, 新值, 变化比例, 是否变差)]"""
+    rows = []
+    for key, value in sorted(new.items()):
+        rule = _direction(key)
+        if rule is None or key not in old:
+            continue
+        direction, floor = rule
+        before = old[key]
+        change = (value - before) / before if before else 0.0
+        worse = direction * (value - before) < 0 and abs(value - before) > floor and abs(change) > threshold
+        rows.append((key, before, value, change, worse))
+    return rows
+
+
+def _print_results(results):
+    for key, value in sorted(results.items()):
+        print(f"  {key:<42} {value:>14.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python tools/benchmark.py", description="mcmanager 性能基准测试")
+    parser.add_argument("suites", nargs="*", metavar="项目", help=f"要运行的项目（默认全部：{' '.join(SUITES)}）")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，快速检查")
+    parser.add_argument("--output", help="结果文件（默认 bench-results/<时间>.json）")
+    parser.add_argument("--compare", metavar="旧结果", help="与之前的结果文件比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"变差超过这个比例时视为退化（默认 {DEFAULT_THRESHOLD}）")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        _worker(args.worker, json.loads(args.config))
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f"未知的项目: {', '.join(unknown)}（可选 {', '.join(SUITES)}）")
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    config = dict(SIZES[args.quick])
+    report = {"meta": _meta(config, args.quick), "results": {}, "errors": {}}
+    for name in args.suites or SUITES:
+        print(f"{name} ...", flush=True)
+        started = time.perf_counter()
+        try:
+            results = run_suite(name, config)
+        except Exception as e:
+            report["errors"][name] = str(e)
+            print(f"  失败: {e}")
+            continue
+        report["results"].update(results)
+        _print_results(results)
+        print(f"  （用时 {time.perf_counter() - started:.1f} 秒）")
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"结果已保存到 {output}")
+
+    failed = bool(report["errors"])
+    if baseline is not None:
+        meta = baseline.get("meta", {})
+        print(f"与 {args.compare} 比较（{meta.get('version')} {meta.get('commit') or ''}，{meta.get('time')}）：")
+        if meta.get("config") != config:
+            print("  注意：两次运行的规模不同，结果可能不可比")
+        rows = compare(baseline.get("results", {}), report["results"], args.threshold)
+        for key, before, value, change, worse in rows:
+            print(f"  {key:<42} {before:>12.2f} → {value:>12.2f} {change:>+8.1%}{'  变差' if worse else ''}")
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print(f"{len(regressions)} 项指标变差超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            failed = True
+        else:
+            print("没有超过阈值的退化")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
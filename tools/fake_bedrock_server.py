@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""模拟 bedrock_server 的测试脚本，用于在没有真实服务器时测试管理器。
+
+把本脚本复制或链接为版本目录中的 bedrock_server（Windows 上需要另行包装成
+bedrock_server.exe）即可被管理器启动。除命令行参数外，也可以通过环境变量
+FAKE_BEDROCK_OPTS 传入参数（管理器启动服务器时不带参数）。
+
+    --startup-delay 秒    输出 "Server started." 之前等待的时间
+    --crash-after 秒      启动后经过指定时间异常退出
+    --exit-code 码        异常退出时使用的退出码（默认 1）
+    --hang-after 秒       启动后经过指定时间卡死（不再输出、不再响应 ping 和命令）
+    --flood-lines 行数    启动后输出指定行数的模拟日志（用于测试控制台的吞吐量和延迟）
+    --flood-rate 行/秒    模拟日志的速率（默认 0，不限速）
+    --line-size 字节      模拟日志每行的长度（默认 120）
+    --crash-after-lines 行数  输出这么多行模拟日志后异常退出
+
+模拟日志每行带有 seq=<序号> t=<写出时的时间戳>，可以据此计算延迟，全部输出后打印
+"Flood finished: <行数> lines"。
+
+控制台命令：stop 正常退出，crash 立即异常退出，hang 立即卡死（忽略终止信号），
+flood 行数 [行/秒] [字节] 输出模拟日志，join 名称 / leave 名称 模拟玩家上线、下线，
+save hold / save query / save resume 与真实服务器一样列出 worlds 中的文件，其他命令原样回显。
+监听 server.properties 中的 server-port，响应 RakNet 非连接 ping。
+"""
+import argparse
+import os
+import random
+import shlex
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+SERVER_GUID = 0x1234567890ABCDEF
+
+hung = threading.Event()
+output_lock = threading.Lock()  # 模拟日志在另一个线程中输出
+
+# 模拟日志的内容和级别，大致按真实服务器的比例
+FLOOD_MESSAGES = (
+    ("INFO", "Running AutoCompaction..."),
+    ("INFO", "Player Spawned: Steve xuid: 2535400000000001, pfid: 0000000000000001"),
+    ("INFO", "[Scripting] tick took 12 ms"),
+    ("INFO", "Saving..."),
+    ("INFO", "Level Name: Bedrock level"),
+    ("INFO", "Content logging to console is enabled"),
+    ("INFO", "opening worlds/Bedrock level/db"),
+    ("INFO", "Running AutoCompaction..."),
+    ("INFO", "IPv4 supported, port: 19132: Used for gameplay and LAN discovery"),
+    ("INFO", "Player disconnected: Alex, xuid: 2535400000000002, pfid: 0000000000000002"),
+    ("INFO", "Running AutoCompaction..."),
+    ("INFO", "[Scripting] entity count 1523"),
+    ("INFO", "Saving..."),
+    ("INFO", "Running AutoCompaction..."),
+    ("INFO", "Changes to the level are resumed."),
+    ("INFO", "Running AutoCompaction..."),
+    ("INFO", "[Scripting] tick took 9 ms"),
+    ("INFO", "Running AutoCompaction..."),
+    ("WARN", "[Scripting] tick took 250 ms, server is running behind"),
+    ("ERROR", "[Scripting] Unhandled promise rejection: TypeError: cannot read property 'x' of undefined"),
+)
+
+
+def log(message, level="INFO"):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    with output_lock:
+        sys.stdout.write(f"[{stamp}:{int(time.time() * 1000) % 1000:03d} {level}] {message}\n")
+        sys.stdout.flush()
+
+
+def flood(count, rate=0.0, size=120, crash_after=None, exit_code=1):
+    """输出 count 行模拟日志，rate 为每秒行数（0 为不限速）"""
+    padding = "." * size
+    started = time.perf_counter()
+    sent = 0
+    while sent < count and not hung.is_set():
+        if rate:
+            due = min(count, int((time.perf_counter() - started) * rate) + 1)
+            if due <= sent:
+                time.sleep(0.002)
+                continue
+        else:
+            due = min(count, sent + 1000)
+        if crash_after is not None:
+            due = min(due, crash_after)
+        now = time.time()
+        prefix = time.strftime("[%Y-%m-%d %H:%M:%S", time.localtime(now)) + f":{int(now * 1000) % 1000:03d} "
+        lines = []
+        for seq in range(sent, due):
+            level, message = FLOOD_MESSAGES[seq % len(FLOOD_MESSAGES)]
+            line = f"{prefix}{level}] {message} seq={seq} t={now:.6f} "
+            lines.append(line + padding[:max(0, size - len(line))] + "\n")
+        with output_lock:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        sent = due
+        if crash_after is not None and sent >= crash_after:
+            crash(exit_code)
+    if not hung.is_set():
+        log(f"Flood finished: {sent} lines")
+
+
+def start_flood(count, rate, size, crash_after=None, exit_code=1):
+    threading.Thread(target=flood, args=(count, rate, size, crash_after, exit_code), daemon=True).start()
+
+
+def read_property(name, default):
+    try:
+        with open("server.properties", "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep and key.strip() == name:
+                    return value.strip()
+    except OSError:
+        pass
+    return default
+
+
+def ensure_world(level):
+    """没有世界时创建一个类似 LevelDB 布局的假世界"""
+    db = os.path.join("worlds", level, "db")
+    if os.path.isdir(db):
+        return
+    os.makedirs(db)
+    for name, size in (("level.dat", 2048), ("db/CURRENT", 16), ("db/MANIFEST-000001", 512),
+                       ("db/000003.log", 4096), ("db/000005.ldb", 256 * 1024)):
+        with open(os.path.join("worlds", level, name), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def list_world(level):
+    entries = []
+    for dirpath, _, filenames in os.walk(os.path.join("worlds", level)):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, "worlds").replace(os.sep, "/")
+            entries.append(f"{relpath}:{os.path.getsize(path)}")
+    return ", ".join(entries)
+
+
+def serve_ping(sock):
+    motd = "MCPE;Fake Server;0;1.0.0;0;10;{};Bedrock level;Survival;1;{};{};".format(
+        SERVER_GUID, sock.getsockname()[1], sock.getsockname()[1] + 1).encode()
+    while True:
+        data, addr = sock.recvfrom(2048)
+        if hung.is_set() or data[:1] != b"\x01" or len(data) < 9:
+            continue
+        pong = (b"\x1c" + data[1:9] + struct.pack(">Q", SERVER_GUID) + RAKNET_MAGIC
+                + struct.pack(">H", len(motd)) + motd)
+        sock.sendto(pong, addr)
+
+
+def fake_xuid(name):
+    """同一个名称每次得到相同的 xuid"""
+    return str(2535400000000000 + zlib.crc32(name.encode()))
+
+
+def crash(code):
+    log("Crash requested", "ERROR")
+    os._exit(code)
+
+
+def hang():
+    hung.set()
+    # 卡死的进程同样不响应终止请求，只能强制结束
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    while True:
+        time.sleep(3600)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--startup-delay", type=float, default=0.0)
+    parser.add_argument("--crash-after", type=float)
+    parser.add_argument("--exit-code", type=int, default=1)
+    parser.add_argument("--hang-after", type=float)
+    parser.add_argument("--flood-lines", type=int, default=0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--line-size", type=int, default=120)
+    parser.add_argument("--crash-after-lines", type=int)
+    argv = list(sys.argv[1:] if argv is None else argv)
+    args = parser.parse_args(shlex.split(os.environ.get("FAKE_BEDROCK_OPTS", "")) + argv)
+
+    try:
+        port = int(read_property("server-port", "19132"))
+    except ValueError:
+        port = 19132
+    level = read_property("level-name", "Bedrock level")
+    ensure_world(level)
+    holding = False
+    queries = 0
+    log("Starting Server")
+    log("Version: 1.0.0.0")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(("0.0.0.0", port))
+    except OSError as e:
+        log(f"Network port occupied, can't start server: {e}", "ERROR")
+        return 1
+    threading.Thread(target=serve_ping, args=(sock,), daemon=True).start()
+    log(f"IPv4 supported, port: {port}")
+    time.sleep(args.startup_delay)
+    log("Server started.")
+
+    if args.crash_after is not None:
+        threading.Timer(args.crash_after, crash, args=(args.exit_code,)).start()
+    if args.hang_after is not None:
+        threading.Timer(args.hang_after, hung.set).start()
+    if args.flood_lines or args.crash_after_lines is not None:
+        count = args.flood_lines or args.crash_after_lines
+        start_flood(count, args.flood_rate, args.line_size, args.crash_after_lines, args.exit_code)
+
+    for line in sys.stdin:
+        if hung.is_set():
+            hang()
+        command = line.strip()
+        if command == "stop":
+            log("Server stop requested.")
+            log("Stopping server...")
+            log("Quit correctly")
+            os._exit(0)
+        elif command == "crash":
+            crash(args.exit_code)
+        elif command == "hang":
+            hang()
+        elif command == "save hold":
+            log("Saving...")
+            holding, queries = True, 0
+        elif command == "save query":
+            queries += 1
+            if not holding or queries == 1:
+                # 真实服务器通常需要再查询一次才准备好
+                log("A previous save has not been completed.")
+            else:
+                log("Data saved. Files are now ready to be copied.")
+                sys.stdout.write(list_world(level) + "\n")
+                sys.stdout.flush()
+        elif command == "save resume":
+            holding = False
+            log("Changes to the level are resumed.")
+        elif command.startswith("flood"):
+            parts = command.split()
+            try:
+                count = int(parts[1]) if len(parts) > 1 else 10000
+                rate = float(parts[2]) if len(parts) > 2 else 0.0
+                size = int(parts[3]) if len(parts) > 3 else args.line_size
+            except ValueError:
+                log(f"Syntax error: {command}", "ERROR")
+                continue
+            start_flood(count, rate, size)
+        elif command.startswith("join "):
+            name = command[len("join "):]
+            log(f"Player connected: {name}, xuid: {fake_xuid(name)}")
+        elif command.startswith("leave "):
+            name = command[len("leave "):]
+            log(f"Player disconnected: {name}, xuid: {fake_xuid(name)}, pfid: {random.getrandbits(64):016x}")
+        elif command:
+            log(f"cmd: {command}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())